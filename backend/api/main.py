@@ -3,18 +3,25 @@ AI-Buyer FastAPI Backend
 Main application entry point for ML-powered Facebook advertising optimization
 """
 
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import uvicorn
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import os
 
+from .startup import StartupReport, start_warmup, warmup_enabled
+
+# Import cost of the framework and of each route module, logged at startup.
+# Route modules must stay light: ML dependencies are imported on first use
+# (or by the optional warmup), never at import time.
+startup_report = StartupReport()
+with startup_report.measure("fastapi"):
+    from fastapi import FastAPI, HTTPException, Depends
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+
 # Import route modules
-from .routes import campaigns, analytics, facebook_accounts
-# from .routes import predictions  # Temporary disabled due to ML dependencies
+ROUTE_MODULES = ["campaigns", "predictions", "analytics", "facebook_accounts"]
+routes = {name: startup_report.import_module(f"{__package__}.routes.{name}") for name in ROUTE_MODULES}
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -75,7 +82,8 @@ async def system_status():
             "status": "operational",
             "timestamp": datetime.now().isoformat(),
             "services": services_status,
-            "uptime": "calculating..."  # Will implement actual uptime
+            "uptime": "calculating...",  # Will implement actual uptime
+            "startup": startup_report.to_dict()
         }
     except Exception as e:
         logger.error(f"Status check failed: {e}")
@@ -84,12 +92,9 @@ async def system_status():
             content={"status": "degraded", "error": str(e)}
         )
 
-# Include route modules
 # Register route modules
-app.include_router(campaigns.router)
-# app.include_router(predictions.router)  # Temporary disabled due to ML dependencies
-app.include_router(analytics.router)
-app.include_router(facebook_accounts.router)
+for name in ROUTE_MODULES:
+    app.include_router(routes[name].router)
 
 # Global exception handler
 @app.exception_handler(Exception)
@@ -104,7 +109,13 @@ async def global_exception_handler(request, exc):
 @app.on_event("startup")
 async def startup_event():
     logger.info("AI-Buyer ML Service starting up...")
-    # TODO: Initialize ML models, database connections, etc.
+    startup_report.mark_ready()
+    startup_report.log()
+    # ML_WARMUP=1 imports the ML stack and loads the shared CTR model in the
+    # background, so the first prediction does not pay for it
+    if warmup_enabled():
+        start_warmup(startup_report)
+    # TODO: Initialize database connections, etc.
 
 # Shutdown event
 @app.on_event("shutdown")
@@ -113,6 +124,8 @@ async def shutdown_event():
     # TODO: Cleanup resources
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "api.main:app",
         host="0.0.0.0",
@@ -8,8 +8,6 @@ from pydantic import BaseModel, Field
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime, timedelta
 import logging
-import pandas as pd
-import numpy as np
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -314,6 +312,8 @@ async def get_time_series_data(
         
         # Calculate trends
         if len(data_points) >= 2:
+            import numpy as np
+
             # Simple linear trend calculation
             dates = [i for i in range(len(data_points))]
             
@@ -8,7 +8,6 @@ from typing import List, Optional
 from pydantic import BaseModel
 import sqlite3
 import json
-import requests
 from datetime import datetime
 
 router = APIRouter(prefix="/api/facebook", tags=["facebook_accounts"])
@@ -83,6 +82,8 @@ def get_db_connection():
 
 async def get_facebook_user_info(access_token: str):
     """Get user info from Facebook API"""
+    import requests
+
     try:
         # Get basic user info
         user_url = f"https://graph.facebook.com/me?access_token={access_token}&fields=id,name,email"
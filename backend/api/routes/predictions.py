@@ -4,13 +4,13 @@ Handles CTR predictions and budget optimization
 """
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Dict, List, Any, Optional
 import logging
 from datetime import datetime
 
-from ..ml.models.ctr_predictor import CTRPredictor
-from ..ml.models.budget_optimizer import BudgetOptimizer
+from ml.models.model_registry import ctr_model_owner, get_model_registry
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -55,11 +55,14 @@ async def predict_ctr(request: CTRPredictionRequest, user_id: str = "default"):
     try:
         logger.info(f"CTR prediction request for user {user_id}, campaign {request.campaign_id}")
         
-        # Initialize predictor
-        predictor = CTRPredictor(user_id)
+        # Loaded predictors are shared across requests; loading and
+        # prediction block, so they run off the event loop. Tenants without
+        # a dedicated model are scored by the shared one
+        predictor = await run_in_threadpool(get_model_registry().get, 'ctr', ctr_model_owner(user_id))
         
-        # Prepare campaign data
+        # Prepare campaign data; the shared model embeds the tenant
         campaign_data = {
+            "user_id": user_id,
             "campaign_id": request.campaign_id,
             "age_group": request.age_group,
             "gender": request.gender,
@@ -72,7 +75,7 @@ async def predict_ctr(request: CTRPredictionRequest, user_id: str = "default"):
         }
         
         # Get prediction
-        result = predictor.predict(campaign_data)
+        result = await run_in_threadpool(predictor.predict, campaign_data)
         
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
@@ -107,21 +110,18 @@ async def optimize_budget(request: BudgetOptimizationRequest, background_tasks:
     try:
         logger.info(f"Budget optimization for user {request.user_id}, {len(request.campaigns)} campaigns")
         
-        # Initialize optimizer
-        optimizer = BudgetOptimizer(request.user_id)
-        
-        # Check if models are trained
-        if not optimizer.is_trained:
-            try:
-                optimizer.load_models()
-            except Exception:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="Models not trained for this user. Please train models first."
-                )
+        # Shared optimizer with the user's trained models
+        try:
+            optimizer = await run_in_threadpool(get_model_registry().get, 'budget', request.user_id)
+        except Exception:
+            raise HTTPException(
+                status_code=400, 
+                detail="Models not trained for this user. Please train models first."
+            )
         
         # Run optimization
-        result = optimizer.optimize_budget_allocation(
+        result = await run_in_threadpool(
+            optimizer.optimize_budget_allocation,
             campaigns=request.campaigns,
             total_budget=request.total_budget,
             optimization_goal=request.optimization_goal
@@ -168,7 +168,7 @@ async def train_models(user_id: str, background_tasks: BackgroundTasks):
 async def train_user_models(user_id: str):
     """Background task to train ML models"""
     try:
-        from ..ml.training.trainer import MLTrainingPipeline
+        from ml.training.trainer import MLTrainingPipeline
         
         # This would fetch user's data from ClickHouse
         # For now, using mock data
@@ -186,14 +186,28 @@ async def train_user_models(user_id: str):
             'conversions': np.random.randint(0, 50, n_samples)
         })
         
+        # Only a dedicated tenant owns its CTR model; the shared one is
+        # retrained on every tenant's rows by the periodic retrain task
+        models_to_train = ['budget_optimization']
+        if ctr_model_owner(user_id) == user_id:
+            models_to_train.append('ctr_prediction')
+        else:
+            logger.info(f"User {user_id} is served the shared CTR model, training its budget model only")
+        
         # Initialize training pipeline
         trainer = MLTrainingPipeline(user_id)
         
         # Run training
-        result = await trainer.run_full_training_pipeline(training_data)
+        result = await trainer.run_full_training_pipeline(training_data, models_to_train=models_to_train)
         
         logger.info(f"Training completed for user {user_id}: {result}")
         
+        # Serve the new models from the next request on
+        registry = get_model_registry()
+        registry.invalidate('budget', user_id)
+        if 'ctr_prediction' in models_to_train:
+            registry.invalidate('ctr', user_id)
+        
     except Exception as e:
         logger.error(f"Background training failed for user {user_id}: {e}")
 
@@ -202,7 +216,7 @@ async def train_user_models(user_id: str):
 async def get_model_status(user_id: str = "default"):
     """Get status of ML models for user"""
     try:
-        from ..ml.training.trainer import MLTrainingPipeline
+        from ml.training.trainer import MLTrainingPipeline
         
         trainer = MLTrainingPipeline(user_id)
         status = trainer.get_model_status()
@@ -211,4 +225,10 @@ async def get_model_status(user_id: str = "default"):
         
     except Exception as e:
         logger.error(f"Status check failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Loaded Model Registry Endpoint
+@router.get("/models/registry")
+async def get_model_registry_status():
+    """Models loaded in this process, their memory use and cache counters"""
+    return get_model_registry().status()
@@ -0,0 +1,148 @@
+"""
+API Startup for AI-Buyer
+Import cost report of the API's modules and optional background warmup of the ML stack
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Iterator, List, Any, Optional
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Loaded on first use (or by the warmup), never while the API starts
+LAZY_MODULES = ['tensorflow', 'deepctr', 'mlflow', 'prophet', 'torch', 'pandas', 'numpy', 'sklearn']
+
+# Left out of the report's newly loaded packages
+STDLIB_MODULES = set(getattr(sys, 'stdlib_module_names', ())) | set(sys.builtin_module_names)
+
+# Imported by the warmup, heaviest dependencies first
+WARMUP_MODULES = ['ml.models.ctr_predictor', 'ml.models.budget_optimizer', 'ml.training.trainer']
+
+
+class StartupReport:
+    """
+    Where the API's start-up time goes
+
+    Each measured import records its wall time and the top-level packages
+    it loaded for the first time, so a route module that pulls in a heavy
+    dependency shows up by name. Any of LAZY_MODULES loaded by the time the
+    app is ready is reported as a regression. The warmup adds its own
+    timings as it goes.
+    """
+
+    def __init__(self):
+        self.created_at = time.perf_counter()
+        self.imports: List[Dict[str, Any]] = []
+        self.warmup: Dict[str, Any] = {'status': 'disabled'}
+        self.ready_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, label: str) -> Iterator[None]:
+        """Record the imports done in the block under a label"""
+        before = set(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            packages = sorted({name.split('.')[0] for name in set(sys.modules) - before} - STDLIB_MODULES)
+            with self._lock:
+                self.imports.append({'module': label, 'seconds': round(seconds, 4), 'new_packages': packages})
+
+    def import_module(self, name: str) -> ModuleType:
+        """Import a module, recording its cost"""
+        with self.measure(name):
+            # The import statement's path, so python -X importtime still sees the module
+            __import__(name)
+        return sys.modules[name]
+
+    def mark_ready(self):
+        """The app is ready to serve: time since the report was created"""
+        self.ready_seconds = round(time.perf_counter() - self.created_at, 4)
+
+    @property
+    def eager_heavy_modules(self) -> List[str]:
+        """LAZY_MODULES already loaded (checked at ready time)"""
+        return [name for name in LAZY_MODULES if name in sys.modules]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'ready_seconds': self.ready_seconds,
+                'imports': sorted(self.imports, key=lambda entry: -entry['seconds']),
+                'eager_heavy_modules': self.eager_heavy_modules,
+                'warmup': dict(self.warmup),
+            }
+
+    def log(self):
+        """Log the import breakdown, slowest first"""
+        report = self.to_dict()
+        logger.info(f"API ready {report['ready_seconds']:.3f}s after the first measured import")
+        for entry in report['imports']:
+            packages = ", ".join(entry['new_packages'][:8])
+            logger.info(f"  import {entry['module']:<32} {entry['seconds'] * 1e3:8.1f} ms  {packages}")
+        if report['eager_heavy_modules']:
+            logger.warning(f"Heavy modules loaded at startup instead of on first use: "
+                           f"{', '.join(report['eager_heavy_modules'])}")
+
+
+def warmup_enabled() -> bool:
+    """Whether ML_WARMUP asks for the background warmup"""
+    return os.getenv('ML_WARMUP', '').lower() in ('1', 'true', 'yes')
+
+
+def start_warmup(report: StartupReport, preload_shared_model: bool = True) -> threading.Thread:
+    """
+    Import the ML stack, and load the shared CTR model, on a background thread
+
+    Requests are served meanwhile; one that needs a module still being
+    imported waits for that import (Python's import lock), so warmup only
+    ever moves the cost off the first request. Failures are logged and
+    reported per module, never raised: whatever failed is loaded on first
+    use as usual.
+
+    Args:
+        report: Report the warmup timings are added to
+        preload_shared_model: Also load the shared CTR model into the registry
+
+    Returns:
+        The warmup thread
+    """
+    def warm():
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        failed: Dict[str, str] = {}
+        report.warmup = {'status': 'running', 'modules': timings, 'failed': failed}
+        for name in WARMUP_MODULES:
+            module_start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+                timings[name] = round(time.perf_counter() - module_start, 4)
+            except Exception as e:
+                failed[name] = str(e)
+        if preload_shared_model and 'ml.models.ctr_predictor' in timings:
+            from ml.models.model_registry import SHARED_CTR_MODEL, get_model_registry
+            model_start = time.perf_counter()
+            try:
+                get_model_registry().get('ctr', SHARED_CTR_MODEL)
+                timings['shared ctr model'] = round(time.perf_counter() - model_start, 4)
+            except Exception as e:
+                failed['shared ctr model'] = str(e)
+        report.warmup = {'status': 'failed' if failed else 'done',
+                         'seconds': round(time.perf_counter() - start, 4),
+                         'modules': timings, 'failed': failed}
+        logger.info(f"ML warmup done in {report.warmup['seconds']:.1f}s: {timings}")
+        if failed:
+            logger.warning(f"ML warmup failures, loaded on first use instead: {failed}")
+
+    thread = threading.Thread(target=warm, name='ml-warmup', daemon=True)
+    thread.start()
+    return thread
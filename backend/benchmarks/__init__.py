@@ -0,0 +1,5 @@
+"""
+Benchmarks for AI-Buyer backend
+Standalone performance scripts, run from the backend directory with
+``python -m benchmarks.<name>``
+"""
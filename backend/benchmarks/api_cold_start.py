@@ -0,0 +1,108 @@
+"""
+API Cold Start Benchmark
+Measures how long a fresh interpreter takes to import the FastAPI app with
+every router registered, from python -X importtime in subprocesses: the total,
+the cumulative cost of each of the API's modules and of the packages they
+import, slowest first. Checks that no heavy ML or data dependency is loaded
+until first use and that every route module's router is registered
+
+Usage:
+    python -m benchmarks.api_cold_start --runs 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import warnings
+from typing import Dict, List, Tuple
+
+from api.startup import LAZY_MODULES
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+CHECK = """
+import json, sys
+import api.main
+print(json.dumps({'lazy_loaded': [name for name in %r if name in sys.modules],
+                  'routers': sorted(name for name in api.main.ROUTE_MODULES
+                                    if api.main.routes[name].router.routes),
+                  'route_modules': api.main.ROUTE_MODULES}))
+""" % (LAZY_MODULES,)
+
+
+def import_times(module: str) -> List[Tuple[int, str, float]]:
+    """(depth, module, cumulative seconds) of every import done importing a module in a fresh interpreter"""
+    env = {**os.environ, 'PYTHONWARNINGS': 'ignore'}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, env=env, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((len(match.group(3)) // 2, match.group(4), int(match.group(2)) / 1e6))
+    return entries
+
+
+def breakdown(entries: List[Tuple[int, str, float]], root: str) -> Dict[str, float]:
+    """
+    Cumulative seconds of the root, of its own package's modules and of the
+    other packages those import directly
+
+    importtime lists a module after everything it imported, one indent
+    level deeper, so the parent of an entry is the next entry at a lower depth.
+    """
+    own = root.split('.')[0]
+    costs: Dict[str, float] = {}
+    pending: List[Tuple[int, str, float]] = []
+    for depth, name, seconds in entries:
+        children = [entry for entry in pending if entry[0] == depth + 1]
+        pending = [entry for entry in pending if entry[0] <= depth] + [(depth, name, seconds)]
+        if name == root or name.split('.')[0] == own:
+            costs[name] = seconds
+            for _, child, child_seconds in children:
+                package = child.split('.')[0]
+                if package != own and package not in sys.stdlib_module_names:
+                    costs[package] = costs.get(package, 0.0) + child_seconds
+    return costs
+
+
+def run(runs: int, top: int):
+    root = 'api.main'
+    checked = json.loads(subprocess.run([sys.executable, '-c', CHECK], capture_output=True, text=True,
+                                        env={**os.environ, 'PYTHONWARNINGS': 'ignore'}, check=True).stdout)
+    assert not checked['lazy_loaded'], f"loaded at import time: {checked['lazy_loaded']}"
+    assert checked['routers'] == sorted(checked['route_modules'])
+    print(f"lazy: none of {', '.join(LAZY_MODULES)} is imported with the app; "
+          f"routers registered: {', '.join(checked['route_modules'])}")
+
+    samples: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        for name, seconds in breakdown(import_times(root), root).items():
+            samples.setdefault(name, []).append(seconds)
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+
+    total = medians.pop(root)
+    print(f"\nimport {root}: {total * 1e3:.0f} ms (median of {runs} fresh interpreters)")
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    for name, seconds in sorted(medians.items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:<40} {seconds * 1e3:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time')
+    parser.add_argument('--top', type=int, default=15, help='Modules to list')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Chunked Feature Pipeline Benchmark
+Runs create_feature_pipeline in memory and out of core over a Parquet input
+and compares time and peak RSS as the input grows; tests/test_chunked_features.py
+checks the outputs match
+
+Usage:
+    python -m benchmarks.chunked_pipeline --rows 100000 200000 --chunk-rows 20000
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from ml.feature_engineering.chunked_pipeline import ParquetChunkSource
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+
+
+def write_input(path: str, rows: int, campaigns: int, missing: float = 0.01, seed: int = 42):
+    """Shuffled raw rows with some conversions missing, so chunks must be bucketed"""
+    df = generate_ad_frame(rows, campaigns=campaigns, seed=seed)
+    rng = np.random.default_rng(seed)
+    df['conversions'] = df['conversions'].astype(np.float64)
+    df.loc[rng.random(len(df)) < missing, 'conversions'] = np.nan
+    df.iloc[rng.permutation(len(df))].to_parquet(path, index=False, row_group_size=50000)
+
+
+def in_memory(input_path: str, output_path: str):
+    df = pd.read_parquet(input_path)
+    FacebookAdFeatureEngineer().create_feature_pipeline(df).to_parquet(output_path, index=False)
+
+
+def chunked(input_path: str, output_path: str, chunk_rows: int):
+    FacebookAdFeatureEngineer().create_feature_pipeline_chunked(
+        ParquetChunkSource(input_path), output_path, chunk_rows=chunk_rows
+    )
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process; ru_maxrss survives exec, so prefer VmHWM"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(fn, args, queue):
+    warnings.simplefilter('ignore')
+    start = time.perf_counter()
+    fn(*args)
+    queue.put((time.perf_counter() - start, peak_rss_mb()))
+
+
+def measure(fn, *args):
+    """Seconds and peak RSS (MB) of fn run in a fresh process"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(fn, args, queue))
+    process.start()
+    seconds, peak_mb = queue.get()
+    process.join()
+    return seconds, peak_mb
+
+
+def run(sizes, campaigns: int, chunk_rows: int):
+    print(f"{'rows':>9} {'in-memory':>18} {'chunked':>18}  columns")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, 'input.parquet')
+            expected_path = os.path.join(tmp, 'expected.parquet')
+            output_path = os.path.join(tmp, 'output.parquet')
+            write_input(input_path, rows, campaigns)
+
+            memory_seconds, memory_rss = measure(in_memory, input_path, expected_path)
+            chunked_seconds, chunked_rss = measure(chunked, input_path, output_path, chunk_rows)
+            columns = len(pq.read_schema(output_path).names)
+
+        print(f"{rows:>9,} {memory_seconds:>7.1f}s {memory_rss:>6.0f} MB "
+              f"{chunked_seconds:>7.1f}s {chunked_rss:>6.0f} MB  {columns}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 200000])
+    parser.add_argument('--campaigns', type=int, default=500)
+    parser.add_argument('--chunk-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.campaigns, args.chunk_rows)
+
+
+if __name__ == '__main__':
+    main()
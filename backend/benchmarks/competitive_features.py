@@ -0,0 +1,66 @@
+"""
+Competitive Feature Benchmark
+Times engineer_competitive_features against the previous implementation that
+joined groupby().agg() tables back with two merges, on object and compact
+dtypes. Parity of the two is checked in tests/test_competitive_features.py
+
+Usage:
+    python -m benchmarks.competitive_features --rows 1000000 --campaigns 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+import warnings
+
+from ml.feature_engineering.dtype_plan import DtypePlan
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import performance_frame
+from tests.legacy_features import legacy_competitive_features
+
+
+def measure(fn, *args):
+    """Best of three seconds, and the peak traced bytes of one run"""
+    seconds = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(rows: int, campaigns: int, missing: float):
+    df = performance_frame(rows, campaigns, missing)
+    plan = DtypePlan()
+    engineer = FacebookAdFeatureEngineer()
+    compact = FacebookAdFeatureEngineer(dtype_plan=plan)
+
+    print(f"rows:      {rows:,} over {campaigns:,} campaigns")
+    print(f"\n{'input':>8} {'merge':>8} {'peak':>8} {'transform':>10} {'peak':>8} {'stage only':>11} {'speedup':>8}")
+    for name, frame, new in [('object', df, engineer), ('compact', plan.apply(df), compact)]:
+        _, legacy_seconds, legacy_peak = measure(legacy_competitive_features, frame)
+        _, new_seconds, new_peak = measure(new.engineer_competitive_features, frame)
+        # The stage without assembling the output frame
+        _, stage_seconds, _ = measure(lambda: new._add_competitive_features(new.feature_builder(frame)))
+        print(f"{name:>8} {legacy_seconds:>7.2f}s {legacy_peak / 1e6:>5.0f} MB {new_seconds:>9.2f}s "
+              f"{new_peak / 1e6:>5.0f} MB {stage_seconds:>10.2f}s {legacy_seconds / new_seconds:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument('--missing', type=float, default=0.1,
+                        help='Fraction of spend and ctr blanked (a tenth of that for group keys)')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    run(args.rows, args.campaigns, args.missing)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Compression Codec Benchmark
+Replays realistic producer payloads through every Kafka codec at several
+batch sizes and linger times, and writes a compression profile that
+FacebookDataStreamer can load with ``compression_profile=<path>``
+
+No broker is needed: a local stand-in reproduces the producer accumulator
+(batches close when full or when linger_ms expires) and compresses each
+batch with the same kafka-python codec functions the producer uses.
+
+Usage:
+    python -m benchmarks.compression_codecs --records 50000 --write-profile profile.json
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from kafka import codec as kafka_codec
+
+from services.compression_profile import CodecMeasurement, CompressionProfile, available_codecs
+from services.kafka_producer import FacebookCampaignEvent, MLPredictionEvent, UserActionEvent
+from benchmarks.event_blocks import generate_records
+
+CODEC_ENCODERS: Dict[str, Callable[[bytes], bytes]] = {
+    'gzip': kafka_codec.gzip_encode,
+    'snappy': kafka_codec.snappy_encode,
+    'lz4': kafka_codec.lz4_encode,
+    'zstd': kafka_codec.zstd_encode,
+}
+
+# Approximate per-record framing in a Kafka v2 record batch
+RECORD_OVERHEAD_BYTES = 12
+
+EVENT_MIX = {'campaign': 0.8, 'prediction': 0.15, 'action': 0.05}
+
+
+def campaign_events(count: int, rng: random.Random) -> List[Tuple[bytes, bytes]]:
+    messages = []
+    for record in generate_records(count, seed=rng.randrange(1 << 30)):
+        data = record['campaign_data']
+        event = FacebookCampaignEvent(
+            user_id=record['user_id'],
+            campaign_id=data['campaign_id'],
+            ad_set_id=data['ad_set_id'],
+            ad_id=data['ad_id'],
+            timestamp=datetime.fromtimestamp(record['timestamp']).isoformat(),
+            event_type='metrics_update',
+            metrics=data['metrics'],
+            metadata=data['metadata'],
+        )
+        messages.append((f"{event.user_id}:{event.campaign_id}", asdict(event)))
+    return [(k.encode('utf-8'), json.dumps(v).encode('utf-8')) for k, v in messages]
+
+
+def prediction_events(count: int, rng: random.Random) -> List[Tuple[bytes, bytes]]:
+    messages = []
+    for _ in range(count):
+        ctr = rng.uniform(0.002, 0.05)
+        event = MLPredictionEvent(
+            user_id='user_1',
+            model_name='ctr_predictor',
+            model_version=str(rng.randint(1, 20)),
+            prediction_id=str(uuid.uuid4()),
+            input_features={
+                'campaign_id': f'2385{rng.randrange(50):08d}',
+                'placement': rng.choice(['feed', 'stories', 'reels']),
+                'device_type': rng.choice(['mobile', 'desktop']),
+                'age_group': rng.choice(['18-24', '25-34', '35-44', '45-54']),
+                'gender': rng.choice(['male', 'female', 'all']),
+                'bid_amount': round(rng.uniform(0.2, 5), 2),
+                'audience_size': rng.randint(10000, 5000000),
+            },
+            prediction_result={
+                'predicted_ctr': ctr,
+                'confidence_interval': [ctr * 0.8, ctr * 1.2],
+            },
+            confidence_score=rng.uniform(0.5, 0.99),
+            timestamp=datetime.now().isoformat(),
+        )
+        messages.append((f"{event.user_id}:{event.model_name}", asdict(event)))
+    return [(k.encode('utf-8'), json.dumps(v).encode('utf-8')) for k, v in messages]
+
+
+def action_events(count: int, rng: random.Random) -> List[Tuple[bytes, bytes]]:
+    messages = []
+    for _ in range(count):
+        event = UserActionEvent(
+            user_id='user_1',
+            action_type=rng.choice(['budget_change', 'campaign_pause', 'optimization_applied']),
+            action_data={
+                'campaign_id': f'2385{rng.randrange(50):08d}',
+                'old_budget': round(rng.uniform(10, 1000), 2),
+                'new_budget': round(rng.uniform(10, 1000), 2),
+                'reason': 'rule_triggered',
+            },
+            timestamp=datetime.now().isoformat(),
+            session_id=str(uuid.uuid4()),
+        )
+        messages.append((event.user_id, asdict(event)))
+    return [(k.encode('utf-8'), json.dumps(v).encode('utf-8')) for k, v in messages]
+
+
+EVENT_GENERATORS = {
+    'campaign': campaign_events,
+    'prediction': prediction_events,
+    'action': action_events,
+}
+
+
+def generate_events(event_type: str, count: int, seed: int = 42) -> List[Tuple[bytes, bytes]]:
+    """Generate (key, value) payloads for one event type or the production mix"""
+    rng = random.Random(seed)
+    if event_type != 'mixed':
+        return EVENT_GENERATORS[event_type](count, rng)
+
+    events = []
+    for name, share in EVENT_MIX.items():
+        events.extend(EVENT_GENERATORS[name](int(count * share), rng))
+    rng.shuffle(events)
+    return events
+
+
+def accumulate(events: List[Tuple[bytes, bytes]],
+               batch_size: int,
+               linger_ms: int,
+               records_per_second: float) -> List[bytes]:
+    """
+    Stand-in for the producer accumulator: records arrive at a fixed rate and
+    a batch is closed when the next record does not fit or linger_ms expired
+    """
+    interval_ms = 1000.0 / records_per_second
+    batches: List[bytes] = []
+    current: List[bytes] = []
+    current_size = 0
+    opened_at = 0.0
+
+    for i, (key, value) in enumerate(events):
+        arrival = i * interval_ms
+        record = key + value
+        size = len(record) + RECORD_OVERHEAD_BYTES
+
+        if current and (current_size + size > batch_size or arrival - opened_at >= linger_ms):
+            batches.append(b''.join(current))
+            current, current_size = [], 0
+
+        if not current:
+            opened_at = arrival
+        current.append(record)
+        current_size += size
+
+    if current:
+        batches.append(b''.join(current))
+    return batches
+
+
+def measure(codec: str,
+            events: List[Tuple[bytes, bytes]],
+            batch_size: int,
+            linger_ms: int,
+            records_per_second: float) -> CodecMeasurement:
+    batches = accumulate(events, batch_size, linger_ms, records_per_second)
+    encode = CODEC_ENCODERS[codec]
+
+    start = time.process_time()
+    compressed = [encode(batch) for batch in batches]
+    cpu_seconds = time.process_time() - start
+
+    return CodecMeasurement(
+        codec=codec,
+        batch_size=batch_size,
+        linger_ms=linger_ms,
+        records=len(events),
+        raw_bytes=sum(len(b) for b in batches),
+        compressed_bytes=sum(len(c) for c in compressed),
+        cpu_seconds=cpu_seconds,
+        batches=len(batches),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--events', default='campaign,prediction,action,mixed',
+                        help='comma-separated event types to replay')
+    parser.add_argument('--batch-sizes', default='16384,65536,262144')
+    parser.add_argument('--linger-ms', default='5,20,50')
+    parser.add_argument('--rate', type=float, default=5000.0, help='records per second')
+    parser.add_argument('--link-mbps', type=float, default=100.0,
+                        help='producer network link in MB/s, used to rank codecs')
+    parser.add_argument('--write-profile', help='write a compression profile from the mixed run')
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    batch_sizes = [int(v) for v in args.batch_sizes.split(',')]
+    lingers = [int(v) for v in args.linger_ms.split(',')]
+    missing = sorted(set(CODEC_ENCODERS) - set(codecs))
+    if missing:
+        print(f"Skipping codecs without Python bindings: {', '.join(missing)}")
+
+    profile_measurements = []
+    print(f"{'events':<11} {'codec':<7} {'batch':>7} {'linger':>6} {'batches':>8} "
+          f"{'ratio':>6} {'cpu s':>7} {'MB/cpu-s':>9} {'rec/s':>10}")
+
+    for event_type in args.events.split(','):
+        events = generate_events(event_type, args.records)
+        for codec in codecs:
+            for batch_size in batch_sizes:
+                for linger_ms in lingers:
+                    m = measure(codec, events, batch_size, linger_ms, args.rate)
+                    records_per_cpu_second = m.records / m.cpu_seconds if m.cpu_seconds else float('inf')
+                    print(f"{event_type:<11} {codec:<7} {batch_size:>7} {linger_ms:>6} {m.batches:>8} "
+                          f"{m.compression_ratio:>6.2f} {m.cpu_seconds:>7.3f} "
+                          f"{m.throughput_mb_per_cpu_second:>9.1f} {records_per_cpu_second:>10.0f}")
+                    if event_type == 'mixed':
+                        profile_measurements.append(m)
+
+    if args.write_profile:
+        if not profile_measurements:
+            parser.error("--write-profile needs the 'mixed' event type")
+        profile = CompressionProfile(profile_measurements, link_mb_per_second=args.link_mbps)
+        profile.save(args.write_profile)
+        print(f"Profile written to {args.write_profile}: {profile.producer_settings()}")
+
+
+if __name__ == '__main__':
+    main()
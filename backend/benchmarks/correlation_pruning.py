@@ -0,0 +1,79 @@
+"""
+Correlation Pruning Benchmark
+Compares the per-run DataFrame.corr drop list with fitting CorrelationPruner
+by streaming covariance and on a row sample, on wide frames: fit time, peak
+traced memory and the cost of reapplying the drop list;
+tests/test_correlation_pruner.py checks the drop lists agree
+
+Usage:
+    python -m benchmarks.correlation_pruning --rows 200000 --columns 100 300
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.correlation_pruner import CorrelationPruner
+from tests.legacy_features import legacy_correlated_features
+
+
+def wide_frame(rows: int, columns: int, seed: int = 42) -> pd.DataFrame:
+    """Groups of noisy copies of shared factors, some very close, with a few NaNs"""
+    rng = np.random.default_rng(seed)
+    factors = rng.standard_normal((rows, max(1, columns // 4)))
+    data = {}
+    for i in range(columns):
+        factor = factors[:, i % factors.shape[1]]
+        noise = 0.05 if i % 3 == 0 else 1.0
+        data[f'f{i:04d}'] = (factor * (1 + i % 5) + noise * rng.standard_normal(rows)).astype(np.float64)
+    df = pd.DataFrame(data)
+    df.iloc[rng.integers(0, rows, rows // 100), 0] = np.nan
+    return df
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(rows: int, columns_list, sample_rows: int):
+    print(f"{'columns':>8} {'method':>10} {'fit':>8} {'peak':>9} {'dropped':>8}")
+    for columns in columns_list:
+        df = wide_frame(rows, columns)
+        expected, seconds, peak = measure(legacy_correlated_features, df)
+        print(f"{columns:>8} {'corr()':>10} {seconds:>7.2f}s {peak / 1e6:>6.0f} MB {len(expected):>8}")
+
+        for name, pruner in [('streaming', CorrelationPruner()),
+                             ('sampled', CorrelationPruner(sample_rows=sample_rows))]:
+            _, seconds, peak = measure(pruner.fit, df)
+            print(f"{columns:>8} {name:>10} {seconds:>7.2f}s {peak / 1e6:>6.0f} MB {len(pruner.to_drop):>8}")
+
+        # Inference reapplies the fitted list to a one-row frame
+        start = time.perf_counter()
+        for _ in range(1000):
+            pruner.transform(df.iloc[:1])
+        print(f"{columns:>8} {'transform':>10} {(time.perf_counter() - start):>7.3f}ms per 1-row frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--columns', type=int, nargs='+', default=[100, 300])
+    parser.add_argument('--sample-rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.rows, args.columns, args.sample_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Creative Text Feature Benchmark
+Compares the creative text features of engineer_creative_features with the
+previous one-regex-pass-per-feature implementation as rows grow over a fixed
+set of unique texts, with a cold, warm and reloaded memo;
+tests/test_creative_text.py checks they agree
+
+Usage:
+    python -m benchmarks.creative_features --rows 100000 1000000 --texts 5000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.creative_text import CreativeTextScanner
+from tests.legacy_features import legacy_text_features
+
+VOCABULARY = [
+    'Shop', 'the', 'BEST', 'deals', 'today', 'Amazing', 'love', 'perfect', 'Sign up', 'get',
+    'worst', 'awful', 'hate', 'Try', 'download', 'learn', 'excellent', 'great', 'bad', 'offer',
+    'greaterrible', 'bestry', 'awfulove', 'buy', '20%', 'off!', 'now', '🔥', 'new', 'arrivals',
+]
+
+
+def make_texts(rows: int, unique: int, seed: int = 42) -> pd.Series:
+    """Rows drawn from a pool of random keyword-heavy texts, with some missing"""
+    rng = np.random.default_rng(seed)
+    pool = [
+        ' '.join(rng.choice(VOCABULARY, rng.integers(2, 15)))
+        for _ in range(unique)
+    ] + [None]
+    return pd.Series(np.array(pool, dtype=object)[rng.integers(0, len(pool), rows)])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(sizes, unique: int):
+    print(f"{'rows':>10} {'legacy':>8} {'cold':>8} {'warm':>8} {'reloaded':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        memo_path = os.path.join(tmp, 'creative_text_memo.npz')
+        for rows in sizes:
+            texts = make_texts(rows, unique)
+            _, legacy_seconds = timed(legacy_text_features, texts)
+
+            scanner = CreativeTextScanner()
+            _, cold_seconds = timed(scanner.features, texts)
+            _, warm_seconds = timed(scanner.features, texts)
+            scanner.save(memo_path)
+
+            reloaded = CreativeTextScanner(memo_path=memo_path)
+            _, reloaded_seconds = timed(reloaded.features, texts)
+            print(f"{rows:>10,} {legacy_seconds:>7.2f}s {cold_seconds:>7.2f}s {warm_seconds:>7.2f}s "
+                  f"{reloaded_seconds:>8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--texts', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.rows, args.texts)
+
+
+if __name__ == '__main__':
+    main()
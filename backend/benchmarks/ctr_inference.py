@@ -0,0 +1,165 @@
+"""
+CTR Inference Benchmark
+Checks the frozen CTRPreprocessor against the LabelEncoder and MinMaxScaler
+it replaces, shows the old per-request refit changed dense inputs with the
+batch, and reports per-row preprocessing latency at several batch sizes.
+When TensorFlow and DeepCTR are installed, also times predict_batch through
+an untrained DeepFM
+
+Usage:
+    python -m benchmarks.ctr_inference --rows 100000 --batch 1 64 4096
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+
+from ml.models.ctr_preprocessor import CTRPreprocessor, DENSE_FEATURES, SPARSE_FEATURES
+from tests.frames import make_ctr_frame
+
+
+class LegacyPreprocessing:
+    """The previous prepare_features: fitted LabelEncoders, a MinMaxScaler refitted on every call"""
+
+    def __init__(self, train: pd.DataFrame):
+        self.encoders = {feat: LabelEncoder().fit(train[feat].astype(str)) for feat in SPARSE_FEATURES}
+        self.scaler = MinMaxScaler().fit(train[DENSE_FEATURES])
+
+    def transform(self, df: pd.DataFrame) -> dict:
+        df = df.copy()
+        for feat in SPARSE_FEATURES:
+            df[feat] = self.encoders[feat].transform(df[feat].astype(str)).astype(np.int32)
+        df[DENSE_FEATURES] = self.scaler.fit_transform(df[DENSE_FEATURES].astype(np.float64))
+        return {name: df[name] for name in SPARSE_FEATURES + DENSE_FEATURES}
+
+
+def per_row(fn, rows: int, min_seconds: float = 0.5) -> float:
+    """Best of three mean seconds per row"""
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / 10:
+            break
+        calls *= 4
+    best = elapsed / calls
+    for _ in range(2):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best / rows
+
+
+def check_parity(train: pd.DataFrame, new: pd.DataFrame) -> CTRPreprocessor:
+    """Same codes (shifted by one) and scaling as the sklearn encoders; unseen values get 0"""
+    preprocessor = CTRPreprocessor().fit(train)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ctr_preprocessor.json')
+        preprocessor.save(path)
+        preprocessor = CTRPreprocessor.load(path)
+
+    legacy = LegacyPreprocessing(train)
+    encoded = preprocessor.transform(train)
+    for feat in SPARSE_FEATURES:
+        np.testing.assert_array_equal(encoded[feat], legacy.encoders[feat].transform(train[feat].astype(str)) + 1)
+        assert preprocessor.vocabulary_size(feat) == len(legacy.encoders[feat].classes_) + 1
+    scaled = legacy.scaler.transform(new[DENSE_FEATURES])
+    encoded_new = preprocessor.transform(new)
+    for position, feat in enumerate(DENSE_FEATURES):
+        np.testing.assert_allclose(encoded_new[feat], scaled[:, position], rtol=1e-6, atol=1e-7, err_msg=feat)
+
+    # Unseen categories map to the reserved code
+    for feat in SPARSE_FEATURES:
+        seen = np.isin(new[feat].astype(str), legacy.encoders[feat].classes_)
+        assert (encoded_new[feat][~seen] == 0).all() and (encoded_new[feat][seen] > 0).all(), feat
+
+    # Record dicts, categoricals, the dict and the Index lookups, and compact
+    # float32 input all encode alike
+    small = new.iloc[:64]
+    records = preprocessor.transform_records(small.to_dict('records'))
+    categorical = preprocessor.transform(small.astype({feat: 'category' for feat in SPARSE_FEATURES}))
+    compact = preprocessor.transform(new.astype({feat: np.float32 for feat in DENSE_FEATURES}))
+    for feat in SPARSE_FEATURES:
+        np.testing.assert_array_equal(records[feat], encoded_new[feat][:64], err_msg=feat)
+        np.testing.assert_array_equal(categorical[feat], encoded_new[feat][:64], err_msg=feat)
+    for feat in DENSE_FEATURES:
+        np.testing.assert_allclose(records[feat], encoded_new[feat][:64], rtol=1e-12, err_msg=feat)
+        assert compact[feat].dtype == np.float32
+        np.testing.assert_allclose(compact[feat], encoded_new[feat], rtol=1e-5, atol=1e-6, err_msg=feat)
+
+    # A row encodes the same alone as in a batch
+    alone = preprocessor.transform_records([small.iloc[0].to_dict()])
+    assert all(alone[name][0] == records[name][0] for name in preprocessor.feature_names)
+    return preprocessor
+
+
+def load_predictor(preprocessor: CTRPreprocessor):
+    """A CTRPredictor around an untrained DeepFM, or None without TensorFlow and DeepCTR"""
+    try:
+        from ml.models.ctr_predictor import CTRPredictor
+    except ImportError as e:
+        print(f"\nmodel timings skipped: {e}")
+        return None
+    predictor = CTRPredictor('benchmark')
+    predictor.preprocessor = preprocessor
+    predictor.feature_columns = predictor.build_feature_columns()
+    predictor.model = predictor.create_model()
+    predictor.is_trained = True
+    return predictor
+
+
+def run(rows: int, batch_sizes):
+    train = make_ctr_frame(rows)
+    new = make_ctr_frame(5000, seed=1)
+    preprocessor = check_parity(train, new)
+    print(f"parity: {len(SPARSE_FEATURES)} sparse and {len(DENSE_FEATURES)} dense features match "
+          f"the sklearn encoders; unseen values get code 0")
+
+    # The old path refitted the scaler on each request, so dense inputs
+    # depended on the batch: a single row always scaled to zero
+    legacy = LegacyPreprocessing(train)
+    frozen = preprocessor.transform(train.iloc[:1])
+    refit = legacy.transform(train.iloc[:1])
+    print(f"single-row dense inputs, frozen: {[round(float(frozen[f][0]), 3) for f in DENSE_FEATURES[:4]]}, "
+          f"refitted: {[float(refit[f].iloc[0]) for f in DENSE_FEATURES[:4]]}")
+
+    predictor = load_predictor(preprocessor)
+    header = f"\n{'batch':>6} {'legacy':>10} {'records':>10} {'frame':>10}"
+    print(header + (f" {'predict_batch':>14}" if predictor else "") + "   (per row)")
+    for size in batch_sizes:
+        # Training rows, which the legacy encoders can all encode
+        batch = train.iloc[:size].reset_index(drop=True)
+        records = batch.to_dict('records')
+        legacy_seconds = per_row(lambda: legacy.transform(pd.DataFrame(records)), size)
+        records_seconds = per_row(lambda: preprocessor.transform_records(records), size)
+        frame_seconds = per_row(lambda: preprocessor.transform(batch), size)
+        line = (f"{size:>6} {legacy_seconds * 1e6:>8.1f}us {records_seconds * 1e6:>8.1f}us "
+                f"{frame_seconds * 1e6:>8.1f}us")
+        if predictor:
+            line += f" {per_row(lambda: predictor.predict_batch(records), size) * 1e6:>12.1f}us"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='Training rows to fit on')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 64, 4096])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+CTR Streaming Input Benchmark
+Writes synthetic engineered CTR rows as sharded Parquet and compares the
+in-memory training input (read everything, encode, train_test_split) with
+CTRTrainingInput streaming the shards: peak memory and rows per second of
+the preprocessor fit and one encoded pass. When TensorFlow is installed,
+also times one pass through the tf.data pipeline; tests/test_ctr_input.py
+checks the streaming fit and the hashed validation split
+
+Usage:
+    python -m benchmarks.ctr_streaming_input --rows 2000000 --shards 16
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.model_selection import train_test_split
+
+from ml.models.ctr_input import CTRTrainingInput
+from ml.models.ctr_preprocessor import CTRPreprocessor
+from tests.frames import make_ctr_frame
+
+
+def make_shard(rows: int, seed: int) -> pd.DataFrame:
+    """Model inputs plus the row key, impressions and target"""
+    rng = np.random.default_rng(seed)
+    frame = make_ctr_frame(rows, seed=seed)
+    frame['timestamp'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(
+        rng.integers(0, 90 * 24 * 3600, rows), unit='s') + pd.to_timedelta(seed, unit='ms')
+    frame['impressions'] = rng.integers(50, 5000, rows)
+    frame['ctr'] = rng.beta(1, 60, rows)
+    return frame
+
+
+def write_shards(directory: str, rows: int, shards: int, row_group_rows: int):
+    for shard in range(shards):
+        table = pa.Table.from_pandas(make_shard(rows // shards, seed=shard), preserve_index=False)
+        pq.write_table(table, os.path.join(directory, f'part-{shard:05d}.parquet'), row_group_size=row_group_rows)
+
+
+def reliable_rows(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame[(frame['impressions'] >= 100) & (frame['ctr'] <= 0.5)]
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def measure(fn, *args):
+    """Run fn in a forked process: (its result, seconds, peak MB above the starting RSS)"""
+    def child(queue):
+        start_rss = rss_mb()
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        queue.put((result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3 - start_rss))
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=child, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def in_memory(directory: str) -> int:
+    """The train path: whole frame, fitted encodings, then a split copy"""
+    frame = reliable_rows(pd.read_parquet(directory))
+    preprocessor = CTRPreprocessor().fit(frame)
+    features = pd.DataFrame(preprocessor.transform(frame), index=frame.index)
+    train, val, y_train, y_val = train_test_split(features, frame['ctr'].to_numpy(), test_size=0.2,
+                                                  random_state=42)
+    return len(train) + len(val)
+
+
+def streaming(directory: str) -> int:
+    """The train_streaming path: streamed fit, then one encoded pass over both splits"""
+    training_input = CTRTrainingInput.from_parquet(directory, row_filter=reliable_rows)
+    preprocessor = training_input.fit_preprocessor(CTRPreprocessor())
+    rows = 0
+    for split in ('train', 'validation'):
+        for _, target in training_input.batches(preprocessor, split):
+            rows += len(target)
+    return rows
+
+
+def tf_pass(directory: str) -> int:
+    training_input = CTRTrainingInput.from_parquet(directory, row_filter=reliable_rows)
+    preprocessor = training_input.fit_preprocessor(CTRPreprocessor())
+    rows = 0
+    for _, target in training_input.dataset(preprocessor, 'train', batch_size=512):
+        rows += int(target.shape[0])
+    return rows
+
+
+def run(rows: int, shards: int, row_group_rows: int):
+    directory = tempfile.mkdtemp(prefix='ctr-shards-')
+    try:
+        write_shards(directory, rows, shards, row_group_rows)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        print(f"{rows:,} rows in {shards} files of {row_group_rows:,}-row groups, {size / 1e6:.0f} MB Parquet")
+        print(f"{'input':<12} {'rows':>11} {'seconds':>8} {'rows/s':>11} {'peak MB':>8}")
+        modes = [('in-memory', in_memory), ('streaming', streaming)]
+        try:
+            import tensorflow  # noqa: F401
+            modes.append(('tf.data', tf_pass))
+        except ImportError:
+            pass
+        for name, fn in modes:
+            result, seconds, peak = measure(fn, directory)
+            print(f"{name:<12} {result:>11,} {seconds:>8.1f} {result / seconds:>11,.0f} {peak:>8.0f}")
+        if len(modes) == 2:
+            print("tf.data pass skipped: TensorFlow is not installed")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--shards', type=int, default=16, help='Parquet files')
+    parser.add_argument('--row-group-rows', type=int, default=65536)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.shards, args.row_group_rows)
+
+
+if __name__ == '__main__':
+    main()
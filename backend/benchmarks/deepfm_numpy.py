@@ -0,0 +1,168 @@
+"""
+NumPy DeepFM Benchmark
+Checks NumpyDeepFM's vectorized forward pass against a literal transcription
+of DeepFM (pairwise FM interactions, one DNN layer at a time), the save and
+memory-mapped load round trip and batch independence, then reports load time,
+import cost and per-row latency at several batch sizes. When TensorFlow and
+DeepCTR are installed, also trains a small DeepFM, exports it through
+CTRPredictor.export_numpy and compares both outputs and latencies
+
+Usage:
+    python -m benchmarks.deepfm_numpy --rows 100000 --batch 1 64 4096
+"""
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from itertools import combinations
+
+import numpy as np
+
+from benchmarks.ctr_inference import per_row
+from ml.models.ctr_preprocessor import CTRPreprocessor
+from ml.models.deepfm_numpy import NumpyDeepFM
+from tests.frames import make_ctr_frame
+
+EMBEDDING_DIM = 8
+HIDDEN_UNITS = (256, 128, 64)
+
+
+def random_model(preprocessor: CTRPreprocessor, seed: int = 0) -> NumpyDeepFM:
+    """A NumpyDeepFM with random weights at the CTRPredictor's sizes"""
+    rng = np.random.default_rng(seed)
+    sizes = [len(preprocessor.sparse_features) * EMBEDDING_DIM + len(preprocessor.dense_features)]
+    sizes += list(HIDDEN_UNITS)
+
+    def normal(*shape, scale=0.05):
+        return rng.normal(0, scale, shape).astype(np.float32)
+
+    return NumpyDeepFM.from_features(
+        preprocessor,
+        embeddings={feat: normal(preprocessor.vocabulary_size(feat), EMBEDDING_DIM)
+                    for feat in preprocessor.sparse_features},
+        linear_weights={feat: normal(preprocessor.vocabulary_size(feat), scale=0.01)
+                        for feat in preprocessor.sparse_features},
+        linear_kernel=normal(len(preprocessor.dense_features)),
+        dnn_kernels=[normal(n_in, n_out, scale=np.sqrt(2 / n_in)) for n_in, n_out in zip(sizes, sizes[1:])],
+        dnn_biases=[normal(n_out, scale=0.01) for n_out in sizes[1:]],
+        output_kernel=normal(sizes[-1], scale=0.1),
+        global_bias=0.02,
+    )
+
+
+def reference_forward(model: NumpyDeepFM, feature_input: dict) -> np.ndarray:
+    """DeepFM as written down, in float64: linear + sum over pairs <e_i, e_j> + DNN + bias"""
+    dense = np.stack([feature_input[feat] for feat in model.dense_features], axis=1).astype(np.float64)
+    rows = [offset + feature_input[feat] for feat, offset in zip(model.sparse_features, model.offsets)]
+    embedded = [model.embedding_table[index].astype(np.float64) for index in rows]
+
+    linear = sum(model.linear_table[index].astype(np.float64) for index in rows)
+    linear += dense @ model.linear_kernel + model.linear_bias
+    fm = sum(np.sum(embedded[i] * embedded[j], axis=1) for i, j in combinations(range(len(embedded)), 2))
+    hidden = np.concatenate(embedded + [dense], axis=1)
+    for kernel, bias in zip(model.dnn_kernels, model.dnn_biases):
+        hidden = np.maximum(hidden @ kernel + bias, 0)
+    return linear + fm + hidden @ model.output_kernel + model.global_bias
+
+
+def check_parity(model: NumpyDeepFM, new) -> NumpyDeepFM:
+    """Matches the reference, survives save and a memory-mapped load, scores rows independently"""
+    feature_input = model.preprocessor.transform(new)
+    np.testing.assert_allclose(model.forward(feature_input), reference_forward(model, feature_input),
+                               rtol=1e-4, atol=1e-5)
+
+    directory = tempfile.mkdtemp()
+    model.save(directory)
+    mapped = NumpyDeepFM.load(directory)
+    loaded = NumpyDeepFM.load(directory, mmap=False)
+    assert isinstance(mapped.embedding_table, np.memmap)
+    expected = model.predict_batch(new)
+    np.testing.assert_array_equal(mapped.predict_batch(new), expected)
+    np.testing.assert_array_equal(loaded.predict_batch(new), expected)
+
+    # Chunked batches, record dicts and single rows score the same
+    np.testing.assert_allclose(mapped.predict_batch(new, batch_size=1000), expected, rtol=1e-6, atol=1e-7)
+    records = new.iloc[:32].to_dict('records')
+    np.testing.assert_allclose(mapped.predict_batch(records), expected[:32], rtol=1e-6, atol=1e-7)
+    alone = [mapped.predict_batch([record])[0] for record in records[:4]]
+    np.testing.assert_allclose(alone, expected[:4], rtol=1e-6, atol=1e-7)
+    return mapped
+
+
+def import_seconds(module: str) -> float:
+    """Import time of a module in a fresh interpreter"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return float(result.stdout.strip().splitlines()[-1]) if result.returncode == 0 else float('nan')
+
+
+def trained_predictor(train):
+    """A CTRPredictor with a briefly trained DeepFM, or None without TensorFlow and DeepCTR"""
+    try:
+        from ml.models.ctr_predictor import CTRPredictor
+    except ImportError as e:
+        print(f"\nTensorFlow parity and timings skipped: {e}")
+        return None
+    predictor = CTRPredictor('benchmark')
+    _, feature_input = predictor.prepare_features(train, fit=True)
+    predictor.model = predictor.create_model()
+    target = np.random.default_rng(0).beta(1, 50, len(train))
+    predictor.model.fit(feature_input, target, batch_size=1024, epochs=1, verbose=0)
+    predictor.is_trained = True
+    return predictor
+
+
+def run(rows: int, batch_sizes):
+    train = make_ctr_frame(rows)
+    new = make_ctr_frame(5000, seed=1)
+    preprocessor = CTRPreprocessor().fit(train)
+    model = check_parity(random_model(preprocessor), new)
+    print(f"parity: vectorized forward matches the pairwise reference; saved, memory-mapped and "
+          f"chunked outputs agree ({model.nbytes / 1e6:.1f} MB of weights)")
+
+    directory = tempfile.mkdtemp()
+    model.save(directory)
+    for mmap in (True, False):
+        start = time.perf_counter()
+        NumpyDeepFM.load(directory, mmap=mmap)
+        print(f"load ({'memory-mapped' if mmap else 'read'}): {(time.perf_counter() - start) * 1e3:.1f} ms")
+    tensorflow = import_seconds('tensorflow')
+    print(f"import ml.models.deepfm_numpy: {import_seconds('ml.models.deepfm_numpy'):.2f}s, tensorflow: "
+          + ('not installed' if np.isnan(tensorflow) else f"{tensorflow:.2f}s"))
+
+    predictor = trained_predictor(train)
+    if predictor is not None:
+        exported = predictor.export_numpy(os.path.join(directory, 'exported'))
+        np.testing.assert_allclose(exported.predict_batch(new), predictor.predict_batch(new),
+                                   rtol=1e-4, atol=1e-5)
+        print("TensorFlow parity: exported model matches predict_batch")
+        model = exported
+
+    print(f"\n{'batch':>6} {'numpy':>10}" + (f" {'tensorflow':>11}" if predictor else "") + "   (per row)")
+    for size in batch_sizes:
+        records = new.iloc[:size].to_dict('records')
+        line = f"{size:>6} {per_row(lambda: model.predict_batch(records), size) * 1e6:>8.1f}us"
+        if predictor:
+            line += f" {per_row(lambda: predictor.predict_batch(records), size) * 1e6:>9.1f}us"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='Training rows to fit on')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 64, 4096])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.batch)
+
+
+if __name__ == '__main__':
+    main()
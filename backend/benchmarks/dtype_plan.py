@@ -0,0 +1,84 @@
+"""
+Dtype Plan Benchmark
+Runs create_feature_pipeline with and without the default DtypePlan, reports
+the memory of the raw input and engineered output and the peak traced memory,
+and lists the largest per-column savings; tests/test_dtype_plan.py checks the
+compact output agrees with the full-width one
+
+Usage:
+    python -m benchmarks.dtype_plan --rows 200000 --campaigns 2000
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+import warnings
+
+from ml.feature_engineering.dtype_plan import DtypePlan, frame_memory
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+
+
+def measure(fn, *args, **kwargs):
+    """Run fn and return its result, seconds and peak traced bytes"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(rows: int, campaigns: int, top: int):
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    df['ctr'] = df['clicks'] / df['impressions']
+    plan = DtypePlan()
+
+    # Correlation pruning is fitted on different float widths, so fix the
+    # drop list from the full-width run and reuse it for the compact one
+    full_engineer = FacebookAdFeatureEngineer()
+    full, full_seconds, full_peak = measure(full_engineer.create_feature_pipeline, df, fit=True)
+
+    compact_engineer = FacebookAdFeatureEngineer(
+        correlation_pruner=full_engineer.correlation_pruner, dtype_plan=plan
+    )
+    compact, compact_seconds, compact_peak = measure(compact_engineer.create_feature_pipeline, df)
+
+    compact_input = plan.apply(df)
+    input_report = plan.report(df, compact_input)
+    output_report = plan.report(full, compact)
+
+    print(f"{rows:,} rows, {campaigns} campaigns, {compact.shape[1]} output columns")
+    print(f"{'':>8} {'input MB':>9} {'output MB':>10} {'peak MB':>8} {'seconds':>8}")
+    print(f"{'full':>8} {frame_memory(df) / 1e6:>9.1f} {frame_memory(full) / 1e6:>10.1f} "
+          f"{full_peak / 1e6:>8.1f} {full_seconds:>7.2f}s")
+    print(f"{'compact':>8} {frame_memory(compact_input) / 1e6:>9.1f} {frame_memory(compact) / 1e6:>10.1f} "
+          f"{compact_peak / 1e6:>8.1f} {compact_seconds:>7.2f}s")
+    print(f"input {input_report['reduction']:.0%} smaller, output {output_report['reduction']:.0%} smaller, "
+          f"{len(output_report['columns'])} output columns compacted")
+
+    savings = sorted(
+        output_report['columns'].items(),
+        key=lambda item: item[1]['bytes_before'] - item[1]['bytes_after'], reverse=True
+    )
+    for name, column in savings[:top]:
+        print(f"  {name:<32} {column['from']:>8} -> {column['to']:<8} "
+              f"{column['bytes_before'] / 1e6:>7.1f} -> {column['bytes_after'] / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--campaigns', type=int, default=2000)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.campaigns, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Event Block Benchmark
+Compares broker bytes and consumer CPU of per-metric JSON events against
+columnar event blocks on the campaign events topic
+
+Usage:
+    python -m benchmarks.event_blocks --metrics 200000
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, List, Any
+
+from services.event_blocks import decode_event_value, encode_campaign_block
+from services.kafka_producer import FacebookCampaignEvent
+
+PLACEMENTS = ['feed', 'stories', 'reels', 'right_column', 'marketplace']
+DEVICES = ['mobile', 'desktop', 'tablet']
+
+
+def generate_records(count: int, campaigns: int = 50, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate buffered campaign metric records like FacebookDataStreamer.batch_buffer"""
+    rng = random.Random(seed)
+    now = time.time()
+    records = []
+    for i in range(count):
+        campaign = rng.randrange(campaigns)
+        impressions = rng.randint(100, 50000)
+        clicks = rng.randint(0, impressions // 20)
+        spend = round(rng.uniform(1, 500), 2)
+        records.append({
+            'user_id': 'user_1',
+            'timestamp': now + i * 0.001,
+            'campaign_data': {
+                'campaign_id': f'2385{campaign:08d}',
+                'ad_set_id': f'2386{campaign:08d}{rng.randrange(4)}',
+                'ad_id': f'2387{campaign:08d}{rng.randrange(12):02d}',
+                'metrics': {
+                    'impressions': impressions,
+                    'clicks': clicks,
+                    'spend': spend,
+                    'reach': int(impressions * rng.uniform(0.6, 0.95)),
+                    'frequency': round(rng.uniform(1, 3), 3),
+                    'ctr': clicks / impressions,
+                    'cpc': spend / clicks if clicks else 0.0,
+                    'cpm': spend / impressions * 1000,
+                    'conversions': rng.randint(0, max(clicks // 10, 1)),
+                    'placement': rng.choice(PLACEMENTS),
+                    'device_platform': rng.choice(DEVICES),
+                },
+                'metadata': {'source': 'facebook_insights', 'api_version': 'v20.0'},
+            },
+        })
+    return records
+
+
+def encode_json(records: List[Dict[str, Any]]) -> List[bytes]:
+    """Encode records as the per-metric JSON events the producer sends today"""
+    messages = []
+    for record in records:
+        data = record['campaign_data']
+        event = FacebookCampaignEvent(
+            user_id=record['user_id'],
+            campaign_id=data['campaign_id'],
+            ad_set_id=data['ad_set_id'],
+            ad_id=data['ad_id'],
+            timestamp=datetime.fromtimestamp(record['timestamp']).isoformat(),
+            event_type='metrics_update',
+            metrics=data['metrics'],
+            metadata=data['metadata'],
+        )
+        key = f"{record['user_id']}:{event.campaign_id}".encode('utf-8')
+        messages.append(key + json.dumps(asdict(event)).encode('utf-8'))
+    return messages
+
+
+def consume(values: List[bytes]) -> float:
+    """Decode values and read the fields CampaignMetricsProcessor uses"""
+    checksum = 0.0
+    for raw in values:
+        decoded = decode_event_value(raw)
+        rows = decoded if not isinstance(decoded, dict) else (decoded,)
+        for row in rows:
+            metrics = row.get('metrics')
+            checksum += metrics.get('impressions', 0) + metrics.get('spend', 0.0)
+            row.get('campaign_id')
+    return checksum
+
+
+def run(metrics_count: int, batch_records: int, block_rows: int) -> Dict[str, Dict[str, float]]:
+    records = generate_records(metrics_count)
+    scale = 1_000_000 / metrics_count
+
+    # Per-metric JSON: one record each, Kafka compresses producer batches
+    json_messages = encode_json(records)
+    json_raw = sum(len(m) for m in json_messages)
+    json_wire = sum(
+        len(gzip.compress(b''.join(json_messages[i:i + batch_records])))
+        for i in range(0, len(json_messages), batch_records)
+    )
+    json_values = [m[m.index(b'{'):] for m in json_messages]
+
+    # Columnar blocks: one record per block, already compressed
+    blocks = [
+        encode_campaign_block('user_1', records[i:i + block_rows])
+        for i in range(0, len(records), block_rows)
+    ]
+    block_wire = sum(len(b) + len(b'user_1') for b in blocks)
+
+    start = time.process_time()
+    json_checksum = consume(json_values)
+    json_cpu = time.process_time() - start
+
+    start = time.process_time()
+    block_checksum = consume(blocks)
+    block_cpu = time.process_time() - start
+
+    if abs(json_checksum - block_checksum) > 1e-6 * abs(json_checksum):
+        raise AssertionError("Block rows do not match JSON events")
+
+    return {
+        'json': {
+            'records_per_million': 1_000_000,
+            'raw_mb_per_million': json_raw * scale / 1e6,
+            'broker_mb_per_million': json_wire * scale / 1e6,
+            'consumer_cpu_s_per_million': json_cpu * scale,
+        },
+        'blocks': {
+            'records_per_million': len(blocks) * scale,
+            'raw_mb_per_million': block_wire * scale / 1e6,
+            'broker_mb_per_million': block_wire * scale / 1e6,
+            'consumer_cpu_s_per_million': block_cpu * scale,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--metrics', type=int, default=200000, help='metrics to generate')
+    parser.add_argument('--batch-records', type=int, default=100,
+                        help='JSON records per compressed producer batch')
+    parser.add_argument('--block-rows', type=int, default=1000, help='rows per event block')
+    args = parser.parse_args()
+
+    results = run(args.metrics, args.batch_records, args.block_rows)
+
+    print(f"{'format':<8} {'records':>10} {'raw MB':>10} {'broker MB':>10} {'consumer CPU s':>15}  (per 1M metrics)")
+    for name, row in results.items():
+        print(f"{name:<8} {row['records_per_million']:>10.0f} {row['raw_mb_per_million']:>10.1f} "
+              f"{row['broker_mb_per_million']:>10.1f} {row['consumer_cpu_s_per_million']:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
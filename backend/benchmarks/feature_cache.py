@@ -0,0 +1,98 @@
+"""
+Feature Cache Benchmark
+Times a daily retrain window through the per-day Parquet feature cache (cold,
+unchanged, and slid forward one day) and checks it matches the uncached pipeline
+
+Usage:
+    python -m benchmarks.feature_cache --days 30 --campaigns 300
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.feature_cache import FeatureCache
+from tests.frames import generate_ad_frame
+
+
+def make_history(days: int, campaigns: int, missing: float, seed: int = 42) -> pd.DataFrame:
+    """Hourly rows for every campaign, with some conversions missing"""
+    df = generate_ad_frame(days * 24 * campaigns, campaigns=campaigns, seed=seed)
+    df['ctr'] = df['clicks'] / df['impressions']
+
+    rng = np.random.default_rng(seed)
+    df['conversions'] = df['conversions'].astype(np.float64)
+    df.loc[rng.random(len(df)) < missing, 'conversions'] = np.nan
+    return df
+
+
+def window(df: pd.DataFrame, first_day: int, days: int) -> pd.DataFrame:
+    """Rows of `days` days starting `first_day` days after the first one"""
+    day = (df['timestamp'] - df['timestamp'].min()).dt.days
+    return df[(day >= first_day) & (day < first_day + days)]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(days: int, campaigns: int, missing: float):
+    history = make_history(days + 1, campaigns, missing)
+    today = window(history, 0, days)
+    tomorrow = window(history, 1, days)
+
+    # Compare engineered features; missing-value handling and correlation
+    # pruning run on the result either way
+    plain = FacebookAdFeatureEngineer()
+    for engineer in [plain]:
+        engineer._handle_missing_values = lambda frame: frame
+        engineer._remove_correlated_features = lambda frame, fit=False: frame
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = FeatureCache(cache_dir)
+        cached = FacebookAdFeatureEngineer(feature_cache=cache)
+        cached._handle_missing_values = lambda frame: frame
+        cached._remove_correlated_features = lambda frame, fit=False: frame
+
+        expected, uncached_seconds = timed(plain.create_feature_pipeline, today)
+        cold, cold_seconds = timed(cached.create_feature_pipeline, today, user_id='bench')
+        warm, warm_seconds = timed(cached.create_feature_pipeline, today, user_id='bench')
+        pd.testing.assert_frame_equal(cold, expected)
+        pd.testing.assert_frame_equal(warm, expected)
+
+        misses = cache.stats['misses']
+        slid, slid_seconds = timed(cached.create_feature_pipeline, tomorrow, user_id='bench')
+        recomputed = cache.stats['misses'] - misses
+        pd.testing.assert_frame_equal(slid, plain.create_feature_pipeline(tomorrow))
+
+    print(f"window:          {days} days, {len(today):,} rows over {campaigns:,} campaigns")
+    print(f"uncached:        {uncached_seconds:.2f}s")
+    print(f"cold cache:      {cold_seconds:.2f}s ({days} days engineered)")
+    print(f"unchanged:       {warm_seconds:.2f}s (0 days engineered)")
+    print(f"next day:        {slid_seconds:.2f}s ({recomputed} days engineered)")
+    print(f"parity:          {expected.shape[1]} columns match in all three runs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--campaigns', type=int, default=300)
+    parser.add_argument('--missing', type=float, default=0.01,
+                        help='Fraction of rows with conversions missing')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore', FutureWarning)
+    run(args.days, args.campaigns, args.missing)
+
+
+if __name__ == '__main__':
+    main()
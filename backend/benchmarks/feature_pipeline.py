@@ -0,0 +1,74 @@
+"""
+Feature Pipeline Memory Benchmark
+Compares peak traced memory of create_feature_pipeline against chaining the
+public engineer_* stages (a full frame copy per stage); tests/test_frame_builder.py
+checks both agree
+
+Usage:
+    python -m benchmarks.feature_pipeline --rows 200000 --campaigns 2000
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+import warnings
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+from tests.legacy_features import chained_stages
+
+
+def measure(fn, *args, **kwargs):
+    """Run fn and return its result, seconds and peak traced bytes"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(rows: int, campaigns: int):
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    df['ctr'] = df['clicks'] / df['impressions']
+    input_mb = df.memory_usage(deep=True).sum() / 1e6
+
+    # Stop before missing-value handling and correlation pruning, which
+    # both variants share
+    engineer = FacebookAdFeatureEngineer()
+    engineer._handle_missing_values = lambda frame: frame
+    engineer._remove_correlated_features = lambda frame, fit=False: frame
+
+    expected, chained_seconds, chained_peak = measure(chained_stages, engineer, df)
+    del expected
+    result, builder_seconds, builder_peak = measure(
+        engineer.create_feature_pipeline, df, track_memory=False
+    )
+
+    output_mb = result.memory_usage(deep=True).sum() / 1e6
+    print(f"rows:            {rows:,} over {campaigns:,} campaigns")
+    print(f"input / output:  {input_mb:.0f} MB / {output_mb:.0f} MB")
+    print(f"chained stages:  peak {chained_peak / 1e6:.0f} MB above input, {chained_seconds:.1f}s")
+    print(f"column builder:  peak {builder_peak / 1e6:.0f} MB above input, {builder_seconds:.1f}s")
+
+    # Per-stage peaks as reported in the pipeline logs
+    logging.getLogger('ml.feature_engineering.frame_builder').setLevel(logging.INFO)
+    engineer.create_feature_pipeline(df, track_memory=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--campaigns', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    warnings.simplefilter('ignore', FutureWarning)
+
+    run(args.rows, args.campaigns)
+
+
+if __name__ == '__main__':
+    main()
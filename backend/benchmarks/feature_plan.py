@@ -0,0 +1,75 @@
+"""
+Feature Plan Benchmark
+Fits a FeaturePlan and compares per-call latency of its NumPy executor and
+of create_feature_pipeline for a single row dict and small batches. Parity
+with the pipeline is checked in tests/test_feature_plan.py
+
+Usage:
+    python -m benchmarks.feature_plan --rows 20000 --campaigns 200
+"""
+
+import argparse
+import logging
+import time
+import warnings
+
+import pandas as pd
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.feature_plan import FeaturePlanExecutor
+from tests.frames import generate_ad_frame
+
+
+def per_call(fn, calls: int) -> float:
+    """Best of three mean seconds per call"""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def run(rows: int, campaigns: int, batch_sizes):
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    df['ctr'] = df['clicks'] / df['impressions']
+    print(f"{rows:,} rows, {campaigns} campaigns")
+
+    engineer = FacebookAdFeatureEngineer()
+    executor = FeaturePlanExecutor(engineer.fit_feature_plan(df, fit=True))
+    later = generate_ad_frame(max(batch_sizes), campaigns=campaigns, seed=1, start='2024-03-01')
+    later['ctr'] = later['clicks'] / later['impressions']
+
+    row = {name: value for name, value in later.iloc[0].items()}
+    pipeline_seconds = per_call(lambda: engineer.create_feature_pipeline(pd.DataFrame([row])), 20)
+    executor_seconds = per_call(lambda: executor.transform_row(row), 200)
+    print(f"\n{'batch':>6} {'pipeline':>10} {'executor':>10} {'per row':>9} {'speedup':>8}")
+    print(f"{1:>6} {pipeline_seconds * 1e3:>8.2f}ms {executor_seconds * 1e6:>8.0f}us "
+          f"{executor_seconds * 1e6:>7.0f}us {pipeline_seconds / executor_seconds:>7.0f}x")
+
+    for size in batch_sizes:
+        if size == 1:
+            continue
+        batch = later.iloc[:size].reset_index(drop=True)
+        columns = {name: batch[name].to_numpy() for name in batch.columns}
+        pipeline_seconds = per_call(lambda: engineer.create_feature_pipeline(batch), 10)
+        executor_seconds = per_call(lambda: executor.transform(columns), 50)
+        print(f"{size:>6} {pipeline_seconds * 1e3:>8.2f}ms {executor_seconds * 1e3:>8.2f}ms "
+              f"{executor_seconds / size * 1e6:>7.0f}us {pipeline_seconds / executor_seconds:>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--campaigns', type=int, default=200)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 16, 256])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.campaigns, args.batch)
+
+
+if __name__ == '__main__':
+    main()
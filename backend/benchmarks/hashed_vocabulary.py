@@ -0,0 +1,137 @@
+"""
+Hashed Vocabulary Benchmark
+Compares exact, hashed and frequency-thresholded hybrid vocabularies for the
+high-cardinality CTR ids on synthetic click data with long-tailed ad ids and
+new ads at test time: embedding memory against held-out log loss and AUC.
+A one-hot logistic model (one weight per embedding row) stands in for the
+DeepFM, so only the encodings differ between runs; tests/test_ctr_preprocessor.py
+checks the hashed codes
+
+Usage:
+    python -m benchmarks.hashed_vocabulary --rows 300000 --ads 200000
+"""
+
+import argparse
+import logging
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import log_loss, roc_auc_score
+
+from ml.models.ctr_preprocessor import CTRPreprocessor, HIGH_CARDINALITY_FEATURES, SPARSE_FEATURES
+
+EMBEDDING_DIM = 8
+
+LOW_CARDINALITY = {
+    'placement': 5, 'device_type': 5, 'age_group': 6, 'gender': 3, 'interest_category': 40,
+    'geographic_location': 200, 'time_period': 4, 'day_of_week': 7, 'hour_of_day': 24,
+    'creative_format': 4, 'campaign_objective': 8, 'optimization_goal': 10,
+}
+
+
+def make_click_data(rows: int, ads: int, new_ad_share: float, seed: int = 0):
+    """
+    Train and test rows whose clicks depend on every sparse feature
+
+    Ads are drawn Zipf-like, so most of them are seen only a few times; ads
+    belong to ad sets and campaigns with their own effects. A share of test
+    rows come from ads never seen in training.
+    """
+    rng = np.random.default_rng(seed)
+    ad_set = rng.integers(0, ads // 5, ads)
+    campaign = ad_set % (ads // 50)
+    effects = {
+        'ad_id': rng.normal(0, 0.6, ads),
+        'ad_set_id': rng.normal(0, 0.4, ads // 5),
+        'campaign_id': rng.normal(0, 0.4, ads // 50),
+    }
+    effects.update({feat: rng.normal(0, 0.3, size) for feat, size in LOW_CARDINALITY.items()})
+
+    popularity = 1.0 / np.arange(1, ads + 1) ** 0.9
+    train_ads = ads - int(ads * 0.2)
+
+    def draw(n: int, new_share: float) -> pd.DataFrame:
+        ad = rng.choice(train_ads, n, p=popularity[:train_ads] / popularity[:train_ads].sum())
+        new = rng.random(n) < new_share
+        ad[new] = rng.integers(train_ads, ads, new.sum())
+        ids = {'ad_id': ad, 'ad_set_id': ad_set[ad], 'campaign_id': campaign[ad]}
+        logit = np.full(n, -3.5)
+        frame = {}
+        for feat in SPARSE_FEATURES:
+            values = ids[feat] if feat in ids else rng.integers(0, LOW_CARDINALITY[feat], n)
+            logit += effects[feat][values]
+            frame[feat] = np.char.add(f'{feat[:2]}', values.astype(str)).astype(object)
+        frame['clicked'] = rng.random(n) < 1.0 / (1.0 + np.exp(-logit))
+        return pd.DataFrame(frame)
+
+    return draw(rows, 0.0), draw(rows // 5, new_ad_share)
+
+
+def one_hot(preprocessor: CTRPreprocessor, frame: pd.DataFrame) -> sparse.csr_matrix:
+    """One column per embedding row of every sparse feature"""
+    encoded = preprocessor.transform(frame)
+    sizes = [preprocessor.vocabulary_size(feat) for feat in SPARSE_FEATURES]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    columns = np.stack([encoded[feat] + offset for feat, offset in zip(SPARSE_FEATURES, offsets)], axis=1)
+    rows = np.repeat(np.arange(len(frame)), len(SPARSE_FEATURES))
+    return sparse.csr_matrix((np.ones(columns.size), (rows, columns.ravel())),
+                             shape=(len(frame), int(np.sum(sizes))))
+
+
+def evaluate(name: str, preprocessor: CTRPreprocessor, train: pd.DataFrame, test: pd.DataFrame):
+    preprocessor.fit(train)
+    x_train, x_test = one_hot(preprocessor, train), one_hot(preprocessor, test)
+    model = LogisticRegression(C=0.5, max_iter=300).fit(x_train, train['clicked'])
+    predicted = model.predict_proba(x_test)[:, 1]
+
+    id_rows = sum(preprocessor.vocabulary_size(feat) for feat in HIGH_CARDINALITY_FEATURES)
+    all_rows = sum(preprocessor.vocabulary_size(feat) for feat in SPARSE_FEATURES)
+    batch = test.iloc[:4096]
+    start = time.perf_counter()
+    for _ in range(10):
+        preprocessor.transform(batch)
+    encode_us = (time.perf_counter() - start) / 10 / len(batch) * 1e6
+
+    print(f"{name:<34} {id_rows:>9,} {all_rows * EMBEDDING_DIM * 4 / 1e6:>9.2f} MB "
+          f"{log_loss(test['clicked'], predicted):>9.4f} {roc_auc_score(test['clicked'], predicted):>7.4f} "
+          f"{encode_us:>7.2f}us")
+
+
+def run(rows: int, ads: int, new_ad_share: float):
+    train, test = make_click_data(rows, ads, new_ad_share)
+    print(f"{len(train):,} train rows, {len(test):,} test rows ({new_ad_share:.0%} from new ads), "
+          f"{train['ad_id'].nunique():,} ads seen in training, "
+          f"{(train['ad_id'].value_counts() < 5).mean():.0%} of them fewer than 5 times")
+    print(f"\n{'vocabulary':<34} {'id rows':>9} {'embeddings':>12} {'log loss':>9} {'AUC':>7} {'encode':>9}")
+
+    def hashed(buckets: int, **options) -> CTRPreprocessor:
+        return CTRPreprocessor(hash_buckets={feat: buckets for feat in HIGH_CARDINALITY_FEATURES}, **options)
+
+    evaluate('exact', CTRPreprocessor(), train, test)
+    for buckets in [1 << 12, 1 << 14, 1 << 16]:
+        evaluate(f'hashed, {buckets:,} buckets', hashed(buckets), train, test)
+    for min_frequency, buckets in [(5, 1 << 12), (5, 1 << 14), (20, 1 << 12)]:
+        evaluate(f'min_frequency {min_frequency} + {buckets:,} buckets',
+                 hashed(buckets, min_frequency=min_frequency), train, test)
+    evaluate('top 10,000 (min 5) + 4,096 buckets',
+             hashed(1 << 12, min_frequency=5, max_vocabulary=10000), train, test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--ads', type=int, default=200000)
+    parser.add_argument('--new-ads', type=float, default=0.2, help='Share of test rows from unseen ads')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.ads, args.new_ads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Holiday Feature Benchmark
+Compares the row-wise holiday helpers of FacebookAdFeatureEngineer with the
+sorted-array lookup used by engineer_temporal_features; tests/test_holiday_features.py
+checks they agree
+
+Usage:
+    python -m benchmarks.holiday_features --rows 1000000
+"""
+
+import argparse
+import time
+
+import holidays
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.legacy_features import legacy_holiday_features
+
+
+def run(rows: int, country_code: str, start: str, end: str, reference_rows: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    first, last = pd.Timestamp(start).value, pd.Timestamp(end).value
+    timestamps = pd.Series(pd.to_datetime(rng.integers(first, last, rows)))
+
+    engineer = FacebookAdFeatureEngineer(country_code=country_code)
+
+    # The scalar helpers only see years already loaded into engineer.holidays;
+    # load the neighbouring years too so they see the same calendar
+    years = range(timestamps.dt.year.min() - 1, timestamps.dt.year.max() + 2)
+    engineer.holidays = holidays.country_holidays(country_code, years=years)
+
+    start_time = time.perf_counter()
+    engineer._holiday_features(timestamps)
+    vectorized_seconds = time.perf_counter() - start_time
+
+    # Row-wise is far slower, so time it on a sample and extrapolate
+    sample = timestamps.iloc[:reference_rows]
+    start_time = time.perf_counter()
+    legacy_holiday_features(engineer, sample)
+    row_wise_seconds = (time.perf_counter() - start_time) * rows / len(sample)
+
+    print(f"rows:       {rows:,} ({country_code}, {start} .. {end})")
+    print(f"row-wise:   {row_wise_seconds:.2f}s (extrapolated from {len(sample):,} rows)")
+    print(f"vectorized: {vectorized_seconds:.3f}s")
+    print(f"speedup:    {row_wise_seconds / vectorized_seconds:,.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--country', default='US')
+    parser.add_argument('--start', default='2022-01-01')
+    parser.add_argument('--end', default='2025-01-01')
+    parser.add_argument('--reference-rows', type=int, default=20000,
+                        help='rows timed with the row-wise helpers')
+    args = parser.parse_args()
+
+    run(args.rows, args.country, args.start, args.end, args.reference_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Incremental CTR Training Benchmark
+Compares daily full retraining over the lookback window with warm-started
+fine-tuning on the new day plus a replay sample of older days, on synthetic
+click data where campaigns launch and end every day and the other feature
+effects drift slowly: training time and next-day log loss and AUC over a week
+of daily updates, next to a model left stale. Checks that extended
+vocabularies keep every trained code and that grow_weights keeps the trained
+rows, and reports the drift signals used to choose a full retrain on an
+ordinary day and after an abrupt shift. A logistic model with one weight
+table per sparse feature, trained with Adam, stands in for the DeepFM
+
+Usage:
+    python -m benchmarks.incremental_ctr_training --rows-per-day 20000 --days 7
+"""
+
+import argparse
+import json
+import logging
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import log_loss, roc_auc_score
+
+from benchmarks.shared_ctr_model import one_hot
+from ml.models.ctr_preprocessor import CTRPreprocessor
+from ml.models.deepfm_numpy import grow_weights
+
+LOOKBACK_DAYS = 30
+FEATURES = ['campaign_id', 'ad_id', 'placement', 'device_type', 'age_group', 'hour_of_day']
+FEATURE_SIZES = {'placement': 5, 'device_type': 5, 'age_group': 6, 'hour_of_day': 24}
+
+
+def make_days(days: int, rows_per_day: int, new_campaigns: int, shift_day: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Click rows per day from campaigns that run for ten days
+
+    Each day new campaigns (with five ads each) launch; the effects of the
+    other features take a small random step every day and jump on shift_day.
+    """
+    rng = np.random.default_rng(seed)
+    effects = {feat: rng.normal(0, 0.4, size) for feat, size in FEATURE_SIZES.items()}
+    campaign_effects, frames = [], []
+    for day in range(days):
+        for feat in effects:
+            effects[feat] = effects[feat] + rng.normal(0, 0.8 if day == shift_day else 0.03, len(effects[feat]))
+        campaign_effects += [rng.normal(0, 0.6) for _ in range(new_campaigns)]
+        live = np.arange(max(0, len(campaign_effects) - 10 * new_campaigns), len(campaign_effects))
+        campaign = rng.choice(live, rows_per_day)
+        ad = campaign * 5 + rng.integers(0, 5, rows_per_day)
+        logit = -3.0 + np.asarray(campaign_effects)[campaign] + 0.3 * np.sin(ad * 12.9898)
+        frame = {'day': np.full(rows_per_day, day), 'campaign_id': np.char.add('c', campaign.astype(str)),
+                 'ad_id': np.char.add('a', ad.astype(str))}
+        for feat, size in FEATURE_SIZES.items():
+            values = rng.integers(0, size, rows_per_day)
+            logit += effects[feat][values]
+            frame[feat] = np.char.add(feat[:2], values.astype(str))
+        frame['clicked'] = rng.random(rows_per_day) < 1.0 / (1.0 + np.exp(-logit))
+        frames.append(pd.DataFrame({name: values.astype(object) if values.dtype.kind == 'U' else values
+                                    for name, values in frame.items()}))
+    return pd.concat(frames, ignore_index=True)
+
+
+class LogisticTables:
+    """Logistic model with one weight table per sparse feature and a bias, trained with Adam"""
+
+    def __init__(self, preprocessor: CTRPreprocessor, trained=None):
+        self.preprocessor = preprocessor
+        initial = [np.zeros(preprocessor.vocabulary_size(feat)) for feat in preprocessor.sparse_features]
+        initial.append(np.array([-3.0]))
+        self.weights = initial if trained is None else grow_weights(trained, initial)
+
+    def fit(self, frame: pd.DataFrame, epochs: int, learning_rate: float, batch_size: int = 2048,
+            l2: float = 1e-6) -> 'LogisticTables':
+        x = one_hot(self.preprocessor, self.preprocessor.transform(frame))
+        y = frame['clicked'].to_numpy(dtype=np.float64)
+        w = np.concatenate(self.weights)
+        first, second = np.zeros_like(w), np.zeros_like(w)
+        rng, step = np.random.default_rng(0), 0
+        for _ in range(epochs):
+            order = rng.permutation(len(y))
+            for start in range(0, len(y), batch_size):
+                rows = order[start:start + batch_size]
+                batch = x[rows]
+                error = 1.0 / (1.0 + np.exp(-(batch @ w[:-1] + w[-1]))) - y[rows]
+                gradient = np.append(batch.T @ error / len(rows) + l2 * w[:-1], error.mean())
+                step += 1
+                first = 0.9 * first + 0.1 * gradient
+                second = 0.999 * second + 0.001 * gradient ** 2
+                w -= learning_rate * (first / (1 - 0.9 ** step)) / (np.sqrt(second / (1 - 0.999 ** step)) + 1e-8)
+        self.weights = np.split(w, np.cumsum([len(table) for table in self.weights])[:-1])
+        return self
+
+    def predict(self, frame: pd.DataFrame) -> np.ndarray:
+        x = one_hot(self.preprocessor, self.preprocessor.transform(frame))
+        return 1.0 / (1.0 + np.exp(-(x @ np.concatenate(self.weights[:-1]) + self.weights[-1][0])))
+
+
+def check_extend(data: pd.DataFrame):
+    """Extended vocabularies keep trained codes; hashed ones are unchanged; grown weights keep trained rows"""
+    old, new = data[data['day'] < 5], data[data['day'] == 5]
+    preprocessor = CTRPreprocessor(sparse_features=FEATURES, dense_features=[],
+                                   hash_buckets={'ad_id': 64}, min_frequency=3).fit(old)
+    before = preprocessor.transform(old)
+    sizes = {feat: preprocessor.vocabulary_size(feat) for feat in FEATURES}
+    hashed_new = preprocessor.transform(new)['ad_id']
+
+    added = preprocessor.extend(new)
+    assert added['campaign_id'] > 0 and added['ad_id'] == 0
+    after = preprocessor.transform(old)
+    for feat in FEATURES:
+        np.testing.assert_array_equal(after[feat], before[feat], err_msg=feat)
+        assert preprocessor.vocabulary_size(feat) == sizes[feat] + added[feat]
+    codes = preprocessor.transform(new)
+    np.testing.assert_array_equal(codes['ad_id'], hashed_new)
+    assert (codes['campaign_id'] > 0).all()
+    assert sum(preprocessor.extend(new).values()) == 0
+    reloaded = CTRPreprocessor.from_dict(json.loads(json.dumps(preprocessor.to_dict())))
+    np.testing.assert_array_equal(reloaded.transform(new)['campaign_id'], codes['campaign_id'])
+
+    trained = [np.arange(sizes['campaign_id'] * 2, dtype=np.float32).reshape(-1, 2), np.ones(3)]
+    initial = [np.zeros((preprocessor.vocabulary_size('campaign_id'), 2), dtype=np.float32), np.zeros(3)]
+    grown = grow_weights(trained, initial)
+    np.testing.assert_array_equal(grown[0][:sizes['campaign_id']], trained[0])
+    assert (grown[0][sizes['campaign_id']:] == trained[0][0]).all() and (grown[1] == 1).all()
+
+
+def normalized_entropy(model: LogisticTables, frame: pd.DataFrame) -> float:
+    """Log loss over the entropy of the base rate, the classification analogue of normalized MSE"""
+    rate = frame['clicked'].mean()
+    return log_loss(frame['clicked'], model.predict(frame)) / -(rate * np.log(rate) + (1 - rate) * np.log(1 - rate))
+
+
+def drift_signals(model: LogisticTables, baseline: float, window: pd.DataFrame) -> str:
+    """Normalized entropy on the window over that at validation, and the largest share of unseen values"""
+    codes = model.preprocessor.transform(window)
+    unseen = max(float(np.mean(codes[feat] == 0)) for feat in FEATURES)
+    return f"normalized entropy {normalized_entropy(model, window) / baseline:.2f}x, unseen {unseen:.0%}"
+
+
+def score(model: LogisticTables, test: pd.DataFrame):
+    predicted = model.predict(test)
+    return log_loss(test['clicked'], predicted), roc_auc_score(test['clicked'], predicted)
+
+
+def run(rows_per_day: int, days: int, new_campaigns: int, full_epochs: int, fine_tune_epochs: int):
+    first = LOOKBACK_DAYS
+    shift_day = first + days + 1
+    data = make_days(shift_day + 1, rows_per_day, new_campaigns, shift_day)
+    check_extend(data)
+    print("parity: extended vocabularies keep every trained code, hashed features are unchanged, "
+          "grow_weights keeps trained rows and starts new ones at the unseen row")
+
+    def window(start: int, end: int) -> pd.DataFrame:
+        return data[(data['day'] >= start) & (data['day'] < end)]
+
+    def full(day: int) -> LogisticTables:
+        train = window(day + 1 - LOOKBACK_DAYS, day + 1)
+        preprocessor = CTRPreprocessor(sparse_features=FEATURES, dense_features=[]).fit(train)
+        return LogisticTables(preprocessor).fit(train, full_epochs, 0.05)
+
+    def incremental(model: LogisticTables, day: int) -> LogisticTables:
+        new = window(day, day + 1)
+        replay = window(day + 1 - LOOKBACK_DAYS, day).sample(n=len(new), random_state=day)
+        preprocessor = CTRPreprocessor.from_dict(model.preprocessor.to_dict())
+        preprocessor.extend(new)
+        return LogisticTables(preprocessor, trained=model.weights).fit(
+            pd.concat([new, replay], ignore_index=True), fine_tune_epochs, 0.01)
+
+    base = full(first - 1)
+    validation = normalized_entropy(base, window(first - 1, first))
+    models = {'stale': base, 'full retrain': base, 'incremental': base}
+    seconds = {name: 0.0 for name in models}
+    results = {name: [] for name in models}
+    print(f"\n{rows_per_day:,} rows per day, {LOOKBACK_DAYS}-day lookback, {new_campaigns} campaigns launched "
+          f"daily; {days} daily updates, each scored on the next day")
+    print(f"{'day':>4} {'new rows':>9} {'full s':>7} {'incr s':>7}   next-day log loss: "
+          f"{'stale':>7} {'full':>7} {'incr':>7}")
+    for day in range(first, first + days):
+        start = time.perf_counter()
+        models['full retrain'] = full(day)
+        seconds['full retrain'] += (full_seconds := time.perf_counter() - start)
+        start = time.perf_counter()
+        models['incremental'] = incremental(models['incremental'], day)
+        seconds['incremental'] += (incremental_seconds := time.perf_counter() - start)
+
+        test = window(day + 1, day + 2)
+        losses = []
+        for name, model in models.items():
+            results[name].append(score(model, test))
+            losses.append(results[name][-1][0])
+        print(f"{day:>4} {len(window(day, day + 1)):>9,} {full_seconds:>7.2f} {incremental_seconds:>7.2f}   "
+              f"{'':>19}{losses[0]:>7.4f} {losses[1]:>7.4f} {losses[2]:>7.4f}")
+
+    print(f"\n{'approach':<14} {'train s':>8} {'log loss':>9} {'AUC':>7}   (mean over {days} days)")
+    for name in models:
+        loss, auc = np.mean(results[name], axis=0)
+        print(f"{name:<14} {seconds[name]:>8.2f} {loss:>9.4f} {auc:>7.4f}")
+
+    # Each scored on the day after its last update
+    model = models['incremental']
+    updated = incremental(model, shift_day - 1)
+    print(f"\ndrift signals of the incremental model (normalized entropy {validation:.3f} at validation):")
+    print(f"  ordinary day:    {drift_signals(model, validation, window(shift_day - 1, shift_day))}")
+    print(f"  after the shift: {drift_signals(updated, validation, window(shift_day, shift_day + 1))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows-per-day', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=7, help='Daily updates to run')
+    parser.add_argument('--new-campaigns', type=int, default=20, help='Campaigns launched per day')
+    parser.add_argument('--full-epochs', type=int, default=5)
+    parser.add_argument('--fine-tune-epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows_per_day, args.days, args.new_campaigns, args.full_epochs, args.fine_tune_epochs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Lag Feature Benchmark
+Compares engineer_lag_features with the previous per-metric groupby and
+rolling polyfit implementation; tests/test_lag_features.py checks they agree
+
+Usage:
+    python -m benchmarks.lag_features --rows 1000000 --campaigns 10000
+"""
+
+import argparse
+import time
+import warnings
+
+import pandas as pd
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+from tests.legacy_features import legacy_lag_features
+
+
+def make_frame(rows: int, campaigns: int) -> pd.DataFrame:
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    engineer = FacebookAdFeatureEngineer()
+    df = engineer.engineer_performance_features(df)
+    # Shuffle so the sort inside the stage does real work
+    return df.sample(frac=1.0, random_state=0)
+
+
+def run(rows: int, campaigns: int, reference_campaigns: int):
+    df = make_frame(rows, campaigns)
+    engineer = FacebookAdFeatureEngineer()
+
+    start = time.perf_counter()
+    engineer.engineer_lag_features(df)
+    new_seconds = time.perf_counter() - start
+
+    # The legacy path spends ~1 polyfit per row, so optionally time it on a
+    # subset of campaigns and extrapolate by row count
+    reference = df
+    if reference_campaigns and reference_campaigns < campaigns:
+        kept = df['campaign_id'].drop_duplicates().sort_values().iloc[:reference_campaigns]
+        reference = df[df['campaign_id'].isin(kept)]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        start = time.perf_counter()
+        legacy_lag_features(reference)
+        legacy_seconds = (time.perf_counter() - start) * len(df) / len(reference)
+
+    print(f"rows:      {rows:,} over {campaigns:,} campaigns")
+    print(f"legacy:    {legacy_seconds:.1f}s" +
+          (f" (extrapolated from {len(reference):,} rows)" if reference is not df else ""))
+    print(f"optimized: {new_seconds:.2f}s")
+    print(f"speedup:   {legacy_seconds / new_seconds:,.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument('--reference-campaigns', type=int, default=0,
+                        help='run the legacy implementation on this many campaigns only (0 = all)')
+    args = parser.parse_args()
+
+    run(args.rows, args.campaigns, args.reference_campaigns)
+
+
+if __name__ == '__main__':
+    main()
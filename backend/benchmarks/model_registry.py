@@ -0,0 +1,122 @@
+"""
+Model Registry Benchmark
+Drives ModelRegistry with simulated loaders (a fixed load latency and model
+size) to show request latency with and without the registry over a skewed
+user mix, single-flight loading under concurrent cold requests, LRU eviction
+under the memory budget, and background refresh of a new model version
+
+Usage:
+    python -m benchmarks.model_registry --users 200 --requests 5000 --budget-models 50
+"""
+
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ml.models.model_registry import ModelLoader, ModelRegistry
+
+MODEL_BYTES = 20 * 1024 ** 2
+
+
+class SimulatedModels:
+    """Versioned per-user models that take load_seconds to load"""
+
+    def __init__(self, load_seconds: float, resolve_seconds: float):
+        self.load_seconds = load_seconds
+        self.resolve_seconds = resolve_seconds
+        self.versions = {}
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def resolve(self, user_id: str) -> str:
+        time.sleep(self.resolve_seconds)
+        return str(self.versions.get(user_id, 1))
+
+    def load(self, user_id: str, version: str):
+        time.sleep(self.load_seconds)
+        with self.lock:
+            self.loads += 1
+        return {'user_id': user_id, 'version': version}
+
+    def loader(self) -> ModelLoader:
+        return ModelLoader(self.resolve, self.load, lambda model: MODEL_BYTES)
+
+
+def skewed_users(users: int, requests: int, seed: int = 0) -> np.ndarray:
+    """Zipf-like request mix: a few busy users, a long tail"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, users + 1)
+    return rng.choice(users, requests, p=weights / weights.sum())
+
+
+def run(users: int, requests: int, budget_models: int, load_ms: float, resolve_ms: float):
+    mix = skewed_users(users, requests)
+
+    # Without a registry every request resolves and loads
+    per_request = (resolve_ms + load_ms) / 1e3
+    print(f"{requests:,} requests over {users} users, {budget_models} models fit the budget")
+    print(f"per-request loading:  {per_request * 1e3:.1f} ms/request (resolve + load on every request)")
+
+    models = SimulatedModels(load_ms / 1e3, resolve_ms / 1e3)
+    registry = ModelRegistry(memory_budget_bytes=budget_models * MODEL_BYTES, refresh_seconds=3600)
+    registry.register('ctr', models.loader())
+    start = time.perf_counter()
+    for user in mix:
+        registry.get('ctr', f'user_{user}')
+    elapsed = time.perf_counter() - start
+    status = registry.status()
+    print(f"registry:             {elapsed / requests * 1e3:.2f} ms/request, {models.loads} loads, "
+          f"{status['hits'] / requests:.0%} hits, {status['evictions']} evictions, "
+          f"{status['memory_bytes'] / MODEL_BYTES:.0f} models held")
+    assert status['memory_bytes'] <= budget_models * MODEL_BYTES
+
+    # Concurrent requests for a cold user share one load
+    models = SimulatedModels(load_ms / 1e3, resolve_ms / 1e3)
+    registry = ModelRegistry(memory_budget_bytes=budget_models * MODEL_BYTES, refresh_seconds=3600)
+    registry.register('ctr', models.loader())
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: registry.get('ctr', 'cold_user'), range(32)))
+        elapsed = time.perf_counter() - start
+    assert models.loads == 1 and all(result is results[0] for result in results)
+    print(f"single-flight:        32 concurrent cold requests, {models.loads} load, {elapsed * 1e3:.0f} ms")
+
+    # A new version is picked up in the background; requests keep the old
+    # model meanwhile instead of waiting on the load
+    models = SimulatedModels(load_ms / 1e3, resolve_ms / 1e3)
+    registry = ModelRegistry(memory_budget_bytes=budget_models * MODEL_BYTES, refresh_seconds=0.05)
+    registry.register('ctr', models.loader())
+    registry.get('ctr', 'user_0')
+    models.versions['user_0'] = 2
+    time.sleep(0.06)
+    start = time.perf_counter()
+    served = registry.get('ctr', 'user_0')['version']
+    stale_ms = (time.perf_counter() - start) * 1e3
+    deadline = time.monotonic() + 10
+    while registry.get('ctr', 'user_0')['version'] != '2' and time.monotonic() < deadline:
+        time.sleep(0.005)
+    print(f"background refresh:   stale request served version {served} in {stale_ms:.2f} ms, "
+          f"then version {registry.get('ctr', 'user_0')['version']} after "
+          f"{registry.status()['refreshes']} refresh")
+    registry.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--budget-models', type=int, default=50)
+    parser.add_argument('--load-ms', type=float, default=20.0, help='Simulated model load time')
+    parser.add_argument('--resolve-ms', type=float, default=2.0, help='Simulated latest-version lookup')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    run(args.users, args.requests, args.budget_models, args.load_ms, args.resolve_ms)
+
+
+if __name__ == '__main__':
+    main()
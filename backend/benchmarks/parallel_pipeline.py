@@ -0,0 +1,74 @@
+"""
+Parallel Feature Pipeline Benchmark
+Runs create_feature_pipeline serially and campaign-sharded over a process pool
+for a range of worker counts and reports the speedup per core count;
+tests/test_parallel_pipeline.py checks the outputs are equal
+
+Usage:
+    python -m benchmarks.parallel_pipeline --rows 400000 --workers 1 2 4 8
+"""
+
+import argparse
+import logging
+import os
+import time
+import warnings
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.parallel_pipeline import ParallelFeaturePipeline, available_cpus
+from tests.frames import generate_ad_frame
+
+
+def run(rows: int, campaigns: int, workers_list, repeats: int):
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    df['ctr'] = df['clicks'] / df['impressions']
+    engineer = FacebookAdFeatureEngineer()
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return result, min(times)
+
+    _, serial_seconds = best_of(lambda: engineer.create_feature_pipeline(df))
+
+    cpus = available_cpus()
+    print(f"{rows:,} rows, {campaigns} campaigns, {cpus} usable of {os.cpu_count()} CPUs")
+    if cpus < 2:
+        print("one usable CPU: rows above 1 worker measure pool overhead, not scaling")
+    print(f"{'workers':>8} {'seconds':>8} {'speedup':>8} {'scatter':>8} {'map':>8} {'reduce':>8}  shards")
+    print(f"{'serial':>8} {serial_seconds:>7.2f}s {1.0:>7.2f}x")
+
+    for workers in workers_list:
+        pipeline = ParallelFeaturePipeline(engineer, workers=workers)
+
+        def parallel():
+            features = pipeline.engineer_features(df)
+            features = engineer._handle_missing_values(features)
+            return engineer._remove_correlated_features(features)
+
+        _, seconds = best_of(parallel)
+
+        run_stats = pipeline.last_run
+        print(f"{workers:>8} {seconds:>7.2f}s {serial_seconds / seconds:>7.2f}x "
+              f"{run_stats['scatter_seconds']:>7.2f}s {run_stats['map_seconds']:>7.2f}s "
+              f"{run_stats['reduce_seconds']:>7.2f}s  {run_stats['shards']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=400000)
+    parser.add_argument('--campaigns', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.rows, args.campaigns, args.workers, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
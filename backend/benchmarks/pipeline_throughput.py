@@ -0,0 +1,75 @@
+"""
+Pipeline Throughput Benchmark
+Runs FacebookDataStreamingService end to end in one process against the
+embedded log broker and reports producer and end-to-end throughput
+
+Usage:
+    python -m benchmarks.pipeline_throughput --metrics 100000 --event-blocks
+"""
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from services.streaming_service import FacebookDataStreamingService, StreamingConfig
+from benchmarks.event_blocks import generate_records
+
+
+async def run(metrics_count: int, request_size: int, event_blocks: bool, data_dir: str):
+    config = StreamingConfig(
+        kafka_bootstrap_servers=[f'embedded://{data_dir}'],
+        consumer_group_id='pipeline-benchmark',
+        health_check_interval=0,
+        auto_restart_on_failure=False,
+        use_event_blocks=event_blocks,
+    )
+    service = FacebookDataStreamingService(config)
+    if not await service.start():
+        raise RuntimeError("Streaming service failed to start")
+
+    campaigns = [r['campaign_data'] for r in generate_records(metrics_count)]
+
+    start = time.perf_counter()
+    sent = 0
+    for i in range(0, len(campaigns), request_size):
+        results = await service.stream_campaign_data('user_1', campaigns[i:i + request_size])
+        sent += results['success']
+    produce_seconds = time.perf_counter() - start
+
+    # Wait for the consumer thread to catch up
+    consumer = service.consumer
+    while consumer.messages_processed + consumer.messages_failed < sent:
+        await asyncio.sleep(0.05)
+    end_to_end_seconds = time.perf_counter() - start
+
+    await service.stop()
+
+    print(f"format:            {'event blocks' if event_blocks else 'json events'}")
+    print(f"metrics delivered: {sent}")
+    print(f"kafka records:     {service.producer.messages_sent}")
+    print(f"producer:          {sent / produce_seconds:,.0f} metrics/s")
+    print(f"end to end:        {sent / end_to_end_seconds:,.0f} metrics/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--metrics', type=int, default=100000)
+    parser.add_argument('--request-size', type=int, default=500,
+                        help='metrics per stream_campaign_data call')
+    parser.add_argument('--event-blocks', action='store_true', help='use columnar event blocks')
+    parser.add_argument('--data-dir', help='broker directory (default: fresh temp dir)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.data_dir:
+        asyncio.run(run(args.metrics, args.request_size, args.event_blocks, args.data_dir))
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            asyncio.run(run(args.metrics, args.request_size, args.event_blocks, data_dir))
+
+
+if __name__ == '__main__':
+    main()
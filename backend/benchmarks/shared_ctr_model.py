@@ -0,0 +1,223 @@
+"""
+Shared CTR Model Benchmark
+Compares one CTR model per tenant with a single shared model that embeds the
+tenant (user_id) as a sparse feature, and with the hybrid that serves only the
+largest tenants from dedicated models, on synthetic click data from a few
+large and many small tenants whose responses partly differ. Reports total
+training time, the float32 weights a DeepFM of each preprocessor's
+vocabularies would hold, and held-out log loss and AUC by tenant size,
+including tenants that were not in the training data. A one-hot logistic
+model stands in for the DeepFM, as in the hashed vocabulary benchmark
+
+Usage:
+    python -m benchmarks.shared_ctr_model --tenants 300 --large 5
+"""
+
+import argparse
+import logging
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import log_loss, roc_auc_score
+
+from ml.models.ctr_preprocessor import CTRPreprocessor, SPARSE_FEATURES, TENANT_FEATURE
+from ml.models.model_registry import SHARED_CTR_MODEL, ctr_model_owner
+
+EMBEDDING_DIM = 8
+HIDDEN_UNITS = (256, 128, 64)
+TENANT_DROPOUT = 0.05
+
+FEATURE_SIZES = {'placement': 5, 'device_type': 5, 'age_group': 6, 'gender': 3,
+                 'hour_of_day': 24, 'day_of_week': 7}
+
+SIZE_BUCKETS = [('small (<500 rows)', 0, 500), ('medium (500-5k)', 500, 5000), ('large (>5k)', 5000, np.inf)]
+
+
+def make_tenant_data(tenants: int, large: int, large_rows: int, new_tenants: int, seed: int = 0):
+    """
+    Train and test rows of tenants with shared and tenant-specific click responses
+
+    Every tenant has its own base rate and campaigns, and deviates from the
+    common placement and device effects; small tenants have a few dozen to
+    a few thousand rows. Test rows include tenants absent from training.
+    """
+    rng = np.random.default_rng(seed)
+    shared = {feat: rng.normal(0, 0.4, size) for feat, size in FEATURE_SIZES.items()}
+    sizes = np.concatenate([np.full(large, large_rows),
+                            np.clip(rng.lognormal(5.5, 1.1, tenants - large), 30, 4000).astype(int)])
+
+    trains, tests = [], []
+    for tenant, rows in enumerate(np.concatenate([sizes, np.full(new_tenants, 500)])):
+        name = f"tenant_{tenant}"
+        deviation = {feat: rng.normal(0, 0.5, FEATURE_SIZES[feat]) for feat in ('placement', 'device_type')}
+        campaigns = rng.normal(0, 0.3, rng.integers(3, 30))
+        n = int(rows * 1.25)
+        logit = np.full(n, -3.2 + rng.normal(0, 0.5))
+        frame = {TENANT_FEATURE: np.full(n, name, dtype=object)}
+        for feat, size in FEATURE_SIZES.items():
+            values = rng.integers(0, size, n)
+            logit += shared[feat][values] + (deviation[feat][values] if feat in deviation else 0)
+            frame[feat] = np.char.add(feat[:2], values.astype(str)).astype(object)
+        campaign = rng.integers(0, len(campaigns), n)
+        logit += campaigns[campaign]
+        frame['campaign_id'] = np.char.add(f"{name}_c", campaign.astype(str)).astype(object)
+        frame['clicked'] = rng.random(n) < 1.0 / (1.0 + np.exp(-logit))
+        frame = pd.DataFrame(frame)
+        if tenant >= tenants:
+            tests.append(frame.iloc[:n // 5])
+        else:
+            trains.append(frame.iloc[:rows])
+            tests.append(frame.iloc[rows:])
+    return pd.concat(trains, ignore_index=True), pd.concat(tests, ignore_index=True)
+
+
+def one_hot(preprocessor: CTRPreprocessor, encoded: dict) -> sparse.csr_matrix:
+    """One column per embedding row of every sparse feature"""
+    features = preprocessor.sparse_features
+    sizes = [preprocessor.vocabulary_size(feat) for feat in features]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    columns = np.stack([encoded[feat] + offset for feat, offset in zip(features, offsets)], axis=1)
+    rows = np.repeat(np.arange(len(columns)), len(features))
+    return sparse.csr_matrix((np.ones(columns.size), (rows, columns.ravel())),
+                             shape=(len(columns), int(np.sum(sizes))))
+
+
+def deepfm_bytes(preprocessor: CTRPreprocessor) -> int:
+    """float32 weights of a DeepFM over the preprocessor's inputs: embeddings, linear weights, DNN"""
+    embedding_rows = sum(preprocessor.vocabulary_size(feat) for feat in preprocessor.sparse_features)
+    units = [len(preprocessor.sparse_features) * EMBEDDING_DIM + len(preprocessor.dense_features)]
+    units += list(HIDDEN_UNITS) + [1]
+    dnn = sum(n_in * n_out + n_out for n_in, n_out in zip(units, units[1:]))
+    return 4 * (embedding_rows * (EMBEDDING_DIM + 1) + len(preprocessor.dense_features) + dnn)
+
+
+class TenantModel:
+    """A preprocessor and the logistic stand-in fitted on it"""
+
+    def __init__(self, sparse_features, tenant_dropout: float = 0.0):
+        self.preprocessor = CTRPreprocessor(sparse_features=sparse_features)
+        self.tenant_dropout = tenant_dropout
+        self.model = None
+        self.base_rate = 0.0
+
+    def fit(self, frame: pd.DataFrame) -> 'TenantModel':
+        self.preprocessor.fit(frame)
+        encoded = self.preprocessor.transform(frame)
+        if self.tenant_dropout:
+            # As CTRPredictor._mask_tenants: the unknown code trains the new-tenant embedding
+            codes = encoded[TENANT_FEATURE].copy()
+            codes[np.random.default_rng(42).random(len(codes)) < self.tenant_dropout] = 0
+            encoded[TENANT_FEATURE] = codes
+        self.base_rate = (frame['clicked'].sum() + 1) / (len(frame) + 2)
+        if frame['clicked'].nunique() == 2:
+            self.model = LogisticRegression(C=0.5, max_iter=300).fit(one_hot(self.preprocessor, encoded),
+                                                                     frame['clicked'])
+        return self
+
+    def predict(self, frame: pd.DataFrame) -> np.ndarray:
+        if self.model is None:
+            # No clicks (or no misses) to learn from
+            return np.full(len(frame), self.base_rate)
+        return self.model.predict_proba(one_hot(self.preprocessor, self.preprocessor.transform(frame)))[:, 1]
+
+
+def check_routing(train: pd.DataFrame, test: pd.DataFrame):
+    """Dedicated tenants keep their model, others get the shared one; unseen tenants encode as unknown"""
+    previous = os.environ.get('CTR_DEDICATED_TENANTS')
+    os.environ['CTR_DEDICATED_TENANTS'] = 'tenant_0, tenant_1'
+    try:
+        assert ctr_model_owner('tenant_0') == 'tenant_0'
+        assert ctr_model_owner('tenant_2') == SHARED_CTR_MODEL
+    finally:
+        if previous is None:
+            del os.environ['CTR_DEDICATED_TENANTS']
+        else:
+            os.environ['CTR_DEDICATED_TENANTS'] = previous
+
+    preprocessor = CTRPreprocessor(sparse_features=SPARSE_FEATURES + [TENANT_FEATURE]).fit(train)
+    seen = set(train[TENANT_FEATURE])
+    codes = preprocessor.transform(test)[TENANT_FEATURE]
+    unseen = ~test[TENANT_FEATURE].isin(seen).to_numpy()
+    assert unseen.any() and (codes[unseen] == 0).all() and (codes[~unseen] > 0).all()
+
+
+def run(tenants: int, large: int, large_rows: int, new_tenants: int):
+    train, test = make_tenant_data(tenants, large, large_rows, new_tenants)
+    check_routing(train, test)
+    rows = train[TENANT_FEATURE].value_counts()
+    print(f"{tenants} tenants, {len(train):,} train rows ({large} tenants of {large_rows:,} rows, "
+          f"median {int(rows.median())}), {len(test):,} test rows, {new_tenants} tenants only in test")
+    print("routing: dedicated tenants keep their models, the rest the shared one; "
+          "unseen tenants encode as the unknown tenant")
+
+    by_tenant = dict(tuple(train.groupby(TENANT_FEATURE, sort=False)))
+    dedicated = set(rows.index[:large])
+
+    per_tenant, fit_seconds = {}, {}
+    for tenant, frame in by_tenant.items():
+        start = time.perf_counter()
+        per_tenant[tenant] = TenantModel(SPARSE_FEATURES).fit(frame)
+        fit_seconds[tenant] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shared = TenantModel(SPARSE_FEATURES + [TENANT_FEATURE], tenant_dropout=TENANT_DROPOUT).fit(train)
+    shared_seconds = time.perf_counter() - start
+
+    per_tenant_bytes = {tenant: deepfm_bytes(model.preprocessor) for tenant, model in per_tenant.items()}
+    approaches = {
+        'per-tenant': (sum(fit_seconds.values()), len(per_tenant), sum(per_tenant_bytes.values()),
+                       lambda tenant: per_tenant.get(tenant)),
+        'shared': (shared_seconds, 1, deepfm_bytes(shared.preprocessor), lambda tenant: shared),
+        f'shared + {large} dedicated': (
+            shared_seconds + sum(fit_seconds[tenant] for tenant in dedicated), 1 + large,
+            deepfm_bytes(shared.preprocessor) + sum(per_tenant_bytes[tenant] for tenant in dedicated),
+            lambda tenant: per_tenant[tenant] if tenant in dedicated else shared),
+    }
+
+    test_rows = test[TENANT_FEATURE].map(rows).fillna(-1).to_numpy()
+    buckets = [(name, (test_rows >= low) & (test_rows < high)) for name, low, high in SIZE_BUCKETS]
+    buckets.append(('new tenants', test_rows < 0))
+
+    header = f"{'approach':<22} {'models':>6} {'train s':>8} {'DeepFM MB':>10}"
+    print(f"\n{header}   log loss / AUC by tenant size")
+    print(f"{'':<22} {'':>6} {'':>8} {'':>10}   " + "  ".join(f"{name:<19}" for name, _ in buckets))
+    for name, (seconds, models, nbytes, model_of) in approaches.items():
+        predicted = np.full(len(test), np.nan)
+        for tenant, rows_index in test.groupby(TENANT_FEATURE, sort=False).indices.items():
+            model = model_of(tenant)
+            if model is not None:
+                predicted[rows_index] = model.predict(test.iloc[rows_index])
+        scores = []
+        for _, mask in buckets:
+            scored = mask & ~np.isnan(predicted)
+            if not scored.any():
+                scores.append(f"{'-':<19}")
+                continue
+            clicked = test['clicked'].to_numpy()[scored]
+            scores.append(f"{log_loss(clicked, predicted[scored]):.4f} / {roc_auc_score(clicked, predicted[scored]):.4f}"
+                          .ljust(19))
+        print((f"{name:<22} {models:>6} {seconds:>8.2f} {nbytes / 1e6:>10.1f}   " + "  ".join(scores)).rstrip())
+    print("\nper-tenant models cannot score new tenants; the shared model scores them with the unknown tenant "
+          f"embedding, trained by masking {TENANT_DROPOUT:.0%} of rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=300)
+    parser.add_argument('--large', type=int, default=5, help='Tenants with many rows, served by dedicated models')
+    parser.add_argument('--large-rows', type=int, default=30000, help='Training rows of each large tenant')
+    parser.add_argument('--new-tenants', type=int, default=20, help='Tenants only in the test rows')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    warnings.simplefilter('ignore')
+    run(args.tenants, args.large, args.large_rows, args.new_tenants)
+
+
+if __name__ == '__main__':
+    main()
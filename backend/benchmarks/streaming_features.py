@@ -0,0 +1,61 @@
+"""
+Streaming Feature Benchmark
+Replays an insights frame record by record through IncrementalLagFeatureEngine
+and reports per-record update cost against batch engineer_lag_features
+(parity is covered by tests/test_streaming_features.py)
+
+Usage:
+    python -m benchmarks.streaming_features --rows 200000 --campaigns 2000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.streaming_features import IncrementalLagFeatureEngine, LAG_METRICS
+from tests.frames import generate_ad_frame
+
+
+def run(rows: int, campaigns: int, missing_fraction: float, seed: int = 7):
+    engineer = FacebookAdFeatureEngineer()
+    df = engineer.engineer_performance_features(generate_ad_frame(rows, campaigns=campaigns))
+
+    # Punch holes in the metrics so NaN handling is covered too
+    rng = np.random.default_rng(seed)
+    for metric in LAG_METRICS:
+        df[metric] = df[metric].astype(float).mask(rng.random(len(df)) < missing_fraction)
+
+    start = time.perf_counter()
+    engineer.engineer_lag_features(df)
+    batch_seconds = time.perf_counter() - start
+
+    # Records arrive in timestamp order, interleaved across campaigns
+    stream = df.sort_values('timestamp', kind='stable')
+    campaign_ids = stream['campaign_id'].tolist()
+    records = stream[LAG_METRICS].to_dict('records')
+
+    engine = IncrementalLagFeatureEngine()
+    start = time.perf_counter()
+    for campaign_id, record in zip(campaign_ids, records):
+        engine.update(campaign_id, record)
+    seconds = time.perf_counter() - start
+
+    print(f"records:    {rows:,} over {campaigns:,} campaigns ({missing_fraction:.0%} missing values)")
+    print(f"update:     {seconds / rows * 1e6:.1f} us/record ({rows / seconds:,.0f} records/s)")
+    print(f"batch:      {batch_seconds:.2f}s for the whole frame ({len(engine.feature_names)} features)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--campaigns', type=int, default=2000)
+    parser.add_argument('--missing-fraction', type=float, default=0.01)
+    args = parser.parse_args()
+
+    run(args.rows, args.campaigns, args.missing_fraction)
+
+
+if __name__ == '__main__':
+    main()
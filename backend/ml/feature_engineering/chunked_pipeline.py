@@ -0,0 +1,582 @@
+"""
+Chunked Feature Pipeline for AI-Buyer
+Out-of-core create_feature_pipeline over campaign-aligned chunks from ClickHouse or Parquet
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import logging
+
+from .correlation_pruner import StreamingCorrelation
+
+logger = logging.getLogger(__name__)
+
+
+def plan_campaign_chunks(campaign_rows: pd.Series, chunk_rows: int) -> List[List[Any]]:
+    """
+    Group campaigns into chunks of about chunk_rows rows, in campaign order
+
+    A campaign is never split across chunks, so one larger than chunk_rows
+    gets a chunk of its own. Rows without a campaign go in a last chunk of
+    their own, keyed by None.
+
+    Args:
+        campaign_rows: Row count per campaign_id
+        chunk_rows: Target rows per chunk
+
+    Returns:
+        Campaign ids of each chunk
+    """
+    missing = campaign_rows.index.isna()
+    chunks: List[List[Any]] = []
+    current: List[Any] = []
+    size = 0
+    for campaign, rows in campaign_rows[~missing].sort_index().items():
+        if current and size + rows > chunk_rows:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(campaign)
+        size += rows
+    if current:
+        chunks.append(current)
+    if missing.any():
+        chunks.append([None])
+    return chunks
+
+
+def sample_campaigns(campaign_rows: pd.Series, max_rows: int, seed: int = 0) -> pd.Series:
+    """
+    Row counts of randomly chosen whole campaigns, at most max_rows rows in all
+
+    Campaigns are taken in a seeded random order while they fit, so each
+    keeps every row its lag features need; rows without a campaign count
+    as one more campaign.
+
+    Args:
+        campaign_rows: Row count per campaign_id
+        max_rows: Most rows of the chosen campaigns
+        seed: Random seed of the order
+
+    Returns:
+        Row count per chosen campaign_id, in campaign order
+    """
+    if campaign_rows.sum() <= max_rows:
+        return campaign_rows
+    shuffled = campaign_rows.sort_index()
+    shuffled = shuffled.iloc[np.random.default_rng(seed).permutation(len(shuffled))]
+    keep = np.zeros(len(shuffled), dtype=bool)
+    total = 0
+    for i, rows in enumerate(shuffled.to_numpy()):
+        if total + rows <= max_rows:
+            keep[i] = True
+            total += rows
+    return shuffled[keep].sort_index()
+
+
+class ParquetChunkSource:
+    """
+    Raw rows from a Parquet file or directory
+
+    Rows are bucketed into one spill file per chunk in a single scan, so
+    each chunk is read once however the input is ordered.
+    """
+
+    def __init__(self, path: str, columns: Optional[List[str]] = None, batch_rows: int = 131072):
+        """
+        Args:
+            path: Parquet file or directory of Parquet files
+            columns: Columns to read (all by default)
+            batch_rows: Rows per scanned record batch
+        """
+        self.dataset = ds.dataset(path, format='parquet')
+        self.columns = columns
+        self.batch_rows = batch_rows
+
+    def campaign_rows(self) -> pd.Series:
+        """Row count per campaign_id"""
+        counts: Counter = Counter()
+        for batch in self.dataset.to_batches(columns=['campaign_id'], batch_size=self.batch_rows):
+            for item in pc.value_counts(batch.column(0)).to_pylist():
+                counts[item['values']] += item['counts']
+        return pd.Series(counts, dtype=np.int64)
+
+    def read_chunks(self, plan: List[List[Any]], spill_dir: str) -> Iterator[pd.DataFrame]:
+        """Yield the rows of each planned chunk, in input order"""
+        chunk_of = {campaign: i for i, campaign_ids in enumerate(plan) for campaign in campaign_ids}
+        null_chunk = chunk_of.get(None, -1)
+        bucket_dir = tempfile.mkdtemp(prefix='buckets-', dir=spill_dir)
+        paths = [os.path.join(bucket_dir, f'{i:06d}.parquet') for i in range(len(plan))]
+        writers: Dict[int, pq.ParquetWriter] = {}
+
+        try:
+            for batch in self.dataset.to_batches(columns=self.columns, batch_size=self.batch_rows):
+                table = pa.Table.from_batches([batch])
+                campaigns = pd.Series(table.column('campaign_id').to_pandas())
+                codes = campaigns.map(chunk_of).fillna(null_chunk).to_numpy(dtype=np.int64)
+
+                order = np.argsort(codes, kind='stable')
+                present, starts = np.unique(codes[order], return_index=True)
+                for code, start, end in zip(present, starts, list(starts[1:]) + [len(order)]):
+                    if code not in writers:
+                        writers[code] = pq.ParquetWriter(paths[code], table.schema)
+                    writers[code].write_table(table.take(order[start:end]))
+
+            for writer in writers.values():
+                writer.close()
+            writers.clear()
+
+            for path in paths:
+                chunk = pq.read_table(path, memory_map=True).to_pandas()
+                os.remove(path)
+                yield chunk
+        finally:
+            for writer in writers.values():
+                writer.close()
+            shutil.rmtree(bucket_dir, ignore_errors=True)
+
+
+class ClickHouseChunkSource:
+    """
+    Raw rows of one user from ClickHouse, queried one chunk of campaigns at a time
+
+    Uses a clickhouse-connect client; filtering and ordering happen on the
+    server, so only one chunk is ever held in memory. Without a user_id every
+    tenant's rows are read, each carrying its tenant in the user_id column.
+    """
+
+    def __init__(self,
+                 client,
+                 user_id: Optional[str],
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 table: str = 'aibuyer.campaign_metrics',
+                 columns: Optional[List[str]] = None):
+        """
+        Args:
+            client: clickhouse_connect client
+            user_id: Tenant whose rows are read (None for all tenants)
+            start: First timestamp to include
+            end: Timestamp to stop before
+            table: Source table
+            columns: Columns to select (all by default)
+        """
+        self.client = client
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+        self.table = table
+        self.columns = columns
+        if user_id is None and columns and 'user_id' not in columns:
+            self.columns = ['user_id'] + list(columns)
+
+    def _where(self) -> str:
+        clauses = ['user_id = {user_id:String}'] if self.user_id is not None else ['1']
+        if self.start is not None:
+            clauses.append('timestamp >= {start:DateTime64(3)}')
+        if self.end is not None:
+            clauses.append('timestamp < {end:DateTime64(3)}')
+        return ' AND '.join(clauses)
+
+    def _parameters(self) -> Dict[str, Any]:
+        return {'user_id': self.user_id, 'start': self.start, 'end': self.end}
+
+    def campaign_rows(self) -> pd.Series:
+        """Row count per campaign_id"""
+        counts = self.client.query_df(
+            f"SELECT campaign_id, count() AS row_count FROM {self.table} "
+            f"WHERE {self._where()} GROUP BY campaign_id",
+            parameters=self._parameters()
+        )
+        return counts.set_index('campaign_id')['row_count'].astype(np.int64)
+
+    def read_chunks(self, plan: List[List[Any]], spill_dir: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """Yield the rows of each planned chunk"""
+        columns = ', '.join(self.columns) if self.columns else '*'
+        for campaign_ids in plan:
+            yield self.client.query_df(
+                f"SELECT {columns} FROM {self.table} "
+                f"WHERE {self._where()} AND campaign_id IN {{campaign_ids:Array(String)}} "
+                f"ORDER BY campaign_id, timestamp",
+                parameters={**self._parameters(), 'campaign_ids': list(campaign_ids)}
+            )
+
+
+class _RankSearch:
+    """
+    Exact k-th smallest value of a spilled column, in a few bounded-memory passes
+
+    Each pass either collects the values in the current range (once few
+    enough are left), samples them to pick pivots, or counts them per pivot
+    bucket to narrow the range to the bucket holding the rank.
+    """
+
+    def __init__(self, column: str, rank: int, count: int, collect_limit: int,
+                 sample_size: int = 65536, pivots: int = 1024, seed: int = 0):
+        self.column = column
+        self.rank = rank
+        self.count = count
+        self.collect_limit = collect_limit
+        self.sample_size = sample_size
+        self.num_pivots = pivots
+        self.rng = np.random.default_rng(seed)
+
+        # Open bounds of the current range (None is unbounded)
+        self.low: Optional[float] = None
+        self.high: Optional[float] = None
+        self.pivots: Optional[np.ndarray] = None
+        self.result: Optional[float] = None
+
+        self._values: List[np.ndarray] = []
+        self._bucket_counts: Optional[np.ndarray] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def observe(self, values: np.ndarray):
+        """Take the non-null values of one chunk"""
+        if self.low is not None:
+            values = values[values > self.low]
+        if self.high is not None:
+            values = values[values < self.high]
+
+        if self.count <= self.collect_limit:
+            self._values.append(values)
+        elif self.pivots is None:
+            keep = self.rng.random(len(values)) < self.sample_size / self.count
+            self._values.append(values[keep])
+        else:
+            # Bucket 2i holds values between pivots i-1 and i, bucket 2i+1 equals pivot i
+            index = np.searchsorted(self.pivots, values, side='left')
+            exact = self.pivots[np.minimum(index, len(self.pivots) - 1)] == values
+            codes = 2 * index + (exact & (index < len(self.pivots)))
+            counts = np.bincount(codes, minlength=2 * len(self.pivots) + 1)
+            self._bucket_counts = counts if self._bucket_counts is None else self._bucket_counts + counts
+
+    def finish_pass(self):
+        """Narrow the search with what the pass observed"""
+        if self.count <= self.collect_limit:
+            values = np.concatenate(self._values)
+            self.result = float(np.partition(values, self.rank)[self.rank])
+        elif self.pivots is None:
+            sample = np.sort(np.concatenate(self._values))
+            if len(sample):
+                positions = np.linspace(0, len(sample) - 1, min(self.num_pivots, len(sample))).astype(np.int64)
+                self.pivots = np.unique(sample[positions])
+        else:
+            counts = self._bucket_counts
+            cumulative = np.cumsum(counts)
+            bucket = int(np.searchsorted(cumulative, self.rank, side='right'))
+            below = int(cumulative[bucket - 1]) if bucket else 0
+            pivot = bucket // 2
+            if bucket % 2:
+                self.result = float(self.pivots[pivot])
+            else:
+                if pivot > 0:
+                    self.low = float(self.pivots[pivot - 1])
+                if pivot < len(self.pivots):
+                    self.high = float(self.pivots[pivot])
+                self.rank -= below
+                self.count = int(counts[bucket])
+                self.pivots = None
+            self._bucket_counts = None
+        self._values = []
+
+
+class ChunkedFeaturePipeline:
+    """
+    create_feature_pipeline for data that does not fit in memory
+
+    Chunks hold whole campaigns, so the per-row stages and the per-campaign
+    lag stage run on each chunk as they would on the full frame. The stages
+    and final steps that look across campaigns use a multi-pass plan over
+    spilled chunks:
+
+    1. Run every other stage per chunk, spill it, and collect the
+       competitive stats (sums, counts and distinct campaign counts).
+    2. Broadcast the combined competitive stats to each spilled chunk and
+       collect null counts and column sums.
+    3. Find exact medians and modes for missing-value filling, reading
+       only the columns with nulls.
+    4. Fit the engineer's correlation pruning, unless already fitted, from
+       pairwise-complete correlation sums over the filled numeric columns.
+    5. Fill, prune correlated columns and stream the chunks to the output.
+
+    Memory is bounded by the chunk size and the number of columns. The
+    output holds the rows of create_feature_pipeline in its order, without
+    the input index.
+    """
+
+    def __init__(self,
+                 engineer,
+                 chunk_rows: int = 100000,
+                 spill_dir: Optional[str] = None,
+                 block_rows: int = 16384,
+                 compression: Optional[str] = 'lz4',
+                 fit: bool = False):
+        """
+        Args:
+            engineer: FacebookAdFeatureEngineer whose stages produce the features
+            chunk_rows: Target rows per chunk
+            spill_dir: Directory for intermediate files (system temp by default)
+            block_rows: Rows per block in the correlation pass
+            compression: Parquet compression of spilled and output files
+            fit: Refit the engineer's correlation pruning even if fitted
+        """
+        self.engineer = engineer
+        self.chunk_rows = chunk_rows
+        self.spill_dir = spill_dir
+        self.block_rows = block_rows
+        self.compression = compression
+        self.fit = fit
+
+    def run(self, source, output_path: str) -> Dict[str, Any]:
+        """
+        Engineer features for every row of a source into a Parquet file
+
+        Args:
+            source: ParquetChunkSource, ClickHouseChunkSource or any object
+                with campaign_rows() and read_chunks(plan, spill_dir)
+            output_path: Output Parquet file
+
+        Returns:
+            Summary with row, chunk and column counts and per-pass seconds
+        """
+        from .facebook_features import FEATURE_STAGES, GLOBAL_STAGES, pipeline_columns
+
+        timings: Dict[str, float] = {}
+        spill_dir = tempfile.mkdtemp(prefix='feature-chunks-', dir=self.spill_dir)
+        try:
+            start = time.perf_counter()
+            plan = plan_campaign_chunks(source.campaign_rows(), self.chunk_rows)
+            if not plan:
+                raise ValueError("Source has no rows")
+            logger.info(f"Engineering features in {len(plan)} campaign-aligned chunks")
+
+            # Pass 1: stages that stay within a campaign
+            local_stages = [stage for stage in FEATURE_STAGES if stage not in GLOBAL_STAGES]
+            paths: List[str] = []
+            competitive_parts = []
+            stage_columns: Dict[str, List[str]] = {}
+            base_columns: List[str] = []
+            for i, chunk in enumerate(source.read_chunks(plan, spill_dir)):
+                builder = self.engineer.feature_builder(chunk)
+                self.engineer.run_stages(builder, local_stages)
+                competitive_parts.append(self.engineer.competitive_stats(builder))
+                for stats in builder.stage_stats:
+                    stage_columns.setdefault(stats['stage'], stats['columns'])
+                base_columns = base_columns or list(chunk.columns)
+
+                path = os.path.join(spill_dir, f'{i:06d}.parquet')
+                self._write(builder.build(), path)
+                paths.append(path)
+                del builder, chunk
+            timings['chunk_stages'] = time.perf_counter() - start
+
+            # Pass 2: cross-campaign stages, then column statistics
+            start = time.perf_counter()
+            competitive = self.engineer.combine_competitive_stats(competitive_parts)
+            rows = 0
+            nulls: Dict[str, int] = {}
+            finite_sums: Dict[str, float] = {}
+            finite_counts: Dict[str, int] = {}
+            schemas = []
+            for path in paths:
+                builder = self.engineer.feature_builder(pq.read_table(path, memory_map=True).to_pandas())
+                with builder.stage('competitive'):
+                    self.engineer._apply_competitive_stats(builder, competitive)
+                stage_columns.setdefault('competitive', builder.stage_stats[-1]['columns'])
+                frame = builder.build(columns=pipeline_columns(base_columns, stage_columns))
+                del builder
+
+                rows += len(frame)
+                for column, count in frame.isna().sum().items():
+                    nulls[column] = nulls.get(column, 0) + int(count)
+                for column in frame.columns:
+                    if pd.api.types.is_numeric_dtype(frame[column]) and not pd.api.types.is_bool_dtype(frame[column]):
+                        values = frame[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                        finite = values[np.isfinite(values)]
+                        finite_sums[column] = finite_sums.get(column, 0.0) + float(finite.sum())
+                        finite_counts[column] = finite_counts.get(column, 0) + len(finite)
+
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                schemas.append(table.schema)
+                pq.write_table(table, path, compression=self.compression)
+                del frame, table
+            schema = pa.unify_schemas(schemas, promote_options='permissive')
+            timings['global_stages'] = time.perf_counter() - start
+
+            # Column kinds as _handle_missing_values sees them on the full frame
+            empty = schema.empty_table().to_pandas()
+            numeric_columns = list(empty.select_dtypes(include=[np.number]).columns)
+            object_columns = list(empty.select_dtypes(include=['object']).columns)
+
+            # Pass 3: medians and modes for missing-value filling
+            start = time.perf_counter()
+            fills = self._fill_values(
+                paths, rows, nulls,
+                [c for c in numeric_columns if nulls[c]],
+                [c for c in object_columns if nulls[c]]
+            )
+            timings['fill_values'] = time.perf_counter() - start
+
+            # Pass 4: correlation of the filled numeric columns, unless the
+            # engineer's correlation pruning is already fitted
+            start = time.perf_counter()
+            pruner = self.engineer.correlation_pruner
+            if self.fit or not pruner.is_fitted:
+                shifts = {}
+                for column in numeric_columns:
+                    count = finite_counts.get(column, 0)
+                    total = finite_sums.get(column, 0.0)
+                    fill = fills.get(column)
+                    if fill is not None and np.isfinite(fill):
+                        count += nulls[column]
+                        total += nulls[column] * fill
+                    shifts[column] = total / count if count else 0.0
+                pruner.fit_correlation(self._correlation(paths, numeric_columns, fills, shifts), rows)
+            to_drop = [column for column in pruner.to_drop if column in schema.names]
+            if to_drop:
+                logger.info(f"Removing {len(to_drop)} highly correlated features: {to_drop}")
+            timings['correlation'] = time.perf_counter() - start
+
+            # Pass 5: fill, prune and stream to the output
+            start = time.perf_counter()
+            columns = [c for c in schema.names if c not in to_drop]
+            self._write_output(paths, output_path, fills, columns, schema)
+            timings['output'] = time.perf_counter() - start
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+        summary = {
+            'rows': rows,
+            'chunks': len(plan),
+            'columns': len(columns),
+            'dropped_columns': to_drop,
+            'seconds': timings,
+            'output_path': output_path,
+        }
+        logger.info(f"Chunked feature engineering completed: {rows} rows, {len(columns)} columns "
+                    f"in {sum(timings.values()):.1f}s")
+        return summary
+
+    def _write(self, frame: pd.DataFrame, path: str):
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path, compression=self.compression)
+
+    def _read_values(self, path: str, columns: List[str]) -> Dict[str, np.ndarray]:
+        """Non-null float64 values of spilled columns"""
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        values = {}
+        for column in columns:
+            array = pc.cast(table.column(column), pa.float64()).to_numpy()
+            values[column] = array[~np.isnan(array)]
+        return values
+
+    def _fill_values(self,
+                     paths: List[str],
+                     rows: int,
+                     nulls: Dict[str, int],
+                     numeric_columns: List[str],
+                     object_columns: List[str]) -> Dict[str, Any]:
+        """Exact column medians and modes, as _handle_missing_values computes them"""
+        fills: Dict[str, Any] = {}
+
+        # Modes: value counts merge across chunks
+        if object_columns:
+            counts = {column: Counter() for column in object_columns}
+            for path in paths:
+                table = pq.read_table(path, columns=object_columns, memory_map=True)
+                for column in object_columns:
+                    for item in pc.value_counts(table.column(column).drop_null()).to_pylist():
+                        counts[column][item['values']] += item['counts']
+            for column, column_counts in counts.items():
+                if not column_counts:
+                    fills[column] = 'unknown'
+                    continue
+                top = max(column_counts.values())
+                modes = [value for value, count in column_counts.items() if count == top]
+                try:
+                    fills[column] = sorted(modes)[0]
+                except TypeError:
+                    fills[column] = modes[0]
+
+        # Medians: the middle one or two ranks of each column's non-null values
+        searches: Dict[str, List[_RankSearch]] = {}
+        for column in numeric_columns:
+            count = rows - nulls[column]
+            if count == 0:
+                continue
+            ranks = sorted({(count - 1) // 2, count // 2})
+            searches[column] = [
+                _RankSearch(column, rank, count, collect_limit=self.chunk_rows) for rank in ranks
+            ]
+
+        passes = 0
+        while any(not s.done for column_searches in searches.values() for s in column_searches):
+            active = [c for c, column_searches in searches.items() if not all(s.done for s in column_searches)]
+            for path in paths:
+                for column, values in self._read_values(path, active).items():
+                    for search in searches[column]:
+                        if not search.done:
+                            search.observe(values)
+            for column in active:
+                for search in searches[column]:
+                    if not search.done:
+                        search.finish_pass()
+            passes += 1
+
+        for column, column_searches in searches.items():
+            fills[column] = sum(s.result for s in column_searches) / len(column_searches)
+        logger.info(f"Found {len(searches)} medians in {passes} passes")
+        return fills
+
+    def _filled(self, frame: pd.DataFrame, fills: Dict[str, Any]) -> pd.DataFrame:
+        fills = {c: v for c, v in fills.items() if c in frame.columns and frame[c].isna().any()}
+        return frame.fillna(fills) if fills else frame
+
+    def _correlation(self,
+                     paths: List[str],
+                     columns: List[str],
+                     fills: Dict[str, Any],
+                     shifts: Dict[str, float]) -> pd.DataFrame:
+        """Pairwise-complete Pearson correlation of the filled chunks, as DataFrame.corr computes it"""
+        stats = StreamingCorrelation(columns, shifts)
+        for path in paths:
+            frame = self._filled(pq.read_table(path, columns=columns, memory_map=True).to_pandas(), fills)
+            stats.update_frame(frame, self.block_rows)
+        return stats.correlation()
+
+    def _write_output(self,
+                      paths: List[str],
+                      output_path: str,
+                      fills: Dict[str, Any],
+                      columns: List[str],
+                      schema: pa.Schema):
+        """Fill, prune and append each spilled chunk to the output file"""
+        writer = None
+        try:
+            for path in paths:
+                frame = self._filled(pq.read_table(path, columns=columns, memory_map=True).to_pandas(), fills)
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    output_schema = pa.schema(
+                        [schema.field(c) for c in columns], metadata=table.schema.metadata
+                    )
+                    writer = pq.ParquetWriter(output_path, output_schema, compression=self.compression)
+                writer.write_table(table.cast(output_schema))
+                os.remove(path)
+        finally:
+            if writer is not None:
+                writer.close()
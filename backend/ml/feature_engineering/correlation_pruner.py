@@ -0,0 +1,245 @@
+"""
+Correlation Pruning for AI-Buyer
+Fit-once selection of highly correlated features, persisted with model artifacts
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingCorrelation:
+    """
+    One-pass pairwise-complete Pearson correlation over row blocks
+
+    Matches DataFrame.corr: a pair of columns is correlated over the rows
+    where both are finite. Values are shifted by a per-column offset (the
+    first block's means unless given) to keep the sums well conditioned.
+    Pair-specific counts and sums are only tracked for dirty columns, those
+    that have had a non-finite value; every other pair shares the row count.
+    Memory is O(columns²) whatever the number of rows.
+    """
+
+    def __init__(self, columns: List[str], shifts: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            columns: Column names, in the order of block columns
+            shifts: Offset per column; about the column mean is best
+        """
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.shift = None if shifts is None else np.array([shifts[c] for c in self.columns], dtype=np.float64)
+        self.rows = 0
+        self.counts = np.zeros(p)
+        self.sums = np.zeros(p)
+        self.squares = np.zeros(p)
+        self.products = np.zeros((p, p))
+        self.dirty = np.zeros(0, dtype=np.int64)
+        self.pair_counts = np.zeros((p, 0))
+        self.pair_sums = np.zeros((p, 0))
+        self.pair_squares = np.zeros((p, 0))
+
+    def update(self, block: np.ndarray):
+        """Add a float64 block of rows × columns"""
+        finite = np.isfinite(block)
+        if self.shift is None:
+            with np.errstate(invalid='ignore'):
+                means = np.where(finite, block, 0.0).sum(axis=0) / finite.sum(axis=0)
+            self.shift = np.where(np.isfinite(means), means, 0.0)
+
+        # Until now a newly dirty column was finite in every row, so its pair
+        # stats with each column are that column's own running stats
+        newly_dirty = np.flatnonzero(~finite.all(axis=0))
+        newly_dirty = newly_dirty[~np.isin(newly_dirty, self.dirty)]
+        if len(newly_dirty):
+            self.dirty = np.concatenate([self.dirty, newly_dirty])
+            self.pair_counts = np.hstack([self.pair_counts, np.repeat(self.counts[:, None], len(newly_dirty), axis=1)])
+            self.pair_sums = np.hstack([self.pair_sums, np.repeat(self.sums[:, None], len(newly_dirty), axis=1)])
+            self.pair_squares = np.hstack([self.pair_squares, np.repeat(self.squares[:, None], len(newly_dirty), axis=1)])
+
+        centered = np.where(finite, block - self.shift, 0.0)
+        squared = centered * centered
+        self.rows += len(block)
+        self.counts += finite.sum(axis=0)
+        self.sums += centered.sum(axis=0)
+        self.squares += squared.sum(axis=0)
+        self.products += centered.T @ centered
+        if len(self.dirty):
+            mask = finite[:, self.dirty].astype(np.float64)
+            self.pair_counts += finite.astype(np.float64).T @ mask
+            self.pair_sums += centered.T @ mask
+            self.pair_squares += squared.T @ mask
+
+    def update_frame(self, frame: pd.DataFrame, block_rows: int = 16384, positions: Optional[np.ndarray] = None):
+        """Add the rows of a frame holding the columns (or those at positions), block by block"""
+        # Rows and columns are selected per block; selecting them up front copies the frame
+        total = len(frame) if positions is None else len(positions)
+        for start in range(0, total, block_rows):
+            if positions is None:
+                block = frame.iloc[start:start + block_rows]
+            else:
+                block = frame.take(positions[start:start + block_rows])
+            self.update(block[self.columns].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def correlation(self) -> pd.DataFrame:
+        """Correlation matrix of the rows added so far"""
+        p = len(self.columns)
+        dirty = self.dirty
+
+        # [i, j] holds column i's count, sum and sum of squares over rows
+        # where both i and j are finite; non-finite values are zero in the sums
+        counts = np.full((p, p), float(self.rows))
+        column_sums = np.repeat(self.sums[:, None], p, axis=1)
+        column_squares = np.repeat(self.squares[:, None], p, axis=1)
+        if len(dirty):
+            counts[:, dirty] = self.pair_counts
+            counts[dirty, :] = self.pair_counts.T
+            column_sums[:, dirty] = self.pair_sums
+            column_squares[:, dirty] = self.pair_squares
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_i = column_sums / counts
+            mean_j = mean_i.T
+            covariance = self.products - counts * mean_i * mean_j
+            variance_i = column_squares - counts * mean_i * mean_i
+            # Constant columns leave only rounding noise in their variance
+            variance_i = np.where(variance_i > 1e-12 * column_squares, variance_i, 0.0)
+            divisor = np.sqrt(variance_i * variance_i.T)
+            corr = np.where((counts >= 1) & (divisor > 0), covariance / divisor, np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+
+def correlated_columns(corr_matrix: pd.DataFrame, threshold: float = 0.95) -> List[str]:
+    """Columns correlated above threshold with an earlier column, given |correlation|"""
+    # Find pairs of highly correlated features
+    upper_triangle = corr_matrix.where(
+        np.triu(np.ones(corr_matrix.shape), k=1).astype(bool)
+    )
+    return [column for column in upper_triangle.columns if any(upper_triangle[column] > threshold)]
+
+
+class CorrelationPruner:
+    """
+    Drops features highly correlated with an earlier feature
+
+    The drop list is chosen once by fit, from a streaming correlation over
+    all rows or over a uniform row sample, and then applied unchanged by
+    transform, so training and inference keep the same columns. It is saved
+    as JSON next to the model artifacts.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.95,
+                 sample_rows: Optional[int] = None,
+                 block_rows: int = 16384,
+                 seed: int = 42):
+        """
+        Args:
+            threshold: Absolute correlation above which a column is dropped
+            sample_rows: Fit on a uniform sample of this many rows (None for all)
+            block_rows: Rows per covariance update
+            seed: Seed of the row sample
+        """
+        self.threshold = threshold
+        self.sample_rows = sample_rows
+        self.block_rows = block_rows
+        self.seed = seed
+        self.columns: List[str] = []
+        self.to_drop: List[str] = []
+        self.fitted_rows = 0
+        self.fitted_at: Optional[str] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.fitted_at is not None
+
+    def fit(self, df: pd.DataFrame) -> 'CorrelationPruner':
+        """
+        Choose the columns to drop from the numeric columns of df
+
+        Args:
+            df: Engineered features
+
+        Returns:
+            self
+        """
+        stats = StreamingCorrelation(list(df.iloc[:0].select_dtypes(include=[np.number]).columns))
+        positions = None
+        if self.sample_rows is not None and len(df) > self.sample_rows:
+            rng = np.random.default_rng(self.seed)
+            positions = np.sort(rng.choice(len(df), self.sample_rows, replace=False))
+        stats.update_frame(df, self.block_rows, positions)
+        return self.fit_correlation(stats.correlation(), stats.rows)
+
+    def fit_chunks(self, chunks: Iterable[pd.DataFrame]) -> 'CorrelationPruner':
+        """
+        Choose the columns to drop from row chunks with the same columns
+
+        Args:
+            chunks: Engineered feature frames, e.g. read chunk by chunk
+
+        Returns:
+            self
+        """
+        stats = None
+        for chunk in chunks:
+            if stats is None:
+                stats = StreamingCorrelation(list(chunk.iloc[:0].select_dtypes(include=[np.number]).columns))
+            stats.update_frame(chunk, self.block_rows)
+        if stats is None:
+            raise ValueError("No rows to fit correlation pruning on")
+        return self.fit_correlation(stats.correlation(), stats.rows)
+
+    def fit_correlation(self, corr_matrix: pd.DataFrame, rows: int) -> 'CorrelationPruner':
+        """Choose the columns to drop from a precomputed correlation matrix"""
+        self.columns = list(corr_matrix.columns)
+        self.to_drop = correlated_columns(corr_matrix.abs(), self.threshold)
+        self.fitted_rows = rows
+        self.fitted_at = datetime.now().isoformat()
+        logger.info(f"Correlation pruning fitted on {rows} rows: dropping {len(self.to_drop)} "
+                    f"of {len(self.columns)} numeric features")
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Drop the fitted columns present in df"""
+        if not self.is_fitted:
+            raise ValueError("CorrelationPruner is not fitted")
+        to_drop = [column for column in self.to_drop if column in df.columns]
+        if to_drop:
+            logger.info(f"Removing {len(to_drop)} highly correlated features: {to_drop}")
+            df = df.drop(columns=to_drop)
+        return df
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'threshold': self.threshold,
+            'sample_rows': self.sample_rows,
+            'columns': self.columns,
+            'to_drop': self.to_drop,
+            'fitted_rows': self.fitted_rows,
+            'fitted_at': self.fitted_at,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'CorrelationPruner':
+        pruner = cls(threshold=state['threshold'], sample_rows=state.get('sample_rows'))
+        pruner.columns = list(state['columns'])
+        pruner.to_drop = list(state['to_drop'])
+        pruner.fitted_rows = state['fitted_rows']
+        pruner.fitted_at = state['fitted_at']
+        return pruner
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> 'CorrelationPruner':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,186 @@
+"""
+Creative Text Features for AI-Buyer
+Single-pass keyword scanning of ad copy, memoized per unique text
+"""
+
+import hashlib
+import os
+import re
+from itertools import islice
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sentiment approximation (simplified)
+POSITIVE_WORDS = ['great', 'amazing', 'best', 'love', 'perfect', 'excellent']
+NEGATIVE_WORDS = ['bad', 'worst', 'hate', 'terrible', 'awful']
+CALL_TO_ACTION_WORDS = ['buy', 'shop', 'learn', 'sign up', 'download', 'get', 'try']
+
+# Keyword groups scanned together: name -> (pattern, case-insensitive)
+TEXT_PATTERNS = {
+    'symbol': (r'[^\w\s]', False),
+    'call_to_action': ('|'.join(CALL_TO_ACTION_WORDS), True),
+    'positive': ('|'.join(POSITIVE_WORDS), True),
+    'negative': ('|'.join(NEGATIVE_WORDS), True),
+}
+
+# Columns of a scanned text, in memo order
+TEXT_FEATURES = [
+    'text_length', 'has_emoji', 'has_call_to_action', 'text_word_count',
+    'positive_sentiment_score', 'negative_sentiment_score'
+]
+
+# Features that are 0/1 flags rather than counts
+FLAG_FEATURES = ['has_emoji', 'has_call_to_action']
+
+
+def _group(pattern: str, ignore_case: bool) -> str:
+    return f'(?i:{pattern})' if ignore_case else f'(?:{pattern})'
+
+
+class CreativeTextScanner:
+    """
+    Text features of creative copy, one regex scan per unique text
+
+    A single compiled pattern finds every position where any keyword group
+    matches; a lookahead per group records which groups match there, so
+    overlapping keywords of different groups are all seen. Counts then keep
+    the non-overlapping matches of each group, left to right, exactly as
+    re.findall would. Results are memoized by a 64-bit hash of the text, so
+    the cost of a frame scales with its unique texts, and the memo can be
+    saved and loaded between runs.
+    """
+
+    def __init__(self, memo_path: Optional[str] = None, max_entries: int = 1000000):
+        """
+        Args:
+            memo_path: .npz file the memo is loaded from and saved to
+            max_entries: Memoized texts kept; the oldest are dropped first
+        """
+        groups = [_group(pattern, ignore_case) for pattern, ignore_case in TEXT_PATTERNS.values()]
+        captures = [
+            f'(?=(?P<{name}>{_group(pattern, ignore_case)})?)'
+            for name, (pattern, ignore_case) in TEXT_PATTERNS.items()
+        ]
+        # Candidate positions first, so positions without any keyword are skipped
+        self._scanner = re.compile('(?=' + '|'.join(groups) + ')' + ''.join(captures))
+        self.version = hashlib.sha256(
+            repr((TEXT_PATTERNS, TEXT_FEATURES)).encode('utf-8')
+        ).hexdigest()
+
+        self.memo_path = memo_path
+        self.max_entries = max_entries
+        self.memo: Dict[int, Tuple[int, ...]] = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+        if memo_path and os.path.exists(memo_path):
+            self.load(memo_path)
+
+    def scan(self, text: str) -> Tuple[int, ...]:
+        """Features of one text, in TEXT_FEATURES order"""
+        counts = {'positive': 0, 'negative': 0}
+        ends = {'positive': 0, 'negative': 0}
+        has_symbol = has_call_to_action = False
+
+        for match in self._scanner.finditer(text):
+            start = match.start()
+            has_symbol = has_symbol or match.group('symbol') is not None
+            has_call_to_action = has_call_to_action or match.group('call_to_action') is not None
+            for name in counts:
+                word = match.group(name)
+                if word is not None and start >= ends[name]:
+                    counts[name] += 1
+                    ends[name] = start + len(word)
+
+        return (
+            len(text), int(has_symbol), int(has_call_to_action), len(text.split()),
+            counts['positive'], counts['negative']
+        )
+
+    def features(self, texts: pd.Series) -> Dict[str, np.ndarray]:
+        """
+        Text features for a column of ad copy
+
+        Missing and non-string values get zeros; as with the pandas string
+        methods, counts are then float64 instead of int64.
+
+        Args:
+            texts: Ad text per row
+
+        Returns:
+            Dictionary of feature arrays, one value per row
+        """
+        codes, uniques = pd.factorize(texts)
+        uniques = np.asarray(uniques, dtype=object)
+        is_text = np.fromiter((isinstance(text, str) for text in uniques), dtype=bool, count=len(uniques))
+
+        # One row per unique text, plus a row of zeros for missing values
+        values = np.zeros((len(uniques) + 1, len(TEXT_FEATURES)), dtype=np.int64)
+        text_index = np.flatnonzero(is_text)
+        if len(text_index):
+            hashes = pd.util.hash_array(uniques[text_index])
+            misses = 0
+            for i, key in zip(text_index, hashes.tolist()):
+                row = self.memo.get(key)
+                if row is None:
+                    row = self.scan(uniques[i])
+                    self.memo[key] = row
+                    misses += 1
+                values[i] = row
+            self.stats['hits'] += len(text_index) - misses
+            self.stats['misses'] += misses
+            self._evict()
+
+        missing = codes < 0
+        missing[~missing] = ~is_text[codes[~missing]]
+        rows = values[np.where(missing, len(uniques), codes)]
+
+        result = {}
+        for j, name in enumerate(TEXT_FEATURES):
+            column = np.ascontiguousarray(rows[:, j])
+            if missing.any() and name not in FLAG_FEATURES:
+                result[name] = column.astype(np.float64)
+            else:
+                result[name] = column
+        return result
+
+    def _evict(self):
+        excess = len(self.memo) - self.max_entries
+        if excess > 0:
+            for key in list(islice(self.memo, excess)):
+                del self.memo[key]
+
+    def save(self, path: Optional[str] = None):
+        """Write the memo to an .npz file"""
+        path = path or self.memo_path
+        if not path:
+            raise ValueError("No memo path given")
+        hashes = np.fromiter(self.memo.keys(), dtype=np.uint64, count=len(self.memo))
+        values = np.array(list(self.memo.values()), dtype=np.int64).reshape(len(self.memo), len(TEXT_FEATURES))
+
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, version=np.array(self.version), hashes=hashes, values=values)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {len(self.memo)} memoized creative texts to {path}")
+
+    def load(self, path: str):
+        """Add the memo saved at path, unless it was made with other keywords"""
+        with np.load(path) as saved:
+            if str(saved['version']) != self.version:
+                logger.warning(f"Ignoring creative text memo {path} made with different keywords")
+                return
+            hashes, values = saved['hashes'], saved['values']
+        self.memo.update(zip(hashes.tolist(), map(tuple, values.tolist())))
+        self._evict()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'memo_entries': len(self.memo),
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,147 @@
+"""
+Dtype Plan for AI-Buyer
+Declarative compact dtypes for raw and engineered feature frames
+"""
+
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality string columns of raw insights and engineered features
+CATEGORY_COLUMNS = [
+    'campaign_id', 'ad_set_id', 'ad_id', 'audience_id', 'placement', 'device_type',
+    'device_platform', 'age_group', 'gender', 'country', 'city', 'ad_format', 'season',
+    'objective', 'campaign_objective', 'optimization_goal', 'creative_format',
+    'interest_category', 'geographic_location', 'time_period'
+]
+
+# Ratio, rate and score features; float32 keeps about 7 significant digits
+FLOAT32_COLUMNS = [
+    'ctr', 'cpc', 'cpm', 'ctr_*', 'cpc_*', 'cpm_*', '*_rate', '*_rate_*', '*_ratio',
+    '*_share_*', '*_score', '*_efficiency', '*_per_*', '*_vs_*', '*_avg', '*_sin', '*_cos',
+    '*_utilization', '*_balance', '*_diversity', '*_interaction'
+]
+
+# 0/1 indicator features
+FLAG_COLUMNS = ['is_*', 'has_*']
+
+# Bounded integer features, stored in the smallest integer type that fits
+SMALL_INT_COLUMNS = [
+    'hour', 'day_of_week', 'day_of_month', 'month', 'quarter', 'week_of_year',
+    'days_to_holiday', 'days_from_holiday', 'num_interests', 'text_word_count'
+]
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Bytes held by a frame's columns, counting Python string objects"""
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def _matches(name: str, patterns: List[str]) -> bool:
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+@dataclass
+class DtypePlan:
+    """
+    Compact dtypes by column name
+
+    Columns are matched against glob patterns. A rule only applies to
+    values it can hold exactly: categories to string columns, float32 to
+    float64 columns, flags and small ints to integer or boolean columns
+    without missing values and within range. Anything else is left as is.
+    Arithmetic on small ints wraps around in their dtype, so code deriving
+    new values from them widens first.
+    """
+    category: List[str] = field(default_factory=lambda: list(CATEGORY_COLUMNS))
+    float32: List[str] = field(default_factory=lambda: list(FLOAT32_COLUMNS))
+    flags: List[str] = field(default_factory=lambda: list(FLAG_COLUMNS))
+    small_ints: List[str] = field(default_factory=lambda: list(SMALL_INT_COLUMNS))
+    keep: List[str] = field(default_factory=list)
+
+    def target(self, name: str, values: pd.Series) -> Optional[Any]:
+        """Compact dtype for a column, or None to keep its dtype"""
+        if _matches(name, self.keep):
+            return None
+        dtype = values.dtype
+
+        if _matches(name, self.category):
+            if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                return 'category'
+            return None
+
+        if _matches(name, self.float32):
+            return np.float32 if dtype == np.float64 else None
+
+        is_integer = pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)
+        if not is_integer or not (_matches(name, self.flags) or _matches(name, self.small_ints)):
+            return None
+        if values.isna().any():
+            return None
+        if _matches(name, self.flags):
+            return np.int8 if values.isin([0, 1]).all() else None
+
+        low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+        for candidate in (np.int8, np.int16, np.int32):
+            info = np.iinfo(candidate)
+            if info.min <= low and high <= info.max:
+                return None if dtype == candidate else candidate
+        return None
+
+    def cast(self, name: str, values: pd.Series) -> pd.Series:
+        """One column in its planned dtype"""
+        dtype = self.target(name, values)
+        if dtype is None or values.dtype == dtype:
+            return values
+        return values.astype(dtype)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        A frame with the planned dtypes; unchanged columns are not copied
+
+        Args:
+            df: Raw or engineered frame
+
+        Returns:
+            Frame with compact columns, same values, index and column order
+        """
+        columns = {}
+        changed = 0
+        for name in df.columns:
+            values = df[name]
+            cast = self.cast(name, values)
+            changed += cast is not values
+            columns[name] = cast
+        if not changed:
+            return df
+        return pd.DataFrame(columns, index=df.index, copy=False)
+
+    def report(self, before: pd.DataFrame, after: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Memory of a frame before and after the plan
+
+        Returns:
+            Dictionary with total bytes and the changed columns' dtypes and bytes
+        """
+        columns = {}
+        for name in after.columns:
+            if name in before.columns and before[name].dtype != after[name].dtype:
+                columns[name] = {
+                    'from': str(before[name].dtype),
+                    'to': str(after[name].dtype),
+                    'bytes_before': int(before[name].memory_usage(index=False, deep=True)),
+                    'bytes_after': int(after[name].memory_usage(index=False, deep=True)),
+                }
+        before_bytes, after_bytes = frame_memory(before), frame_memory(after)
+        return {
+            'bytes_before': before_bytes,
+            'bytes_after': after_bytes,
+            'reduction': 1 - after_bytes / before_bytes if before_bytes else 0.0,
+            'columns': columns,
+        }
@@ -5,27 +5,363 @@ Advanced feature extraction and transformation for ML models
 
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime, timedelta
 import logging
 from sklearn.preprocessing import StandardScaler, RobustScaler, LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 import holidays
 
+from .correlation_pruner import CorrelationPruner
+from .creative_text import CreativeTextScanner
+from .dtype_plan import DtypePlan, frame_memory
+from .frame_builder import FeatureFrameBuilder
+
+if TYPE_CHECKING:
+    from .feature_cache import FeatureCache
+    from .feature_plan import FeaturePlan
+
 logger = logging.getLogger(__name__)
 
+# Sorted holiday lookup tables, cached per country code
+_HOLIDAY_TABLES: Dict[str, 'HolidayTable'] = {}
+
+# Days reported when no holiday is found near a date
+NO_HOLIDAY_DAYS = 365
+_NO_DAY = np.iinfo(np.int64).min
+
+# Bump when feature semantics change in a way the source fingerprint misses
+# (e.g. a dependency upgrade); cached feature partitions are keyed by it
+FEATURE_VERSION = 1
+
+# create_feature_pipeline stages, in order; each is a _add_<name>_features method
+FEATURE_STAGES = ['temporal', 'performance', 'competitive', 'audience', 'creative', 'lag', 'interaction']
+
+# Stages that aggregate across campaigns and days; every other stage only
+# looks at a row and, for lag features, earlier rows of its campaign
+GLOBAL_STAGES = ['competitive']
+
+# Metrics the lag stage creates lags and moving averages for, and 7-day trends for
+LAG_METRICS = ['ctr', 'cpc', 'conversions', 'spend', 'impressions', 'clicks']
+TREND_METRICS = ['ctr', 'conversions']
+TREND_WINDOW = 7
+
+# Row-level lookups of the audience and creative stages
+MAJOR_MARKETS = ['US', 'GB', 'CA', 'AU', 'DE', 'FR']
+MAJOR_CITIES = [
+    'New York', 'Los Angeles', 'London', 'Toronto', 'Sydney',
+    'Berlin', 'Paris', 'Tokyo', 'Seoul', 'Singapore'
+]
+DEVICE_PATTERNS = {'is_mobile': 'mobile|android|ios', 'is_desktop': 'desktop|windows|mac'}
+AD_FORMAT_PATTERNS = {
+    'is_video': 'video',
+    'is_carousel': 'carousel',
+    'is_single_image': 'single_image|image',
+    'is_collection': 'collection',
+}
+
+
+def pipeline_columns(base_columns: List[str], stage_columns: Dict[str, List[str]]) -> List[str]:
+    """
+    Output column order of create_feature_pipeline
+    
+    Args:
+        base_columns: Input frame columns
+        stage_columns: Columns added by each stage, as recorded in
+            FeatureFrameBuilder.stage_stats
+    """
+    return list(dict.fromkeys(
+        list(base_columns) + [col for stage in FEATURE_STAGES for col in stage_columns.get(stage, [])]
+    ))
+
+
+class HolidayTable:
+    """
+    Sorted holiday dates for a country over a range of years
+    
+    Dates are stored as int64 day numbers (days since 1970-01-01) so that
+    holiday features for a whole frame come from one np.searchsorted. The
+    year-boundary fallbacks reproduce FacebookAdFeatureEngineer's scalar
+    helpers: the earliest of the first 5 holidays of the next year and the
+    latest of the last 5 holidays of the previous year, in the order the
+    holidays package lists them.
+    """
+    
+    def __init__(self, country_code: str, first_year: int, last_year: int):
+        self.country_code = country_code
+        self.first_year = first_year
+        self.last_year = last_year
+        
+        # Neighbouring years are loaded so boundary lookups see them
+        calendar = holidays.country_holidays(country_code, years=range(first_year - 1, last_year + 2))
+        
+        by_year: Dict[int, List[int]] = {}
+        for holiday in calendar:
+            by_year.setdefault(holiday.year, []).append(self._day_number(holiday))
+        
+        self.days = np.array(sorted(d for days in by_year.values() for d in days), dtype=np.int64)
+        self.years = self._year_of(self.days)
+        
+        # Per data year: fallback day number, or _NO_DAY when there is none
+        years = range(first_year, last_year + 1)
+        self.next_year_fallback = np.array(
+            [min(by_year[y + 1][:5]) if by_year.get(y + 1) else _NO_DAY for y in years], dtype=np.int64
+        )
+        self.previous_year_fallback = np.array(
+            [max(by_year[y - 1][-5:]) if by_year.get(y - 1) else _NO_DAY for y in years], dtype=np.int64
+        )
+    
+    @staticmethod
+    def _day_number(day) -> int:
+        return int(np.datetime64(day, 'D').astype(np.int64))
+    
+    @staticmethod
+    def _year_of(day_numbers: np.ndarray) -> np.ndarray:
+        return day_numbers.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+    
+    def covers(self, first_year: int, last_year: int) -> bool:
+        return self.first_year <= first_year and last_year <= self.last_year
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'country_code': self.country_code,
+            'first_year': self.first_year,
+            'last_year': self.last_year,
+            'days': self.days.tolist(),
+            'next_year_fallback': self.next_year_fallback.tolist(),
+            'previous_year_fallback': self.previous_year_fallback.tolist(),
+        }
+    
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'HolidayTable':
+        """Rebuild a table without the holidays package, e.g. from a feature plan"""
+        table = cls.__new__(cls)
+        table.country_code = state['country_code']
+        table.first_year = state['first_year']
+        table.last_year = state['last_year']
+        table.days = np.array(state['days'], dtype=np.int64)
+        table.years = cls._year_of(table.days)
+        table.next_year_fallback = np.array(state['next_year_fallback'], dtype=np.int64)
+        table.previous_year_fallback = np.array(state['previous_year_fallback'], dtype=np.int64)
+        return table
+    
+    def features(self, day_numbers: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Holiday features for an array of day numbers
+        
+        Returns:
+            Dictionary with is_holiday, days_to_holiday and days_from_holiday arrays
+        """
+        years = self._year_of(day_numbers)
+        year_index = years - self.first_year
+        last = len(self.days) - 1
+        
+        if last < 0:
+            no_holiday = np.full(len(day_numbers), NO_HOLIDAY_DAYS, dtype=np.int64)
+            return {
+                'is_holiday': np.zeros(len(day_numbers), dtype=np.int64),
+                'days_to_holiday': no_holiday,
+                'days_from_holiday': no_holiday.copy(),
+            }
+        
+        # Next holiday on or after the date, within the same year
+        position = np.searchsorted(self.days, day_numbers, side='left')
+        candidate = np.minimum(position, last)
+        has_next = (position <= last) & (self.years[candidate] == years)
+        next_day = np.where(has_next, self.days[candidate], self.next_year_fallback[year_index])
+        
+        # Last holiday on or before the date, within the same year
+        position = np.searchsorted(self.days, day_numbers, side='right') - 1
+        candidate = np.maximum(position, 0)
+        has_previous = (position >= 0) & (self.years[candidate] == years)
+        previous_day = np.where(has_previous, self.days[candidate], self.previous_year_fallback[year_index])
+        
+        return {
+            'is_holiday': (has_previous & (previous_day == day_numbers)).astype(np.int64),
+            'days_to_holiday': np.where(next_day != _NO_DAY, next_day - day_numbers, NO_HOLIDAY_DAYS),
+            'days_from_holiday': np.where(previous_day != _NO_DAY, day_numbers - previous_day, NO_HOLIDAY_DAYS),
+        }
+
+
+def get_holiday_table(country_code: str, first_year: int, last_year: int) -> HolidayTable:
+    """Cached holiday table for a country covering at least the given years"""
+    table = _HOLIDAY_TABLES.get(country_code)
+    if table is None or not table.covers(first_year, last_year):
+        if table is not None:
+            first_year = min(first_year, table.first_year)
+            last_year = max(last_year, table.last_year)
+        table = HolidayTable(country_code, first_year, last_year)
+        _HOLIDAY_TABLES[country_code] = table
+    return table
+
+
+def _group_positions(codes: np.ndarray) -> np.ndarray:
+    """Position of each row within its run of equal group codes"""
+    index = np.arange(len(codes))
+    starts = np.ones(len(codes), dtype=bool)
+    starts[1:] = codes[1:] != codes[:-1]
+    return index - np.maximum.accumulate(np.where(starts, index, 0))
+
+
+def _rows_axis(array: np.ndarray, ndim: int) -> np.ndarray:
+    """A per-row array shaped to broadcast against values with a column per metric"""
+    return array.reshape((-1,) + (1,) * (ndim - 1))
+
+
+def _group_shift(values: np.ndarray, positions: np.ndarray, periods: int) -> np.ndarray:
+    """groupby().shift(periods) for rows sorted by group"""
+    if periods == 0:
+        return values.copy()
+    shifted = np.full(values.shape, np.nan)
+    shifted[periods:] = values[:-periods]
+    shifted[positions < periods] = np.nan
+    return shifted
+
+
+def _group_ffill(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """groupby().ffill() for rows sorted by group"""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    index = _rows_axis(np.arange(len(values)), values.ndim)
+    last_valid = np.maximum.accumulate(np.where(missing, -1, index), axis=0)
+    filled = np.take_along_axis(values, np.maximum(last_valid, 0), axis=0)
+    filled[last_valid < index - _rows_axis(positions, values.ndim)] = np.nan
+    return filled
+
+
+def _group_rolling_mean(values: np.ndarray, positions: np.ndarray, window: int) -> np.ndarray:
+    """groupby().rolling(window, min_periods=1).mean() for rows sorted by group"""
+    total = np.zeros(values.shape)
+    count = np.zeros(values.shape)
+    for offset in range(window):
+        shifted = _group_shift(values, positions, offset)
+        present = ~np.isnan(shifted)
+        total += np.where(present, shifted, 0.0)
+        count += present
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def _group_rolling_slope(values: np.ndarray,
+                         positions: np.ndarray,
+                         window: int,
+                         min_periods: int) -> np.ndarray:
+    """
+    Least-squares slope of each trailing window against 0..n-1, in closed form
+    
+    Equivalent to rolling(window, min_periods).apply(np.polyfit(range(len(x)), x, 1)[0])
+    within each group: slope = (n*Sxy - Sx*Sy) / (n*Sxx - Sx^2) with Sx and Sxx
+    fixed by the window length and Sy, Sxy built from rolling sums of y.
+    Windows containing NaN yield NaN.
+    """
+    n = _rows_axis(np.minimum(positions + 1, window).astype(np.float64), values.ndim)
+    sum_y = np.zeros(values.shape)
+    sum_offset_y = np.zeros(values.shape)
+    for offset in range(window):
+        shifted = np.where(offset < n, _group_shift(values, positions, offset), 0.0)
+        sum_y += shifted
+        sum_offset_y += offset * shifted
+    
+    # Row i - offset sits at x = n - 1 - offset inside its window
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    sum_xy = (n - 1) * sum_y - sum_offset_y
+    
+    slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+    return np.where(n < min_periods, np.nan, slope)
+
+
+def lag_feature_columns(values: Dict[str, np.ndarray],
+                        positions: np.ndarray,
+                        lag_periods: List[int],
+                        stacked: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Lag, moving average, percentage change and trend columns
+    
+    Args:
+        values: Float64 values per metric, for rows sorted by group and time
+        positions: Position of each row within its group
+        lag_periods: Lag periods to create
+        stacked: Compute all metrics at once as columns of one array; far
+            fewer NumPy calls for small batches, at the cost of a copy
+        
+    Returns:
+        New columns in pipeline order, aligned to the sorted rows
+    """
+    metrics = [metric for metric in LAG_METRICS if metric in values]
+    trend_metrics = [metric for metric in TREND_METRICS if metric in values]
+    
+    def blocks(names: List[str]):
+        if stacked and names:
+            return [(names, np.column_stack([values[name] for name in names]))]
+        return [([name], values[name]) for name in names]
+    
+    def add(names: List[str], suffix: str, result: np.ndarray):
+        for j, name in enumerate(names):
+            new_columns[f'{name}{suffix}'] = result[:, j] if result.ndim > 1 else result
+    
+    new_columns: Dict[str, np.ndarray] = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for names, block in blocks(metrics):
+            for lag in lag_periods:
+                # Lag features
+                add(names, f'_lag_{lag}', _group_shift(block, positions, lag))
+                
+                # Moving averages
+                add(names, f'_ma_{lag}', _group_rolling_mean(block, positions, lag))
+                
+                # Percentage change
+                if lag == 1:
+                    filled = _group_ffill(block, positions)
+                    add(names, '_pct_change', filled / _group_shift(filled, positions, 1) - 1)
+        
+        # Trend features
+        for names, block in blocks(trend_metrics):
+            # 7-day trend
+            add(names, '_trend_7d', _group_rolling_slope(block, positions, window=TREND_WINDOW, min_periods=3))
+    
+    # Pipeline order: each metric's lags, averages and change, then the trends
+    order = [
+        f'{metric}{suffix}' for metric in metrics for lag in lag_periods
+        for suffix in [f'_lag_{lag}', f'_ma_{lag}'] + (['_pct_change'] if lag == 1 else [])
+    ] + [f'{metric}_trend_7d' for metric in trend_metrics]
+    return {name: new_columns[name] for name in order}
+
+
 class FacebookAdFeatureEngineer:
     """
     Comprehensive feature engineering for Facebook advertising data
     Creates features optimized for CTR prediction and budget optimization
     """
     
-    def __init__(self, country_code: str = 'US'):
+    def __init__(self, country_code: str = 'US', feature_cache: Optional['FeatureCache'] = None,
+                 correlation_pruner: Optional[CorrelationPruner] = None,
+                 text_scanner: Optional[CreativeTextScanner] = None,
+                 dtype_plan: Optional[DtypePlan] = None):
+        """
+        Args:
+            country_code: Country whose holidays drive the holiday features
+            feature_cache: On-disk cache of engineered daily partitions,
+                used by create_feature_pipeline when given a user_id
+            correlation_pruner: Fitted correlated-feature drop list, e.g.
+                loaded with a model; fitted on the first pipeline run if not
+            text_scanner: Creative text scanner, e.g. with a persisted memo
+            dtype_plan: Compact dtypes for the input and every engineered
+                column (categoricals, float32 ratios, small-int flags)
+        """
         self.country_code = country_code
         self.encoders = {}
         self.scalers = {}
         self.holidays = holidays.country_holidays(country_code)
-        self.feature_cache = {}
+        self.feature_cache = feature_cache
+        self.correlation_pruner = correlation_pruner or CorrelationPruner()
+        self.text_scanner = text_scanner or CreativeTextScanner()
+        self.dtype_plan = dtype_plan
+        self.memory_report: Dict[str, Any] = {}
+    
+    def feature_builder(self, df: pd.DataFrame) -> FeatureFrameBuilder:
+        """Feature builder over df that keeps added columns in the dtype plan"""
+        return FeatureFrameBuilder(df, dtype_plan=self.dtype_plan)
         
     def engineer_temporal_features(self, df: pd.DataFrame, timestamp_col: str = 'timestamp') -> pd.DataFrame:
         """
@@ -38,9 +374,14 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with additional temporal features
         """
+        builder = self.feature_builder(df)
+        self._add_temporal_features(builder, timestamp_col=timestamp_col)
+        return builder.build()
+    
+    def _add_temporal_features(self, df: FeatureFrameBuilder, timestamp_col: str = 'timestamp'):
+        """Add temporal feature columns to a feature builder"""
         logger.info("Engineering temporal features")
         
-        df = df.copy()
         df[timestamp_col] = pd.to_datetime(df[timestamp_col])
         
         # Basic time features
@@ -65,14 +406,9 @@ class FacebookAdFeatureEngineer:
         df['is_evening'] = ((df['hour'] >= 18) & (df['hour'] <= 22)).astype(int)
         df['is_night'] = ((df['hour'] >= 23) | (df['hour'] <= 5)).astype(int)
         
-        # Holiday features
-        df['is_holiday'] = df[timestamp_col].dt.date.apply(
-            lambda x: x in self.holidays
-        ).astype(int)
-        
-        # Days before/after holiday
-        df['days_to_holiday'] = df[timestamp_col].apply(self._days_to_next_holiday)
-        df['days_from_holiday'] = df[timestamp_col].apply(self._days_from_last_holiday)
+        # Holiday features, including days before/after holiday
+        for name, values in self._holiday_features(df[timestamp_col]).items():
+            df[name] = values
         
         # Season features
         df['season'] = df['month'].apply(self._get_season)
@@ -84,8 +420,6 @@ class FacebookAdFeatureEngineer:
             ).dt.days
             df['campaign_age_weeks'] = df['campaign_age_days'] / 7
             df['is_new_campaign'] = (df['campaign_age_days'] <= 7).astype(int)
-        
-        return df
     
     def engineer_performance_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -97,10 +431,14 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with additional performance features
         """
+        builder = self.feature_builder(df)
+        self._add_performance_features(builder)
+        return builder.build()
+    
+    def _add_performance_features(self, df: FeatureFrameBuilder):
+        """Add performance feature columns to a feature builder"""
         logger.info("Engineering performance features")
         
-        df = df.copy()
-        
         # Basic calculated metrics
         df['ctr'] = np.where(df['impressions'] > 0, df['clicks'] / df['impressions'], 0)
         df['cpc'] = np.where(df['clicks'] > 0, df['spend'] / df['clicks'], 0)
@@ -133,8 +471,6 @@ class FacebookAdFeatureEngineer:
             df['remaining_budget_percentage'] = np.where(
                 df['budget'] > 0, df['remaining_budget'] / df['budget'], 0
             )
-        
-        return df
     
     def engineer_competitive_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -146,56 +482,138 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with competitive features
         """
+        builder = self.feature_builder(df)
+        self._add_competitive_features(builder)
+        return builder.build()
+    
+    def _add_competitive_features(self, df: FeatureFrameBuilder):
+        """Add competitive feature columns to a feature builder"""
         logger.info("Engineering competitive features")
         
-        df = df.copy()
+        # Group totals are broadcast with transform, which keeps the input
+        # rows and index; the same group sums as competitive_stats
+        if 'audience_id' in df.columns:
+            keys = df.frame(['audience_id', 'hour', 'impressions', 'spend', 'campaign_id'])
+            grouped = keys.groupby(['audience_id', 'hour'], sort=False, observed=True)
+            df['impressions_audience_total'] = grouped['impressions'].transform('sum')
+            df['spend_audience_total'] = grouped['spend'].transform('sum')
+            df['competing_campaigns'] = grouped['campaign_id'].transform('nunique')
+            df.discard_index()
+            self._add_audience_shares(df)
+        
+        if 'placement' in df.columns:
+            metrics = ['impressions', 'cpc', 'ctr']
+            grouped = df.frame(['placement', 'hour'] + metrics).groupby(
+                ['placement', 'hour'], sort=False, observed=True
+            )[metrics]
+            sums = grouped.transform('sum')
+            counts = grouped.transform('count')
+            for metric in metrics:
+                df[f'{metric}_placement_avg'] = sums[metric] / counts[metric]
+            df.discard_index()
+            self._add_placement_ratios(df)
+    
+    def competitive_stats(self, df: FeatureFrameBuilder) -> Dict[str, pd.DataFrame]:
+        """
+        Aggregates behind the competitive features
+        
+        Kept as sums, counts and distinct campaign counts so that the stats
+        of campaign-aligned row chunks add up with combine_competitive_stats.
+        
+        Args:
+            df: Builder with the temporal and performance features
+        
+        Returns:
+            Dictionary with 'audience' and/or 'placement' stats frames
+        """
+        stats = {}
         
         # Group by audience and time to create competitive metrics
         if 'audience_id' in df.columns:
             # Competition intensity by audience
-            audience_stats = df.groupby(['audience_id', 'hour']).agg({
+            keys = df.frame(['audience_id', 'hour', 'impressions', 'spend', 'campaign_id'])
+            stats['audience'] = keys.groupby(['audience_id', 'hour'], observed=True).agg({
                 'impressions': 'sum',
                 'spend': 'sum',
                 'campaign_id': 'nunique'
-            }).rename(columns={'campaign_id': 'competing_campaigns'})
-            
-            df = df.merge(
-                audience_stats,
-                on=['audience_id', 'hour'],
-                how='left',
-                suffixes=('', '_audience_total')
-            )
-            
-            df['audience_share_impressions'] = np.where(
-                df['impressions_audience_total'] > 0,
-                df['impressions'] / df['impressions_audience_total'],
-                0
-            )
-            df['audience_share_spend'] = np.where(
-                df['spend_audience_total'] > 0,
-                df['spend'] / df['spend_audience_total'],
-                0
-            )
+            }).rename(columns={
+                'impressions': 'impressions_audience_total',
+                'spend': 'spend_audience_total',
+                'campaign_id': 'competing_campaigns'
+            })
         
         # Market saturation features
         if 'placement' in df.columns:
-            placement_stats = df.groupby(['placement', 'hour']).agg({
-                'impressions': 'mean',
-                'cpc': 'mean',
-                'ctr': 'mean'
-            }).add_suffix('_placement_avg')
-            
-            df = df.merge(
-                placement_stats,
-                on=['placement', 'hour'],
-                how='left'
-            )
-            
-            # Relative performance vs placement average
-            df['ctr_vs_placement_avg'] = df['ctr'] / (df['ctr_placement_avg'] + 1e-6)
-            df['cpc_vs_placement_avg'] = df['cpc'] / (df['cpc_placement_avg'] + 1e-6)
+            metrics = ['impressions', 'cpc', 'ctr']
+            grouped = df.frame(['placement', 'hour'] + metrics).groupby(['placement', 'hour'], observed=True)[metrics]
+            stats['placement'] = pd.concat([
+                grouped.sum().add_suffix('_sum'),
+                grouped.count().add_suffix('_count')
+            ], axis=1)
+        
+        return stats
+    
+    @staticmethod
+    def combine_competitive_stats(parts: List[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+        """
+        Combine the competitive_stats of row chunks
         
-        return df
+        Exact as long as no campaign spans two chunks, since
+        competing_campaigns adds up per-chunk distinct counts.
+        """
+        combined = {}
+        for name in ['audience', 'placement']:
+            frames = [part[name] for part in parts if name in part]
+            if frames:
+                combined[name] = pd.concat(frames).groupby(level=[0, 1], observed=True).sum()
+        return combined
+    
+    @staticmethod
+    def placement_averages(sums: pd.DataFrame) -> pd.DataFrame:
+        """Per placement and hour averages from the 'placement' competitive stats"""
+        return pd.DataFrame({
+            f'{metric}_placement_avg': sums[f'{metric}_sum'] / sums[f'{metric}_count']
+            for metric in ['impressions', 'cpc', 'ctr']
+        })
+    
+    def _apply_competitive_stats(self, df: FeatureFrameBuilder, stats: Dict[str, pd.DataFrame]):
+        """Broadcast precomputed competitive stats to the rows of a feature builder"""
+        if 'audience' in stats:
+            # Reindexing by the row keys is a hash lookup in row order; keys
+            # without stats get NaN, as the left merge it replaces did
+            rows = stats['audience'].reindex(pd.MultiIndex.from_frame(df.frame(['audience_id', 'hour'])))
+            for column in rows.columns:
+                df[column] = rows[column].to_numpy()
+            df.discard_index()
+            self._add_audience_shares(df)
+        
+        if 'placement' in stats:
+            placement_stats = self.placement_averages(stats['placement'])
+            rows = placement_stats.reindex(pd.MultiIndex.from_frame(df.frame(['placement', 'hour'])))
+            for column in rows.columns:
+                df[column] = rows[column].to_numpy()
+            df.discard_index()
+            self._add_placement_ratios(df)
+    
+    @staticmethod
+    def _add_audience_shares(df: FeatureFrameBuilder):
+        """Row shares of the audience and hour totals"""
+        df['audience_share_impressions'] = np.where(
+            df['impressions_audience_total'] > 0,
+            df['impressions'] / df['impressions_audience_total'],
+            0
+        )
+        df['audience_share_spend'] = np.where(
+            df['spend_audience_total'] > 0,
+            df['spend'] / df['spend_audience_total'],
+            0
+        )
+    
+    @staticmethod
+    def _add_placement_ratios(df: FeatureFrameBuilder):
+        """Relative performance vs placement average"""
+        df['ctr_vs_placement_avg'] = df['ctr'] / (df['ctr_placement_avg'] + 1e-6)
+        df['cpc_vs_placement_avg'] = df['cpc'] / (df['cpc_placement_avg'] + 1e-6)
     
     def engineer_audience_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -207,10 +625,14 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with audience features
         """
+        builder = self.feature_builder(df)
+        self._add_audience_features(builder)
+        return builder.build()
+    
+    def _add_audience_features(self, df: FeatureFrameBuilder):
+        """Add audience feature columns to a feature builder"""
         logger.info("Engineering audience features")
         
-        df = df.copy()
-        
         # Age group features
         if 'age_min' in df.columns and 'age_max' in df.columns:
             df['age_range'] = df['age_max'] - df['age_min']
@@ -236,23 +658,16 @@ class FacebookAdFeatureEngineer:
         # Geographic features
         if 'country' in df.columns:
             # Major market indicators
-            major_markets = ['US', 'GB', 'CA', 'AU', 'DE', 'FR']
-            df['is_major_market'] = df['country'].isin(major_markets).astype(int)
+            df['is_major_market'] = df['country'].isin(MAJOR_MARKETS).astype(int)
             
         if 'city' in df.columns:
             # Urban vs rural approximation (simplified)
-            major_cities = [
-                'New York', 'Los Angeles', 'London', 'Toronto', 'Sydney',
-                'Berlin', 'Paris', 'Tokyo', 'Seoul', 'Singapore'
-            ]
-            df['is_major_city'] = df['city'].isin(major_cities).astype(int)
+            df['is_major_city'] = df['city'].isin(MAJOR_CITIES).astype(int)
         
         # Device and platform features
         if 'device_platform' in df.columns:
-            df['is_mobile'] = df['device_platform'].str.contains('mobile|android|ios', case=False, na=False).astype(int)
-            df['is_desktop'] = df['device_platform'].str.contains('desktop|windows|mac', case=False, na=False).astype(int)
-        
-        return df
+            for name, pattern in DEVICE_PATTERNS.items():
+                df[name] = df['device_platform'].str.contains(pattern, case=False, na=False).astype(int)
     
     def engineer_creative_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -264,16 +679,18 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with creative features
         """
+        builder = self.feature_builder(df)
+        self._add_creative_features(builder)
+        return builder.build()
+    
+    def _add_creative_features(self, df: FeatureFrameBuilder):
+        """Add creative feature columns to a feature builder"""
         logger.info("Engineering creative features")
         
-        df = df.copy()
-        
         # Ad format features
         if 'ad_format' in df.columns:
-            df['is_video'] = df['ad_format'].str.contains('video', case=False, na=False).astype(int)
-            df['is_carousel'] = df['ad_format'].str.contains('carousel', case=False, na=False).astype(int)
-            df['is_single_image'] = df['ad_format'].str.contains('single_image|image', case=False, na=False).astype(int)
-            df['is_collection'] = df['ad_format'].str.contains('collection', case=False, na=False).astype(int)
+            for name, pattern in AD_FORMAT_PATTERNS.items():
+                df[name] = df['ad_format'].str.contains(pattern, case=False, na=False).astype(int)
         
         # Creative freshness
         if 'creative_created_date' in df.columns:
@@ -283,28 +700,12 @@ class FacebookAdFeatureEngineer:
             df['is_fresh_creative'] = (df['creative_age_days'] <= 7).astype(int)
             df['creative_fatigue_score'] = np.minimum(df['creative_age_days'] / 30, 1.0)
         
-        # Text analysis features
+        # Text analysis features, one keyword scan per unique text
         if 'ad_text' in df.columns:
-            df['text_length'] = df['ad_text'].str.len().fillna(0)
-            df['has_emoji'] = df['ad_text'].str.contains(r'[^\w\s]', na=False).astype(int)
-            df['has_call_to_action'] = df['ad_text'].str.contains(
-                r'buy|shop|learn|sign up|download|get|try', case=False, na=False
-            ).astype(int)
-            df['text_word_count'] = df['ad_text'].str.split().str.len().fillna(0)
-            
-            # Sentiment approximation (simplified)
-            positive_words = ['great', 'amazing', 'best', 'love', 'perfect', 'excellent']
-            negative_words = ['bad', 'worst', 'hate', 'terrible', 'awful']
-            
-            df['positive_sentiment_score'] = df['ad_text'].str.count(
-                '|'.join(positive_words), case=False
-            ).fillna(0)
-            df['negative_sentiment_score'] = df['ad_text'].str.count(
-                '|'.join(negative_words), case=False
-            ).fillna(0)
+            text_features = self.text_scanner.features(df['ad_text'])
+            for name, values in text_features.items():
+                df[name] = values
             df['sentiment_balance'] = df['positive_sentiment_score'] - df['negative_sentiment_score']
-        
-        return df
     
     def engineer_lag_features(self, df: pd.DataFrame, 
                             group_by_cols: List[str] = ['campaign_id'],
@@ -320,42 +721,40 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with lag features
         """
+        builder = self.feature_builder(df)
+        self._add_lag_features(builder, group_by_cols=group_by_cols, lag_periods=lag_periods)
+        return builder.build()
+    
+    def _add_lag_features(self, df: FeatureFrameBuilder,
+                          group_by_cols: List[str] = ['campaign_id'],
+                          lag_periods: List[int] = [1, 3, 7]):
+        """Add lag feature columns to a feature builder"""
         logger.info("Engineering lag features")
         
-        df = df.copy()
-        df = df.sort_values(group_by_cols + ['timestamp'])
-        
-        # Metrics to create lags for
-        lag_metrics = ['ctr', 'cpc', 'conversions', 'spend', 'impressions', 'clicks']
-        
-        for metric in lag_metrics:
-            if metric in df.columns:
-                for lag in lag_periods:
-                    # Lag features
-                    lag_col = f'{metric}_lag_{lag}'
-                    df[lag_col] = df.groupby(group_by_cols)[metric].shift(lag)
-                    
-                    # Moving averages
-                    ma_col = f'{metric}_ma_{lag}'
-                    df[ma_col] = df.groupby(group_by_cols)[metric].rolling(
-                        window=lag, min_periods=1
-                    ).mean().reset_index(level=group_by_cols, drop=True)
-                    
-                    # Percentage change
-                    if lag == 1:
-                        pct_change_col = f'{metric}_pct_change'
-                        df[pct_change_col] = df.groupby(group_by_cols)[metric].pct_change()
-        
-        # Trend features
-        for metric in ['ctr', 'conversions']:
-            if metric in df.columns:
-                # 7-day trend
-                trend_col = f'{metric}_trend_7d'
-                df[trend_col] = df.groupby(group_by_cols)[metric].rolling(
-                    window=7, min_periods=3
-                ).apply(lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) >= 3 else 0).reset_index(level=group_by_cols, drop=True)
-        
-        return df
+        # Rows are sorted by reordering the output only; values are read in
+        # sorted order and written back in input order
+        order = df.sorted_positions(group_by_cols + ['timestamp'])
+        df.reorder_rows(order)
+        
+        # One grouping for every metric: rows are contiguous per group after
+        # the sort, so each row only needs its position within the group
+        # (ngroup numbers rows with a missing key NaN; they get no lag features)
+        codes = df.frame(group_by_cols).take(order).groupby(group_by_cols, sort=False, observed=True).ngroup()
+        codes = codes.fillna(-1).to_numpy(dtype=np.int64)
+        positions = _group_positions(codes)
+        ungrouped = codes < 0
+        
+        values = {
+            metric: df[metric].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+            for metric in LAG_METRICS if metric in df.columns
+        }
+        new_columns = lag_feature_columns(values, positions, lag_periods)
+        
+        for name, column in new_columns.items():
+            column[ungrouped] = np.nan
+            unsorted = np.empty_like(column)
+            unsorted[order] = column
+            df[name] = unsorted
     
     def engineer_interaction_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -367,13 +766,19 @@ class FacebookAdFeatureEngineer:
         Returns:
             DataFrame with interaction features
         """
+        builder = self.feature_builder(df)
+        self._add_interaction_features(builder)
+        return builder.build()
+    
+    def _add_interaction_features(self, df: FeatureFrameBuilder):
+        """Add interaction feature columns to a feature builder"""
         logger.info("Engineering interaction features")
         
-        df = df.copy()
-        
         # Time-based interactions
         if all(col in df.columns for col in ['hour', 'day_of_week']):
-            df['hour_dayofweek_interaction'] = df['hour'] * df['day_of_week']
+            # Widen first: the dtype plan may store hour and day_of_week as int8
+            widened = np.result_type(df['day_of_week'].dtype, np.int64)
+            df['hour_dayofweek_interaction'] = df['hour'] * df['day_of_week'].astype(widened)
         
         # Performance interactions
         if all(col in df.columns for col in ['ctr', 'frequency']):
@@ -392,39 +797,169 @@ class FacebookAdFeatureEngineer:
         # Budget-performance interactions
         if all(col in df.columns for col in ['budget_utilization', 'ctr']):
             df['budget_performance_interaction'] = df['budget_utilization'] * df['ctr']
-        
-        return df
     
-    def create_feature_pipeline(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_feature_pipeline(self, df: pd.DataFrame, track_memory: bool = False,
+                                user_id: Optional[str] = None,
+                                workers: Optional[int] = None,
+                                fit: bool = False) -> pd.DataFrame:
         """
         Complete feature engineering pipeline
         
+        Stages add their columns to one FeatureFrameBuilder, so the input
+        frame is never copied between stages and the output is assembled once.
+        With a feature cache and a user_id, unchanged days are loaded from
+        the cache instead of being engineered again. With more than one
+        worker, campaigns are engineered in a process pool (see
+        ParallelFeaturePipeline); the result is the same as serial.
+        
         Args:
             df: Raw input dataframe
+            track_memory: Log each stage's peak traced allocation
+            user_id: Owner of the data, for the feature cache
+            workers: Worker processes for campaign-sharded execution, at
+                most the usable CPUs; by default (and on one CPU) stages run
+                in this process
+            fit: Refit correlation pruning on this data, as when training;
+                otherwise the fitted drop list is reapplied
             
         Returns:
             DataFrame with all engineered features
         """
         logger.info("Running complete feature engineering pipeline")
         
-        # Apply all feature engineering steps
-        df = self.engineer_temporal_features(df)
-        df = self.engineer_performance_features(df)
-        df = self.engineer_competitive_features(df)
-        df = self.engineer_audience_features(df)
-        df = self.engineer_creative_features(df)
-        df = self.engineer_lag_features(df)
-        df = self.engineer_interaction_features(df)
+        # Compact dtypes right after load; stages keep their columns compact
+        if self.dtype_plan is not None:
+            input_bytes = frame_memory(df)
+            df = self.dtype_plan.apply(df)
+            self.memory_report = {'input_bytes': input_bytes, 'compact_input_bytes': frame_memory(df)}
+        
+        if workers is not None and workers > 1:
+            # Processes beyond the usable CPUs only add scatter and IPC cost
+            from .parallel_pipeline import available_cpus
+            
+            workers = min(workers, available_cpus())
+        
+        if self.feature_cache is not None and user_id is not None:
+            df = self.feature_cache.engineer(self, df, user_id, track_memory=track_memory)
+        elif workers is not None and workers > 1 and len(df) > 0:
+            from .parallel_pipeline import ParallelFeaturePipeline
+            
+            df = ParallelFeaturePipeline(self, workers=workers).engineer_features(df)
+        else:
+            # Apply all feature engineering steps
+            builder = self.feature_builder(df)
+            self.run_stages(builder, FEATURE_STAGES, track_memory=track_memory)
+            df = builder.build()
+            del builder
         
         # Handle missing values
         df = self._handle_missing_values(df)
         
         # Remove highly correlated features
-        df = self._remove_correlated_features(df)
+        df = self._remove_correlated_features(df, fit=fit)
+        
+        if self.dtype_plan is not None:
+            self.memory_report['output_bytes'] = frame_memory(df)
+            logger.info(
+                f"Feature memory: input {self.memory_report['input_bytes'] / 1e6:.1f} MB, "
+                f"{self.memory_report['compact_input_bytes'] / 1e6:.1f} MB compact; "
+                f"output {self.memory_report['output_bytes'] / 1e6:.1f} MB"
+            )
         
         logger.info(f"Feature engineering completed. Final shape: {df.shape}")
         return df
     
+    def create_feature_pipeline_chunked(self,
+                                        source,
+                                        output_path: str,
+                                        chunk_rows: int = 100000,
+                                        spill_dir: Optional[str] = None,
+                                        fit: bool = False) -> Dict[str, Any]:
+        """
+        Out-of-core create_feature_pipeline, streaming results to Parquet
+        
+        Reads campaign-aligned chunks from the source and keeps memory
+        bounded by the chunk size; see ChunkedFeaturePipeline.
+        
+        Args:
+            source: ParquetChunkSource or ClickHouseChunkSource
+            output_path: Output Parquet file
+            chunk_rows: Target rows per chunk
+            spill_dir: Directory for intermediate files
+            fit: Refit correlation pruning on this data
+            
+        Returns:
+            Run summary
+        """
+        from .chunked_pipeline import ChunkedFeaturePipeline
+        
+        pipeline = ChunkedFeaturePipeline(self, chunk_rows=chunk_rows, spill_dir=spill_dir, fit=fit)
+        return pipeline.run(source, output_path)
+    
+    def fit_feature_plan(self, df: pd.DataFrame, fit: bool = False) -> 'FeaturePlan':
+        """
+        Freeze the pipeline state fitted on df for real-time feature computation
+        
+        The plan holds the output columns, competitive stats, missing-value
+        fills, holiday table and recent lag history of every campaign, and
+        is executed on dicts or small batches by FeaturePlanExecutor.
+        
+        Args:
+            df: Raw input dataframe, e.g. the training window
+            fit: Refit correlation pruning on this data
+        
+        Returns:
+            Serializable FeaturePlan
+        """
+        from .feature_plan import build_feature_plan
+        
+        return build_feature_plan(self, df, fit=fit)
+
+    def run_stages(self, builder: FeatureFrameBuilder, stages: List[str], track_memory: bool = False):
+        """
+        Run named pipeline stages on a feature builder, in the given order
+        
+        Args:
+            builder: Builder wrapping the input frame
+            stages: Names from FEATURE_STAGES
+            track_memory: Log each stage's peak traced allocation
+        """
+        for name in stages:
+            with builder.stage(name, track_memory=track_memory):
+                getattr(self, f'_add_{name}_features')(builder)
+    
+    def _holiday_features(self, timestamps: pd.Series) -> Dict[str, np.ndarray]:
+        """
+        Vectorized is_holiday, days_to_holiday and days_from_holiday
+        
+        Matches _days_to_next_holiday and _days_from_last_holiday row by row,
+        looked up in a sorted holiday array instead of scanning self.holidays.
+        """
+        if timestamps.dt.tz is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        
+        valid = timestamps.notna().to_numpy()
+        day_numbers = timestamps.to_numpy().astype('datetime64[D]').astype(np.int64)
+        
+        if not valid.any():
+            return {
+                'is_holiday': np.zeros(len(timestamps), dtype=np.int64),
+                'days_to_holiday': np.full(len(timestamps), NO_HOLIDAY_DAYS, dtype=np.int64),
+                'days_from_holiday': np.full(len(timestamps), NO_HOLIDAY_DAYS, dtype=np.int64),
+            }
+        
+        # Missing timestamps are looked up as any valid day and reset afterwards
+        day_numbers = np.where(valid, day_numbers, day_numbers[valid][0])
+        years = timestamps[valid].dt.year
+        table = get_holiday_table(self.country_code, int(years.min()), int(years.max()))
+        
+        features = table.features(day_numbers)
+        if not valid.all():
+            features['is_holiday'][~valid] = 0
+            features['days_to_holiday'][~valid] = NO_HOLIDAY_DAYS
+            features['days_from_holiday'][~valid] = NO_HOLIDAY_DAYS
+        return features
+    
     def _days_to_next_holiday(self, date: datetime) -> int:
         """Calculate days to next holiday"""
         current_year_holidays = [h for h in self.holidays if h.year == date.year and h >= date.date()]
@@ -474,25 +1009,24 @@ class FacebookAdFeatureEngineer:
             if df[col].isnull().any():
                 df[col].fillna(df[col].mode().iloc[0] if not df[col].mode().empty else 'unknown', inplace=True)
         
+        # Same for columns compacted to categoricals by the dtype plan
+        for col in df.select_dtypes(include=['category']).columns:
+            if df[col].isnull().any():
+                mode = df[col].mode()
+                if mode.empty:
+                    df[col] = df[col].cat.add_categories(['unknown'])
+                df[col] = df[col].fillna(mode.iloc[0] if not mode.empty else 'unknown')
+        
         return df
     
-    def _remove_correlated_features(self, df: pd.DataFrame, threshold: float = 0.95) -> pd.DataFrame:
-        """Remove highly correlated features to reduce multicollinearity"""
-        numeric_df = df.select_dtypes(include=[np.number])
-        
-        # Calculate correlation matrix
-        corr_matrix = numeric_df.corr().abs()
-        
-        # Find pairs of highly correlated features
-        upper_triangle = corr_matrix.where(
-            np.triu(np.ones(corr_matrix.shape), k=1).astype(bool)
-        )
-        
-        # Find features to drop
-        to_drop = [column for column in upper_triangle.columns if any(upper_triangle[column] > threshold)]
-        
-        if to_drop:
-            logger.info(f"Removing {len(to_drop)} highly correlated features: {to_drop}")
-            df = df.drop(columns=to_drop)
+    def _remove_correlated_features(self, df: pd.DataFrame, fit: bool = False) -> pd.DataFrame:
+        """
+        Remove highly correlated features to reduce multicollinearity
         
-        return df
\ No newline at end of file
+        The drop list comes from self.correlation_pruner, fitted on df when
+        fit is set or the pruner is not yet fitted, so later runs keep the
+        columns of the run it was fitted on.
+        """
+        if fit or not self.correlation_pruner.is_fitted:
+            self.correlation_pruner.fit(df)
+        return self.correlation_pruner.transform(df)
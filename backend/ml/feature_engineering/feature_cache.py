@@ -0,0 +1,322 @@
+"""
+Feature Cache for AI-Buyer
+Content-addressed Parquet cache of engineered feature partitions per user and day
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Any, Optional
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import logging
+
+from .dtype_plan import DtypePlan
+from .frame_builder import FeatureFrameBuilder
+
+logger = logging.getLogger(__name__)
+
+# Lag features are computed per campaign, ordered by timestamp
+GROUP_BY_COLS = ['campaign_id']
+
+# Raw inputs of the lag metrics; a row with all of them present defines every lag metric
+LAG_INPUTS = ['impressions', 'clicks', 'spend', 'conversions']
+
+ROW_COLUMN = '_partition_row'
+METADATA_KEY = b'ai_buyer_features'
+PARTITION_SUFFIX = '.parquet'
+
+
+def frame_digest(row_hashes: np.ndarray, dtypes: pd.Series) -> str:
+    """Digest of a partition from its per-row hashes and column dtypes"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c), str(t)] for c, t in dtypes.items()]).encode('utf-8'))
+    digest.update(np.ascontiguousarray(row_hashes).tobytes())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    On-disk cache of engineered features, one Parquet file per (user_id, day)
+
+    A day's file name is a hash of the day's raw rows, the raw rows its lag
+    features look back on (the lag context), the country code, the dtype
+    plan and the feature code, so a changed day, a changed lag context or
+    new feature code is a cache miss and everything else is read back memory-mapped.
+    Each day is engineered with its lag context prepended, so lag, moving
+    average, pct_change and trend features are exact across day
+    boundaries. Stages in GLOBAL_STAGES aggregate across days and always
+    run on the assembled frame; the result matches running
+    create_feature_pipeline stages on the whole frame, in the same row and
+    column order.
+    """
+
+    def __init__(self,
+                 cache_dir: str,
+                 context_rows: int = 7,
+                 compression: Optional[str] = 'lz4'):
+        """
+        Args:
+            cache_dir: Root directory of the cache
+            context_rows: Rows of history each campaign needs for its lag
+                features (the longest lag, moving-average or trend window)
+            compression: Parquet compression codec
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.context_rows = context_rows
+        self.compression = compression
+        self.stats = {'hits': 0, 'misses': 0}
+        self._code_versions: Dict[type, str] = {}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def code_version(self, engineer) -> str:
+        """Fingerprint of FEATURE_VERSION and the source of the feature code"""
+        from .facebook_features import FEATURE_VERSION
+
+        cls = type(engineer)
+        version = self._code_versions.get(cls)
+        if version is None:
+            digest = hashlib.sha256(str(FEATURE_VERSION).encode('utf-8'))
+            paths = {inspect.getsourcefile(klass) for klass in cls.__mro__ if klass is not object}
+            paths |= {inspect.getsourcefile(FeatureFrameBuilder), os.path.abspath(__file__)}
+            paths.add(inspect.getsourcefile(type(engineer.text_scanner)))
+            paths.add(inspect.getsourcefile(DtypePlan))
+            for path in sorted(p for p in paths if p):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            version = digest.hexdigest()
+            self._code_versions[cls] = version
+        return version
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.cache_dir, quote(str(user_id), safe=''))
+
+    def engineer(self, engineer, df: pd.DataFrame, user_id: str, track_memory: bool = False) -> pd.DataFrame:
+        """
+        Engineered features for df, reusing cached days
+
+        Args:
+            engineer: FacebookAdFeatureEngineer whose stages produce the features
+            df: Raw input dataframe covering one or more days
+            user_id: Owner of the data
+            track_memory: Log each stage's peak traced allocation
+
+        Returns:
+            Features before missing-value handling and correlation pruning
+        """
+        from .facebook_features import FEATURE_STAGES
+
+        start = time.perf_counter()
+        timestamps = pd.to_datetime(df['timestamp'])
+        if timestamps.isna().any():
+            logger.warning("Rows without a timestamp cannot be partitioned; engineering without the cache")
+            builder = engineer.feature_builder(df)
+            engineer.run_stages(builder, FEATURE_STAGES, track_memory=track_memory)
+            return builder.build()
+
+        day_codes, days = pd.factorize(timestamps.dt.normalize(), sort=True)
+        labels = list(days.strftime('%Y-%m-%d'))
+
+        # Raw rows of each day, in input order
+        day_order = np.argsort(day_codes, kind='stable')
+        day_offsets = np.concatenate([[0], np.cumsum(np.bincount(day_codes, minlength=len(days)))])
+        context = self._lag_context(df, timestamps, day_codes, len(days))
+
+        version = self.code_version(engineer)
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        user_dir = self._user_dir(user_id)
+        hits = 0
+
+        tables = []
+        for day, label in enumerate(labels):
+            rows = day_order[day_offsets[day]:day_offsets[day + 1]]
+            context_rows = context[day]
+
+            key = hashlib.sha256('|'.join([
+                version,
+                engineer.country_code,
+                repr(engineer.dtype_plan),
+                str(self.context_rows),
+                frame_digest(row_hashes[rows], df.dtypes),
+                frame_digest(row_hashes[context_rows], df.dtypes),
+            ]).encode('utf-8')).hexdigest()
+            path = os.path.join(user_dir, label, key + PARTITION_SUFFIX)
+
+            if os.path.exists(path):
+                hits += 1
+            else:
+                self._write_partition(engineer, df.take(context_rows), df.take(rows), path, track_memory)
+            tables.append(pq.read_table(path, memory_map=True))
+
+        self.stats['hits'] += hits
+        self.stats['misses'] += len(labels) - hits
+
+        result = self._assemble(engineer, df, tables, day_order, day_offsets, track_memory)
+
+        logger.info(f"Feature cache for user {user_id}: {hits}/{len(labels)} days cached, "
+                    f"{len(labels) - hits} engineered in {time.perf_counter() - start:.2f}s")
+        return result
+
+    def _lag_context(self,
+                     df: pd.DataFrame,
+                     timestamps: pd.Series,
+                     day_codes: np.ndarray,
+                     num_days: int) -> List[np.ndarray]:
+        """
+        Raw row positions each day's lag features look back on
+
+        For every campaign with rows on a day, the context is the campaign's
+        last ``context_rows`` rows from earlier days, extended back to the
+        last row with every lag input present so pct_change's forward fill
+        finds the same value it would in the full frame.
+        """
+        keys = pd.DataFrame({col: df[col].to_numpy() for col in GROUP_BY_COLS})
+        keys['timestamp'] = timestamps.to_numpy()
+        order = keys.sort_values(GROUP_BY_COLS + ['timestamp'], kind='stable').index.to_numpy()
+
+        groups = keys.groupby(GROUP_BY_COLS, sort=False, dropna=False).ngroup().to_numpy()[order]
+        sorted_days = day_codes[order]
+        index = np.arange(len(order))
+
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = groups[1:] != groups[:-1]
+        group_start = np.maximum.accumulate(np.where(new_group, index, 0))
+
+        # First row of each (campaign, day) run that has earlier rows in its campaign
+        new_day = new_group.copy()
+        new_day[1:] |= sorted_days[1:] != sorted_days[:-1]
+        heads = np.flatnonzero(new_day & ~new_group)
+
+        inputs = [col for col in LAG_INPUTS if col in df.columns]
+        complete = df[inputs].notna().all(axis=1).to_numpy()[order]
+        last_complete = np.maximum.accumulate(np.where(complete, index, -1))
+        complete_before = np.concatenate([[-1], last_complete[:-1]])[heads]
+
+        starts = np.maximum(heads - self.context_rows, group_start[heads])
+        starts = np.where(
+            complete_before >= group_start[heads],
+            np.minimum(starts, complete_before),
+            group_start[heads]
+        )
+
+        lengths = heads - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+        position_days = np.repeat(sorted_days[heads], lengths)
+
+        by_day = np.argsort(position_days, kind='stable')
+        day_bounds = np.concatenate([[0], np.cumsum(np.bincount(position_days, minlength=num_days))])
+        positions = order[positions[by_day]]
+        return [positions[day_bounds[day]:day_bounds[day + 1]] for day in range(num_days)]
+
+    def _write_partition(self,
+                         engineer,
+                         context: pd.DataFrame,
+                         partition: pd.DataFrame,
+                         path: str,
+                         track_memory: bool):
+        """Engineer one day with its lag context and store only the day's rows"""
+        from .facebook_features import FEATURE_STAGES, GLOBAL_STAGES
+
+        frame = pd.concat([context, partition], ignore_index=True)
+        builder = engineer.feature_builder(frame)
+        engineer.run_stages(
+            builder, [stage for stage in FEATURE_STAGES if stage not in GLOBAL_STAGES],
+            track_memory=track_memory
+        )
+
+        builder[ROW_COLUMN] = np.arange(len(frame)) - len(context)
+        positions = builder.positions()
+        builder.reorder_rows(positions[positions >= len(context)])
+        features = builder.build()
+
+        metadata = {
+            'base': list(partition.columns),
+            'stages': {stats['stage']: stats['columns'] for stats in builder.stage_stats},
+        }
+        table = pa.Table.from_pandas(features, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            METADATA_KEY: json.dumps(metadata).encode('utf-8'),
+        })
+
+        day_dir = os.path.dirname(path)
+        os.makedirs(day_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, path)
+
+        # A day has one current version; older ones can never be hit again
+        for name in os.listdir(day_dir):
+            if name != os.path.basename(path):
+                os.remove(os.path.join(day_dir, name))
+
+    def _assemble(self,
+                  engineer,
+                  df: pd.DataFrame,
+                  tables: List[pa.Table],
+                  day_order: np.ndarray,
+                  day_offsets: np.ndarray,
+                  track_memory: bool) -> pd.DataFrame:
+        """Concatenate day partitions, run the global stages and restore pipeline order"""
+        from .facebook_features import GLOBAL_STAGES, pipeline_columns
+
+        metadata = json.loads(tables[0].schema.metadata[METADATA_KEY])
+        features = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+        del tables
+
+        # Input row of every cached row, for the pipeline's output index
+        table_days = np.repeat(np.arange(len(day_offsets) - 1), np.diff(day_offsets))
+        partition_rows = features.pop(ROW_COLUMN).to_numpy()
+        input_rows = day_order[day_offsets[table_days] + partition_rows]
+
+        builder = engineer.feature_builder(features)
+        engineer.run_stages(builder, GLOBAL_STAGES, track_memory=track_memory)
+        stage_columns = dict(metadata['stages'])
+        stage_columns.update({stats['stage']: stats['columns'] for stats in builder.stage_stats})
+
+        order = builder.sorted_positions(GROUP_BY_COLS + ['timestamp'])
+        builder.reorder_rows(order)
+        result = builder.build(columns=pipeline_columns(metadata['base'], stage_columns))
+
+        input_rows = input_rows[order]
+        result.index = pd.Index(input_rows) if builder.reset_index else df.index.take(input_rows)
+        return result
+
+    def days(self, user_id: str) -> List[str]:
+        """Days with a cached partition for a user"""
+        user_dir = self._user_dir(user_id)
+        if not os.path.isdir(user_dir):
+            return []
+        return sorted(os.listdir(user_dir))
+
+    def prune(self, user_id: str, before: str) -> int:
+        """
+        Delete a user's cached days older than a date
+
+        Args:
+            user_id: Owner of the data
+            before: First day to keep, as YYYY-MM-DD
+
+        Returns:
+            Number of days removed
+        """
+        removed = [day for day in self.days(user_id) if day < before]
+        for day in removed:
+            shutil.rmtree(os.path.join(self._user_dir(user_id), day), ignore_errors=True)
+        return len(removed)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,834 @@
+"""
+Feature Plan for AI-Buyer
+Frozen feature pipeline state and a NumPy executor for single rows and small batches
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+import logging
+
+from .creative_text import CreativeTextScanner, TEXT_FEATURES, FLAG_FEATURES
+from .facebook_features import (
+    FEATURE_STAGES, FEATURE_VERSION, LAG_METRICS, TREND_METRICS, TREND_WINDOW, NO_HOLIDAY_DAYS,
+    MAJOR_MARKETS, MAJOR_CITIES, DEVICE_PATTERNS, AD_FORMAT_PATTERNS,
+    HolidayTable, get_holiday_table, lag_feature_columns, _group_ffill, _group_positions
+)
+
+if TYPE_CHECKING:
+    from .facebook_features import FacebookAdFeatureEngineer
+
+logger = logging.getLogger(__name__)
+
+# Lag periods of create_feature_pipeline (the _add_lag_features defaults)
+LAG_PERIODS = [1, 3, 7]
+
+_HOUR_NS = 3600 * 10**9
+_DAY_NS = 24 * _HOUR_NS
+
+
+@dataclass(frozen=True)
+class FeaturePlan:
+    """
+    Everything create_feature_pipeline learned from a frame, as plain data
+
+    Row-level features are recomputed from the input; state that depends on
+    other rows is frozen at fit time: competitive stats per audience or
+    placement and hour, the medians and modes missing values are filled
+    with, the correlated columns dropped, and the last rows of each
+    campaign for lag features. Lists of rows rather than mappings keep
+    non-string keys intact through JSON.
+    """
+    version: int
+    country_code: str
+    input_columns: List[str]
+    input_kinds: Dict[str, str]
+    columns: List[str]
+    dtypes: Dict[str, str]
+    seasons: List[str]
+    holidays: Dict[str, Any]
+    audience_stats: Optional[List[list]]
+    placement_stats: Optional[List[list]]
+    fill_values: Dict[str, Any]
+    lag_periods: List[int]
+    lag_metrics: List[str]
+    lag_history: List[list]
+    text_version: str
+    fitted_rows: int
+    fitted_at: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'FeaturePlan':
+        if state['version'] != FEATURE_VERSION:
+            raise ValueError(f"Feature plan version {state['version']} does not match "
+                             f"feature version {FEATURE_VERSION}")
+        return cls(**state)
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> 'FeaturePlan':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_model_feature_plan(path: str) -> Optional[FeaturePlan]:
+    """
+    Feature plan saved with a model, if it has a usable one
+
+    Models saved before feature plans have none. A plan of another feature
+    version is skipped with a warning rather than failing the model load;
+    requests must then carry the engineered features themselves.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return FeaturePlan.load(path)
+    except ValueError as e:
+        logger.warning(f"Feature plan not used, requests must carry engineered features: {e}")
+        return None
+
+
+def _input_kind(values: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return 'datetime'
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return 'object'
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return 'numeric'
+    return 'object'
+
+
+def _scalar(value: Any) -> Any:
+    """Python scalar of a NumPy or pandas value, None when missing"""
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _rows(frame: pd.DataFrame, index: List[str], columns: List[str]) -> List[list]:
+    """Rows of an indexed stats frame as lists of Python scalars"""
+    frame = frame.reset_index()
+    return [list(row) for row in zip(*(frame[name].tolist() for name in index + columns))]
+
+
+def _time_keys(timestamps: np.ndarray) -> np.ndarray:
+    """Sortable int64 timestamps with missing ones last, as in sort_values"""
+    return np.where(np.isnat(timestamps), np.iinfo(np.int64).max, timestamps.view(np.int64))
+
+
+def _lag_history(features: pd.DataFrame, metrics: List[str]) -> List[list]:
+    """
+    Last rows of each campaign that lag features of a later row can see
+
+    Rows are kept in time order. When a campaign has more rows, one extra
+    row holding the forward-filled values is kept first, so percentage
+    changes of rows after a run of missing values still find the last
+    value; lags and windows never reach back to it.
+    """
+    lookback = max(max(LAG_PERIODS), TREND_WINDOW - 1)
+    codes = features.groupby('campaign_id', sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    grouped = np.flatnonzero(codes >= 0)
+    if not len(grouped):
+        return []
+
+    # Stable sort by campaign and time, as in the lag stage
+    time_keys = _time_keys(features['timestamp'].to_numpy(dtype='datetime64[ns]'))
+    order = grouped[np.lexsort((time_keys[grouped], codes[grouped]))]
+    codes = codes[order]
+    positions = _group_positions(codes)
+    first = np.maximum(np.bincount(codes)[codes] - lookback - 1, 0)
+
+    values = features[metrics].take(order).to_numpy(dtype=np.float64, na_value=np.nan)
+    filled = np.column_stack([_group_ffill(values[:, j], positions) for j in range(len(metrics))])
+    values = np.where((positions == first)[:, None], filled, values)
+
+    keep = positions >= first
+    keys = features['campaign_id'].take(order[keep]).tolist()
+    values = values[keep]
+    starts = np.flatnonzero(positions[keep] == first[keep])
+    ends = np.append(starts[1:], len(values))
+    return [[keys[start], values[start:end].tolist()] for start, end in zip(starts, ends)]
+
+
+def build_feature_plan(engineer: 'FacebookAdFeatureEngineer', df: pd.DataFrame,
+                       fit: bool = False) -> FeaturePlan:
+    """
+    Run the pipeline on df and freeze its state
+
+    Args:
+        engineer: Engineer whose settings the plan follows
+        df: Raw input dataframe
+        fit: Refit correlation pruning on this data
+
+    Returns:
+        FeaturePlan whose executor reproduces create_feature_pipeline on df
+    """
+    if engineer.dtype_plan is not None:
+        df = engineer.dtype_plan.apply(df)
+
+    builder = engineer.feature_builder(df)
+    engineer.run_stages(builder, FEATURE_STAGES)
+    stats = engineer.competitive_stats(builder)
+    features = builder.build()
+    del builder
+
+    # Missing-value fills as _handle_missing_values would choose them
+    fill_values = {}
+    for name in features.select_dtypes(include=[np.number]).columns:
+        fill_values[name] = _scalar(features[name].median())
+    for name in features.select_dtypes(include=['object', 'category']).columns:
+        mode = features[name].mode()
+        fill_values[name] = _scalar(mode.iloc[0]) if not mode.empty else 'unknown'
+
+    metrics = [metric for metric in LAG_METRICS if metric in features.columns]
+    history = _lag_history(features, metrics) if 'campaign_id' in features.columns else []
+
+    output = engineer._remove_correlated_features(engineer._handle_missing_values(features), fit=fit)
+
+    timestamps = pd.to_datetime(df['timestamp'])
+    years = timestamps.dt.year.dropna()
+    first_year, last_year = (int(years.min()), int(years.max())) if len(years) else (datetime.now().year,) * 2
+    # One more year, so rows served after the fitted window still have holidays
+    holiday_table = get_holiday_table(engineer.country_code, first_year, last_year + 1)
+
+    audience_stats = placement_stats = None
+    if 'audience' in stats:
+        audience_stats = _rows(stats['audience'], ['audience_id', 'hour'],
+                               ['impressions_audience_total', 'spend_audience_total', 'competing_campaigns'])
+    if 'placement' in stats:
+        averages = engineer.placement_averages(stats['placement'])
+        placement_stats = _rows(averages, ['placement', 'hour'], list(averages.columns))
+
+    plan = FeaturePlan(
+        version=FEATURE_VERSION,
+        country_code=engineer.country_code,
+        input_columns=list(df.columns),
+        input_kinds={name: _input_kind(df[name]) for name in df.columns},
+        columns=list(output.columns),
+        dtypes={name: str(dtype) for name, dtype in output.dtypes.items()},
+        seasons=[engineer._get_season(month) for month in [np.nan] + list(range(1, 13))],
+        holidays=holiday_table.to_dict(),
+        audience_stats=audience_stats,
+        placement_stats=placement_stats,
+        fill_values=fill_values,
+        lag_periods=list(LAG_PERIODS),
+        lag_metrics=metrics,
+        lag_history=history,
+        text_version=engineer.text_scanner.version,
+        fitted_rows=len(df),
+        fitted_at=datetime.now().isoformat(),
+    )
+    logger.info(f"Feature plan fitted on {len(df)} rows: {len(plan.columns)} columns, "
+                f"{len(history)} campaign histories")
+    return plan
+
+
+def refresh_lag_history(engineer: 'FacebookAdFeatureEngineer', plan: FeaturePlan,
+                        df: pd.DataFrame) -> FeaturePlan:
+    """
+    The plan with the lag history of df's campaigns, the rest of its state kept
+
+    For a model fine-tuned without refitting its plan: lag features served
+    afterwards look back at df's latest rows instead of those of the last
+    full fit. Campaigns without rows in df keep their history.
+
+    Args:
+        engineer: Engineer whose settings the plan follows
+        plan: Fitted plan
+        df: Raw input dataframe, e.g. the retraining lookback
+
+    Returns:
+        New FeaturePlan
+    """
+    if engineer.dtype_plan is not None:
+        df = engineer.dtype_plan.apply(df)
+
+    # The lag metrics are raw or come from the performance stage
+    builder = engineer.feature_builder(df)
+    engineer.run_stages(builder, ['temporal', 'performance'])
+    features = builder.build()
+    if 'campaign_id' not in features.columns:
+        return plan
+
+    history = _lag_history(features, plan.lag_metrics)
+    refreshed = {key for key, _ in history}
+    kept = [entry for entry in plan.lag_history if entry[0] not in refreshed]
+    logger.info(f"Feature plan lag history refreshed for {len(history)} campaigns, {len(kept)} kept")
+    return replace(plan, lag_history=kept + history)
+
+
+def _as_datetime(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]', copy=False)
+    return np.array([None if _is_missing(value) else value for value in values.tolist()],
+                    dtype='datetime64[ns]')
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _days(delta: np.ndarray) -> np.ndarray:
+    """Whole days of timedeltas, as Series.dt.days: int64, or float64 with NaN for NaT"""
+    days = delta.view(np.int64) // _DAY_NS
+    missing = np.isnat(delta)
+    if missing.any():
+        days = days.astype(np.float64)
+        days[missing] = np.nan
+    return days
+
+
+def _full(value: Any, rows: int) -> np.ndarray:
+    value = np.asarray(value)
+    return value if value.ndim else np.full(rows, value)
+
+
+def _last_row_lag_features(window: np.ndarray, metrics: List[str],
+                           lag_periods: List[int]) -> Dict[str, np.ndarray]:
+    """
+    lag_feature_columns of the last row of one campaign's rows
+
+    The same arithmetic in the same order, on Python floats of the few
+    rows the last row's windows reach: a row costs well under a hundred
+    float operations instead of a group shift per window offset. The
+    percentage change divides NumPy scalars, which follow the errstate
+    like the arrays do.
+
+    Args:
+        window: Float64 rows of the campaign in time order, a column per metric
+        metrics: Metrics of the window's columns, in LAG_METRICS order
+        lag_periods: Lag periods to create
+
+    Returns:
+        New columns of length one, in pipeline order
+    """
+    nan = float('nan')
+    new_columns: Dict[str, float] = {}
+    trends: Dict[str, float] = {}
+    # Each metric's values from the last row back
+    for metric, back in zip(metrics, window[::-1].T.tolist()):
+        for lag in lag_periods:
+            # Lag features
+            new_columns[f'{metric}_lag_{lag}'] = back[lag] if lag < len(back) else nan
+
+            # Moving averages
+            total, count = 0.0, 0
+            for value in back[:lag]:
+                if value == value:
+                    total += value
+                    count += 1
+            new_columns[f'{metric}_ma_{lag}'] = total / count if count else nan
+
+            # Percentage change of the forward-filled values
+            if lag == 1:
+                current = next((value for value in back if value == value), nan)
+                previous = next((value for value in back[1:] if value == value), nan)
+                new_columns[f'{metric}_pct_change'] = float(np.float64(current) / previous - 1)
+
+        # 7-day trend
+        if metric in TREND_METRICS:
+            n = float(min(len(back), TREND_WINDOW))
+            sum_y = sum_offset_y = 0.0
+            for offset, value in enumerate(back[:int(n)]):
+                sum_y += value
+                sum_offset_y += offset * value
+            sum_x = n * (n - 1) / 2
+            sum_xx = (n - 1) * n * (2 * n - 1) / 6
+            sum_xy = (n - 1) * sum_y - sum_offset_y
+            trends[f'{metric}_trend_7d'] = (
+                (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x) if n >= 3 else nan
+            )
+
+    # Pipeline order: each metric's lags, averages and change, then the trends
+    new_columns.update(trends)
+    values = np.array(list(new_columns.values()), dtype=np.float64)
+    return {name: values[i:i + 1] for i, name in enumerate(new_columns)}
+
+
+class FeaturePlanExecutor:
+    """
+    create_feature_pipeline for dicts and small batches, without pandas
+
+    Row-level features are computed with NumPy in the pipeline's own
+    arithmetic, so values match it exactly; competitive stats, fills and
+    the column list come from the plan. Lag features extend each
+    campaign's history in the plan: rows are taken to follow the fitted
+    window, and rows of the same campaign in a batch follow each other in
+    time order. Without history, a batch is engineered on its own, as
+    create_feature_pipeline would.
+    """
+
+    AUDIENCE_COLUMNS = ['impressions_audience_total', 'spend_audience_total', 'competing_campaigns']
+    PLACEMENT_COLUMNS = ['impressions_placement_avg', 'cpc_placement_avg', 'ctr_placement_avg']
+
+    def __init__(self, plan: FeaturePlan, max_texts: int = 100000):
+        """
+        Args:
+            plan: Fitted feature plan
+            max_texts: Creative texts whose scans are memoized
+        """
+        self.plan = plan
+        self.plan_columns = set(plan.columns)
+        self.holidays = HolidayTable.from_dict(plan.holidays)
+        self.seasons = np.array(plan.seasons, dtype=object)
+        self.audience_index, self.audience_values = self._stats_index(plan.audience_stats)
+        self.placement_index, self.placement_values = self._stats_index(plan.placement_stats)
+        self.history = {
+            key: np.array(rows, dtype=np.float64).reshape(-1, len(plan.lag_metrics))
+            for key, rows in plan.lag_history
+        }
+
+        self.text_scanner = CreativeTextScanner(max_entries=max_texts)
+        if self.text_scanner.version != plan.text_version:
+            logger.warning("Feature plan was fitted with different creative text keywords")
+        self.device_patterns = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in DEVICE_PATTERNS.items()}
+        self.ad_format_patterns = {
+            name: re.compile(pattern, re.IGNORECASE) for name, pattern in AD_FORMAT_PATTERNS.items()
+        }
+        self.major_markets = set(MAJOR_MARKETS)
+        self.major_cities = set(MAJOR_CITIES)
+
+    @staticmethod
+    def _stats_index(rows: Optional[List[list]]) -> Tuple[Optional[Dict[tuple, int]], List[np.ndarray]]:
+        """Key -> row lookup and value columns of a competitive stats table"""
+        if rows is None:
+            return None, []
+        index = {(row[0], row[1]): i for i, row in enumerate(rows)}
+        values = [np.array(column) for column in zip(*rows)][2:] if rows else []
+        return index, values
+
+    def transform_row(self, row: Dict[str, Any], use_history: bool = True) -> Dict[str, Any]:
+        """
+        Features of one row
+
+        Args:
+            row: Raw column values, as in a row of the pipeline's input
+            use_history: Compute lag features after the plan's campaign history
+
+        Returns:
+            Feature values in plan column order, as NumPy scalars
+        """
+        features = self.transform({name: [value] for name, value in row.items()}, use_history=use_history)
+        return {name: values[0] for name, values in features.items()}
+
+    def transform(self,
+                  rows: Union[Dict[str, Any], List[Dict[str, Any]], pd.DataFrame],
+                  use_history: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Features of a batch of rows
+
+        Args:
+            rows: Columns of values, a list of row dicts or a DataFrame
+            use_history: Compute lag features after the plan's campaign history
+
+        Returns:
+            Feature arrays in plan column order, rows in input order
+        """
+        columns, n = self._columns(rows)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._temporal(columns, n)
+            self._performance(columns, n)
+            self._competitive(columns)
+            self._audience(columns, n)
+            self._creative(columns, n)
+            self._lag(columns, n, use_history)
+            self._interaction(columns)
+        self._fill_missing(columns)
+
+        missing = [name for name in self.plan.columns if name not in columns]
+        if missing:
+            raise ValueError(f"Feature plan columns not computed from the input: {missing}")
+        return {name: columns[name] for name in self.plan.columns}
+
+    def complete(self,
+                 rows: Union[List[Dict[str, Any]], pd.DataFrame],
+                 names: List[str]) -> Union[List[Dict[str, Any]], pd.DataFrame]:
+        """
+        Rows with the named features they lack computed from the plan
+
+        Values the rows carry are kept, so a caller that engineered a
+        feature itself is not overridden; nothing is computed unless some
+        row lacks one of the features.
+
+        Args:
+            rows: List of row dicts or a DataFrame of raw columns
+            names: Features wanted, e.g. a model's inputs; ones not in the plan are skipped
+
+        Returns:
+            Rows of the same type and order, with the features added
+        """
+        names = [name for name in names if name in self.plan_columns]
+        if isinstance(rows, pd.DataFrame):
+            missing = [name for name in names if name not in rows.columns]
+            if not missing or rows.empty:
+                return rows
+            features = self.transform(rows)
+            return rows.assign(**{name: features[name] for name in missing})
+
+        missing = [name for name in names if any(row.get(name) is None for row in rows)]
+        if not missing:
+            return rows
+        features = self.transform(rows)
+        return [
+            {**row, **{name: features[name][i] for name in missing if row.get(name) is None}}
+            for i, row in enumerate(rows)
+        ]
+
+    def _columns(self, rows) -> Tuple[Dict[str, np.ndarray], int]:
+        """Input columns of the plan as arrays, missing ones filled with nulls"""
+        if isinstance(rows, pd.DataFrame):
+            rows = {name: rows[name].to_numpy() for name in rows.columns}
+        elif isinstance(rows, list):
+            rows = {name: [row.get(name) for row in rows] for name in self.plan.input_columns}
+        n = len(next(iter(rows.values()))) if rows else 0
+
+        columns = {}
+        for name in self.plan.input_columns:
+            kind = self.plan.input_kinds[name]
+            values = rows.get(name)
+            if values is None:
+                values = [None] * n
+            if kind == 'datetime':
+                columns[name] = _as_datetime(np.asarray(values))
+            elif kind == 'numeric':
+                array = np.asarray(values)
+                if array.dtype == object:
+                    array = np.array([np.nan if _is_missing(value) else value for value in array.tolist()],
+                                     dtype=np.float64)
+                columns[name] = array
+            else:
+                columns[name] = np.asarray(values, dtype=object)
+        return columns, n
+
+    def _temporal(self, df: Dict[str, np.ndarray], n: int):
+        timestamps = _as_datetime(df['timestamp'])
+        df['timestamp'] = timestamps
+        missing = np.isnat(timestamps)
+        nanoseconds = timestamps.view(np.int64)
+        days = nanoseconds // _DAY_NS
+        month_starts = timestamps.astype('datetime64[M]')
+        months = month_starts.view(np.int64) % 12
+        day_of_week = (days + 3) % 7
+
+        # ISO week: the week of the year that holds the week's Thursday
+        thursday = days - day_of_week + 3
+        first_day = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').view(np.int64)
+
+        fields = {
+            'hour': (nanoseconds // _HOUR_NS) % 24,
+            'day_of_week': day_of_week,
+            'day_of_month': days - month_starts.astype('datetime64[D]').view(np.int64) + 1,
+            'month': months + 1,
+            'quarter': months // 3 + 1,
+            'week_of_year': (thursday - first_day) // 7 + 1,
+        }
+        any_missing = missing.any()
+        for name, values in fields.items():
+            if any_missing:
+                values = values.astype(np.float64)
+                values[missing] = np.nan
+            else:
+                values = values.astype(np.uint32 if name == 'week_of_year' else np.int32)
+            df[name] = values
+
+        # Cyclical encoding for temporal features
+        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
+        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+        df['day_of_week_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
+        df['day_of_week_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
+        df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
+        df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
+
+        # Business logic features
+        df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
+        df['is_business_hours'] = ((df['hour'] >= 9) & (df['hour'] <= 17)).astype(int)
+        df['is_evening'] = ((df['hour'] >= 18) & (df['hour'] <= 22)).astype(int)
+        df['is_night'] = ((df['hour'] >= 23) | (df['hour'] <= 5)).astype(int)
+
+        df.update(self._holiday_features(timestamps, missing, n))
+
+        # Month 0 stands for a missing month
+        df['season'] = self.seasons[np.where(missing, 0, months + 1)]
+
+        if 'campaign_start_date' in df:
+            df['campaign_age_days'] = _days(timestamps - _as_datetime(df['campaign_start_date']))
+            df['campaign_age_weeks'] = df['campaign_age_days'] / 7
+            df['is_new_campaign'] = (df['campaign_age_days'] <= 7).astype(int)
+
+    def _holiday_features(self, timestamps: np.ndarray, missing: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+        if missing.all():
+            return {
+                'is_holiday': np.zeros(n, dtype=np.int64),
+                'days_to_holiday': np.full(n, NO_HOLIDAY_DAYS, dtype=np.int64),
+                'days_from_holiday': np.full(n, NO_HOLIDAY_DAYS, dtype=np.int64),
+            }
+
+        day_numbers = timestamps.astype('datetime64[D]').view(np.int64)
+        day_numbers = np.where(missing, day_numbers[~missing][0], day_numbers)
+        years = HolidayTable._year_of(day_numbers)
+        if not self.holidays.covers(int(years.min()), int(years.max())):
+            raise ValueError(f"Feature plan holidays cover {self.holidays.first_year}-{self.holidays.last_year}, "
+                             f"not {int(years.min())}-{int(years.max())}")
+
+        features = self.holidays.features(day_numbers)
+        if missing.any():
+            features['is_holiday'][missing] = 0
+            features['days_to_holiday'][missing] = NO_HOLIDAY_DAYS
+            features['days_from_holiday'][missing] = NO_HOLIDAY_DAYS
+        return features
+
+    def _performance(self, df: Dict[str, np.ndarray], n: int):
+        # Basic calculated metrics
+        df['ctr'] = np.where(df['impressions'] > 0, df['clicks'] / df['impressions'], 0)
+        df['cpc'] = np.where(df['clicks'] > 0, df['spend'] / df['clicks'], 0)
+        df['cpm'] = np.where(df['impressions'] > 0, df['spend'] / df['impressions'] * 1000, 0)
+        df['conversion_rate'] = np.where(df['clicks'] > 0, df['conversions'] / df['clicks'], 0)
+        df['cost_per_conversion'] = np.where(df['conversions'] > 0, df['spend'] / df['conversions'], 0)
+
+        # Advanced performance metrics
+        df['engagement_rate'] = np.where(
+            df['impressions'] > 0,
+            (df.get('likes', 0) + df.get('shares', 0) + df.get('comments', 0)) / df['impressions'],
+            0
+        )
+
+        # Efficiency ratios
+        df['clicks_per_impression'] = df['ctr']
+        df['spend_efficiency'] = np.where(df['spend'] > 0, df['conversions'] / df['spend'], 0)
+        df['impression_efficiency'] = np.where(df['impressions'] > 0, df['conversions'] / df['impressions'], 0)
+
+        if 'frequency' in df and 'reach' in df:
+            df['frequency_capped'] = np.minimum(df['frequency'], 10)
+            df['reach_percentage'] = df['reach'] / df.get('audience_size', df['reach'])
+            df['impression_reach_ratio'] = np.where(df['reach'] > 0, df['impressions'] / df['reach'], 0)
+
+        if 'budget' in df:
+            df['budget_utilization'] = np.where(df['budget'] > 0, df['spend'] / df['budget'], 0)
+            df['remaining_budget'] = df['budget'] - df['spend']
+            df['remaining_budget_percentage'] = np.where(
+                df['budget'] > 0, df['remaining_budget'] / df['budget'], 0
+            )
+
+    @staticmethod
+    def _lookup(index: Dict[tuple, int], values: List[np.ndarray], keys: np.ndarray,
+                hours: np.ndarray) -> List[np.ndarray]:
+        """Stats columns for each row's (key, hour), NaN where the plan has none"""
+        positions = np.fromiter(
+            (index.get(key, -1) for key in zip(keys.tolist(), hours.tolist())), dtype=np.intp, count=len(keys)
+        )
+        unmatched = positions < 0
+        columns = []
+        for column in values:
+            if unmatched.any():
+                column = np.append(column.astype(np.float64), np.nan)
+            columns.append(column[positions])
+        if not values:
+            columns = [np.full(len(keys), np.nan) for _ in range(3)]
+        return columns
+
+    def _competitive(self, df: Dict[str, np.ndarray]):
+        if self.audience_index is not None:
+            stats = self._lookup(self.audience_index, self.audience_values, df['audience_id'], df['hour'])
+            df.update(zip(self.AUDIENCE_COLUMNS, stats))
+            df['audience_share_impressions'] = np.where(
+                df['impressions_audience_total'] > 0,
+                df['impressions'] / df['impressions_audience_total'],
+                0
+            )
+            df['audience_share_spend'] = np.where(
+                df['spend_audience_total'] > 0,
+                df['spend'] / df['spend_audience_total'],
+                0
+            )
+
+        if self.placement_index is not None:
+            stats = self._lookup(self.placement_index, self.placement_values, df['placement'], df['hour'])
+            df.update(zip(self.PLACEMENT_COLUMNS, stats))
+            df['ctr_vs_placement_avg'] = df['ctr'] / (df['ctr_placement_avg'] + 1e-6)
+            df['cpc_vs_placement_avg'] = df['cpc'] / (df['cpc_placement_avg'] + 1e-6)
+
+    @staticmethod
+    def _contains(values: np.ndarray, pattern: 're.Pattern') -> np.ndarray:
+        """Series.str.contains(case=False, na=False) as 0/1"""
+        return np.fromiter(
+            (isinstance(value, str) and pattern.search(value) is not None for value in values.tolist()),
+            dtype=bool, count=len(values)
+        ).astype(int)
+
+    @staticmethod
+    def _isin(values: np.ndarray, members: set) -> np.ndarray:
+        return np.fromiter((value in members for value in values.tolist()), dtype=bool, count=len(values)).astype(int)
+
+    def _audience(self, df: Dict[str, np.ndarray], n: int):
+        if 'age_min' in df and 'age_max' in df:
+            df['age_range'] = df['age_max'] - df['age_min']
+            df['age_midpoint'] = (df['age_min'] + df['age_max']) / 2
+            df['is_young_audience'] = (df['age_midpoint'] <= 25).astype(int)
+            df['is_mature_audience'] = (df['age_midpoint'] >= 45).astype(int)
+
+        if 'gender_distribution' in df:
+            df['gender_balance'] = _full(np.abs(0.5 - df.get('female_percentage', 0.5)), n)
+            df['is_gender_balanced'] = (df['gender_balance'] <= 0.1).astype(int)
+
+        if 'interests' in df:
+            df['num_interests'] = np.fromiter(
+                (len(value.split(',')) if isinstance(value, str) else 0 for value in df['interests'].tolist()),
+                dtype=np.int64, count=n
+            )
+            df['has_specific_interests'] = (df['num_interests'] > 0).astype(int)
+            df['interest_diversity'] = np.log1p(df['num_interests'])
+
+        if 'country' in df:
+            df['is_major_market'] = self._isin(df['country'], self.major_markets)
+
+        if 'city' in df:
+            df['is_major_city'] = self._isin(df['city'], self.major_cities)
+
+        if 'device_platform' in df:
+            for name, pattern in self.device_patterns.items():
+                df[name] = self._contains(df['device_platform'], pattern)
+
+    def _creative(self, df: Dict[str, np.ndarray], n: int):
+        if 'ad_format' in df:
+            for name, pattern in self.ad_format_patterns.items():
+                df[name] = self._contains(df['ad_format'], pattern)
+
+        if 'creative_created_date' in df:
+            df['creative_age_days'] = _days(df['timestamp'] - _as_datetime(df['creative_created_date']))
+            df['is_fresh_creative'] = (df['creative_age_days'] <= 7).astype(int)
+            df['creative_fatigue_score'] = np.minimum(df['creative_age_days'] / 30, 1.0)
+
+        if 'ad_text' in df:
+            df.update(self._text_features(df['ad_text'], n))
+            df['sentiment_balance'] = df['positive_sentiment_score'] - df['negative_sentiment_score']
+
+    def _text_features(self, texts: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+        """CreativeTextScanner.features for an array of texts, memoized by text"""
+        values = np.zeros((n, len(TEXT_FEATURES)), dtype=np.int64)
+        missing = np.zeros(n, dtype=bool)
+        memo = self.text_scanner.memo
+        for i, text in enumerate(texts.tolist()):
+            if not isinstance(text, str):
+                missing[i] = True
+                continue
+            row = memo.get(text)
+            if row is None:
+                if len(memo) >= self.text_scanner.max_entries:
+                    memo.clear()
+                row = memo[text] = self.text_scanner.scan(text)
+            values[i] = row
+
+        features = {}
+        for j, name in enumerate(TEXT_FEATURES):
+            column = np.ascontiguousarray(values[:, j])
+            features[name] = column.astype(np.float64) if missing.any() and name not in FLAG_FEATURES else column
+        return features
+
+    def _lag(self, df: Dict[str, np.ndarray], n: int, use_history: bool):
+        metrics = self.plan.lag_metrics
+        if not metrics or 'campaign_id' not in df:
+            return
+
+        if n == 1:
+            self._lag_row(df, use_history)
+            return
+
+        codes: Dict[Any, int] = {}
+        batch_codes = np.fromiter(
+            (-1 if _is_missing(key) else codes.setdefault(key, len(codes)) for key in df['campaign_id'].tolist()),
+            dtype=np.int64, count=n
+        )
+        batch_values = np.column_stack([np.asarray(df[metric], dtype=np.float64) for metric in metrics])
+
+        # History rows of the batch's campaigns come first within each campaign
+        history_codes, history_values = [], []
+        if use_history:
+            for key, code in codes.items():
+                rows = self.history.get(key)
+                if rows is not None:
+                    history_codes.append(np.full(len(rows), code))
+                    history_values.append(rows)
+        history_rows = sum(len(rows) for rows in history_values)
+
+        all_codes = np.concatenate(history_codes + [batch_codes])
+        all_values = np.concatenate(history_values + [batch_values])
+        is_batch = np.arange(len(all_codes)) >= history_rows
+        time_keys = np.concatenate([np.zeros(history_rows, dtype=np.int64), _time_keys(df['timestamp'])])
+        order = np.lexsort((np.arange(len(all_codes)), time_keys, is_batch, all_codes))
+
+        sorted_codes = all_codes[order]
+        positions = _group_positions(sorted_codes)
+        values = {metric: all_values[order, j] for j, metric in enumerate(metrics)}
+        ungrouped = sorted_codes < 0
+        for name, column in lag_feature_columns(values, positions, self.plan.lag_periods, stacked=True).items():
+            column[ungrouped] = np.nan
+            unsorted = np.empty_like(column)
+            unsorted[order] = column
+            df[name] = unsorted[history_rows:]
+
+    def _lag_row(self, df: Dict[str, np.ndarray], use_history: bool):
+        """Lag features of a single row, after its campaign's history"""
+        metrics = self.plan.lag_metrics
+        key = df['campaign_id'][0]
+        row = np.array([[df[metric][0] for metric in metrics]], dtype=np.float64)
+        history = self.history.get(key) if use_history and not _is_missing(key) else None
+        window = row if history is None else np.concatenate([history, row])
+        features = _last_row_lag_features(window, metrics, self.plan.lag_periods)
+        if _is_missing(key):
+            features = {name: np.full(1, np.nan) for name in features}
+        df.update(features)
+
+    def _interaction(self, df: Dict[str, np.ndarray]):
+        if 'hour' in df and 'day_of_week' in df:
+            widened = np.result_type(df['day_of_week'].dtype, np.int64)
+            df['hour_dayofweek_interaction'] = df['hour'] * df['day_of_week'].astype(widened)
+
+        if 'ctr' in df and 'frequency' in df:
+            df['ctr_frequency_interaction'] = df['ctr'] * df['frequency']
+
+        if 'bid_amount' in df and 'cpc' in df:
+            df['bid_cpc_ratio'] = np.where(df['cpc'] > 0, df['bid_amount'] / df['cpc'], 0)
+
+        if 'age_midpoint' in df and 'is_video' in df:
+            df['age_video_interaction'] = df['age_midpoint'] * df['is_video']
+
+        if 'is_mobile' in df and 'creative_age_days' in df:
+            df['mobile_creative_freshness'] = df['is_mobile'] * (1 / (1 + df['creative_age_days']))
+
+        if 'budget_utilization' in df and 'ctr' in df:
+            df['budget_performance_interaction'] = df['budget_utilization'] * df['ctr']
+
+    def _fill_missing(self, df: Dict[str, np.ndarray]):
+        """Missing values get the fitted medians and modes"""
+        fills = self.plan.fill_values
+        names = [name for name in df if fills.get(name) is not None]
+        floats = [name for name in names if df[name].dtype.kind == 'f']
+        objects = [name for name in names if df[name].dtype == object]
+
+        # One NaN scan over every float column instead of one per column
+        missing_floats = []
+        if floats:
+            missing = np.isnan(np.concatenate([df[name] for name in floats])).reshape(len(floats), -1)
+            missing_floats = [(floats[i], missing[i]) for i in np.flatnonzero(missing.any(axis=1))]
+        missing_objects = [
+            (name, np.fromiter((_is_missing(value) for value in df[name].tolist()), dtype=bool, count=len(df[name])))
+            for name in objects
+        ]
+
+        for name, missing in missing_floats + missing_objects:
+            if missing.any():
+                values = df[name].copy()
+                values[missing] = fills[name]
+                df[name] = values
@@ -0,0 +1,187 @@
+"""
+Feature Frame Builder for AI-Buyer
+Collects engineered columns next to an untouched input frame and assembles them once
+"""
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Iterator, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+import logging
+
+if TYPE_CHECKING:
+    from .dtype_plan import DtypePlan
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureFrameBuilder:
+    """
+    Column builder used by FacebookAdFeatureEngineer stages
+
+    Reads fall through to the input frame, which is never copied or
+    modified; assignments are kept as separate columns aligned to the input
+    rows. Stages that reorder rows (the lag stage sorts by campaign and
+    time) record a row order instead of moving data. ``build`` assembles
+    the output frame once, in the column and row order a chain of
+    ``df = df.copy(); df[...] = ...`` stages would have produced. With a
+    dtype plan, assigned columns are stored in their planned dtypes.
+    """
+
+    def __init__(self, df: pd.DataFrame, dtype_plan: Optional['DtypePlan'] = None):
+        self.base = df
+        self.dtype_plan = dtype_plan
+        self.index = df.index
+        self.added: Dict[str, pd.Series] = {}
+        self.row_order: Optional[np.ndarray] = None
+        self.reset_index = False
+        self.stage_stats: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    @property
+    def columns(self) -> List[str]:
+        """Column names in output order"""
+        return list(self.base.columns) + [c for c in self.added if c not in self.base.columns]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.added or name in self.base.columns
+
+    def __getitem__(self, name: str) -> pd.Series:
+        if name in self.added:
+            return self.added[name]
+        return self.base[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self[name] if name in self else default
+
+    def __setitem__(self, name: str, values: Any):
+        """Add a column, or replace one, aligned to the input rows"""
+        if isinstance(values, pd.Series):
+            if not values.index.equals(self.index):
+                values = values.reindex(self.index)
+            values = values.rename(name)
+        else:
+            values = pd.Series(values, index=self.index, name=name)
+        if self.dtype_plan is not None:
+            values = self.dtype_plan.cast(name, values)
+        self.added[name] = values
+
+    def frame(self, columns: List[str]) -> pd.DataFrame:
+        """Small frame of the given columns in input row order, for group-bys and merges"""
+        return pd.DataFrame({name: self[name] for name in columns}, index=self.index)
+
+    def positions(self) -> np.ndarray:
+        """Input row positions in current output order"""
+        if self.row_order is None:
+            return np.arange(len(self))
+        return self.row_order
+
+    def sorted_positions(self, by: List[str]) -> np.ndarray:
+        """Input row positions after sorting the current rows by the given columns"""
+        positions = self.positions()
+        keys = self.frame(by).take(positions)
+        keys.index = positions
+        # Categoricals sort by category order, which depends on how they were
+        # built; sort by value as for the plain column
+        for name in by:
+            if isinstance(keys[name].dtype, pd.CategoricalDtype):
+                keys[name] = keys[name].astype(keys[name].cat.categories.dtype)
+        return keys.sort_values(by).index.to_numpy()
+
+    def reorder_rows(self, positions: np.ndarray):
+        """Set the output row order, given as input row positions"""
+        self.row_order = positions
+
+    def discard_index(self):
+        """Give the output a fresh RangeIndex, as DataFrame.merge does"""
+        self.reset_index = True
+
+    def build(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Assemble the output frame with a single copy of every column
+
+        Args:
+            columns: Output columns in order (defaults to ``columns``)
+        """
+        if columns is None:
+            columns = self.columns
+
+        index = self.index
+        if self.reset_index:
+            index = pd.RangeIndex(len(self))
+
+        if self.row_order is None:
+            return pd.DataFrame({name: self._values(name) for name in columns},
+                                index=index, copy=True)
+
+        order = self.row_order
+        return pd.DataFrame(
+            {name: self._values(name).take(order) for name in columns},
+            index=index.take(order), copy=False
+        )
+
+    def _values(self, name: str) -> Any:
+        """Backing array of a column; plain ndarrays for NumPy dtypes"""
+        values = self[name].array
+        # DataFrame construction scans wrapped object arrays for missing
+        # values, which dominates build time for text columns
+        if isinstance(values, pd.arrays.NumpyExtensionArray):
+            return np.asarray(values)
+        return values
+
+    def memory_usage(self, columns: Optional[List[str]] = None) -> int:
+        """Bytes held by added columns"""
+        names = self.added if columns is None else columns
+        return int(sum(self.added[name].memory_usage(index=False, deep=True) for name in names))
+
+    @contextmanager
+    def stage(self, name: str, track_memory: bool = False) -> Iterator[None]:
+        """
+        Time a pipeline stage and log the columns and memory it added
+
+        Args:
+            name: Stage name for the log line
+            track_memory: Also report the stage's peak traced allocation
+                (tracemalloc; slows allocation-heavy stages)
+        """
+        before = set(self.added)
+        started_tracing = False
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        if track_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if track_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+
+            new_columns = [c for c in self.added if c not in before]
+            stats = {
+                'stage': name,
+                'seconds': elapsed,
+                'columns': [c for c in new_columns if c not in self.base.columns],
+                'columns_added': len(new_columns),
+                'bytes_added': self.memory_usage(new_columns),
+                'peak_bytes': peak,
+            }
+            self.stage_stats.append(stats)
+
+            message = (f"Stage {name}: {stats['columns_added']} columns, "
+                       f"{stats['bytes_added'] / 1e6:.1f} MB added in {elapsed:.2f}s")
+            if peak is not None:
+                message += f", peak {peak / 1e6:.1f} MB"
+            logger.info(message)
@@ -0,0 +1,200 @@
+"""
+Parallel Feature Pipeline for AI-Buyer
+Runs per-campaign feature stages over campaign shards in a process pool
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import logging
+
+from .chunked_pipeline import plan_campaign_chunks
+from .feature_cache import GROUP_BY_COLS
+from .frame_builder import FeatureFrameBuilder
+
+logger = logging.getLogger(__name__)
+
+INPUT_ROW_COLUMN = '_input_row'
+
+# Shared-memory filesystem for shard files, where available
+SHARED_MEMORY_DIR = '/dev/shm'
+
+# Feature engineer of the current worker process, set by the pool initializer
+_worker_engineer = None
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (its affinity mask, where the OS has one)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def write_arrow(frame: pd.DataFrame, path: str) -> int:
+    """Write a frame as an Arrow IPC file and return its size in bytes"""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return os.path.getsize(path)
+
+
+def read_arrow(path: str) -> pa.Table:
+    """Memory-map an Arrow IPC file; buffers are read in place, not copied"""
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _init_worker(engineer):
+    global _worker_engineer
+    _worker_engineer = engineer
+
+
+def _engineer_shard(input_path: str, output_path: str, stages: List[str]) -> Dict[str, Any]:
+    """Run stages on one shard file and write the result next to it"""
+    frame = read_arrow(input_path).to_pandas()
+    os.remove(input_path)
+
+    builder = _worker_engineer.feature_builder(frame)
+    _worker_engineer.run_stages(builder, stages)
+    write_arrow(builder.build(), output_path)
+
+    return {
+        'rows': len(frame),
+        'stage_columns': {stats['stage']: stats['columns'] for stats in builder.stage_stats},
+        'base_columns': [c for c in frame.columns if c != INPUT_ROW_COLUMN],
+    }
+
+
+class ParallelFeaturePipeline:
+    """
+    create_feature_pipeline stages with the per-campaign work in a process pool
+
+    The input is split into campaign-aligned shards written as Arrow IPC
+    files to shared memory; workers memory-map their shard, run every stage
+    outside GLOBAL_STAGES and write their result the same way, so only file
+    paths and column names are pickled. The parent then concatenates the
+    shards, which are in campaign order, and runs the cross-campaign stages
+    as a reduce over key columns taken in input row order. Output matches
+    the serial pipeline value for value, in the same row and column order.
+
+    Opt-in: create_feature_pipeline runs in-process unless asked for more
+    than one worker and more than one CPU is usable. Speedup against core
+    count has not been measured yet (benchmarks/parallel_pipeline.py);
+    enable it for training only where the benchmark shows a gain.
+    """
+
+    def __init__(self,
+                 engineer,
+                 workers: Optional[int] = None,
+                 shards_per_worker: int = 4,
+                 shard_dir: Optional[str] = None):
+        """
+        Args:
+            engineer: FacebookAdFeatureEngineer whose stages produce the features
+            workers: Worker processes (defaults to the usable CPUs)
+            shards_per_worker: Shards per worker, for load balancing
+            shard_dir: Directory for shard files (shared memory by default)
+        """
+        self.engineer = engineer
+        self.workers = workers or available_cpus()
+        self.shards_per_worker = shards_per_worker
+        if shard_dir is None and os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+            shard_dir = SHARED_MEMORY_DIR
+        self.shard_dir = shard_dir
+        self.last_run: Dict[str, Any] = {}
+
+    def engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Engineered features for df
+
+        Args:
+            df: Raw input dataframe
+
+        Returns:
+            Features before missing-value handling and correlation pruning
+        """
+        from .facebook_features import FEATURE_STAGES, GLOBAL_STAGES, pipeline_columns
+
+        start = time.perf_counter()
+        campaign_rows = df['campaign_id'].value_counts(dropna=False)
+        shard_rows = max(1, math.ceil(len(df) / (self.workers * self.shards_per_worker)))
+        plan = plan_campaign_chunks(campaign_rows, shard_rows)
+
+        shard_dir = tempfile.mkdtemp(prefix='feature-shards-', dir=self.shard_dir)
+        try:
+            # Scatter: one Arrow file per shard, rows in input order
+            shard_of = {campaign: i for i, campaign_ids in enumerate(plan) for campaign in campaign_ids}
+            codes = df['campaign_id'].map(shard_of).fillna(shard_of.get(None, -1)).to_numpy(dtype=np.int64)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(plan) + 1))
+
+            inputs, outputs = [], []
+            for i in range(len(plan)):
+                rows = order[bounds[i]:bounds[i + 1]]
+                shard = df.take(rows)
+                shard[INPUT_ROW_COLUMN] = rows
+                inputs.append(os.path.join(shard_dir, f'{i:06d}.in.arrow'))
+                outputs.append(os.path.join(shard_dir, f'{i:06d}.out.arrow'))
+                write_arrow(shard, inputs[-1])
+                del shard
+            scatter_seconds = time.perf_counter() - start
+
+            # Map: per-campaign stages in the pool
+            local_stages = [stage for stage in FEATURE_STAGES if stage not in GLOBAL_STAGES]
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     initializer=_init_worker,
+                                     initargs=(self.engineer,)) as pool:
+                results = list(pool.map(
+                    _engineer_shard, inputs, outputs, [local_stages] * len(plan)
+                ))
+            map_seconds = time.perf_counter() - start - scatter_seconds
+
+            # Gather
+            tables = [read_arrow(path) for path in outputs]
+            features = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+            del tables
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+        input_rows = features.pop(INPUT_ROW_COLUMN).to_numpy()
+
+        # Reduce: cross-campaign stages over key columns in input row order,
+        # so their aggregates are summed exactly as in the serial pipeline
+        builder = self.engineer.feature_builder(features)
+        with builder.stage('competitive'):
+            in_input_order = FeatureFrameBuilder(features.take(np.argsort(input_rows, kind='stable')))
+            stats = self.engineer.competitive_stats(in_input_order)
+            del in_input_order
+            self.engineer._apply_competitive_stats(builder, stats)
+
+        stage_columns = dict(results[0]['stage_columns'])
+        stage_columns['competitive'] = builder.stage_stats[-1]['columns']
+
+        # Serial output order: the lag stage sorts rows by campaign and time
+        order = builder.sorted_positions(GROUP_BY_COLS + ['timestamp'])
+        builder.reorder_rows(order)
+        result = builder.build(columns=pipeline_columns(results[0]['base_columns'], stage_columns))
+
+        input_rows = input_rows[order]
+        result.index = pd.Index(input_rows) if builder.reset_index else df.index.take(input_rows)
+
+        self.last_run = {
+            'workers': self.workers,
+            'shards': len(plan),
+            'scatter_seconds': scatter_seconds,
+            'map_seconds': map_seconds,
+            'reduce_seconds': time.perf_counter() - start - scatter_seconds - map_seconds,
+        }
+        logger.info(f"Engineered {len(plan)} campaign shards on {self.workers} workers "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return result
@@ -0,0 +1,306 @@
+"""
+Streaming Feature Engine for AI-Buyer
+Incremental per-campaign lag, moving-average and trend features for real-time scoring
+"""
+
+import math
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Optional, Tuple, Hashable, Mapping
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Metrics and windows used by FacebookAdFeatureEngineer.engineer_lag_features
+LAG_METRICS = ['ctr', 'cpc', 'conversions', 'spend', 'impressions', 'clicks']
+TREND_METRICS = ['ctr', 'conversions']
+LAG_PERIODS = [1, 3, 7]
+
+NAN = float('nan')
+
+
+def _divide(numerator: float, denominator: float) -> float:
+    """Division with NumPy semantics (x/0 is +-inf, 0/0 is NaN)"""
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return NAN
+        return math.copysign(math.inf, numerator) * math.copysign(1.0, denominator)
+    return numerator / denominator
+
+
+def _number(value: Any) -> float:
+    """Reported metric as a float, NaN when missing"""
+    return NAN if value is None or value == '' else float(value)
+
+
+def performance_record(metrics: Mapping[str, Any]) -> Dict[str, float]:
+    """
+    Lag metrics of one reported record, derived as _add_performance_features does
+
+    Rates come from the raw counts (a reported ctr, a percentage in
+    Facebook insights, is not used), and missing or None counts are NaN as
+    in the batch frame, not 0.
+
+    Args:
+        metrics: Reported metrics, e.g. the metrics of a campaign event
+
+    Returns:
+        Counts and derived rates
+    """
+    impressions = _number(metrics.get('impressions'))
+    clicks = _number(metrics.get('clicks'))
+    spend = _number(metrics.get('spend'))
+    return {
+        'impressions': impressions,
+        'clicks': clicks,
+        'spend': spend,
+        'conversions': _number(metrics.get('conversions')),
+        # NaN > 0 is False, so a missing denominator gives 0 as np.where does
+        'ctr': clicks / impressions if impressions > 0 else 0.0,
+        'cpc': spend / clicks if clicks > 0 else 0.0,
+        'cpm': spend / impressions * 1000 if impressions > 0 else 0.0,
+    }
+
+
+class _MetricState:
+    """
+    Sliding-window state for one metric of one campaign
+
+    Keeps the last few values plus running sums per window, so each update
+    costs the same regardless of how much history the campaign has. Missing
+    values are kept as NaN in the history and counted separately in the
+    sums, mirroring pandas' NaN handling in the batch features.
+    """
+
+    __slots__ = ('history', 'rows', 'window_sums', 'window_counts',
+                 'trend_sum_y', 'trend_sum_xy', 'trend_missing', 'last_valid', 'updates')
+
+    def __init__(self, history_size: int, windows: List[int]):
+        self.history: deque = deque(maxlen=history_size)
+        self.rows = 0
+        self.window_sums = {window: 0.0 for window in windows}
+        self.window_counts = {window: 0 for window in windows}
+        self.trend_sum_y = 0.0
+        self.trend_sum_xy = 0.0
+        self.trend_missing = 0
+        self.last_valid = NAN
+        self.updates = 0
+
+    def value_back(self, periods: int) -> float:
+        """Value `periods` rows before the next one, NaN if the campaign is younger"""
+        return self.history[-periods] if len(self.history) >= periods else NAN
+
+    def resync(self, windows: List[int], trend_window: int):
+        """Recompute running sums from the history to shed floating-point drift"""
+        values = list(self.history)
+        for window in windows:
+            present = [v for v in values[-window:] if not math.isnan(v)]
+            self.window_sums[window] = math.fsum(present)
+            self.window_counts[window] = len(present)
+
+        trend_values = values[-trend_window:]
+        self.trend_sum_y = math.fsum(0.0 if math.isnan(v) else v for v in trend_values)
+        self.trend_sum_xy = math.fsum(x * v for x, v in enumerate(trend_values) if not math.isnan(v))
+        self.trend_missing = sum(1 for v in trend_values if math.isnan(v))
+
+
+class IncrementalLagFeatureEngine:
+    """
+    Per-campaign incremental version of engineer_lag_features
+
+    Each ``update`` takes one metric record for a campaign and returns the
+    lag, moving-average, pct_change and trend features the batch pipeline
+    would compute for that row, in O(1) time and memory per campaign.
+    Records are taken in arrival order, so results match the batch
+    features when each campaign's records arrive in timestamp order.
+    """
+
+    def __init__(self,
+                 lag_periods: List[int] = LAG_PERIODS,
+                 lag_metrics: List[str] = LAG_METRICS,
+                 trend_metrics: List[str] = TREND_METRICS,
+                 trend_window: int = 7,
+                 trend_min_periods: int = 3,
+                 max_campaigns: Optional[int] = None,
+                 resync_every: int = 1000):
+        """
+        Args:
+            lag_periods: Lag and moving-average windows
+            lag_metrics: Metrics that get lag, MA and pct_change features
+            trend_metrics: Metrics that get a rolling trend slope
+            trend_window: Rows in the trend window
+            trend_min_periods: Rows needed before a trend is reported
+            max_campaigns: Campaigns kept in memory, least recently updated
+                evicted first (None keeps all)
+            resync_every: Updates between recomputing running sums from history
+        """
+        self.lag_periods = list(lag_periods)
+        self.lag_metrics = list(lag_metrics)
+        self.trend_metrics = list(trend_metrics)
+        self.trend_window = trend_window
+        self.trend_min_periods = trend_min_periods
+        self.max_campaigns = max_campaigns
+        self.resync_every = resync_every
+
+        self.metrics = list(dict.fromkeys(self.lag_metrics + self.trend_metrics))
+        self.windows = sorted(set(self.lag_periods))
+        self.history_size = max(self.windows + [trend_window])
+
+        self.campaigns: 'OrderedDict[Hashable, Dict[str, _MetricState]]' = OrderedDict()
+        self.latest: Dict[Hashable, Dict[str, float]] = {}
+        self.records_processed = 0
+        self.campaigns_evicted = 0
+
+    @property
+    def feature_names(self) -> List[str]:
+        """Feature names in the column order of engineer_lag_features"""
+        names = []
+        for metric in self.lag_metrics:
+            for lag in self.lag_periods:
+                names += [f'{metric}_lag_{lag}', f'{metric}_ma_{lag}']
+                if lag == 1:
+                    names.append(f'{metric}_pct_change')
+        names += [self._trend_name(metric) for metric in self.trend_metrics]
+        return names
+
+    def update(self, campaign_key: Hashable, record: Mapping[str, Any]) -> Dict[str, float]:
+        """
+        Add one metric record for a campaign and return its features
+
+        Args:
+            campaign_key: Campaign identifier (the batch group_by key)
+            record: Flat mapping of metric name to value; missing metrics
+                are treated as NaN
+
+        Returns:
+            Feature name to value for this record
+        """
+        state = self.campaigns.get(campaign_key)
+        if state is None:
+            state = {metric: _MetricState(self.history_size, self.windows) for metric in self.metrics}
+            self.campaigns[campaign_key] = state
+            if self.max_campaigns and len(self.campaigns) > self.max_campaigns:
+                evicted, _ = self.campaigns.popitem(last=False)
+                self.latest.pop(evicted, None)
+                self.campaigns_evicted += 1
+        else:
+            self.campaigns.move_to_end(campaign_key)
+
+        features: Dict[str, float] = {}
+        for metric in self.metrics:
+            value = record.get(metric)
+            value = NAN if value is None else float(value)
+            self._update_metric(metric, state[metric], value, features)
+
+        self.records_processed += 1
+        self.latest[campaign_key] = features
+        return features
+
+    def update_reported(self, campaign_key: Hashable, metrics: Mapping[str, Any]) -> Dict[str, float]:
+        """
+        As update, for metrics as reported rather than as engineered
+
+        Args:
+            campaign_key: Campaign identifier (the batch group_by key)
+            metrics: Reported metrics, see performance_record
+
+        Returns:
+            Feature name to value for this record
+        """
+        return self.update(campaign_key, performance_record(metrics))
+
+    def _update_metric(self, metric: str, state: _MetricState, value: float, features: Dict[str, float]):
+        """Emit features for one metric value and advance its state"""
+        present = not math.isnan(value)
+
+        if metric in self.lag_metrics:
+            for lag in self.lag_periods:
+                # Lag features
+                features[f'{metric}_lag_{lag}'] = state.value_back(lag)
+
+                # Moving averages: add the new value, drop the one leaving the window
+                leaving = state.value_back(lag)
+                window_sum = state.window_sums[lag] + (value if present else 0.0)
+                window_count = state.window_counts[lag] + present
+                if not math.isnan(leaving):
+                    window_sum -= leaving
+                    window_count -= 1
+                state.window_sums[lag] = window_sum
+                state.window_counts[lag] = window_count
+                features[f'{metric}_ma_{lag}'] = window_sum / window_count if window_count else NAN
+
+                # Percentage change against the forward-filled previous value
+                if lag == 1:
+                    previous = state.last_valid if state.rows else NAN
+                    current = value if present else previous
+                    features[f'{metric}_pct_change'] = _divide(current, previous) - 1
+
+        if metric in self.trend_metrics:
+            features[self._trend_name(metric)] = self._update_trend(state, value, present)
+
+        state.history.append(value)
+        state.rows += 1
+        if present:
+            state.last_valid = value
+
+        state.updates += 1
+        if state.updates % self.resync_every == 0:
+            state.resync(self.windows, self.trend_window)
+
+    def _update_trend(self, state: _MetricState, value: float, present: bool) -> float:
+        """
+        Slide the trend window and return its least-squares slope
+
+        The window holds values at x = 0..n-1, oldest first. Sliding drops
+        x = 0 and shifts every other value down by one, so
+        Sxy' = Sxy - (Sy - y_out) + (n - 1) * y_new.
+        """
+        window = self.trend_window
+        y = value if present else 0.0
+
+        if state.rows >= window:
+            leaving = state.history[-window]
+            y_out = 0.0 if math.isnan(leaving) else leaving
+            state.trend_sum_xy = state.trend_sum_xy - (state.trend_sum_y - y_out) + (window - 1) * y
+            state.trend_sum_y = state.trend_sum_y - y_out + y
+            state.trend_missing -= math.isnan(leaving)
+            n = window
+        else:
+            state.trend_sum_xy += state.rows * y
+            state.trend_sum_y += y
+            n = state.rows + 1
+        state.trend_missing += not present
+
+        if n < self.trend_min_periods or state.trend_missing:
+            return NAN
+
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * state.trend_sum_xy - sum_x * state.trend_sum_y) / (n * sum_xx - sum_x ** 2)
+
+    def _trend_name(self, metric: str) -> str:
+        return f'{metric}_trend_7d' if self.trend_window == 7 else f'{metric}_trend_{self.trend_window}'
+
+    def update_many(self, records: List[Tuple[Hashable, Mapping[str, Any]]]) -> List[Dict[str, float]]:
+        """Update with (campaign_key, record) pairs in order"""
+        return [self.update(key, record) for key, record in records]
+
+    def latest_features(self, campaign_key: Hashable) -> Optional[Dict[str, float]]:
+        """Features emitted for a campaign's most recent record"""
+        return self.latest.get(campaign_key)
+
+    def reset(self, campaign_key: Optional[Hashable] = None):
+        """Forget one campaign, or every campaign"""
+        if campaign_key is None:
+            self.campaigns.clear()
+            self.latest.clear()
+        else:
+            self.campaigns.pop(campaign_key, None)
+            self.latest.pop(campaign_key, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'campaigns_tracked': len(self.campaigns),
+            'campaigns_evicted': self.campaigns_evicted,
+            'records_processed': self.records_processed,
+        }
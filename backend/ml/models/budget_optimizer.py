@@ -29,6 +29,8 @@ class BudgetOptimizer:
         self.user_id = user_id
         self.prophet_models = {}
         self.optimization_history = []
+        # Bounded, since the API keeps optimizers loaded across requests
+        self.max_history = 100
         self.is_trained = False
         
         # Optimization parameters
@@ -465,6 +467,7 @@ class BudgetOptimizer:
             
             # Store optimization history
             self.optimization_history.append(optimization_result)
+            del self.optimization_history[:-self.max_history]
             
             return optimization_result
             
@@ -476,20 +479,26 @@ class BudgetOptimizer:
                 "user_id": self.user_id
             }
     
+    @staticmethod
+    def resolve_model_run(user_id: str) -> str:
+        """Run id of the latest budget optimization training run of a user"""
+        experiment_name = f"budget_optimization_{user_id}"
+        experiment = mlflow.get_experiment_by_name(experiment_name)
+        if experiment is None:
+            raise Exception(f"No experiment found: {experiment_name}")
+        
+        runs = mlflow.search_runs(experiment_ids=[experiment.experiment_id])
+        if runs.empty:
+            raise Exception(f"No runs found in experiment: {experiment_name}")
+        
+        return runs.iloc[0]['run_id']
+    
     def load_models(self, model_run_id: Optional[str] = None):
         """Load trained Prophet models from MLflow"""
         try:
             if model_run_id is None:
                 # Get latest run from experiment
-                experiment = mlflow.get_experiment_by_name(self.experiment_name)
-                if experiment is None:
-                    raise Exception(f"No experiment found: {self.experiment_name}")
-                
-                runs = mlflow.search_runs(experiment_ids=[experiment.experiment_id])
-                if runs.empty:
-                    raise Exception(f"No runs found in experiment: {self.experiment_name}")
-                
-                model_run_id = runs.iloc[0]['run_id']
+                model_run_id = self.resolve_model_run(self.user_id)
             
             # Download model artifacts
             artifacts_uri = f"runs:/{model_run_id}/prophet_models_{self.user_id}"
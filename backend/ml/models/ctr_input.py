@@ -0,0 +1,306 @@
+"""
+CTR Training Input for AI-Buyer
+Streaming CTRPredictor training rows from Parquet shards or ClickHouse chunks through tf.data
+"""
+
+import glob
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import logging
+
+from .ctr_preprocessor import CTRPreprocessor
+
+logger = logging.getLogger(__name__)
+
+# Columns identifying a training row, hashed for the validation split
+DEFAULT_KEY_COLUMNS = ['campaign_id', 'timestamp']
+
+# Resolution of the validation share
+SPLIT_BUCKETS = 10000
+
+
+def validation_mask(frame: pd.DataFrame, key_columns: List[str], validation_split: float) -> np.ndarray:
+    """
+    Rows in the validation split, by a stable hash of their key columns
+
+    A row lands in the same split however the data is sharded or chunked,
+    in every run and process, so no split has to be materialized.
+    Timestamps are hashed as UTC nanoseconds, since Parquet may hand them
+    back in another unit.
+
+    Args:
+        frame: Training rows
+        key_columns: Columns identifying a row
+        validation_split: Share of rows for validation
+
+    Returns:
+        Boolean mask, True for validation rows
+    """
+    missing = [column for column in key_columns if column not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing row key columns for the validation split: {missing}")
+
+    keys = {}
+    for column in key_columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if getattr(values.dt, 'tz', None) is not None:
+                values = values.dt.tz_convert(None)
+            values = values.astype('datetime64[ns]').astype(np.int64)
+        keys[column] = values.to_numpy() if isinstance(values.dtype, np.dtype) else values
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(keys, index=frame.index), index=False).to_numpy()
+    return hashes % np.uint64(SPLIT_BUCKETS) < np.uint64(round(validation_split * SPLIT_BUCKETS))
+
+
+class CTRTrainingInput:
+    """
+    Training rows of the CTR model, read shard by shard
+
+    A shard is a unit read independently and in parallel: a row group of a
+    Parquet file, or a chunk of campaigns queried from ClickHouse. Rows are
+    never all held in memory; the preprocessor is fitted in one streaming
+    pass over the training split, and dataset() decodes shards into a
+    tf.data pipeline with a bounded shuffle buffer and prefetching.
+    """
+
+    def __init__(self,
+                 shards: List[Any],
+                 read_shard: Callable[[Any], Iterator[pd.DataFrame]],
+                 target_column: str = 'ctr',
+                 key_columns: Optional[List[str]] = None,
+                 validation_split: float = 0.2,
+                 row_filter: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None):
+        """
+        Args:
+            shards: Shard descriptors, passed to read_shard
+            read_shard: Frames of one shard's rows
+            target_column: Column with the training target
+            key_columns: Columns identifying a row (defaults to DEFAULT_KEY_COLUMNS)
+            validation_split: Share of rows, by key hash, held out for validation
+            row_filter: Applied to every frame before splitting, e.g. to drop
+                rows with too few impressions
+        """
+        if not shards:
+            raise ValueError("Training input has no shards")
+        self.shards = shards
+        self.read_shard = read_shard
+        self.target_column = target_column
+        self.key_columns = list(DEFAULT_KEY_COLUMNS if key_columns is None else key_columns)
+        self.validation_split = validation_split
+        self.row_filter = row_filter
+        # Rows per split, counted while fitting the preprocessor
+        self.row_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_parquet(cls, path: str, columns: Optional[List[str]] = None,
+                     batch_rows: int = 65536, dictionary_strings: bool = True,
+                     **options: Any) -> 'CTRTrainingInput':
+        """
+        Input over a Parquet file or a directory of Parquet files
+
+        Every row group is a shard, so a single large file (such as the
+        chunked feature pipeline's output) is read in parallel as well.
+
+        Args:
+            path: Parquet file or directory
+            columns: Columns to read (all by default)
+            batch_rows: Rows per decoded record batch
+            dictionary_strings: Decode string columns as categoricals, so
+                each distinct value is converted and encoded once per batch
+                rather than once per row
+            **options: CTRTrainingInput options
+
+        Returns:
+            The input
+        """
+        files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)) \
+            if os.path.isdir(path) else [path]
+        shards = [(file, group) for file in files for group in range(pq.ParquetFile(file).num_row_groups)]
+
+        def read_shard(shard: Tuple[str, int]) -> Iterator[pd.DataFrame]:
+            file, group = shard
+            strings = []
+            if dictionary_strings:
+                schema = pq.read_schema(file, memory_map=True)
+                strings = [field.name for field in schema
+                           if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)]
+            parquet = pq.ParquetFile(file, memory_map=True, read_dictionary=strings)
+            for batch in parquet.iter_batches(batch_size=batch_rows, row_groups=[group], columns=columns):
+                yield batch.to_pandas()
+
+        logger.info(f"Training input: {len(shards)} row groups in {len(files)} Parquet files")
+        return cls(shards, read_shard, **options)
+
+    @classmethod
+    def from_clickhouse(cls, source, chunk_rows: int = 500000, **options: Any) -> 'CTRTrainingInput':
+        """
+        Input over ClickHouse rows, one shard per chunk of campaigns
+
+        Args:
+            source: ClickHouseChunkSource (or anything with campaign_rows() and read_chunks(plan))
+            chunk_rows: Target rows per shard
+            **options: CTRTrainingInput options
+
+        Returns:
+            The input
+        """
+        from ..feature_engineering.chunked_pipeline import plan_campaign_chunks
+
+        plan = plan_campaign_chunks(source.campaign_rows(), chunk_rows)
+        logger.info(f"Training input: {len(plan)} ClickHouse chunks")
+        return cls(plan, lambda campaign_ids: source.read_chunks([campaign_ids]), **options)
+
+    def frames(self, split: Optional[str] = None, shards: Optional[Iterable[Any]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Filtered rows, frame by frame
+
+        Args:
+            split: 'train', 'validation' or None for all rows
+            shards: Shards to read (all by default)
+
+        Yields:
+            Non-empty frames
+        """
+        if split not in (None, 'train', 'validation'):
+            raise ValueError(f"Unknown split '{split}'")
+        for shard in self.shards if shards is None else shards:
+            for frame in self.read_shard(shard):
+                if self.row_filter is not None:
+                    frame = self.row_filter(frame)
+                if split is not None and len(frame):
+                    mask = validation_mask(frame, self.key_columns, self.validation_split)
+                    frame = frame[mask if split == 'validation' else ~mask]
+                if len(frame):
+                    yield frame
+
+    def fit_preprocessor(self, preprocessor: CTRPreprocessor, exclude: Iterable[str] = ()) -> CTRPreprocessor:
+        """
+        Fit a preprocessor on the training split in one pass, counting the rows of both splits
+
+        Args:
+            preprocessor: Unfitted preprocessor
+            exclude: Features to treat as missing (pruned at training time)
+
+        Returns:
+            The fitted preprocessor
+        """
+        excluded = list(exclude)
+        self.row_counts = {'train': 0, 'validation': 0}
+
+        def training_frames() -> Iterator[pd.DataFrame]:
+            for frame in self.frames():
+                mask = validation_mask(frame, self.key_columns, self.validation_split)
+                validation_rows = int(mask.sum())
+                self.row_counts['validation'] += validation_rows
+                self.row_counts['train'] += len(frame) - validation_rows
+                yield frame[~mask].drop(columns=[column for column in excluded if column in frame.columns])
+
+        preprocessor.fit_chunks(training_frames())
+        logger.info(f"Training input: {self.row_counts['train']} training and "
+                    f"{self.row_counts['validation']} validation rows")
+        return preprocessor
+
+    def target_variance(self, split: Optional[str] = None) -> float:
+        """
+        Variance of the target over a split, in one pass of running sums
+
+        Args:
+            split: 'train', 'validation' or None for all rows
+
+        Returns:
+            The population variance (0.0 without rows)
+        """
+        count, total, squares = 0, 0.0, 0.0
+        for frame in self.frames(split):
+            values = frame[self.target_column].to_numpy(dtype=np.float64)
+            count += len(values)
+            total += values.sum()
+            squares += np.dot(values, values)
+        if count == 0:
+            return 0.0
+        mean = total / count
+        return max(squares / count - mean * mean, 0.0)
+
+    def batches(self,
+                preprocessor: CTRPreprocessor,
+                split: str = 'train',
+                exclude: Iterable[str] = (),
+                shards: Optional[Iterable[Any]] = None) -> Iterator[Tuple[Dict[str, np.ndarray], np.ndarray]]:
+        """
+        Encoded model inputs and targets, one decoded frame at a time
+
+        Args:
+            preprocessor: Fitted preprocessor
+            split: 'train' or 'validation'
+            exclude: Features to treat as missing
+            shards: Shards to read (all by default)
+
+        Yields:
+            int32 codes and float32 dense values by feature, float32 targets
+        """
+        excluded = list(exclude)
+        dense = set(preprocessor.dense_features)
+        for frame in self.frames(split, shards):
+            feature_input = preprocessor.transform(frame, exclude=excluded)
+            feature_input = {name: values.astype(np.float32, copy=False) if name in dense else values
+                             for name, values in feature_input.items()}
+            yield feature_input, frame[self.target_column].to_numpy(dtype=np.float32)
+
+    def dataset(self,
+                preprocessor: CTRPreprocessor,
+                split: str = 'train',
+                batch_size: int = 512,
+                shuffle_buffer: int = 65536,
+                parallel_reads: int = 4,
+                exclude: Iterable[str] = (),
+                seed: Optional[int] = 42):
+        """
+        tf.data pipeline of (features, target) batches
+
+        Shards are decoded and encoded in parallel by interleaving one
+        generator per shard. The training split visits shards in a new
+        order each epoch and shuffles rows through a buffer; memory is
+        bounded by the buffer, the decoded batches in flight and prefetch.
+
+        Args:
+            preprocessor: Fitted preprocessor
+            split: 'train' or 'validation'
+            batch_size: Rows per batch
+            shuffle_buffer: Rows in the shuffle buffer (training split)
+            parallel_reads: Shards decoded concurrently
+            exclude: Features to treat as missing
+            seed: Shuffle seed
+
+        Returns:
+            tf.data.Dataset
+        """
+        import tensorflow as tf
+
+        excluded = list(exclude)
+        signature = (
+            {**{feat: tf.TensorSpec((None,), tf.int32) for feat in preprocessor.sparse_features},
+             **{feat: tf.TensorSpec((None,), tf.float32) for feat in preprocessor.dense_features}},
+            tf.TensorSpec((None,), tf.float32),
+        )
+        training = split == 'train'
+
+        def read(index):
+            return tf.data.Dataset.from_generator(
+                lambda i: self.batches(preprocessor, split, excluded, [self.shards[int(i)]]),
+                args=(index,), output_signature=signature
+            )
+
+        shards = tf.data.Dataset.range(len(self.shards))
+        if training:
+            shards = shards.shuffle(len(self.shards), seed=seed, reshuffle_each_iteration=True)
+        dataset = shards.interleave(read, cycle_length=parallel_reads, num_parallel_calls=parallel_reads,
+                                    deterministic=not training)
+        dataset = dataset.unbatch()
+        if training:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
@@ -7,8 +7,7 @@ import pandas as pd
 import numpy as np
 import mlflow
 import mlflow.tensorflow
-from typing import List, Dict, Any, Optional, Tuple
-from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+from typing import List, Dict, Any, Optional, Tuple, Union
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import tensorflow as tf
@@ -21,12 +20,30 @@ import os
 from deepctr.models import DeepFM
 from deepctr.feature_column import SparseFeat, DenseFeat, get_feature_names
 
+from ..feature_engineering.correlation_pruner import CorrelationPruner
+from ..feature_engineering.feature_plan import FeaturePlan, FeaturePlanExecutor, load_model_feature_plan
+from .ctr_input import CTRTrainingInput
+from .ctr_preprocessor import CTRPreprocessor, SPARSE_FEATURES, TENANT_FEATURE
+from .deepfm_numpy import NumpyDeepFM, grow_weights
+from .model_registry import SHARED_CTR_MODEL, resolve_ctr_model_version
+
 logger = logging.getLogger(__name__)
 
+def normalized_mse(mse: float, target_variance: float) -> float:
+    """MSE over the target variance (1 - R²): 1.0 is no better than predicting the mean"""
+    return float(mse / target_variance) if target_variance > 0 else float('nan')
+
 class CTRPredictor:
     """
     Deep Learning CTR prediction model using DeepFM architecture
     Optimized for Facebook advertising data with categorical and numerical features
+    
+    The model of user_id SHARED_CTR_MODEL is trained on the rows of all
+    tenants, with the tenant as one more sparse feature (TENANT_FEATURE),
+    so each tenant gets an embedding of its own while the rest of the
+    network learns from every tenant's data. A share of training rows have
+    their tenant masked as unknown, which trains the embedding that tenants
+    new since training are scored with.
     """
     
     def __init__(self, user_id: str, model_name: str = "ctr_predictor"):
@@ -34,9 +51,16 @@ class CTRPredictor:
         self.model_name = model_name
         self.model = None
         self.feature_columns = None
-        self.feature_encoders = {}
-        self.scaler = MinMaxScaler()
+        self.preprocessor = CTRPreprocessor()
+        self.correlation_pruner: Optional[CorrelationPruner] = None
+        # Feature pipeline state of the training data; predictions compute
+        # the engineered inputs a request lacks (e.g. day_of_week) from it
+        self.feature_plan: Optional[FeaturePlan] = None
+        self._feature_executor: Optional[FeaturePlanExecutor] = None
         self.is_trained = False
+        # Validation MSE of the current model over the target variance
+        # (1 - R²), the baseline of drift_report
+        self.validation_nmse: Optional[float] = None
         
         # Model hyperparameters
         self.embedding_dim = 8
@@ -46,6 +70,17 @@ class CTRPredictor:
         self.task = 'regression'
         self.dnn_dropout = 0.1
         
+        # Fixed-size hashed vocabularies for high-cardinality ids, e.g.
+        # {'ad_id': 50000}; see CTRPreprocessor. Empty keeps exact vocabularies
+        self.hash_buckets: Dict[str, int] = {}
+        self.min_frequency: Optional[int] = None
+        self.max_vocabulary: Optional[int] = None
+        
+        # Tenant feature of the shared model and the share of training rows
+        # whose tenant is masked as unknown
+        self.tenant_feature: Optional[str] = TENANT_FEATURE if user_id == SHARED_CTR_MODEL else None
+        self.tenant_dropout = 0.05
+        
         # MLflow configuration
         self.experiment_name = f"ctr_prediction_{user_id}"
         self._setup_mlflow()
@@ -58,86 +93,94 @@ class CTRPredictor:
         except Exception as e:
             logger.error(f"Failed to setup MLflow experiment: {e}")
     
-    def prepare_features(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, List]:
+    def prepare_features(self, df: pd.DataFrame, fit: bool = False) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
         """
         Prepare features for DeepCTR model
         
         Args:
             df: Raw dataframe with campaign data
+            fit: Fit the encodings and feature columns on df (training);
+                otherwise apply the frozen ones
             
         Returns:
-            Processed dataframe and feature columns definition
+            Processed dataframe and feature input dict
         """
         logger.info("Preparing features for CTR prediction")
         
-        # Define sparse (categorical) features
-        sparse_features = [
-            'campaign_id', 'ad_set_id', 'ad_id', 'placement', 'device_type',
-            'age_group', 'gender', 'interest_category', 'geographic_location',
-            'time_period', 'day_of_week', 'hour_of_day', 'creative_format',
-            'campaign_objective', 'optimization_goal'
-        ]
+        if fit:
+            # Features pruned at training time get the same defaults everywhere
+            self.preprocessor = self._new_preprocessor().fit(self._without_pruned(df))
+            self.feature_columns = self.build_feature_columns()
         
-        # Define dense (numerical) features
-        dense_features = [
-            'bid_amount', 'budget_remaining', 'frequency', 'reach',
-            'previous_ctr', 'previous_cpc', 'previous_conversion_rate',
-            'audience_size', 'competition_index', 'weather_score',
-            'seasonal_factor', 'campaign_age_days'
-        ]
-        
-        # Create missing columns with default values if needed
-        for feat in sparse_features:
-            if feat not in df.columns:
-                df[feat] = 'unknown'
-        
-        for feat in dense_features:
-            if feat not in df.columns:
-                df[feat] = 0.0
-        
-        # Encode sparse features
-        for feat in sparse_features:
-            if feat not in self.feature_encoders:
-                self.feature_encoders[feat] = LabelEncoder()
-                df[feat] = self.feature_encoders[feat].fit_transform(df[feat].astype(str))
-            else:
-                # Handle unseen categories
-                unique_values = df[feat].unique()
-                encoder_classes = self.feature_encoders[feat].classes_
-                new_values = set(unique_values) - set(encoder_classes)
-                
-                if new_values:
-                    # Add new categories to encoder
-                    all_classes = np.concatenate([encoder_classes, list(new_values)])
-                    self.feature_encoders[feat].classes_ = all_classes
-                
-                df[feat] = self.feature_encoders[feat].transform(df[feat].astype(str))
+        feature_input = self.preprocessor.transform(df, exclude=self._pruned_features())
+        return pd.DataFrame(feature_input, index=df.index), feature_input
+    
+    def _new_preprocessor(self) -> CTRPreprocessor:
+        """Unfitted preprocessor with this model's vocabulary settings and inputs"""
+        sparse_features = SPARSE_FEATURES + ([self.tenant_feature] if self.tenant_feature else [])
+        return CTRPreprocessor(
+            sparse_features=sparse_features,
+            hash_buckets=self.hash_buckets,
+            min_frequency=self.min_frequency,
+            max_vocabulary=self.max_vocabulary
+        )
+    
+    def _mask_tenants(self, feature_input: Dict[str, np.ndarray], seed: int = 42) -> Dict[str, np.ndarray]:
+        """Training input with the tenant of a tenant_dropout share of rows set to the unknown code"""
+        if not self.tenant_feature or not self.tenant_dropout:
+            return feature_input
+        codes = feature_input[self.tenant_feature].copy()
+        codes[np.random.default_rng(seed).random(len(codes)) < self.tenant_dropout] = 0
+        return {**feature_input, self.tenant_feature: codes}
+    
+    def _mask_tenants_dataset(self, dataset):
+        """As _mask_tenants, on a tf.data pipeline, with new rows masked every epoch"""
+        if not self.tenant_feature or not self.tenant_dropout:
+            return dataset
+        feat, rate = self.tenant_feature, self.tenant_dropout
         
-        # Normalize dense features
-        df[dense_features] = self.scaler.fit_transform(df[dense_features])
+        def mask(features, target):
+            codes = features[feat]
+            kept = tf.random.uniform(tf.shape(codes)) >= rate
+            return {**features, feat: tf.where(kept, codes, tf.zeros_like(codes))}, target
         
-        # Create feature columns for DeepCTR
-        fixlen_feature_columns = [
-            SparseFeat(feat, vocabulary_size=df[feat].nunique() + 1, 
+        return dataset.map(mask, num_parallel_calls=tf.data.AUTOTUNE)
+    
+    def build_feature_columns(self) -> List:
+        """DeepCTR feature columns for the fitted preprocessor"""
+        return [
+            SparseFeat(feat, vocabulary_size=self.preprocessor.vocabulary_size(feat),
                       embedding_dim=self.embedding_dim)
-            for feat in sparse_features
+            for feat in self.preprocessor.sparse_features
         ] + [
-            DenseFeat(feat, 1) for feat in dense_features
+            DenseFeat(feat, 1) for feat in self.preprocessor.dense_features
         ]
-        
-        self.feature_columns = fixlen_feature_columns
-        
-        # Create feature input dict for model
-        feature_names = get_feature_names(fixlen_feature_columns)
-        feature_input = {name: df[name] for name in feature_names}
-        
-        return df, feature_input
     
-    def create_model(self) -> tf.keras.Model:
+    def _pruned_features(self) -> List[str]:
+        if self.correlation_pruner is None:
+            return []
+        return self.correlation_pruner.to_drop
+    
+    def _without_pruned(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.correlation_pruner is None:
+            return df
+        return self.correlation_pruner.transform(df)
+    
+    def _with_engineered_features(self, campaigns: Union[pd.DataFrame, List[Dict[str, Any]]]):
+        """Campaigns with the model inputs they lack computed by the feature plan, if there is one"""
+        if self.feature_plan is None:
+            return campaigns
+        if self._feature_executor is None or self._feature_executor.plan is not self.feature_plan:
+            self._feature_executor = FeaturePlanExecutor(self.feature_plan)
+        return self._feature_executor.complete(campaigns, self.preprocessor.feature_names)
+    
+    def create_model(self, learning_rate: float = 0.001) -> tf.keras.Model:
         """Create DeepFM model architecture"""
         logger.info("Creating DeepFM model architecture")
         
+        # The same columns feed the linear and the FM/DNN parts
         model = DeepFM(
+            self.feature_columns,
             self.feature_columns,
             task=self.task,
             dnn_hidden_units=self.dnn_hidden_units,
@@ -148,13 +191,70 @@ class CTRPredictor:
         )
         
         model.compile(
-            optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+            optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
             loss='mse' if self.task == 'regression' else 'binary_crossentropy',
             metrics=['mae'] if self.task == 'regression' else ['AUC']
         )
         
         return model
     
+    def _callbacks(self, early_stopping_patience: int) -> List:
+        return [
+            tf.keras.callbacks.EarlyStopping(
+                patience=early_stopping_patience, 
+                restore_best_weights=True
+            ),
+            tf.keras.callbacks.ReduceLROnPlateau(
+                factor=0.5, patience=5, min_lr=1e-6
+            )
+        ]
+    
+    def _model_params(self) -> Dict[str, Any]:
+        """Hyperparameters and vocabulary sizes logged with every training run"""
+        return {
+            "user_id": self.user_id,
+            "model_type": "DeepFM",
+            "embedding_dim": self.embedding_dim,
+            "dnn_hidden_units": str(self.dnn_hidden_units),
+            "l2_reg_embedding": self.l2_reg_embedding,
+            "hash_buckets": str(self.hash_buckets),
+            "min_frequency": self.min_frequency,
+            "tenant_feature": self.tenant_feature,
+            "tenant_dropout": self.tenant_dropout if self.tenant_feature else 0,
+            "embedding_rows": sum(self.preprocessor.vocabulary_size(feat)
+                                  for feat in self.preprocessor.sparse_features),
+        }
+    
+    def _log_model(self):
+        """Register the model and log the artifacts inference needs to the active run"""
+        model_path = f"models/ctr_predictor_{self.user_id}"
+        model_info = mlflow.tensorflow.log_model(
+            self.model,
+            model_path,
+            registered_model_name=f"ctr_predictor_{self.user_id}"
+        )
+        # The registry version, which load_model and the model registry key
+        # on, identifies the model everywhere: exports, results, predictions
+        self.model_version = str(model_info.registered_model_version)
+        
+        # Save feature encoders and scaler
+        artifacts_path = f"artifacts_{self.user_id}"
+        os.makedirs(artifacts_path, exist_ok=True)
+        
+        self.preprocessor.save(f"{artifacts_path}/ctr_preprocessor.json")
+        with open(f"{artifacts_path}/feature_columns.pkl", 'wb') as f:
+            pickle.dump(self.feature_columns, f)
+        if self.correlation_pruner is not None:
+            self.correlation_pruner.save(f"{artifacts_path}/correlation_pruner.json")
+        if self.feature_plan is not None:
+            self.feature_plan.save(f"{artifacts_path}/feature_plan.json")
+        try:
+            self.export_numpy(f"{artifacts_path}/numpy_model", model_version=self.model_version)
+        except Exception as e:
+            logger.warning(f"NumPy export failed, scoring this model needs TensorFlow: {e}")
+        
+        mlflow.log_artifacts(artifacts_path)
+    
     def train(self, training_data: pd.DataFrame, target_column: str = 'ctr',
               validation_split: float = 0.2, epochs: int = 100, 
               batch_size: int = 512, early_stopping_patience: int = 10) -> Dict[str, Any]:
@@ -177,112 +277,318 @@ class CTRPredictor:
         with mlflow.start_run():
             try:
                 # Prepare features
-                processed_data, feature_input = self.prepare_features(training_data)
+                processed_data, feature_input = self.prepare_features(training_data, fit=True)
                 target = training_data[target_column].values
                 
-                # Split data
-                train_input, val_input, y_train, y_val = train_test_split(
-                    feature_input, target, test_size=validation_split, random_state=42
+                # Split rows; the input is a dict of per-feature arrays
+                train_rows, val_rows = train_test_split(
+                    np.arange(len(target)), test_size=validation_split, random_state=42
                 )
                 
                 # Create model
                 self.model = self.create_model()
                 
-                # Setup callbacks
-                callbacks = [
-                    tf.keras.callbacks.EarlyStopping(
-                        patience=early_stopping_patience, 
-                        restore_best_weights=True
-                    ),
-                    tf.keras.callbacks.ReduceLROnPlateau(
-                        factor=0.5, patience=5, min_lr=1e-6
+                return self._fit_rows(feature_input, target, train_rows, val_rows,
+                                      epochs=epochs, batch_size=batch_size,
+                                      early_stopping_patience=early_stopping_patience,
+                                      params={"training_mode": "full"})
+                
+            except Exception as e:
+                logger.error(f"Model training failed: {e}")
+                mlflow.log_params({"error": str(e)})
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "user_id": self.user_id
+                }
+    
+    def _fit_rows(self, feature_input: Dict[str, np.ndarray], target: np.ndarray,
+                  train_rows: np.ndarray, val_rows: np.ndarray, epochs: int, batch_size: int,
+                  early_stopping_patience: int, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fit self.model on encoded rows, then log metrics and the model to the active run"""
+        train_input = {name: values[train_rows] for name, values in feature_input.items()}
+        val_input = {name: values[val_rows] for name, values in feature_input.items()}
+        y_train, y_val = target[train_rows], target[val_rows]
+        
+        # Setup callbacks
+        callbacks = self._callbacks(early_stopping_patience)
+        
+        # Log parameters
+        mlflow.log_params({
+            **self._model_params(),
+            **(params or {}),
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "training_samples": len(y_train),
+            "validation_samples": len(y_val)
+        })
+        
+        # Train model
+        history = self.model.fit(
+            self._mask_tenants(train_input), y_train,
+            validation_data=(val_input, y_val),
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=callbacks,
+            verbose=1
+        )
+        
+        # Evaluate model
+        train_pred = self.model.predict(train_input)
+        val_pred = self.model.predict(val_input)
+        
+        train_mse = mean_squared_error(y_train, train_pred)
+        val_mse = mean_squared_error(y_val, val_pred)
+        train_mae = mean_absolute_error(y_train, train_pred)
+        val_mae = mean_absolute_error(y_val, val_pred)
+        val_nmse = normalized_mse(val_mse, np.var(y_val))
+        
+        # Log metrics
+        mlflow.log_metrics({
+            "train_mse": train_mse,
+            "val_mse": val_mse,
+            "val_nmse": val_nmse,
+            "train_mae": train_mae,
+            "val_mae": val_mae,
+            "final_loss": history.history['loss'][-1],
+            "final_val_loss": history.history['val_loss'][-1]
+        })
+        
+        self.is_trained = True
+        self.validation_nmse = val_nmse
+        self._log_model()
+        
+        logger.info(f"Model training completed successfully. Val MSE: {val_mse:.6f}")
+        return {
+            "success": True,
+            "user_id": self.user_id,
+            "training_samples": len(y_train),
+            "validation_samples": len(y_val),
+            "train_mse": train_mse,
+            "val_mse": val_mse,
+            "train_mae": train_mae,
+            "val_mae": val_mae,
+            "epochs_trained": len(history.history['loss']),
+            "model_version": self.model_version,
+            "trained_at": datetime.now().isoformat()
+        }
+    
+    def fine_tune(self, new_data: pd.DataFrame, replay_data: Optional[pd.DataFrame] = None,
+                  target_column: str = 'ctr', validation_split: float = 0.2, epochs: int = 3,
+                  batch_size: int = 512, learning_rate: float = 1e-4,
+                  early_stopping_patience: int = 2) -> Dict[str, Any]:
+        """
+        Warm-start the current model on a new window of rows
+        
+        Starts from the loaded (or latest registered) model's weights and
+        encoders: the vocabularies are extended with the window's new
+        categories (see CTRPreprocessor.extend) and the grown embedding
+        tables keep their trained rows. The model is then trained for a few
+        epochs at a lower learning rate on the new rows plus a replay sample
+        of older ones, which keeps it from forgetting what the window does
+        not show. Validation uses new rows only.
+        
+        Args:
+            new_data: Rows since the current model was trained
+            replay_data: Sample of older rows to train on alongside
+            target_column: Name of target column (CTR values)
+            validation_split: Fraction of new rows for validation
+            epochs: Number of training epochs
+            batch_size: Training batch size
+            learning_rate: Adam learning rate of the fine-tuning
+            early_stopping_patience: Early stopping patience
+            
+        Returns:
+            Training metrics and model info
+        """
+        logger.info(f"Starting incremental CTR model training for user {self.user_id}")
+        
+        if not self.is_trained or self.model is None:
+            self.load_model()
+        base_version = getattr(self, 'model_version', 'unknown')
+        previous = self.model, self.preprocessor, self.feature_columns
+        
+        with mlflow.start_run():
+            try:
+                # Extend a copy, so a failed run leaves the loaded model usable
+                self.preprocessor = CTRPreprocessor.from_dict(self.preprocessor.to_dict())
+                added = self.preprocessor.extend(self._without_pruned(new_data))
+                self.feature_columns = self.build_feature_columns()
+                self.model = self._warm_start(previous[0], learning_rate)
+                
+                replay_rows = 0 if replay_data is None else len(replay_data)
+                data = pd.concat([new_data, replay_data], ignore_index=True) if replay_rows else new_data
+                _, feature_input = self.prepare_features(data)
+                target = data[target_column].values
+                
+                train_rows, val_rows = train_test_split(
+                    np.arange(len(new_data)), test_size=validation_split, random_state=42
+                )
+                train_rows = np.concatenate([train_rows, np.arange(len(new_data), len(data))])
+                
+                return self._fit_rows(feature_input, target, train_rows, val_rows,
+                                      epochs=epochs, batch_size=batch_size,
+                                      early_stopping_patience=early_stopping_patience,
+                                      params={
+                                          "training_mode": "incremental",
+                                          "base_model_version": base_version,
+                                          "learning_rate": learning_rate,
+                                          "new_samples": len(new_data),
+                                          "replay_samples": replay_rows,
+                                          "categories_added": sum(added.values())
+                                      })
+                
+            except Exception as e:
+                logger.error(f"Incremental model training failed: {e}")
+                self.model, self.preprocessor, self.feature_columns = previous
+                mlflow.log_params({"error": str(e)})
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "user_id": self.user_id
+                }
+    
+    def _warm_start(self, previous: tf.keras.Model, learning_rate: float) -> tf.keras.Model:
+        """
+        Model for the current feature columns, starting from a trained model's weights
+        
+        Rows of new categories start as the unseen-value row, see grow_weights.
+        """
+        model = self.create_model(learning_rate=learning_rate)
+        weights = grow_weights(previous.get_weights(), model.get_weights(),
+                               fill_unseen=bool(self.preprocessor.code_offset))
+        model.set_weights(weights)
+        return model
+    
+    def drift_report(self, new_data: pd.DataFrame, target_column: str = 'ctr') -> Dict[str, Any]:
+        """
+        How the current model fares on new rows, to decide between fine-tuning and a full retrain
+        
+        Args:
+            new_data: Rows since the current model was trained
+            target_column: Name of target column (CTR values)
+            
+        Returns:
+            The model's MSE over the target variance on the rows against the
+            same at validation, so a shift in the CTR level alone does not
+            count as drift, and the share of the rows' values unseen by each
+            exact vocabulary (hashed features are left out)
+        """
+        target = new_data[target_column].values
+        window_nmse = normalized_mse(mean_squared_error(target, self.predict_batch(new_data)), np.var(target))
+        baseline_nmse = self.validation_nmse
+        
+        unseen = {}
+        if self.preprocessor.code_offset:
+            feature_input = self.preprocessor.transform(new_data, exclude=self._pruned_features())
+            unseen = {feat: float(np.mean(feature_input[feat] == 0))
+                      for feat in self.preprocessor.sparse_features
+                      if feat in new_data.columns and feat not in self.preprocessor.hash_buckets}
+        
+        return {
+            "window_nmse": window_nmse,
+            "baseline_nmse": baseline_nmse,
+            "nmse_ratio": window_nmse / baseline_nmse if baseline_nmse else None,
+            "unseen_share": max(unseen.values(), default=0.0),
+            "unseen_by_feature": unseen,
+            "rows": len(new_data)
+        }
+    
+    def train_streaming(self, training_input: CTRTrainingInput, epochs: int = 100,
+                        batch_size: int = 512, early_stopping_patience: int = 10,
+                        shuffle_buffer: int = 65536, parallel_reads: int = 4) -> Dict[str, Any]:
+        """
+        Train the CTR prediction model on rows streamed from shards
+        
+        Unlike train, the rows are never all in memory: the preprocessor is
+        fitted in one pass over the training split, then every epoch reads
+        the shards again through a tf.data pipeline. Validation rows are
+        chosen by a hash of the row key (see CTRTrainingInput).
+        
+        Args:
+            training_input: Sharded training rows
+            epochs: Number of training epochs
+            batch_size: Training batch size
+            early_stopping_patience: Early stopping patience
+            shuffle_buffer: Rows in the training shuffle buffer
+            parallel_reads: Shards decoded concurrently
+            
+        Returns:
+            Training metrics and model info
+        """
+        logger.info(f"Starting streaming CTR model training for user {self.user_id}")
+        
+        with mlflow.start_run():
+            try:
+                pruned = self._pruned_features()
+                self.preprocessor = training_input.fit_preprocessor(self._new_preprocessor(), exclude=pruned)
+                self.feature_columns = self.build_feature_columns()
+                rows = training_input.row_counts
+                if rows['train'] == 0 or rows['validation'] == 0:
+                    raise ValueError(f"Not enough rows to train and validate on: {rows}")
+                
+                def dataset(split: str):
+                    return training_input.dataset(
+                        self.preprocessor, split, batch_size=batch_size, shuffle_buffer=shuffle_buffer,
+                        parallel_reads=parallel_reads, exclude=pruned
                     )
-                ]
+                train_dataset, val_dataset = dataset('train'), dataset('validation')
                 
-                # Log parameters
+                self.model = self.create_model()
                 mlflow.log_params({
-                    "user_id": self.user_id,
-                    "model_type": "DeepFM",
-                    "embedding_dim": self.embedding_dim,
-                    "dnn_hidden_units": str(self.dnn_hidden_units),
-                    "l2_reg_embedding": self.l2_reg_embedding,
+                    **self._model_params(),
                     "epochs": epochs,
                     "batch_size": batch_size,
-                    "training_samples": len(y_train),
-                    "validation_samples": len(y_val)
+                    "training_input": "streaming",
+                    "shards": len(training_input.shards),
+                    "shuffle_buffer": shuffle_buffer,
+                    "training_samples": rows['train'],
+                    "validation_samples": rows['validation']
                 })
                 
-                # Train model
                 history = self.model.fit(
-                    train_input, y_train,
-                    validation_data=(val_input, y_val),
+                    self._mask_tenants_dataset(train_dataset),
+                    validation_data=val_dataset,
                     epochs=epochs,
-                    batch_size=batch_size,
-                    callbacks=callbacks,
-                    verbose=1
+                    callbacks=self._callbacks(early_stopping_patience),
+                    verbose=2
                 )
                 
-                # Evaluate model
-                train_pred = self.model.predict(train_input)
-                val_pred = self.model.predict(val_input)
-                
-                train_mse = mean_squared_error(y_train, train_pred)
-                val_mse = mean_squared_error(y_val, val_pred)
-                train_mae = mean_absolute_error(y_train, train_pred)
-                val_mae = mean_absolute_error(y_val, val_pred)
-                
-                # Log metrics
+                # Loss is the MSE (plus the L2 penalties), the metric MAE
+                train_mse, train_mae = self.model.evaluate(train_dataset, verbose=0)
+                val_mse, val_mae = self.model.evaluate(val_dataset, verbose=0)
+                val_nmse = normalized_mse(val_mse, training_input.target_variance('validation'))
                 mlflow.log_metrics({
                     "train_mse": train_mse,
                     "val_mse": val_mse,
+                    "val_nmse": val_nmse,
                     "train_mae": train_mae,
                     "val_mae": val_mae,
                     "final_loss": history.history['loss'][-1],
                     "final_val_loss": history.history['val_loss'][-1]
                 })
                 
-                # Save model
-                model_path = f"models/ctr_predictor_{self.user_id}"
-                mlflow.tensorflow.log_model(
-                    self.model,
-                    model_path,
-                    registered_model_name=f"ctr_predictor_{self.user_id}"
-                )
-                
-                # Save feature encoders and scaler
-                artifacts_path = f"artifacts_{self.user_id}"
-                os.makedirs(artifacts_path, exist_ok=True)
-                
-                with open(f"{artifacts_path}/feature_encoders.pkl", 'wb') as f:
-                    pickle.dump(self.feature_encoders, f)
-                with open(f"{artifacts_path}/scaler.pkl", 'wb') as f:
-                    pickle.dump(self.scaler, f)
-                with open(f"{artifacts_path}/feature_columns.pkl", 'wb') as f:
-                    pickle.dump(self.feature_columns, f)
-                
-                mlflow.log_artifacts(artifacts_path)
-                
                 self.is_trained = True
+                self.validation_nmse = val_nmse
+                self._log_model()
                 
-                training_results = {
+                logger.info(f"Streaming model training completed. Val MSE: {val_mse:.6f}")
+                return {
                     "success": True,
                     "user_id": self.user_id,
-                    "training_samples": len(y_train),
-                    "validation_samples": len(y_val),
+                    "training_samples": rows['train'],
+                    "validation_samples": rows['validation'],
                     "train_mse": train_mse,
                     "val_mse": val_mse,
                     "train_mae": train_mae,
                     "val_mae": val_mae,
                     "epochs_trained": len(history.history['loss']),
-                    "model_version": mlflow.active_run().info.run_id,
+                    "model_version": self.model_version,
                     "trained_at": datetime.now().isoformat()
                 }
                 
-                logger.info(f"Model training completed successfully. Val MSE: {val_mse:.6f}")
-                return training_results
-                
             except Exception as e:
-                logger.error(f"Model training failed: {e}")
+                logger.error(f"Streaming model training failed: {e}")
                 mlflow.log_params({"error": str(e)})
                 return {
                     "success": False,
@@ -300,18 +606,8 @@ class CTRPredictor:
         Returns:
             Prediction results with confidence intervals
         """
-        if not self.is_trained or self.model is None:
-            self.load_model()
-        
         try:
-            # Convert to DataFrame
-            df = pd.DataFrame([campaign_data])
-            
-            # Prepare features
-            processed_data, feature_input = self.prepare_features(df)
-            
-            # Make prediction
-            prediction = self.model.predict(feature_input)[0][0]
+            prediction = float(self.predict_batch([campaign_data])[0])
             
             # Calculate confidence interval (using model uncertainty)
             # This is a simplified approach - in production, use proper uncertainty quantification
@@ -322,7 +618,7 @@ class CTRPredictor:
             ]
             
             return {
-                "predicted_ctr": float(prediction),
+                "predicted_ctr": prediction,
                 "confidence_interval": confidence_interval,
                 "model_version": getattr(self, 'model_version', 'unknown'),
                 "prediction_date": datetime.now().isoformat()
@@ -335,6 +631,116 @@ class CTRPredictor:
                 "predicted_ctr": None
             }
     
+    def predict_batch(self, campaigns: Union[pd.DataFrame, List[Dict[str, Any]]],
+                      batch_size: int = 4096) -> np.ndarray:
+        """
+        Predict CTR for many campaigns in one model call
+        
+        Encodes with the frozen preprocessor from training, so the result
+        for a row does not depend on the other rows in the batch. Engineered
+        inputs a row lacks are computed by the feature plan, when the model
+        has one.
+        
+        Args:
+            campaigns: Frame of campaign features, or a list of feature dicts
+            batch_size: Rows per forward pass
+            
+        Returns:
+            Predicted CTR per row
+        """
+        if not self.is_trained or self.model is None:
+            self.load_model()
+        
+        campaigns = self._with_engineered_features(campaigns)
+        if isinstance(campaigns, pd.DataFrame):
+            feature_input = self.preprocessor.transform(campaigns, exclude=self._pruned_features())
+        else:
+            feature_input = self.preprocessor.transform_records(campaigns, exclude=self._pruned_features())
+        
+        rows = len(campaigns)
+        if rows == 0:
+            return np.zeros(0, dtype=np.float32)
+        if rows <= batch_size:
+            # predict() sets up a dataset pipeline per call; one batch needs none
+            return np.asarray(self.model.predict_on_batch(feature_input)).reshape(-1)
+        return self.model.predict(feature_input, batch_size=batch_size, verbose=0).reshape(-1)
+    
+    def export_numpy(self, directory: str, model_version: Optional[str] = None) -> NumpyDeepFM:
+        """
+        Export the trained DeepFM for TensorFlow-free scoring
+        
+        Reads the weights off DeepCTR's layers: the linear and FM/DNN
+        embeddings (named '<prefix>_emb_<feature>'), the Linear, DNN and
+        output Dense layers and the prediction layer's bias.
+        
+        Args:
+            directory: Where to write the arrays, see NumpyDeepFM.save
+            model_version: Version recorded with the export (defaults to the loaded one)
+            
+        Returns:
+            The exported model, checked against this one on a few rows
+        """
+        if not self.is_trained or self.model is None:
+            raise ValueError("Model must be trained or loaded before export")
+        
+        embeddings, linear_weights = {}, {}
+        layers = {}
+        for layer in self.model.layers:
+            kind = type(layer).__name__
+            if kind == 'Embedding':
+                prefix, feat = layer.name.split('_emb_', 1)
+                table = layer.get_weights()[0]
+                if prefix.startswith('linear'):
+                    linear_weights[feat] = table[:, 0]
+                else:
+                    embeddings[feat] = table
+            elif kind in ('Linear', 'DNN', 'Dense', 'PredictionLayer'):
+                if kind in layers:
+                    raise ValueError(f"Unexpected model layout: more than one {kind} layer")
+                layers[kind] = layer
+        
+        linear, dnn = layers['Linear'], layers['DNN']
+        if dnn.use_bn or dnn.output_activation:
+            raise ValueError("DNN batch normalization and output activations are not supported by the NumPy export")
+        activation = dnn.activation if isinstance(dnn.activation, str) else dnn.activation.__name__
+        prediction = layers['PredictionLayer']
+        dense_features = [fc.name for fc in self.feature_columns if isinstance(fc, DenseFeat)]
+        
+        exported = NumpyDeepFM.from_features(
+            self.preprocessor,
+            embeddings=embeddings,
+            linear_weights=linear_weights,
+            linear_kernel=linear.kernel.numpy() if hasattr(linear, 'kernel') else np.zeros(len(dense_features)),
+            dnn_kernels=[kernel.numpy() for kernel in dnn.kernels],
+            dnn_biases=[bias.numpy() for bias in dnn.bias],
+            output_kernel=layers['Dense'].get_weights()[0],
+            linear_bias=float(linear.bias.numpy()[0]) if linear.use_bias else 0.0,
+            global_bias=float(prediction.global_bias.numpy()[0]) if prediction.use_bias else 0.0,
+            activation=activation,
+            task=prediction.task,
+            sparse_features=[fc.name for fc in self.feature_columns if isinstance(fc, SparseFeat)],
+            dense_features=dense_features,
+            pruned_features=self._pruned_features(),
+            model_version=str(model_version or getattr(self, 'model_version', 'unknown'))
+        )
+        
+        # Unknown values for every feature, then a few category codes
+        probe = {feat: np.arange(5, dtype=np.int32) % self.preprocessor.vocabulary_size(feat)
+                 for feat in exported.sparse_features}
+        probe.update({feat: np.linspace(0, 1, 5, dtype=np.float32) for feat in dense_features})
+        expected = np.asarray(self.model.predict_on_batch(probe)).reshape(-1)
+        np.testing.assert_allclose(exported.forward(probe), expected, rtol=1e-4, atol=1e-5)
+        exported.save(directory)
+        
+        logger.info(f"Exported NumPy model for user {self.user_id} to {directory}: "
+                    f"{exported.nbytes / 1e6:.1f} MB")
+        return exported
+    
+    @staticmethod
+    def resolve_model_version(user_id: str) -> str:
+        """Latest Production or Staging version of a user's registered model, else the newest"""
+        return resolve_ctr_model_version(user_id)
+    
     def load_model(self, model_version: Optional[str] = None):
         """Load trained model from MLflow"""
         try:
@@ -342,37 +748,36 @@ class CTRPredictor:
             model_name = f"ctr_predictor_{self.user_id}"
             
             if model_version is None:
-                # Get latest production version
-                latest_versions = client.get_latest_versions(
-                    model_name, 
-                    stages=["Production", "Staging"]
-                )
-                if not latest_versions:
-                    # If no production/staging version, get latest
-                    latest_versions = client.get_latest_versions(model_name)
-                
-                if latest_versions:
-                    model_version = latest_versions[0].version
-                else:
-                    raise Exception(f"No model found for user {self.user_id}")
+                model_version = self.resolve_model_version(self.user_id)
+            run_id = client.get_model_version(model_name, model_version).run_id
             
             # Load model
             model_uri = f"models:/{model_name}/{model_version}"
             self.model = mlflow.tensorflow.load_model(model_uri)
             
             # Load artifacts
-            artifacts_uri = f"runs:/{latest_versions[0].run_id}/artifacts_{self.user_id}"
+            artifacts_uri = f"runs:/{run_id}/artifacts_{self.user_id}"
             artifacts_path = mlflow.artifacts.download_artifacts(artifacts_uri)
             
-            with open(f"{artifacts_path}/feature_encoders.pkl", 'rb') as f:
-                self.feature_encoders = pickle.load(f)
-            with open(f"{artifacts_path}/scaler.pkl", 'rb') as f:
-                self.scaler = pickle.load(f)
+            preprocessor_path = f"{artifacts_path}/ctr_preprocessor.json"
+            if os.path.exists(preprocessor_path):
+                self.preprocessor = CTRPreprocessor.load(preprocessor_path)
+            else:
+                # Models saved before the preprocessor kept sklearn encoders
+                with open(f"{artifacts_path}/feature_encoders.pkl", 'rb') as f:
+                    feature_encoders = pickle.load(f)
+                with open(f"{artifacts_path}/scaler.pkl", 'rb') as f:
+                    scaler = pickle.load(f)
+                self.preprocessor = CTRPreprocessor.from_legacy(feature_encoders, scaler)
             with open(f"{artifacts_path}/feature_columns.pkl", 'rb') as f:
                 self.feature_columns = pickle.load(f)
+            pruner_path = f"{artifacts_path}/correlation_pruner.json"
+            self.correlation_pruner = CorrelationPruner.load(pruner_path) if os.path.exists(pruner_path) else None
+            self.feature_plan = load_model_feature_plan(f"{artifacts_path}/feature_plan.json")
             
             self.is_trained = True
             self.model_version = model_version
+            self.validation_nmse = client.get_run(run_id).data.metrics.get('val_nmse')
             
             logger.info(f"Model loaded successfully for user {self.user_id}, version {model_version}")
             
@@ -0,0 +1,433 @@
+"""
+CTR Feature Preprocessing for AI-Buyer
+Frozen categorical encodings and dense scaling shared by CTR training and inference
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Any, Optional, Union
+
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sparse (categorical) features
+SPARSE_FEATURES = [
+    'campaign_id', 'ad_set_id', 'ad_id', 'placement', 'device_type',
+    'age_group', 'gender', 'interest_category', 'geographic_location',
+    'time_period', 'day_of_week', 'hour_of_day', 'creative_format',
+    'campaign_objective', 'optimization_goal'
+]
+
+# Dense (numerical) features
+DENSE_FEATURES = [
+    'bid_amount', 'budget_remaining', 'frequency', 'reach',
+    'previous_ctr', 'previous_cpc', 'previous_conversion_rate',
+    'audience_size', 'competition_index', 'weather_score',
+    'seasonal_factor', 'campaign_age_days'
+]
+
+# High-cardinality ids, the usual candidates for hashed vocabularies
+HIGH_CARDINALITY_FEATURES = ['campaign_id', 'ad_set_id', 'ad_id']
+
+# Sparse feature identifying the tenant in the shared multi-tenant model
+TENANT_FEATURE = 'user_id'
+
+# Value of a missing sparse feature
+UNKNOWN_CATEGORY = 'unknown'
+
+# Batches up to this size look categories up one by one in a dict; larger
+# ones go through a vectorized Index lookup, which has a higher fixed cost
+SMALL_BATCH_ROWS = 1024
+
+
+class CTRPreprocessor:
+    """
+    Fitted input encodings of the CTR model
+
+    fit learns a vocabulary per sparse feature and the range of each dense
+    feature once, on the training frame; transform then applies them
+    unchanged to any number of rows. Categories are matched by their string
+    form in precomputed hash maps, with code 0 kept for values not seen at
+    fit time, and dense features are scaled as MinMaxScaler does. Saved as
+    JSON next to the model artifacts.
+
+    Features given hash buckets get a fixed-size vocabulary instead: values
+    kept in the explicit vocabulary (those seen at least min_frequency
+    times, at most max_vocabulary of them) keep their own code, and every
+    other value, seen or not, shares one of the buckets by a stable hash of
+    its string. Without min_frequency all values are hashed.
+    """
+
+    def __init__(self,
+                 sparse_features: Optional[List[str]] = None,
+                 dense_features: Optional[List[str]] = None,
+                 hash_buckets: Optional[Dict[str, int]] = None,
+                 min_frequency: Optional[int] = None,
+                 max_vocabulary: Optional[int] = None):
+        """
+        Args:
+            sparse_features: Categorical inputs (defaults to SPARSE_FEATURES)
+            dense_features: Numerical inputs (defaults to DENSE_FEATURES)
+            hash_buckets: Number of hash buckets per hashed feature
+            min_frequency: Training count for a hashed feature's value to get
+                its own code (None hashes every value)
+            max_vocabulary: Most frequent values of a hashed feature to keep
+                explicitly
+        """
+        self.sparse_features = list(SPARSE_FEATURES if sparse_features is None else sparse_features)
+        self.dense_features = list(DENSE_FEATURES if dense_features is None else dense_features)
+        self.hash_buckets = dict(hash_buckets or {})
+        self.min_frequency = min_frequency
+        self.max_vocabulary = max_vocabulary
+        self.vocabularies: Dict[str, List[str]] = {}
+        # Code of a vocabulary's first entry; 1 leaves 0 for unseen values
+        self.code_offset = 1
+        self.dense_min: List[float] = []
+        self.dense_scale: List[float] = []
+        self.fitted_rows = 0
+        self.fitted_at: Optional[str] = None
+        self._maps: Dict[str, Dict[str, int]] = {}
+        self._indexes: Dict[str, pd.Index] = {}
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.fitted_at is not None
+
+    @property
+    def feature_names(self) -> List[str]:
+        """Model input names, in feature column order"""
+        return self.sparse_features + self.dense_features
+
+    def vocabulary_size(self, feature: str) -> int:
+        """Embedding rows needed for a sparse feature, unseen-value code and hash buckets included"""
+        return len(self.vocabularies[feature]) + self.code_offset + self.hash_buckets.get(feature, 0)
+
+    def fit(self, df: pd.DataFrame) -> 'CTRPreprocessor':
+        """
+        Learn the vocabularies and dense ranges from a training frame
+
+        Args:
+            df: Training rows; missing features take their defaults
+
+        Returns:
+            self
+        """
+        return self.fit_chunks([df])
+
+    def fit_chunks(self, chunks: Iterable[pd.DataFrame]) -> 'CTRPreprocessor':
+        """
+        Learn the vocabularies and dense ranges from training rows in chunks
+
+        Only per-value counts and dense ranges are kept between chunks, so
+        memory is bounded by the vocabularies, not the rows; the result is
+        the same as fit on the concatenated chunks.
+
+        Args:
+            chunks: Frames of training rows; missing features take their defaults
+
+        Returns:
+            self
+        """
+        counts: Dict[str, List[pd.Series]] = {feat: [] for feat in self.sparse_features}
+        data_min = np.full(len(self.dense_features), np.nan)
+        data_max = np.full(len(self.dense_features), np.nan)
+        rows = 0
+        for df in chunks:
+            columns = self._columns(df, len(df))
+            for feat in self.sparse_features:
+                counts[feat].append(self._value_counts(columns[feat]))
+                if len(counts[feat]) >= 32:
+                    counts[feat] = [self._merge_counts(counts[feat])]
+            if len(df):
+                dense = self._dense(columns, len(df)).astype(np.float64)
+                data_min = np.fmin(data_min, np.nanmin(dense, axis=0))
+                data_max = np.fmax(data_max, np.nanmax(dense, axis=0))
+            rows += len(df)
+
+        for feat in self.sparse_features:
+            feature_counts = self._merge_counts(counts[feat])
+            if feat in self.hash_buckets:
+                self.vocabularies[feat] = self._explicit_vocabulary(feature_counts)
+            else:
+                self.vocabularies[feat] = sorted(feature_counts.index.tolist())
+
+        data_min = np.nan_to_num(data_min)
+        data_range = np.nan_to_num(data_max) - data_min
+        # Constant features are shifted to 0, as MinMaxScaler leaves them
+        scale = 1.0 / np.where(data_range == 0, 1.0, data_range)
+        self.dense_min = (-data_min * scale).tolist()
+        self.dense_scale = scale.tolist()
+
+        self.fitted_rows = rows
+        self.fitted_at = datetime.now().isoformat()
+        self._maps, self._indexes = {}, {}
+        logger.info(f"CTR preprocessing fitted on {rows} rows: " +
+                    ", ".join(f"{feat}={self.vocabulary_size(feat)}" for feat in self.sparse_features))
+        return self
+
+    def extend(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        Add the categories of new training rows to the fitted vocabularies
+
+        New values are appended after the existing ones, so every code a
+        trained model has an embedding row for keeps its meaning and the
+        model can be fine-tuned with its tables grown by the new rows.
+        Hashed features are left as they are: their buckets follow the
+        explicit vocabulary and already cover new values. Dense ranges stay
+        frozen, and fitted_at remains the time of the full fit.
+
+        Args:
+            df: New training rows; missing features take their defaults
+
+        Returns:
+            Number of categories added per sparse feature
+        """
+        if not self.is_fitted:
+            raise ValueError("CTRPreprocessor is not fitted")
+        columns = self._columns(df, len(df))
+        added = {}
+        for feat in self.sparse_features:
+            if feat in self.hash_buckets:
+                added[feat] = 0
+                continue
+            values = self._value_counts(columns[feat]).index
+            new = sorted(values[self._index(feat).get_indexer(values) < 0].tolist())
+            self.vocabularies[feat] = self.vocabularies[feat] + new
+            added[feat] = len(new)
+
+        self.fitted_rows += len(df)
+        self._maps, self._indexes = {}, {}
+        logger.info(f"CTR preprocessing extended with {len(df)} rows: " +
+                    ", ".join(f"{feat}+{count}" for feat, count in added.items() if count))
+        return added
+
+    def _value_counts(self, values: Any) -> pd.Series:
+        """Count per string form of the values"""
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            # Count by category code, then convert each category once
+            counts = values.value_counts(sort=False, dropna=False)
+            counts = counts[counts > 0]
+            return pd.Series(counts.to_numpy(), index=self._strings(counts.index.to_numpy(dtype=object)))
+        return pd.Series(self._strings(values)).value_counts(sort=False, dropna=False)
+
+    @staticmethod
+    def _merge_counts(counts: List[pd.Series]) -> pd.Series:
+        if not counts:
+            return pd.Series(dtype=np.int64)
+        if len(counts) == 1 and counts[0].index.is_unique:
+            return counts[0]
+        return pd.concat(counts).groupby(level=0, sort=False).sum()
+
+    def _explicit_vocabulary(self, counts: pd.Series) -> List[str]:
+        """Values of a hashed feature that keep their own code, from their training counts"""
+        if self.min_frequency is None:
+            return []
+        counts = counts[counts >= self.min_frequency]
+        if self.max_vocabulary is not None and len(counts) > self.max_vocabulary:
+            # Most frequent first, ties by value
+            order = np.lexsort((counts.index.to_numpy(dtype=str), -counts.to_numpy()))
+            counts = counts.iloc[order[:self.max_vocabulary]]
+        return sorted(counts.index.tolist())
+
+    def transform(self, data: Union[pd.DataFrame, Dict[str, Any]],
+                  exclude: Iterable[str] = ()) -> Dict[str, np.ndarray]:
+        """
+        Encode rows with the fitted vocabularies and ranges
+
+        Args:
+            data: Frame, or dict of equal-length columns
+            exclude: Features to treat as missing (e.g. pruned at training time)
+
+        Returns:
+            Model input dict of int32 codes and scaled dense arrays
+        """
+        if not self.is_fitted:
+            raise ValueError("CTRPreprocessor is not fitted")
+        rows = len(data) if isinstance(data, pd.DataFrame) else self._row_count(data)
+        excluded = set(exclude)
+        columns = self._columns({name: data[name] for name in self.feature_names
+                                 if name in data and name not in excluded}, rows)
+
+        feature_input = {feat: self._encode(feat, columns[feat]) for feat in self.sparse_features}
+        dense = self._dense(columns, rows)
+        scaled = dense * np.asarray(self.dense_scale, dtype=dense.dtype) + np.asarray(self.dense_min, dtype=dense.dtype)
+        for position, feat in enumerate(self.dense_features):
+            feature_input[feat] = scaled[:, position]
+        return feature_input
+
+    def transform_records(self, records: List[Dict[str, Any]],
+                          exclude: Iterable[str] = ()) -> Dict[str, np.ndarray]:
+        """
+        Encode a list of row dicts, e.g. a request body
+
+        Args:
+            records: Rows keyed by feature; missing features take their defaults
+            exclude: Features to treat as missing
+
+        Returns:
+            Model input dict, as transform
+        """
+        excluded = set(exclude)
+        columns = {
+            name: [record.get(name, default) for record in records]
+            for name, default in self._defaults().items() if name not in excluded
+        }
+        return self.transform(columns)
+
+    def _defaults(self) -> Dict[str, Any]:
+        defaults = {feat: UNKNOWN_CATEGORY for feat in self.sparse_features}
+        defaults.update({feat: 0.0 for feat in self.dense_features})
+        return defaults
+
+    @staticmethod
+    def _row_count(columns: Dict[str, Any]) -> int:
+        if not columns:
+            raise ValueError("No columns to count rows from")
+        return len(next(iter(columns.values())))
+
+    def _columns(self, data: Any, rows: int) -> Dict[str, Any]:
+        """Every feature's values, defaults filled in for missing ones"""
+        columns = {}
+        for feat in self.sparse_features:
+            columns[feat] = data[feat] if feat in data else np.full(rows, UNKNOWN_CATEGORY, dtype=object)
+        for feat in self.dense_features:
+            if feat in data:
+                columns[feat] = data[feat]
+        return columns
+
+    def _dense(self, columns: Dict[str, Any], rows: int) -> np.ndarray:
+        """Rows × dense features, float32 unless present columns need more"""
+        values = {}
+        for feat in self.dense_features:
+            if feat not in columns:
+                continue
+            column = columns[feat]
+            dtype = getattr(column, 'dtype', None)
+            if isinstance(column, pd.Series) and hasattr(dtype, 'numpy_dtype'):
+                # Nullable numbers, with NA as NaN
+                column = column.to_numpy(dtype=np.result_type(dtype.numpy_dtype, np.float32), na_value=np.nan)
+            column = np.asarray(column)
+            # Plain lists of numbers and None, e.g. from request bodies
+            values[feat] = column.astype(np.float64) if column.dtype == object else column
+
+        # Dense features keep float32 when the input is compact (see DtypePlan)
+        # and are only widened as far as the present columns require
+        dense_dtype = np.result_type(np.float32, *[
+            column.dtype for column in values.values() if column.dtype.kind in 'biuf'
+        ])
+        dense = np.zeros((rows, len(self.dense_features)), dtype=dense_dtype)
+        for position, feat in enumerate(self.dense_features):
+            if feat in values:
+                dense[:, position] = values[feat]
+        return dense
+
+    @staticmethod
+    def _strings(values: Any) -> np.ndarray:
+        """Values as strings, as astype(str) gives them"""
+        values = np.asarray(values)
+        if values.dtype == object and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+            return values
+        return values.astype(str).astype(object)
+
+    def _encode(self, feature: str, values: Any) -> np.ndarray:
+        """int32 codes of a sparse feature's values"""
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            # Look each category up once, then take by the category codes
+            categories = self._encode(feature, np.asarray(values.cat.categories, dtype=object))
+            missing = self._encode(feature, np.array(['nan'], dtype=object))
+            return np.append(categories, missing).take(values.cat.codes.to_numpy()).astype(np.int32, copy=False)
+
+        values = np.asarray(values)
+        if len(values) <= SMALL_BATCH_ROWS:
+            lookup = self._map(feature).get
+            # The string forms _strings gives: tolist() would widen float32 values
+            if values.dtype == object:
+                strings = [str(value) for value in values.tolist()]
+            else:
+                strings = values.astype(str).tolist()
+            codes = np.fromiter((lookup(value, 0) for value in strings), dtype=np.int32, count=len(values))
+        else:
+            strings = self._strings(values)
+            positions = self._index(feature).get_indexer(strings)
+            codes = np.where(positions < 0, 0, positions + self.code_offset).astype(np.int32)
+
+        if feature in self.hash_buckets:
+            misses = np.flatnonzero(codes == 0)
+            if len(misses):
+                codes[misses] = self._hash_codes(feature, np.asarray(strings, dtype=object)[misses])
+        return codes
+
+    def _hash_codes(self, feature: str, strings: np.ndarray) -> np.ndarray:
+        """Bucket codes, after the explicit vocabulary, by a hash that is stable across processes"""
+        hashes = pd.util.hash_array(strings, categorize=False)
+        first = self.code_offset + len(self.vocabularies[feature])
+        return (hashes % np.uint64(self.hash_buckets[feature])).astype(np.int64) + first
+
+    def _map(self, feature: str) -> Dict[str, int]:
+        if feature not in self._maps:
+            self._maps[feature] = {value: code for code, value in
+                                   enumerate(self.vocabularies[feature], start=self.code_offset)}
+        return self._maps[feature]
+
+    def _index(self, feature: str) -> pd.Index:
+        if feature not in self._indexes:
+            self._indexes[feature] = pd.Index(self.vocabularies[feature], dtype=object)
+        return self._indexes[feature]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'sparse_features': self.sparse_features,
+            'dense_features': self.dense_features,
+            'hash_buckets': self.hash_buckets,
+            'min_frequency': self.min_frequency,
+            'max_vocabulary': self.max_vocabulary,
+            'vocabularies': self.vocabularies,
+            'code_offset': self.code_offset,
+            'dense_min': self.dense_min,
+            'dense_scale': self.dense_scale,
+            'fitted_rows': self.fitted_rows,
+            'fitted_at': self.fitted_at,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'CTRPreprocessor':
+        preprocessor = cls(state['sparse_features'], state['dense_features'],
+                           hash_buckets=state.get('hash_buckets'),
+                           min_frequency=state.get('min_frequency'),
+                           max_vocabulary=state.get('max_vocabulary'))
+        preprocessor.vocabularies = {feat: list(values) for feat, values in state['vocabularies'].items()}
+        preprocessor.code_offset = state['code_offset']
+        preprocessor.dense_min = list(state['dense_min'])
+        preprocessor.dense_scale = list(state['dense_scale'])
+        preprocessor.fitted_rows = state['fitted_rows']
+        preprocessor.fitted_at = state['fitted_at']
+        return preprocessor
+
+    @classmethod
+    def from_legacy(cls, encoders: Dict[str, Any], scaler: Any) -> 'CTRPreprocessor':
+        """
+        Wrap the LabelEncoders and MinMaxScaler saved with older models
+
+        Their codes start at 0, so unseen values share the first category's code.
+        """
+        preprocessor = cls()
+        preprocessor.vocabularies = {feat: [str(value) for value in encoders[feat].classes_]
+                                     for feat in preprocessor.sparse_features}
+        preprocessor.code_offset = 0
+        preprocessor.dense_min = np.asarray(scaler.min_, dtype=np.float64).tolist()
+        preprocessor.dense_scale = np.asarray(scaler.scale_, dtype=np.float64).tolist()
+        preprocessor.fitted_rows = int(getattr(scaler, 'n_samples_seen_', 0))
+        preprocessor.fitted_at = datetime.now().isoformat()
+        return preprocessor
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> 'CTRPreprocessor':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,375 @@
+"""
+NumPy DeepFM for AI-Buyer
+TensorFlow-free CTR scoring from the weights of a trained DeepFM
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Any, Optional, Union, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+import logging
+
+from .ctr_preprocessor import CTRPreprocessor
+
+if TYPE_CHECKING:
+    from ..feature_engineering.feature_plan import FeaturePlanExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the file layout changes
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+PREPROCESSOR_FILE = 'ctr_preprocessor.json'
+
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: np.divide(1.0, 1.0 + np.exp(-x, out=x), out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'linear': lambda x: x,
+}
+
+
+def grow_weights(trained: List[np.ndarray], initial: List[np.ndarray],
+                 fill_unseen: bool = True) -> List[np.ndarray]:
+    """
+    Weights of a model whose embedding tables grew, starting from a trained model's
+
+    The two models differ only in vocabulary sizes (see
+    CTRPreprocessor.extend), so weights are matched in order and only the
+    first dimension of a table may have grown. Trained rows are kept; new
+    rows take the unseen-value row (code 0), so a new category starts out
+    scored as an unknown one, or keep their initial values.
+
+    Args:
+        trained: Weights of the trained model (Keras get_weights order)
+        initial: Freshly initialized weights of the grown model
+        fill_unseen: Start new rows from row 0, the unseen-value code
+
+    Returns:
+        Weights for the grown model
+    """
+    if len(trained) != len(initial):
+        raise ValueError(f"Cannot warm-start from a model with {len(trained)} weights "
+                         f"into one with {len(initial)}")
+
+    weights = []
+    for old, new in zip(trained, initial):
+        if old.shape == new.shape:
+            weights.append(old)
+        elif old.shape[1:] == new.shape[1:] and new.shape[0] > old.shape[0]:
+            grown = np.array(new, copy=True)
+            grown[:len(old)] = old
+            if fill_unseen:
+                grown[len(old):] = old[0]
+            weights.append(grown)
+        else:
+            raise ValueError(f"Cannot warm-start a weight of shape {old.shape} into {new.shape}")
+    return weights
+
+
+class NumpyDeepFM:
+    """
+    DeepFM forward pass over exported weights
+
+    Reproduces DeepCTR's DeepFM at inference time: a linear term (one
+    weight per category plus a kernel over the dense inputs), the FM
+    second-order term over the sparse embeddings, and a DNN over the
+    flattened embeddings and dense inputs, summed with the global bias.
+    Dropout is the identity at inference; batch normalization in the DNN
+    is not supported.
+
+    The embedding tables of all sparse features are stacked into one, so a
+    batch needs a single lookup, and each array is saved as its own .npy
+    file so the embedding tables, by far the largest part, can be
+    memory-mapped: loading is then nearly free and processes scoring the
+    same model share the pages.
+
+    The model registry serves it in place of a CTRPredictor, so it answers
+    predict in the same format; engineered inputs a request lacks are
+    computed by feature_executor, when the loader attaches the model's
+    feature plan.
+    """
+
+    def __init__(self,
+                 preprocessor: CTRPreprocessor,
+                 embedding_table: np.ndarray,
+                 linear_table: np.ndarray,
+                 linear_kernel: np.ndarray,
+                 dnn_kernels: List[np.ndarray],
+                 dnn_biases: List[np.ndarray],
+                 output_kernel: np.ndarray,
+                 linear_bias: float = 0.0,
+                 global_bias: float = 0.0,
+                 activation: str = 'relu',
+                 task: str = 'regression',
+                 sparse_features: Optional[List[str]] = None,
+                 dense_features: Optional[List[str]] = None,
+                 pruned_features: Iterable[str] = (),
+                 model_version: str = 'unknown'):
+        """
+        Args:
+            preprocessor: Fitted preprocessor the model was trained with
+            embedding_table: FM/DNN embeddings of all sparse features, stacked
+                in feature order (total vocabulary x dim)
+            linear_table: Linear weight per category, stacked the same way
+            linear_kernel: Linear weights of the dense inputs
+            dnn_kernels: DNN layer kernels, input layer first
+            dnn_biases: DNN layer biases
+            output_kernel: Weights of the DNN output to its logit
+            linear_bias: Bias of the linear term, if it has one
+            global_bias: Bias of the prediction layer
+            activation: DNN activation
+            task: 'regression' (logit as is) or 'binary' (sigmoid)
+            sparse_features: Sparse model inputs in model order (defaults to the preprocessor's)
+            dense_features: Dense model inputs in model order (defaults to the preprocessor's)
+            pruned_features: Features treated as missing, as at training time
+            model_version: Version reported with predictions
+        """
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported DNN activation '{activation}'")
+        if task not in ('regression', 'binary'):
+            raise ValueError(f"Unsupported task '{task}'")
+
+        self.preprocessor = preprocessor
+        self.sparse_features = list(preprocessor.sparse_features if sparse_features is None else sparse_features)
+        self.dense_features = list(preprocessor.dense_features if dense_features is None else dense_features)
+        self.embedding_table = embedding_table
+        self.linear_table = linear_table.reshape(-1)
+        self.linear_kernel = np.asarray(linear_kernel, dtype=np.float32).reshape(-1)
+        self.dnn_kernels = [np.asarray(kernel, dtype=np.float32) for kernel in dnn_kernels]
+        self.dnn_biases = [np.asarray(bias, dtype=np.float32) for bias in dnn_biases]
+        self.output_kernel = np.asarray(output_kernel, dtype=np.float32).reshape(-1)
+        self.linear_bias = float(linear_bias)
+        self.global_bias = float(global_bias)
+        self.activation = activation
+        self.task = task
+        self.pruned_features = list(pruned_features)
+        self.model_version = model_version
+        self.feature_executor: Optional['FeaturePlanExecutor'] = None
+
+        # First row of each feature's embeddings in the stacked tables
+        sizes = [preprocessor.vocabulary_size(feat) for feat in self.sparse_features]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        if sum(sizes) != len(embedding_table) or sum(sizes) != len(self.linear_table):
+            raise ValueError(f"Embedding tables have {len(embedding_table)} and {len(self.linear_table)} rows, "
+                             f"the vocabularies {sum(sizes)}")
+
+        self.embedding_dim = int(embedding_table.shape[1])
+        expected = len(self.sparse_features) * self.embedding_dim + len(self.dense_features)
+        first = self.dnn_kernels[0].shape[0] if self.dnn_kernels else len(self.output_kernel)
+        if first != expected:
+            raise ValueError(f"DNN input size {first} does not match {len(self.sparse_features)} embeddings "
+                             f"of {self.embedding_dim} and {len(self.dense_features)} dense inputs")
+
+    @classmethod
+    def from_features(cls, preprocessor: CTRPreprocessor,
+                      embeddings: Dict[str, np.ndarray],
+                      linear_weights: Dict[str, np.ndarray],
+                      sparse_features: Optional[List[str]] = None,
+                      **weights: Any) -> 'NumpyDeepFM':
+        """
+        Model from per-feature embedding tables (as DeepCTR keeps them)
+
+        Args:
+            preprocessor: Fitted preprocessor the model was trained with
+            embeddings: FM/DNN embedding table (vocabulary x dim) by sparse feature
+            linear_weights: Linear weight per category by sparse feature
+            sparse_features: Sparse model inputs in model order (defaults to the preprocessor's)
+            **weights: The remaining constructor arguments
+
+        Returns:
+            The model
+        """
+        sparse = list(preprocessor.sparse_features if sparse_features is None else sparse_features)
+        return cls(
+            preprocessor,
+            embedding_table=np.concatenate([embeddings[feat] for feat in sparse]).astype(np.float32),
+            linear_table=np.concatenate([linear_weights[feat].reshape(-1) for feat in sparse]).astype(np.float32),
+            sparse_features=sparse,
+            **weights
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of all weights, memory-mapped or not"""
+        arrays = ([self.embedding_table, self.linear_table, self.linear_kernel, self.output_kernel] +
+                  self.dnn_kernels + self.dnn_biases)
+        return sum(array.nbytes for array in arrays)
+
+    def predict_batch(self, campaigns: Union[pd.DataFrame, List[Dict[str, Any]]],
+                      batch_size: int = 4096) -> np.ndarray:
+        """
+        Predict CTR for many campaigns
+
+        Args:
+            campaigns: Frame of campaign features, or a list of feature dicts
+            batch_size: Rows per forward pass, bounding the activations held at once
+
+        Returns:
+            Predicted CTR per row
+        """
+        if self.feature_executor is not None:
+            campaigns = self.feature_executor.complete(campaigns, self.sparse_features + self.dense_features)
+        if isinstance(campaigns, pd.DataFrame):
+            feature_input = self.preprocessor.transform(campaigns, exclude=self.pruned_features)
+        else:
+            feature_input = self.preprocessor.transform_records(campaigns, exclude=self.pruned_features)
+
+        rows = len(campaigns)
+        if rows <= batch_size:
+            return self.forward(feature_input)
+        return np.concatenate([
+            self.forward({name: values[start:start + batch_size] for name, values in feature_input.items()})
+            for start in range(0, rows, batch_size)
+        ])
+
+    def predict(self, campaign_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Predict CTR for one campaign, in CTRPredictor.predict's format
+
+        Args:
+            campaign_data: Dictionary with campaign features
+
+        Returns:
+            Prediction with the same simplified 10% confidence interval
+        """
+        try:
+            prediction = float(self.predict_batch([campaign_data])[0])
+        except Exception as e:
+            logger.error(f"Prediction failed: {e}")
+            return {"error": str(e), "predicted_ctr": None}
+
+        prediction_std = prediction * 0.1
+        return {
+            "predicted_ctr": prediction,
+            "confidence_interval": [max(0, prediction - 1.96 * prediction_std),
+                                    min(1, prediction + 1.96 * prediction_std)],
+            "model_version": self.model_version,
+            "prediction_date": datetime.now().isoformat()
+        }
+
+    def forward(self, feature_input: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Model output for encoded inputs
+
+        Args:
+            feature_input: Codes and scaled values by feature, as CTRPreprocessor.transform returns them
+
+        Returns:
+            Output per row
+        """
+        fields, dim = len(self.sparse_features), self.embedding_dim
+        names = self.sparse_features or self.dense_features
+        rows = len(feature_input[names[0]])
+
+        # One lookup in the stacked tables for all sparse features
+        codes = np.empty((rows, fields), dtype=np.intp)
+        for position, feat in enumerate(self.sparse_features):
+            codes[:, position] = feature_input[feat]
+        codes += self.offsets
+        embedded = self.embedding_table[codes]
+        logit = self.linear_table[codes].sum(axis=1)
+
+        dense = np.empty((rows, len(self.dense_features)), dtype=np.float32)
+        for position, feat in enumerate(self.dense_features):
+            dense[:, position] = feature_input[feat]
+        logit += dense @ self.linear_kernel + self.linear_bias
+
+        # FM: 0.5 * ((sum of embeddings)^2 - sum of squared embeddings)
+        summed = embedded.sum(axis=1)
+        logit += 0.5 * (np.einsum('rd,rd->r', summed, summed) - np.einsum('rfd,rfd->r', embedded, embedded))
+
+        # DNN input: embeddings flattened in feature order, then dense inputs
+        dnn_input = np.concatenate([embedded.reshape(rows, fields * dim), dense], axis=1)
+        hidden = dnn_input
+        activate = ACTIVATIONS[self.activation]
+        for kernel, bias in zip(self.dnn_kernels, self.dnn_biases):
+            hidden = hidden @ kernel
+            hidden += bias
+            hidden = activate(hidden)
+        logit += hidden @ self.output_kernel + self.global_bias
+
+        if self.task == 'binary':
+            return 1.0 / (1.0 + np.exp(-logit))
+        return logit
+
+    def save(self, directory: str):
+        """Write one .npy file per array, the preprocessor and a manifest"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+
+        def write(name: str, array: np.ndarray):
+            filename = f"{name}.npy"
+            np.save(os.path.join(directory, filename), np.ascontiguousarray(array, dtype=np.float32))
+            arrays[name] = filename
+
+        write('embedding_table', self.embedding_table)
+        write('linear_table', self.linear_table)
+        write('linear_kernel', self.linear_kernel)
+        for layer, (kernel, bias) in enumerate(zip(self.dnn_kernels, self.dnn_biases)):
+            write(f"dnn_kernel_{layer}", kernel)
+            write(f"dnn_bias_{layer}", bias)
+        write('output_kernel', self.output_kernel)
+
+        self.preprocessor.save(os.path.join(directory, PREPROCESSOR_FILE))
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'sparse_features': self.sparse_features,
+            'dense_features': self.dense_features,
+            'pruned_features': self.pruned_features,
+            'embedding_dim': self.embedding_dim,
+            'dnn_layers': len(self.dnn_kernels),
+            'activation': self.activation,
+            'task': self.task,
+            'linear_bias': self.linear_bias,
+            'global_bias': self.global_bias,
+            'model_version': self.model_version,
+            'arrays': arrays,
+            'exported_at': datetime.now().isoformat(),
+        }
+        with open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'NumpyDeepFM':
+        """
+        Load an exported model
+
+        Args:
+            directory: Directory written by save
+            mmap: Memory-map the embedding tables instead of reading them
+
+        Returns:
+            The model
+        """
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format {manifest['format_version']}")
+
+        def read(name: str, mapped: bool = False) -> np.ndarray:
+            return np.load(os.path.join(directory, manifest['arrays'][name]),
+                           mmap_mode='r' if mapped else None)
+
+        layers = range(manifest['dnn_layers'])
+        return cls(
+            preprocessor=CTRPreprocessor.load(os.path.join(directory, PREPROCESSOR_FILE)),
+            embedding_table=read('embedding_table', mmap),
+            linear_table=read('linear_table', mmap),
+            linear_kernel=read('linear_kernel'),
+            dnn_kernels=[read(f"dnn_kernel_{layer}") for layer in layers],
+            dnn_biases=[read(f"dnn_bias_{layer}") for layer in layers],
+            output_kernel=read('output_kernel'),
+            linear_bias=manifest['linear_bias'],
+            global_bias=manifest['global_bias'],
+            activation=manifest['activation'],
+            task=manifest['task'],
+            sparse_features=manifest['sparse_features'],
+            dense_features=manifest['dense_features'],
+            pruned_features=manifest['pruned_features'],
+            model_version=manifest['model_version'],
+        )
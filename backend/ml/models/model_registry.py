@@ -0,0 +1,390 @@
+"""
+Model Registry for AI-Buyer
+Process-wide cache of loaded per-user models with LRU eviction and background refresh
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (kind, user_id, version)
+ModelKey = Tuple[str, str, str]
+
+# user_id of the CTR model trained on all tenants' rows
+SHARED_CTR_MODEL = 'shared'
+
+
+@dataclass
+class ModelLoader:
+    """
+    How to find and load one kind of per-user model
+
+    Attributes:
+        resolve: Latest version for a user (e.g. registry version or run id)
+        load: Model for a user and version
+        size: Approximate bytes a loaded model holds
+    """
+    resolve: Callable[[str], str]
+    load: Callable[[str, str], Any]
+    size: Callable[[Any], int]
+
+
+@dataclass
+class _Entry:
+    model: Any
+    nbytes: int
+    loaded_at: float
+
+
+class ModelRegistry:
+    """
+    Loaded models by (kind, user_id, version) under a memory budget
+
+    Models are loaded on first use and evicted least recently used first
+    once their estimated sizes exceed the budget. Loads are single-flight:
+    concurrent requests for a model that is not loaded yet wait on one
+    load. Requests without a version get the user's latest version; once
+    that was resolved longer than ``refresh_seconds`` ago, the cached model
+    keeps being served while the latest version is resolved, and loaded if
+    it changed, on a background thread.
+    """
+
+    def __init__(self,
+                 memory_budget_bytes: int = 2 * 1024 ** 3,
+                 refresh_seconds: float = 300.0,
+                 refresh_workers: int = 1):
+        """
+        Args:
+            memory_budget_bytes: Estimated bytes of loaded models to keep
+            refresh_seconds: Age after which a latest-version lookup is redone
+            refresh_workers: Threads for background refreshes
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self.refresh_seconds = refresh_seconds
+        self.loaders: Dict[str, ModelLoader] = {}
+        self._entries: 'OrderedDict[ModelKey, _Entry]' = OrderedDict()
+        self._latest: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._inflight: Dict[Any, Future] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=refresh_workers,
+                                                thread_name_prefix='model-refresh')
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'refreshes': 0, 'load_errors': 0}
+
+    def register(self, kind: str, loader: ModelLoader):
+        """Register how models of a kind are resolved, loaded and sized"""
+        self.loaders[kind] = loader
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(self, kind: str, user_id: str, version: Optional[str] = None, timeout: Optional[float] = None) -> Any:
+        """
+        Loaded model of a user, loading it if needed
+
+        Args:
+            kind: Registered model kind
+            user_id: User identifier
+            version: Model version; None for the latest
+            timeout: Seconds to wait for a load in progress
+
+        Returns:
+            The model
+
+        Raises:
+            KeyError: For an unregistered kind
+            Exception: Whatever the loader raised
+        """
+        if kind not in self.loaders:
+            raise KeyError(f"No loader registered for model kind '{kind}'")
+
+        if version is None:
+            with self._lock:
+                latest = self._latest.get((kind, user_id))
+                stale = latest is None or time.monotonic() - latest[1] > self.refresh_seconds
+                entry = self._entries.get((kind, user_id, latest[0])) if latest else None
+                if entry is not None:
+                    self._touch((kind, user_id, latest[0]))
+                    if stale:
+                        self._schedule_refresh(kind, user_id)
+                    return entry.model
+            if stale:
+                # Cold user: resolving and loading is one flight
+                return self._single_flight(('latest', kind, user_id),
+                                           lambda: self._load_latest(kind, user_id), timeout)
+            # The latest version is known but was evicted
+            version = latest[0]
+
+        key = (kind, user_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch(key)
+                return entry.model
+        return self._single_flight(key, lambda: self._load(key), timeout)
+
+    def invalidate(self, kind: Optional[str] = None, user_id: Optional[str] = None):
+        """Drop loaded models (all, of a kind, or of a kind and user), e.g. after training"""
+        with self._lock:
+            for key in [key for key in self._entries
+                        if (kind is None or key[0] == kind) and (user_id is None or key[1] == user_id)]:
+                del self._entries[key]
+            for key in [key for key in self._latest
+                        if (kind is None or key[0] == kind) and (user_id is None or key[1] == user_id)]:
+                del self._latest[key]
+
+    def status(self) -> Dict[str, Any]:
+        """Loaded models, memory use and counters"""
+        with self._lock:
+            models: List[Dict[str, Any]] = [
+                {'kind': key[0], 'user_id': key[1], 'version': key[2],
+                 'bytes': entry.nbytes, 'age_seconds': round(time.monotonic() - entry.loaded_at, 1)}
+                for key, entry in self._entries.items()
+            ]
+            return {
+                'models': models,
+                'memory_bytes': sum(model['bytes'] for model in models),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                **self.stats,
+            }
+
+    def shutdown(self):
+        self._refresh_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _touch(self, key: ModelKey):
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+
+    def _single_flight(self, flight: Any, work: Callable[[], Any], timeout: Optional[float]) -> Any:
+        """Run work once for concurrent callers with the same flight key"""
+        with self._lock:
+            future = self._inflight.get(flight)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[flight] = future
+
+        if owner:
+            try:
+                future.set_result(work())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(flight, None)
+        return future.result(timeout)
+
+    def _load_latest(self, kind: str, user_id: str) -> Any:
+        version = self.loaders[kind].resolve(user_id)
+        key = (kind, user_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+        model = entry.model if entry is not None else self._single_flight(key, lambda: self._load(key), None)
+        with self._lock:
+            self._latest[(kind, user_id)] = (version, time.monotonic())
+        return model
+
+    def _load(self, key: ModelKey) -> Any:
+        kind, user_id, version = key
+        loader = self.loaders[kind]
+        with self._lock:
+            self.stats['misses'] += 1
+        start = time.perf_counter()
+        try:
+            model = loader.load(user_id, version)
+            nbytes = int(loader.size(model))
+        except Exception:
+            with self._lock:
+                self.stats['load_errors'] += 1
+            raise
+
+        with self._lock:
+            self.stats['loads'] += 1
+            self._entries[key] = _Entry(model, nbytes, time.monotonic())
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        logger.info(f"Loaded {kind} model for user {user_id}, version {version}: "
+                    f"{nbytes / 1e6:.1f} MB in {time.perf_counter() - start:.2f}s")
+        return model
+
+    def _evict(self, keep: ModelKey):
+        """Drop least recently used models until within budget (never the one just loaded)"""
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.memory_budget_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).nbytes
+            self.stats['evictions'] += 1
+            logger.info(f"Evicted {key[0]} model for user {key[1]}, version {key[2]}")
+        if total > self.memory_budget_bytes:
+            logger.warning(f"Model memory {total / 1e6:.1f} MB exceeds the budget of "
+                           f"{self.memory_budget_bytes / 1e6:.1f} MB")
+
+    def _schedule_refresh(self, kind: str, user_id: str):
+        if (kind, user_id) in self._refreshing:
+            return
+        self._refreshing.add((kind, user_id))
+        self._refresh_pool.submit(self._refresh, kind, user_id)
+
+    def _refresh(self, kind: str, user_id: str):
+        """Resolve the latest version and load it if it changed; the old one is served meanwhile"""
+        try:
+            self._load_latest(kind, user_id)
+            with self._lock:
+                self.stats['refreshes'] += 1
+        except Exception as e:
+            logger.warning(f"Refreshing {kind} model for user {user_id} failed, serving the cached one: {e}")
+            with self._lock:
+                # Back off for another interval
+                latest = self._latest.get((kind, user_id))
+                if latest is not None:
+                    self._latest[(kind, user_id)] = (latest[0], time.monotonic())
+        finally:
+            with self._lock:
+                self._refreshing.discard((kind, user_id))
+
+
+def dedicated_ctr_tenants() -> Set[str]:
+    """Tenants opted in to a CTR model of their own, from CTR_DEDICATED_TENANTS (comma-separated)"""
+    return {tenant.strip() for tenant in os.getenv('CTR_DEDICATED_TENANTS', '').split(',') if tenant.strip()}
+
+
+def ctr_model_owner(user_id: str) -> str:
+    """
+    Whose CTR model serves a tenant
+
+    Dedicated tenants are served by their own model, every other tenant by
+    the shared model, which knows tenants by their user_id embedding and
+    scores tenants it was not trained on with the average tenant's.
+    """
+    return user_id if user_id in dedicated_ctr_tenants() else SHARED_CTR_MODEL
+
+
+def resolve_ctr_model_version(user_id: str) -> str:
+    """Latest Production or Staging registry version of a user's CTR model, else the newest"""
+    import mlflow
+    client = mlflow.tracking.MlflowClient()
+    model_name = f"ctr_predictor_{user_id}"
+
+    latest_versions = client.get_latest_versions(model_name, stages=["Production", "Staging"])
+    if not latest_versions:
+        # If no production/staging version, get latest
+        latest_versions = client.get_latest_versions(model_name)
+
+    if not latest_versions:
+        raise Exception(f"No model found for user {user_id}")
+    return latest_versions[0].version
+
+
+def _ctr_model_artifacts(user_id: str, version: str) -> str:
+    """Local copy of the artifacts logged with a registry version of a user's CTR model"""
+    import mlflow
+    client = mlflow.tracking.MlflowClient()
+    run_id = client.get_model_version(f"ctr_predictor_{user_id}", version).run_id
+    return mlflow.artifacts.download_artifacts(f"runs:/{run_id}/artifacts_{user_id}")
+
+
+def _load_numpy_ctr_model(user_id: str, version: str) -> Optional[Any]:
+    """
+    The NumPy export of a CTR model version, None if its run has none
+
+    Its feature plan, when logged, is attached for the engineered inputs
+    of requests. Exports made before they recorded the registry version
+    carry the run id, so the version is set to the one loaded.
+    """
+    artifacts_path = _ctr_model_artifacts(user_id, version)
+    directory = os.path.join(artifacts_path, 'numpy_model')
+    if not os.path.isdir(directory):
+        return None
+
+    from .deepfm_numpy import NumpyDeepFM
+    from ..feature_engineering.feature_plan import FeaturePlanExecutor, load_model_feature_plan
+    try:
+        model = NumpyDeepFM.load(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"NumPy export of CTR model {user_id} version {version} not loadable, "
+                       f"loading the Keras model instead: {e}")
+        return None
+    model.model_version = version
+    plan = load_model_feature_plan(os.path.join(artifacts_path, 'feature_plan.json'))
+    if plan is not None:
+        model.feature_executor = FeaturePlanExecutor(plan)
+    return model
+
+
+def _load_ctr_predictor(user_id: str, version: str) -> Any:
+    """CTR model of a registry version: its NumPy export, else the Keras model (needs TensorFlow)"""
+    model = _load_numpy_ctr_model(user_id, version)
+    if model is not None:
+        return model
+
+    from .ctr_predictor import CTRPredictor
+    predictor = CTRPredictor(user_id)
+    predictor.load_model(version)
+    return predictor
+
+
+def ctr_predictor_size(predictor: Any) -> int:
+    """Weights plus encoder vocabularies of a loaded NumpyDeepFM or CTRPredictor"""
+    from .deepfm_numpy import NumpyDeepFM
+    if isinstance(predictor, NumpyDeepFM):
+        weights = predictor.nbytes
+    else:
+        weights = sum(weight.nbytes for weight in predictor.model.get_weights())
+    vocabularies = sum(len(value) + 64 for values in predictor.preprocessor.vocabularies.values()
+                       for value in values)
+    return weights + vocabularies
+
+
+def _resolve_budget_optimizer(user_id: str) -> str:
+    from .budget_optimizer import BudgetOptimizer
+    return BudgetOptimizer.resolve_model_run(user_id)
+
+
+def _load_budget_optimizer(user_id: str, run_id: str) -> Any:
+    from .budget_optimizer import BudgetOptimizer
+    optimizer = BudgetOptimizer(user_id)
+    optimizer.load_models(run_id)
+    return optimizer
+
+
+def budget_optimizer_size(optimizer: Any) -> int:
+    """Pickled size of a BudgetOptimizer's Prophet models"""
+    return sum(len(pickle.dumps(model)) for model in optimizer.prophet_models.values())
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    The process-wide registry, with 'ctr' and 'budget' loaders
+
+    The budget and refresh interval come from MODEL_REGISTRY_MEMORY_MB and
+    MODEL_REGISTRY_REFRESH_SECONDS.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(
+                memory_budget_bytes=int(float(os.getenv('MODEL_REGISTRY_MEMORY_MB', '2048')) * 1024 ** 2),
+                refresh_seconds=float(os.getenv('MODEL_REGISTRY_REFRESH_SECONDS', '300')),
+            )
+            _registry.register('ctr', ModelLoader(resolve_ctr_model_version, _load_ctr_predictor, ctr_predictor_size))
+            _registry.register('budget', ModelLoader(_resolve_budget_optimizer, _load_budget_optimizer,
+                                                     budget_optimizer_size))
+        return _registry
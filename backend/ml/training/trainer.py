@@ -5,7 +5,7 @@ Orchestrates training of CTR prediction and budget optimization models
 
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 from datetime import datetime, timedelta
 import mlflow
@@ -14,8 +14,14 @@ from concurrent.futures import ThreadPoolExecutor
 
 # Import our ML models and feature engineering
 from ..models.ctr_predictor import CTRPredictor
+from ..models.ctr_input import CTRTrainingInput
+from ..models.ctr_preprocessor import TENANT_FEATURE
+from ..models.model_registry import SHARED_CTR_MODEL
 from ..models.budget_optimizer import BudgetOptimizer
+from ..feature_engineering.correlation_pruner import CorrelationPruner
 from ..feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ..feature_engineering.feature_plan import refresh_lag_history
+from ..feature_engineering.dtype_plan import DtypePlan
 
 logger = logging.getLogger(__name__)
 
@@ -25,18 +31,49 @@ class MLTrainingPipeline:
     Handles data preparation, feature engineering, model training, and deployment
     """
     
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, feature_cache_dir: Optional[str] = None,
+                 feature_workers: Optional[int] = None,
+                 dtype_plan: Optional[DtypePlan] = None):
+        """
+        Args:
+            user_id: User whose models are trained
+            feature_cache_dir: Directory of the per-day engineered feature
+                cache; unchanged days are not re-engineered on retrain
+            feature_workers: Worker processes for feature engineering when
+                not using the feature cache; unset (the default) engineers
+                features in this process
+            dtype_plan: Compact dtypes applied to the raw data and kept
+                through feature engineering and dataset preparation
+        """
         self.user_id = user_id
-        self.feature_engineer = FacebookAdFeatureEngineer()
+        self.feature_workers = feature_workers
+        self.dtype_plan = dtype_plan
+        feature_cache = None
+        if feature_cache_dir:
+            from ..feature_engineering.feature_cache import FeatureCache
+            feature_cache = FeatureCache(feature_cache_dir)
+        self.feature_engineer = FacebookAdFeatureEngineer(feature_cache=feature_cache, dtype_plan=dtype_plan)
         self.ctr_predictor = CTRPredictor(user_id)
         self.budget_optimizer = BudgetOptimizer(user_id)
         
-        # Training configuration
+        # Training configuration; max_training_samples bounds in-memory
+        # training, train_ctr_model_streaming reads any number of rows
         self.min_training_samples = 100
         self.max_training_samples = 100000
         self.validation_split = 0.2
         self.test_split = 0.1
         
+        # Daily CTR retraining: the model is fine-tuned on the new window
+        # plus replay_ratio times as many older rows, and retrained from
+        # scratch every full_retrain_days or when its error on the window
+        # or the share of unseen categories points to drift
+        self.new_window_days = 1
+        self.replay_ratio = 1.0
+        self.full_retrain_days = 7
+        self.drift_nmse_ratio = 1.15
+        self.drift_unseen_share = 0.2
+        self.fine_tune_epochs = 3
+        
         # MLflow configuration
         self.experiment_name = f"ml_pipeline_{user_id}"
         self._setup_mlflow()
@@ -49,15 +86,59 @@ class MLTrainingPipeline:
         except Exception as e:
             logger.error(f"Failed to setup MLflow experiment: {e}")
     
+    def load_training_data(self, client, lookback_days: int = 30,
+                           end: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Raw campaign rows of the lookback period from ClickHouse
+        
+        The shared CTR model's pipeline reads the rows of every tenant, each
+        with its tenant in the user_id column (TENANT_FEATURE); any other
+        pipeline reads its own user's rows. Beyond max_training_samples rows,
+        whole campaigns are sampled at random to stay within it.
+        
+        Args:
+            client: clickhouse_connect client
+            lookback_days: Days of rows to read
+            end: Timestamp to stop before (now by default)
+            
+        Returns:
+            Raw rows, ordered by campaign and timestamp
+        """
+        from ..feature_engineering.chunked_pipeline import (
+            ClickHouseChunkSource, plan_campaign_chunks, sample_campaigns
+        )
+        
+        end = end or datetime.now()
+        source = ClickHouseChunkSource(
+            client,
+            None if self.user_id == SHARED_CTR_MODEL else self.user_id,
+            start=end - timedelta(days=lookback_days),
+            end=end
+        )
+        campaign_rows = source.campaign_rows()
+        sampled = sample_campaigns(campaign_rows, self.max_training_samples)
+        if len(sampled) < len(campaign_rows):
+            logger.warning(f"Sampled {int(sampled.sum())} of {int(campaign_rows.sum())} rows "
+                           f"({len(sampled)} of {len(campaign_rows)} campaigns) for user {self.user_id}; "
+                           f"train_ctr_model_streaming trains on every row")
+        plan = plan_campaign_chunks(sampled, self.max_training_samples)
+        chunks = list(source.read_chunks(plan))
+        raw_data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        logger.info(f"Loaded {len(raw_data)} rows of the last {lookback_days} days for user {self.user_id}")
+        return raw_data
+    
     async def prepare_training_data(self, 
                                   raw_data: pd.DataFrame,
-                                  include_feature_engineering: bool = True) -> Dict[str, pd.DataFrame]:
+                                  include_feature_engineering: bool = True,
+                                  fit_feature_pruning: bool = False) -> Dict[str, pd.DataFrame]:
         """
         Prepare data for training ML models
         
         Args:
             raw_data: Raw campaign data from ClickHouse
             include_feature_engineering: Whether to apply feature engineering
+            fit_feature_pruning: Refit the correlated-feature drop list on
+                this data; otherwise the fitted one is reapplied
             
         Returns:
             Dictionary with prepared datasets for different models
@@ -95,7 +176,17 @@ class MLTrainingPipeline:
             # Apply feature engineering if requested
             if include_feature_engineering:
                 logger.info("Applying feature engineering")
-                engineered_data = self.feature_engineer.create_feature_pipeline(raw_data)
+                engineered_data = self.feature_engineer.create_feature_pipeline(
+                    raw_data, user_id=self.user_id, workers=self.feature_workers,
+                    fit=fit_feature_pruning
+                )
+                if fit_feature_pruning:
+                    self._fit_feature_plan(raw_data)
+            elif self.dtype_plan is not None:
+                engineered_data = self.dtype_plan.apply(raw_data)
+                report = self.dtype_plan.report(raw_data, engineered_data)
+                logger.info(f"Compacted training data from {report['bytes_before'] / 1e6:.1f} MB "
+                            f"to {report['bytes_after'] / 1e6:.1f} MB")
             else:
                 engineered_data = raw_data.copy()
             
@@ -130,6 +221,35 @@ class MLTrainingPipeline:
             logger.error(f"Error preparing training data: {e}")
             raise
     
+    def _fit_feature_plan(self, raw_data: pd.DataFrame):
+        """
+        Freeze the feature pipeline fitted on raw_data for the CTR model's predictions
+        
+        Saved with the model, it computes the engineered inputs a prediction
+        request lacks as training computed them. Costs one more pipeline
+        pass over raw_data, on full retrains only.
+        """
+        try:
+            self.ctr_predictor.feature_plan = self.feature_engineer.fit_feature_plan(raw_data)
+        except Exception as e:
+            self.ctr_predictor.feature_plan = None
+            logger.warning(f"Feature plan not fitted, requests must carry engineered features: {e}")
+    
+    def _refresh_feature_plan(self, raw_data: pd.DataFrame):
+        """
+        Refresh the lag history of the CTR model's feature plan from raw_data
+        
+        Fine-tuning keeps the plan of the last full retrain otherwise, whose
+        lag history ends where that retrain's data did.
+        """
+        if self.ctr_predictor.feature_plan is None:
+            return
+        try:
+            self.ctr_predictor.feature_plan = refresh_lag_history(
+                self.feature_engineer, self.ctr_predictor.feature_plan, raw_data)
+        except Exception as e:
+            logger.warning(f"Feature plan lag history not refreshed: {e}")
+    
     def _prepare_ctr_dataset(self, data: pd.DataFrame) -> pd.DataFrame:
         """Prepare dataset specifically for CTR prediction"""
         # Select relevant features for CTR prediction
@@ -137,28 +257,36 @@ class MLTrainingPipeline:
             'campaign_id', 'ad_set_id', 'placement', 'device_type',
             'age_group', 'gender', 'hour', 'day_of_week', 'is_weekend',
             'bid_amount', 'frequency', 'budget_utilization',
-            'creative_age_days', 'is_video', 'text_length'
+            'creative_age_days', 'is_video', 'text_length',
+            # Rows of every tenant, for the shared model
+            TENANT_FEATURE
         ]
         
+        # The shared model's tenant embedding must not silently go missing
+        if self.ctr_predictor.tenant_feature and self.ctr_predictor.tenant_feature not in data.columns:
+            raise ValueError(f"The shared CTR model needs the tenant of each row in "
+                             f"'{self.ctr_predictor.tenant_feature}'; load rows with load_training_data")
+        
         # Include only columns that exist in the data
         available_features = [col for col in feature_columns if col in data.columns]
         target_columns = ['ctr', 'timestamp', 'impressions']
         
         selected_columns = available_features + target_columns
-        ctr_dataset = data[selected_columns].copy()
-        
+        return self._reliable_ctr_rows(data[selected_columns].copy())
+    
+    @staticmethod
+    def _reliable_ctr_rows(data: pd.DataFrame) -> pd.DataFrame:
+        """Rows with enough impressions for a reliable CTR, without outliers"""
         # Filter for records with sufficient impressions for reliable CTR
-        ctr_dataset = ctr_dataset[ctr_dataset['impressions'] >= 100]
+        data = data[data['impressions'] >= 100]
         
         # Remove outliers (CTR > 50% is likely an error)
-        ctr_dataset = ctr_dataset[ctr_dataset['ctr'] <= 0.5]
-        
-        return ctr_dataset
+        return data[data['ctr'] <= 0.5]
     
     def _prepare_budget_dataset(self, data: pd.DataFrame) -> pd.DataFrame:
         """Prepare dataset for budget optimization (time series)"""
         # Aggregate by campaign and day for time series
-        daily_data = data.groupby(['campaign_id', data['timestamp'].dt.date]).agg({
+        daily_data = data.groupby(['campaign_id', data['timestamp'].dt.date], observed=True).agg({
             'spend': 'sum',
             'conversions': 'sum',
             'clicks': 'sum',
@@ -187,7 +315,7 @@ class MLTrainingPipeline:
     def _prepare_forecast_dataset(self, data: pd.DataFrame) -> pd.DataFrame:
         """Prepare dataset for performance forecasting"""
         # Hourly aggregation for more granular forecasting
-        hourly_data = data.groupby(['campaign_id', data['timestamp'].dt.floor('H')]).agg({
+        hourly_data = data.groupby(['campaign_id', data['timestamp'].dt.floor('H')], observed=True).agg({
             'spend': 'sum',
             'conversions': 'sum',
             'clicks': 'sum',
@@ -208,6 +336,10 @@ class MLTrainingPipeline:
         logger.info("Training CTR prediction model")
         
         try:
+            # The drop list is saved with the model and reapplied at inference
+            if self.feature_engineer.correlation_pruner.is_fitted:
+                self.ctr_predictor.correlation_pruner = self.feature_engineer.correlation_pruner
+            
             # Run training in thread pool to avoid blocking
             with ThreadPoolExecutor(max_workers=1) as executor:
                 future = executor.submit(
@@ -220,18 +352,60 @@ class MLTrainingPipeline:
                 )
                 training_result = future.result()
             
+            return self._ctr_result(training_result)
+            
+        except Exception as e:
+            logger.error(f"CTR model training failed: {e}")
             return {
                 "model_type": "ctr_prediction",
-                "status": "success" if training_result.get("success") else "failed",
-                "user_id": self.user_id,
-                "training_samples": training_result.get("training_samples", 0),
-                "validation_mse": training_result.get("val_mse", None),
-                "training_time": training_result.get("epochs_trained", 0),
-                "model_version": training_result.get("model_version", None)
+                "status": "failed",
+                "error": str(e),
+                "user_id": self.user_id
             }
+    
+    async def train_ctr_model_streaming(self, features_path: str,
+                                        key_columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Train the CTR prediction model from engineered features in Parquet
+        
+        For data beyond max_training_samples: rows are streamed from the
+        file's row groups (or a directory of shards, such as the chunked
+        feature pipeline writes) instead of loaded, and validation rows are
+        picked by a hash of the row key.
+        
+        Args:
+            features_path: Parquet file or directory of engineered features
+            key_columns: Columns identifying a row (campaign_id and timestamp by default)
+            
+        Returns:
+            Training summary
+        """
+        logger.info("Training CTR prediction model from streamed features")
+        
+        try:
+            if self.feature_engineer.correlation_pruner.is_fitted:
+                self.ctr_predictor.correlation_pruner = self.feature_engineer.correlation_pruner
+            
+            training_input = CTRTrainingInput.from_parquet(
+                features_path,
+                target_column='ctr',
+                key_columns=key_columns,
+                validation_split=self.validation_split,
+                row_filter=self._reliable_ctr_rows
+            )
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(
+                    self.ctr_predictor.train_streaming,
+                    training_input,
+                    epochs=50,
+                    batch_size=512
+                )
+                training_result = future.result()
+            
+            return self._ctr_result(training_result)
             
         except Exception as e:
-            logger.error(f"CTR model training failed: {e}")
+            logger.error(f"Streaming CTR model training failed: {e}")
             return {
                 "model_type": "ctr_prediction",
                 "status": "failed",
@@ -239,6 +413,130 @@ class MLTrainingPipeline:
                 "user_id": self.user_id
             }
     
+    async def retrain_ctr_model(self, raw_data: pd.DataFrame, force_full: bool = False) -> Dict[str, Any]:
+        """
+        Daily CTR retrain: fine-tune the current model, or retrain it from scratch
+        
+        The last new_window_days of raw_data are the new window. Unless a
+        full retrain is forced, scheduled or called for by drift (see
+        ctr_retrain_decision), the current model is fine-tuned on the window
+        plus a replay sample of the older rows; otherwise the whole of
+        raw_data goes through the full training pipeline.
+        
+        Args:
+            raw_data: Raw campaign data of the whole lookback period
+            force_full: Retrain from scratch regardless
+            
+        Returns:
+            Training summary, with the mode and the reason for it
+        """
+        window_start = raw_data['timestamp'].max() - timedelta(days=self.new_window_days)
+        new_rows = raw_data['timestamp'] > window_start
+        
+        if force_full:
+            mode, reason, drift = 'full', 'forced', {}
+        else:
+            try:
+                self.ctr_predictor.load_model()
+            except Exception as e:
+                mode, reason, drift = 'full', f"no model to fine-tune: {e}", {}
+            else:
+                # Prune as the model was trained, so none of its inputs go missing
+                if self.ctr_predictor.correlation_pruner is not None:
+                    self.feature_engineer.correlation_pruner = CorrelationPruner.from_dict(
+                        self.ctr_predictor.correlation_pruner.to_dict())
+                datasets = await self.prepare_training_data(raw_data)
+                ctr_data = datasets.get('ctr_prediction')
+                if ctr_data is None:
+                    return {"model_type": "ctr_prediction", "status": "failed", "user_id": self.user_id,
+                            "error": "Not enough CTR rows to retrain on"}
+                window = ctr_data['timestamp'] > window_start
+                new_data, history_data = ctr_data[window], ctr_data[~window]
+                mode, reason, drift = self.ctr_retrain_decision(new_data)
+        logger.info(f"CTR retrain for user {self.user_id}: {mode} ({reason}), "
+                    f"{int(new_rows.sum())} of {len(raw_data)} rows new")
+        
+        if mode == 'skip':
+            return {"model_type": "ctr_prediction", "status": "skipped", "user_id": self.user_id,
+                    "mode": mode, "reason": reason}
+        if mode == 'full':
+            result = await self.run_full_training_pipeline(raw_data, models_to_train=['ctr_prediction'])
+            result = result.get('training_results', {}).get('ctr_prediction', result)
+            return {**result, "mode": mode, "reason": reason, "drift": drift}
+        
+        feature_plan = self.ctr_predictor.feature_plan
+        try:
+            # Lag features served after the fine-tune look back at the newest rows
+            self._refresh_feature_plan(raw_data)
+            replay_rows = min(len(history_data), int(len(new_data) * self.replay_ratio))
+            replay_data = history_data.sample(n=replay_rows, random_state=42) if replay_rows else None
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(
+                    self.ctr_predictor.fine_tune,
+                    new_data,
+                    replay_data,
+                    target_column='ctr',
+                    validation_split=self.validation_split,
+                    epochs=self.fine_tune_epochs,
+                    batch_size=512
+                )
+                training_result = future.result()
+            if not training_result.get("success"):
+                self.ctr_predictor.feature_plan = feature_plan
+            
+            return {**self._ctr_result(training_result), "mode": mode, "reason": reason, "drift": drift,
+                    "replay_samples": replay_rows}
+            
+        except Exception as e:
+            logger.error(f"Incremental CTR model training failed: {e}")
+            self.ctr_predictor.feature_plan = feature_plan
+            return {
+                "model_type": "ctr_prediction",
+                "status": "failed",
+                "error": str(e),
+                "user_id": self.user_id,
+                "mode": mode
+            }
+    
+    def ctr_retrain_decision(self, new_data: pd.DataFrame) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Whether the loaded CTR model can be fine-tuned on a new window or must be retrained from scratch
+        
+        Args:
+            new_data: Prepared CTR rows of the new window, pruned with the
+                model's correlation drop list
+            
+        Returns:
+            'incremental', 'full' or 'skip' (too few new rows), the reason,
+            and the drift report if one was made
+        """
+        preprocessor = self.ctr_predictor.preprocessor
+        if not preprocessor.code_offset:
+            return 'full', "model has legacy encoders", {}
+        # fitted_at is kept through fine-tuning: it dates the last full retrain
+        if datetime.now() - datetime.fromisoformat(preprocessor.fitted_at) >= timedelta(days=self.full_retrain_days):
+            return 'full', "scheduled", {}
+        if len(new_data) < self.min_training_samples:
+            return 'skip', f"only {len(new_data)} new rows", {}
+        
+        drift = self.ctr_predictor.drift_report(new_data)
+        if drift['nmse_ratio'] is not None and drift['nmse_ratio'] > self.drift_nmse_ratio:
+            return 'full', f"drift: normalized MSE {drift['nmse_ratio']:.2f}x that at validation", drift
+        if drift['unseen_share'] > self.drift_unseen_share:
+            return 'full', f"drift: {drift['unseen_share']:.0%} of a feature's values unseen", drift
+        return 'incremental', "no drift", drift
+    
+    def _ctr_result(self, training_result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "model_type": "ctr_prediction",
+            "status": "success" if training_result.get("success") else "failed",
+            "user_id": self.user_id,
+            "training_samples": training_result.get("training_samples", 0),
+            "validation_mse": training_result.get("val_mse", None),
+            "training_time": training_result.get("epochs_trained", 0),
+            "model_version": training_result.get("model_version", None)
+        }
+    
     async def train_budget_model(self, training_data: pd.DataFrame) -> Dict[str, Any]:
         """Train budget optimization model"""
         logger.info("Training budget optimization model")
@@ -300,7 +598,7 @@ class MLTrainingPipeline:
                 })
                 
                 # Prepare training data
-                datasets = await self.prepare_training_data(raw_data)
+                datasets = await self.prepare_training_data(raw_data, fit_feature_pruning=True)
                 
                 if not datasets:
                     return {
@@ -0,0 +1,127 @@
+"""
+Compression Profiles for AI-Buyer Kafka Producers
+Stores measured codec/batching results and picks producer settings from them
+"""
+
+import json
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+import logging
+
+from kafka import codec as kafka_codec
+
+logger = logging.getLogger(__name__)
+
+# Codecs the Kafka producer accepts, with the check for their Python bindings
+CODEC_AVAILABILITY = {
+    'gzip': kafka_codec.has_gzip,
+    'snappy': kafka_codec.has_snappy,
+    'lz4': kafka_codec.has_lz4,
+    'zstd': kafka_codec.has_zstd,
+}
+
+# Defaults used by FacebookDataStreamer when no profile is given
+DEFAULT_PRODUCER_SETTINGS = {
+    'compression_type': 'gzip',
+    'batch_size': 16384,
+    'linger_ms': 10,
+}
+
+
+def available_codecs() -> List[str]:
+    """Codecs usable by the Kafka producer in this process"""
+    return [name for name, is_available in CODEC_AVAILABILITY.items() if is_available()]
+
+
+@dataclass
+class CodecMeasurement:
+    """Measured cost of one codec and batching configuration"""
+    codec: str
+    batch_size: int
+    linger_ms: int
+    records: int
+    raw_bytes: int
+    compressed_bytes: int
+    cpu_seconds: float
+    batches: int
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+    @property
+    def throughput_mb_per_cpu_second(self) -> float:
+        return self.raw_bytes / 1e6 / self.cpu_seconds if self.cpu_seconds > 0 else float('inf')
+
+    def effective_seconds_per_mb(self, link_mb_per_second: float) -> float:
+        """
+        Producer cost of shipping 1 MB of raw payload: compression CPU time
+        plus the time the compressed bytes occupy the network link
+        """
+        raw_mb = self.raw_bytes / 1e6
+        if raw_mb == 0:
+            return float('inf')
+        network_seconds = self.compressed_bytes / 1e6 / link_mb_per_second
+        return (self.cpu_seconds + network_seconds) / raw_mb
+
+
+@dataclass
+class CompressionProfile:
+    """Set of codec measurements taken by benchmarks.compression_codecs"""
+    measurements: List[CodecMeasurement]
+    link_mb_per_second: float = 100.0
+    measured_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    def ranked(self, codecs: Optional[List[str]] = None) -> List[CodecMeasurement]:
+        """Measurements ordered from cheapest to most expensive"""
+        candidates = [
+            m for m in self.measurements
+            if codecs is None or m.codec in codecs
+        ]
+        return sorted(
+            candidates,
+            key=lambda m: m.effective_seconds_per_mb(self.link_mb_per_second)
+        )
+
+    def best(self) -> Optional[CodecMeasurement]:
+        """Cheapest measurement whose codec is usable in this process"""
+        ranked = self.ranked(available_codecs())
+        return ranked[0] if ranked else None
+
+    def producer_settings(self) -> Dict[str, Any]:
+        """KafkaProducer settings for the best measurement"""
+        best = self.best()
+        if best is None:
+            logger.warning("No usable codec in compression profile, using producer defaults")
+            return dict(DEFAULT_PRODUCER_SETTINGS)
+
+        return {
+            'compression_type': best.codec,
+            'batch_size': best.batch_size,
+            'linger_ms': best.linger_ms,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'measured_at': self.measured_at,
+            'link_mb_per_second': self.link_mb_per_second,
+            'measurements': [asdict(m) for m in self.measurements],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CompressionProfile':
+        return cls(
+            measurements=[CodecMeasurement(**m) for m in data['measurements']],
+            link_mb_per_second=data.get('link_mb_per_second', 100.0),
+            measured_at=data.get('measured_at', ''),
+        )
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> 'CompressionProfile':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,655 @@
+"""
+Embedded Log Broker for AI-Buyer
+In-process, file-backed stand-in for Kafka used for local end-to-end and
+throughput testing of the streaming pipeline
+
+Implements the subset of broker behaviour the streaming components rely on:
+topics with partitions, keyed partitioning (Kafka's murmur2, so keys land on
+the same partitions as on a real cluster), consumer groups with partition
+assignment, per-group committed offsets and durable memory-mapped segments.
+
+Components opt in through their bootstrap servers setting:
+
+    FacebookDataStreamer(bootstrap_servers=['embedded:///tmp/ai-buyer-log'])
+    create_ai_buyer_consumer(bootstrap_servers=['embedded:///tmp/ai-buyer-log'])
+    KafkaRulesProcessor({'kafka_servers': 'embedded:///tmp/ai-buyer-log', ...})
+"""
+
+import asyncio
+import bisect
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from array import array
+from collections import namedtuple
+from typing import Dict, List, Any, Optional, Callable, Iterable, Union
+import logging
+
+from kafka.partitioner import murmur2
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED_SCHEME = 'embedded://'
+
+TopicPartition = namedtuple('TopicPartition', ['topic', 'partition'])
+RecordMetadata = namedtuple('RecordMetadata', ['topic', 'partition', 'offset', 'timestamp'])
+ConsumerRecord = namedtuple(
+    'ConsumerRecord', ['topic', 'partition', 'offset', 'timestamp', 'key', 'value']
+)
+ClusterMetadata = namedtuple('ClusterMetadata', ['topics', 'brokers'])
+
+# Record frame: payload length (excluding this field), offset, timestamp ms,
+# key length, value length (-1 encodes None), then key and value bytes
+_FRAME = struct.Struct('<Iqqii')
+
+
+def is_embedded_bootstrap(bootstrap_servers: Union[str, List[str], None]) -> bool:
+    """Check whether bootstrap servers point at an embedded broker"""
+    if not bootstrap_servers:
+        return False
+    if isinstance(bootstrap_servers, str):
+        bootstrap_servers = bootstrap_servers.split(',')
+    return bootstrap_servers[0].startswith(EMBEDDED_SCHEME)
+
+
+class _Segment:
+    """Preallocated, memory-mapped log segment"""
+
+    def __init__(self, path: str, base_offset: int, size: int):
+        self.path = path
+        self.base_offset = base_offset
+        self.positions = array('Q')
+
+        exists = os.path.exists(path)
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(size)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        self.position = 0
+
+        if exists:
+            self._recover()
+
+    def _recover(self):
+        """Rebuild the position index by scanning written frames"""
+        while self.position + _FRAME.size <= self.size:
+            length = _FRAME.unpack_from(self._map, self.position)[0]
+            if length == 0:
+                break
+            self.positions.append(self.position)
+            self.position += 4 + length
+
+    @property
+    def next_offset(self) -> int:
+        return self.base_offset + len(self.positions)
+
+    def append(self, timestamp_ms: int, key: Optional[bytes], value: Optional[bytes]) -> Optional[int]:
+        """Append a record, returning its offset or None when the segment is full"""
+        key_len = -1 if key is None else len(key)
+        value_len = -1 if value is None else len(value)
+        frame_size = _FRAME.size + max(key_len, 0) + max(value_len, 0)
+        if self.position + frame_size > self.size:
+            return None
+
+        offset = self.next_offset
+        pos = self.position + _FRAME.size
+        if key:
+            self._map[pos:pos + key_len] = key
+            pos += key_len
+        if value:
+            self._map[pos:pos + value_len] = value
+
+        # Header last: a non-zero length marks the frame as complete on recovery
+        _FRAME.pack_into(self._map, self.position, frame_size - 4, offset, timestamp_ms, key_len, value_len)
+
+        self.positions.append(self.position)
+        self.position += frame_size
+        return offset
+
+    def read(self, offset: int):
+        """Read (offset, timestamp_ms, key, value) at an offset held by this segment"""
+        pos = self.positions[offset - self.base_offset]
+        _, record_offset, timestamp_ms, key_len, value_len = _FRAME.unpack_from(self._map, pos)
+        pos += _FRAME.size
+        key = None
+        if key_len >= 0:
+            key = self._map[pos:pos + key_len]
+            pos += key_len
+        value = None if value_len < 0 else self._map[pos:pos + value_len]
+        return record_offset, timestamp_ms, key, value
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class _Partition:
+    """Ordered sequence of segments for one topic partition"""
+
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments: List[_Segment] = []
+        for name in sorted(f for f in os.listdir(directory) if f.endswith('.log')):
+            self.segments.append(_Segment(
+                os.path.join(directory, name), int(name[:-4]), segment_bytes
+            ))
+        if not self.segments:
+            self._roll(0)
+        self._base_offsets = [s.base_offset for s in self.segments]
+
+    def _roll(self, base_offset: int):
+        path = os.path.join(self.directory, f'{base_offset:020d}.log')
+        self.segments.append(_Segment(path, base_offset, self.segment_bytes))
+
+    @property
+    def end_offset(self) -> int:
+        return self.segments[-1].next_offset
+
+    def append(self, timestamp_ms: int, key: Optional[bytes], value: Optional[bytes]) -> int:
+        offset = self.segments[-1].append(timestamp_ms, key, value)
+        if offset is None:
+            record_size = _FRAME.size + len(key or b'') + len(value or b'')
+            if record_size > self.segment_bytes:
+                raise ValueError(f"Record of {record_size} bytes exceeds segment size {self.segment_bytes}")
+            self._roll(self.end_offset)
+            self._base_offsets.append(self.segments[-1].base_offset)
+            offset = self.segments[-1].append(timestamp_ms, key, value)
+        return offset
+
+    def read(self, offset: int, max_records: int):
+        records = []
+        end = min(self.end_offset, offset + max_records)
+        index = bisect.bisect_right(self._base_offsets, offset) - 1
+        while offset < end:
+            segment = self.segments[index]
+            if offset >= segment.next_offset:
+                index += 1
+                continue
+            records.append(segment.read(offset))
+            offset += 1
+        return records
+
+    def flush(self):
+        for segment in self.segments:
+            segment.flush()
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+class EmbeddedLogBroker:
+    """
+    Single-process log broker backed by memory-mapped segment files
+
+    One instance is shared by every client that uses the same data directory
+    (see get_embedded_broker), so producers and consumers in one process see
+    each other's records.
+    """
+
+    def __init__(self,
+                 data_dir: str,
+                 num_partitions: int = 3,
+                 segment_bytes: int = 64 * 1024 * 1024):
+        self.data_dir = data_dir
+        self.num_partitions = num_partitions
+        self.segment_bytes = segment_bytes
+
+        self._lock = threading.RLock()
+        self._data_available = threading.Condition(self._lock)
+        self._topics: Dict[str, List[_Partition]] = {}
+        self._round_robin = itertools.count()
+
+        # Consumer groups: members in join order, a generation bumped on
+        # every membership change, and committed offsets
+        self._group_members: Dict[str, Dict[str, List[str]]] = {}
+        self._generations: Dict[str, int] = {}
+        self._offsets_path = os.path.join(data_dir, 'consumer_offsets.json')
+        self._committed: Dict[str, Dict[str, int]] = {}
+
+        os.makedirs(data_dir, exist_ok=True)
+        self._load_existing()
+
+        logger.info(f"EmbeddedLogBroker opened at {data_dir}")
+
+    def _load_existing(self):
+        for name in sorted(os.listdir(self.data_dir)):
+            topic_dir = os.path.join(self.data_dir, name)
+            if not os.path.isdir(topic_dir):
+                continue
+            partitions = sorted(int(p) for p in os.listdir(topic_dir) if p.isdigit())
+            self._topics[name] = [
+                _Partition(os.path.join(topic_dir, str(p)), self.segment_bytes)
+                for p in partitions
+            ]
+
+        if os.path.exists(self._offsets_path):
+            with open(self._offsets_path) as f:
+                self._committed = json.load(f)
+
+    # Topics
+
+    def create_topic(self, topic: str, num_partitions: Optional[int] = None) -> List[_Partition]:
+        with self._lock:
+            if topic not in self._topics:
+                count = num_partitions or self.num_partitions
+                topic_dir = os.path.join(self.data_dir, topic)
+                self._topics[topic] = [
+                    _Partition(os.path.join(topic_dir, str(p)), self.segment_bytes)
+                    for p in range(count)
+                ]
+            return self._topics[topic]
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return list(self._topics)
+
+    def partitions_for(self, topic: str) -> List[int]:
+        return list(range(len(self.create_topic(topic))))
+
+    def end_offset(self, tp: TopicPartition) -> int:
+        with self._lock:
+            return self.create_topic(tp.topic)[tp.partition].end_offset
+
+    # Producing
+
+    def _partition_for(self, topic: str, key: Optional[bytes]) -> int:
+        count = len(self.create_topic(topic))
+        if key is None:
+            return next(self._round_robin) % count
+        return (murmur2(key) & 0x7fffffff) % count
+
+    def append(self,
+               topic: str,
+               key: Optional[bytes],
+               value: Optional[bytes],
+               partition: Optional[int] = None,
+               timestamp_ms: Optional[int] = None) -> RecordMetadata:
+        """Append one record and wake up waiting consumers"""
+        if timestamp_ms is None:
+            timestamp_ms = int(time.time() * 1000)
+
+        with self._lock:
+            if partition is None:
+                partition = self._partition_for(topic, key)
+            offset = self.create_topic(topic)[partition].append(timestamp_ms, key, value)
+            self._data_available.notify_all()
+
+        return RecordMetadata(topic, partition, offset, timestamp_ms)
+
+    # Fetching
+
+    def fetch(self, tp: TopicPartition, offset: int, max_records: int) -> List[ConsumerRecord]:
+        with self._lock:
+            raw = self.create_topic(tp.topic)[tp.partition].read(offset, max_records)
+        return [
+            ConsumerRecord(tp.topic, tp.partition, record_offset, timestamp_ms, key, value)
+            for record_offset, timestamp_ms, key, value in raw
+        ]
+
+    def wait_for_data(self, timeout: float):
+        """Block until a record is appended or the timeout expires"""
+        with self._data_available:
+            self._data_available.wait(timeout)
+
+    # Consumer groups
+
+    def join_group(self, group_id: str, member_id: str, topics: Iterable[str]):
+        with self._lock:
+            for topic in topics:
+                self.create_topic(topic)
+                members = self._group_members.setdefault(group_id, {}).setdefault(topic, [])
+                if member_id not in members:
+                    members.append(member_id)
+                    self._generations[group_id] = self._generations.get(group_id, 0) + 1
+
+    def leave_group(self, group_id: str, member_id: str):
+        with self._lock:
+            for members in self._group_members.get(group_id, {}).values():
+                if member_id in members:
+                    members.remove(member_id)
+                    self._generations[group_id] = self._generations.get(group_id, 0) + 1
+
+    def generation(self, group_id: str) -> int:
+        """Count of membership changes of a group, so members can tell a rebalance happened"""
+        with self._lock:
+            return self._generations.get(group_id, 0)
+
+    def assignment(self, group_id: str, member_id: str) -> List[TopicPartition]:
+        """Round-robin partitions of each subscribed topic across group members"""
+        with self._lock:
+            assigned = []
+            for topic, members in self._group_members.get(group_id, {}).items():
+                if member_id not in members:
+                    continue
+                index = members.index(member_id)
+                for partition in range(len(self._topics[topic])):
+                    if partition % len(members) == index:
+                        assigned.append(TopicPartition(topic, partition))
+            return assigned
+
+    def committed(self, group_id: str, tp: TopicPartition) -> Optional[int]:
+        with self._lock:
+            return self._committed.get(group_id, {}).get(f'{tp.topic}:{tp.partition}')
+
+    def commit(self, group_id: str, offsets: Dict[TopicPartition, int]):
+        """Persist committed offsets for a group"""
+        with self._lock:
+            group = self._committed.setdefault(group_id, {})
+            for tp, offset in offsets.items():
+                group[f'{tp.topic}:{tp.partition}'] = offset
+
+            tmp_path = self._offsets_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._committed, f)
+            os.replace(tmp_path, self._offsets_path)
+
+    def flush(self):
+        with self._lock:
+            for partitions in self._topics.values():
+                for partition in partitions:
+                    partition.flush()
+
+    def close(self):
+        with self._lock:
+            for partitions in self._topics.values():
+                for partition in partitions:
+                    partition.close()
+            self._topics.clear()
+
+        # The next client of this directory opens it again from disk
+        with _brokers_lock:
+            data_dir = os.path.abspath(self.data_dir)
+            if _brokers.get(data_dir) is self:
+                del _brokers[data_dir]
+
+
+# Process-wide brokers keyed by data directory
+_brokers: Dict[str, EmbeddedLogBroker] = {}
+_brokers_lock = threading.Lock()
+
+
+def get_embedded_broker(bootstrap_servers: Union[str, List[str]], **broker_options) -> EmbeddedLogBroker:
+    """
+    Get the shared broker for an ``embedded://<data_dir>`` bootstrap address
+
+    Args:
+        bootstrap_servers: Bootstrap servers setting of the client
+        broker_options: EmbeddedLogBroker options used on first open
+    """
+    if isinstance(bootstrap_servers, str):
+        bootstrap_servers = bootstrap_servers.split(',')
+    data_dir = os.path.abspath(bootstrap_servers[0][len(EMBEDDED_SCHEME):])
+
+    with _brokers_lock:
+        if data_dir not in _brokers:
+            _brokers[data_dir] = EmbeddedLogBroker(data_dir, **broker_options)
+        return _brokers[data_dir]
+
+
+class _ImmediateFuture:
+    """Completed send future with the kafka-python callback interface"""
+
+    def __init__(self, value: Any = None, exception: Optional[Exception] = None):
+        self.value = value
+        self.exception = exception
+
+    def add_callback(self, fn: Callable, *args, **kwargs) -> '_ImmediateFuture':
+        if self.exception is None:
+            fn(*args, self.value, **kwargs)
+        return self
+
+    def add_errback(self, fn: Callable, *args, **kwargs) -> '_ImmediateFuture':
+        if self.exception is not None:
+            fn(*args, self.exception, **kwargs)
+        return self
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def succeeded(self) -> bool:
+        return self.exception is None
+
+
+class EmbeddedProducer:
+    """KafkaProducer-compatible client for EmbeddedLogBroker"""
+
+    def __init__(self,
+                 bootstrap_servers: Union[str, List[str]],
+                 value_serializer: Optional[Callable] = None,
+                 key_serializer: Optional[Callable] = None,
+                 **_kafka_options):
+        self.broker = get_embedded_broker(bootstrap_servers)
+        self.value_serializer = value_serializer
+        self.key_serializer = key_serializer
+
+    def send(self, topic: str, value: Any = None, key: Any = None,
+             partition: Optional[int] = None, timestamp_ms: Optional[int] = None) -> _ImmediateFuture:
+        try:
+            key_bytes = self.key_serializer(key) if self.key_serializer and key is not None else key
+            value_bytes = self.value_serializer(value) if self.value_serializer and value is not None else value
+            metadata = self.broker.append(topic, key_bytes, value_bytes, partition, timestamp_ms)
+            return _ImmediateFuture(metadata)
+        except Exception as e:
+            return _ImmediateFuture(exception=e)
+
+    def flush(self, timeout: Optional[float] = None):
+        self.broker.flush()
+
+    def list_topics(self, timeout: Optional[float] = None) -> ClusterMetadata:
+        return ClusterMetadata(
+            topics={topic: self.broker.partitions_for(topic) for topic in self.broker.topics()},
+            brokers=[self.broker.data_dir]
+        )
+
+    def close(self, timeout: Optional[float] = None):
+        self.flush()
+
+
+class EmbeddedConsumer:
+    """KafkaConsumer-compatible client for EmbeddedLogBroker"""
+
+    def __init__(self,
+                 *topics: str,
+                 bootstrap_servers: Union[str, List[str]],
+                 group_id: Optional[str] = None,
+                 auto_offset_reset: str = 'latest',
+                 enable_auto_commit: bool = True,
+                 max_poll_records: int = 500,
+                 value_deserializer: Optional[Callable] = None,
+                 key_deserializer: Optional[Callable] = None,
+                 consumer_timeout_ms: float = float('inf'),
+                 **_kafka_options):
+        self.broker = get_embedded_broker(bootstrap_servers)
+        self.group_id = group_id or f'embedded-{uuid.uuid4()}'
+        self.member_id = str(uuid.uuid4())
+        self.auto_offset_reset = auto_offset_reset
+        self.enable_auto_commit = enable_auto_commit
+        self.max_poll_records = max_poll_records
+        self.value_deserializer = value_deserializer
+        self.key_deserializer = key_deserializer
+        self.consumer_timeout_ms = consumer_timeout_ms
+
+        self._positions: Dict[TopicPartition, int] = {}
+        self._generation: Optional[int] = None
+        self._closed = False
+        self.subscribe(topics)
+
+    def subscribe(self, topics: Iterable[str]):
+        self.broker.join_group(self.group_id, self.member_id, topics)
+
+    def assignment(self) -> set:
+        return set(self.broker.assignment(self.group_id, self.member_id))
+
+    def _position(self, tp: TopicPartition) -> int:
+        if tp not in self._positions:
+            committed = self.broker.committed(self.group_id, tp)
+            if committed is not None:
+                self._positions[tp] = committed
+            elif self.auto_offset_reset == 'earliest':
+                self._positions[tp] = 0
+            else:
+                self._positions[tp] = self.broker.end_offset(tp)
+        return self._positions[tp]
+
+    def _deserialize(self, record: ConsumerRecord) -> ConsumerRecord:
+        key, value = record.key, record.value
+        if self.key_deserializer and key is not None:
+            key = self.key_deserializer(key)
+        if self.value_deserializer and value is not None:
+            value = self.value_deserializer(value)
+        return record._replace(key=key, value=value)
+
+    def _check_rebalance(self):
+        """
+        Drop consumed positions once the group has rebalanced
+
+        Partitions may have moved to another member and back since the
+        positions were cached, so reading resumes from the group's committed
+        offsets, as after a Kafka rebalance.
+        """
+        generation = self.broker.generation(self.group_id)
+        if generation != self._generation:
+            self._positions.clear()
+            self._generation = generation
+
+    def _fetch(self, max_records: int) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        self._check_rebalance()
+        batch = {}
+        for tp in sorted(self.assignment()):
+            if max_records <= 0:
+                break
+            records = self.broker.fetch(tp, self._position(tp), max_records)
+            if records:
+                batch[tp] = [self._deserialize(r) for r in records]
+                self._positions[tp] = records[-1].offset + 1
+                max_records -= len(records)
+        return batch
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        """Fetch records from assigned partitions, waiting up to timeout_ms"""
+        if self._closed:
+            raise RuntimeError("Consumer is closed")
+
+        deadline = time.time() + timeout_ms / 1000.0
+        while True:
+            batch = self._fetch(max_records or self.max_poll_records)
+            remaining = deadline - time.time()
+            if batch or remaining <= 0:
+                return batch
+            self.broker.wait_for_data(remaining)
+
+    def commit(self, offsets: Optional[Dict[TopicPartition, int]] = None):
+        """Commit consumed positions (or the given offsets) for the group"""
+        if offsets is None:
+            self._check_rebalance()
+            offsets = {tp: pos for tp, pos in self._positions.items() if tp in self.assignment()}
+        self.broker.commit(self.group_id, offsets)
+
+    def committed(self, tp: TopicPartition) -> Optional[int]:
+        return self.broker.committed(self.group_id, tp)
+
+    def __iter__(self):
+        idle_since = time.time()
+        while not self._closed:
+            batch = self.poll(timeout_ms=min(self.consumer_timeout_ms, 1000))
+            if not batch:
+                if (time.time() - idle_since) * 1000 >= self.consumer_timeout_ms:
+                    return
+                continue
+            idle_since = time.time()
+            for records in batch.values():
+                for record in records:
+                    yield record
+            if self.enable_auto_commit:
+                self.commit()
+
+    def close(self, autocommit: bool = True):
+        if self._closed:
+            return
+        if autocommit and self.enable_auto_commit:
+            self.commit()
+        self.broker.leave_group(self.group_id, self.member_id)
+        self._closed = True
+
+
+class EmbeddedAIOProducer:
+    """AIOKafkaProducer-compatible client for EmbeddedLogBroker"""
+
+    def __init__(self, bootstrap_servers: Union[str, List[str]], **kafka_options):
+        self._producer = EmbeddedProducer(bootstrap_servers, **kafka_options)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self._producer.close()
+
+    async def send(self, topic: str, value: Any = None, key: Any = None,
+                   partition: Optional[int] = None) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        result = self._producer.send(topic, value=value, key=key, partition=partition)
+        if result.succeeded():
+            future.set_result(result.value)
+        else:
+            future.set_exception(result.exception)
+        return future
+
+    async def send_and_wait(self, topic: str, value: Any = None, key: Any = None,
+                            partition: Optional[int] = None) -> RecordMetadata:
+        return await (await self.send(topic, value=value, key=key, partition=partition))
+
+
+class EmbeddedAIOConsumer:
+    """AIOKafkaConsumer-compatible client for EmbeddedLogBroker"""
+
+    def __init__(self, *topics: str, bootstrap_servers: Union[str, List[str]], **kafka_options):
+        self._topics = topics
+        self._bootstrap_servers = bootstrap_servers
+        self._options = kafka_options
+        self._consumer: Optional[EmbeddedConsumer] = None
+
+    async def start(self):
+        self._consumer = EmbeddedConsumer(
+            *self._topics, bootstrap_servers=self._bootstrap_servers, **self._options
+        )
+
+    async def stop(self):
+        if self._consumer:
+            self._consumer.close()
+
+    async def getmany(self, timeout_ms: int = 0,
+                      max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        # Wait in a worker thread so the event loop keeps running
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._consumer.poll, timeout_ms, max_records
+        )
+
+    async def commit(self, offsets: Optional[Dict[TopicPartition, int]] = None):
+        self._consumer.commit(offsets)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while not self._consumer._closed:
+            batch = await self.getmany(timeout_ms=1000)
+            for records in batch.values():
+                for record in records:
+                    yield record
+            if batch and self._consumer.enable_auto_commit:
+                self._consumer.commit()
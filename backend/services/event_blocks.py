@@ -0,0 +1,402 @@
+"""
+Columnar Event Blocks for AI-Buyer
+Packs many campaign metric records for one user into a single Kafka record
+"""
+
+import json
+import struct
+import uuid
+import zlib
+from array import array
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Wire format:
+#   MAGIC (4 bytes) | version (u8) | codec (u8) | payload
+# payload (after decompression):
+#   header length (u32) | header JSON | 8-byte aligned column buffers
+BLOCK_MAGIC = b'FBCB'
+BLOCK_VERSION = 1
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+
+_PREFIX = struct.Struct('<4sBB')
+_HEADER_LEN = struct.Struct('<I')
+_NULL_INDEX = 0xFFFFFFFF
+_MISSING = object()
+
+# Row states in a column's 'nulls' map: the key is absent, its value is an
+# explicit null, or an integer stored in a float column
+_ABSENT = 1
+_NULL = 2
+_INTEGER = 3
+
+# Largest integer a float column holds exactly
+_EXACT_FLOAT_INT = 2 ** 53
+
+# Column types: int64, float64, dictionary-encoded string,
+# dictionary-encoded JSON value, 16-byte UUID
+_TYPE_CODES = {'i': 'q', 'f': 'd', 's': 'I', 'j': 'I'}
+
+ENVELOPE_COLUMNS = ('campaign_id', 'ad_set_id', 'ad_id')
+
+# Topic the producer writes campaign events and event blocks to
+CAMPAIGN_EVENTS_TOPIC = 'facebook-campaign-events'
+
+
+def is_event_block(raw: Optional[bytes]) -> bool:
+    """Check whether a raw Kafka value is a columnar event block"""
+    return raw is not None and raw[:4] == BLOCK_MAGIC
+
+
+def decode_event_value(raw: Optional[bytes]) -> Union['CampaignEventBlock', Dict[str, Any], None]:
+    """
+    Kafka value deserializer that understands both JSON events and event blocks
+
+    Args:
+        raw: Raw message value
+
+    Returns:
+        CampaignEventBlock for block records, decoded JSON otherwise
+    """
+    if not raw:
+        return None
+    if is_event_block(raw):
+        return CampaignEventBlock(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+def event_timestamp(record: Dict[str, Any]) -> str:
+    """
+    ISO timestamp of a buffered campaign record's event
+
+    The campaign data's own timestamp when it has one, otherwise the time
+    the record was buffered; JSON events and event blocks both use it.
+    """
+    own = record['campaign_data'].get('timestamp')
+    if own is None:
+        return datetime.fromtimestamp(record['timestamp']).isoformat()
+    return own.isoformat() if isinstance(own, datetime) else str(own)
+
+
+def _infer_type(values: List[Any]) -> str:
+    """Pick the narrowest column type for the present values"""
+    present = [v for v in values if v is not None and v is not _MISSING]
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return 'i'
+    if all(isinstance(v, float) or
+           (isinstance(v, int) and not isinstance(v, bool) and abs(v) <= _EXACT_FLOAT_INT)
+           for v in present):
+        return 'f'
+    if all(isinstance(v, str) for v in present):
+        return 's'
+    return 'j'
+
+
+def _encode_column(values: List[Any], col_type: str) -> Dict[str, Any]:
+    """Encode one column into its buffer, dictionary and row state map"""
+    column: Dict[str, Any] = {'type': col_type}
+    states = bytes(
+        _ABSENT if v is _MISSING else
+        _NULL if v is None else
+        _INTEGER if col_type == 'f' and isinstance(v, int) else 0
+        for v in values
+    )
+
+    if col_type in ('s', 'j'):
+        dictionary: Dict[str, int] = {}
+        indices = array('I')
+        for value in values:
+            if value is None or value is _MISSING:
+                indices.append(_NULL_INDEX)
+                continue
+            token = value if col_type == 's' else json.dumps(value, default=str)
+            indices.append(dictionary.setdefault(token, len(dictionary)))
+        column['dict'] = list(dictionary)
+        column['buffer'] = indices.tobytes()
+    else:
+        data = array(_TYPE_CODES[col_type], (0 if v is None or v is _MISSING else v for v in values))
+        column['buffer'] = data.tobytes()
+
+    if any(states):
+        column['nulls'] = states
+
+    return column
+
+
+def encode_campaign_block(user_id: str,
+                          records: List[Dict[str, Any]],
+                          compress: bool = True,
+                          compression_level: int = 6) -> bytes:
+    """
+    Encode campaign metric records for one user as a columnar event block
+
+    Args:
+        user_id: User identifier shared by all records
+        records: Buffered records with 'campaign_data' and 'timestamp' keys
+            (the layout used by FacebookDataStreamer.batch_buffer)
+        compress: Whether to zlib-compress the payload
+        compression_level: zlib compression level
+
+    Returns:
+        Encoded block ready to be sent as a Kafka value
+    """
+    campaigns = [record['campaign_data'] for record in records]
+
+    columns: List[Dict[str, Any]] = []
+
+    for name in ENVELOPE_COLUMNS:
+        values = [c.get(name, '') for c in campaigns]
+        columns.append(dict(
+            _encode_column(values, _infer_type(values)),
+            name=name, group='envelope'
+        ))
+
+    # Buffer times as epoch seconds, unless some events carry their own
+    if any(c.get('timestamp') is not None for c in campaigns):
+        columns.append(dict(
+            _encode_column([event_timestamp(record) for record in records], 's'),
+            name='timestamp', group='envelope'
+        ))
+    else:
+        columns.append(dict(
+            _encode_column([float(record['timestamp']) for record in records], 'f'),
+            name='timestamp', group='envelope'
+        ))
+    columns.append({
+        'name': 'event_id', 'group': 'envelope', 'type': 'u',
+        'buffer': b''.join(uuid.uuid4().bytes for _ in records)
+    })
+    columns.append(dict(
+        _encode_column([c.get('metadata', {}) for c in campaigns], 'j'),
+        name='metadata', group='envelope'
+    ))
+
+    # Metric keys in order of first appearance
+    metric_names: Dict[str, None] = {}
+    for campaign in campaigns:
+        metric_names.update(dict.fromkeys(campaign.get('metrics') or {}))
+
+    for name in metric_names:
+        values = [(campaign.get('metrics') or {}).get(name, _MISSING) for campaign in campaigns]
+        columns.append(dict(
+            _encode_column(values, _infer_type(values)),
+            name=name, group='metrics'
+        ))
+
+    # Lay out buffers on 8-byte boundaries so readers can cast them in place
+    body = bytearray()
+    for column in columns:
+        for part in ('buffer', 'nulls'):
+            if part not in column:
+                continue
+            body.extend(b'\0' * (-len(body) % 8))
+            chunk = column.pop(part)
+            column[part] = [len(body), len(chunk)]
+            body.extend(chunk)
+
+    header = json.dumps({
+        'user_id': user_id,
+        'event_type': 'metrics_update',
+        'rows': len(records),
+        'columns': columns
+    }, separators=(',', ':')).encode('utf-8')
+
+    header_size = _HEADER_LEN.size + len(header)
+    padding = b' ' * (-header_size % 8)
+    payload = _HEADER_LEN.pack(len(header) + len(padding)) + header + padding + bytes(body)
+
+    codec = CODEC_NONE
+    if compress:
+        payload = zlib.compress(payload, compression_level)
+        codec = CODEC_ZLIB
+
+    return _PREFIX.pack(BLOCK_MAGIC, BLOCK_VERSION, codec) + payload
+
+
+class _Column:
+    """Read-only view over one encoded column"""
+
+    __slots__ = ('name', 'type', 'values', 'dictionary', 'nulls', '_decoded')
+
+    def __init__(self, spec: Dict[str, Any], body: memoryview):
+        self.name = spec['name']
+        self.type = spec['type']
+        offset, length = spec['buffer']
+        raw = body[offset:offset + length]
+        self.values = raw if self.type == 'u' else raw.cast(_TYPE_CODES[self.type])
+        self.dictionary = spec.get('dict')
+        self.nulls = None
+        if 'nulls' in spec:
+            offset, length = spec['nulls']
+            self.nulls = body[offset:offset + length]
+        self._decoded: Dict[int, Any] = {}
+
+    def value(self, row: int, default: Any = None) -> Any:
+        if self.type == 'u':
+            return str(uuid.UUID(bytes=bytes(self.values[row * 16:row * 16 + 16])))
+        if self.nulls is not None and self.nulls[row]:
+            state = self.nulls[row]
+            if state == _NULL:
+                return None
+            if state == _INTEGER:
+                return int(self.values[row])
+            return default
+
+        raw = self.values[row]
+        if self.type in ('i', 'f'):
+            return raw
+        if raw == _NULL_INDEX:
+            return default
+        if self.type == 's':
+            return self.dictionary[raw]
+
+        # JSON values are decoded once per distinct value
+        if raw not in self._decoded:
+            self._decoded[raw] = json.loads(self.dictionary[raw])
+        return self._decoded[raw]
+
+
+class CampaignEventBlock:
+    """
+    Decoded columnar block of campaign metric events
+
+    Columns are views into the decompressed payload; iterating yields
+    lightweight row views that read values on access.
+    """
+
+    def __init__(self, raw: bytes):
+        magic, version, codec = _PREFIX.unpack_from(raw)
+        if magic != BLOCK_MAGIC:
+            raise ValueError("Not a campaign event block")
+        if version != BLOCK_VERSION:
+            raise ValueError(f"Unsupported event block version: {version}")
+
+        payload = raw[_PREFIX.size:]
+        if codec == CODEC_ZLIB:
+            payload = zlib.decompress(payload)
+        elif codec != CODEC_NONE:
+            raise ValueError(f"Unsupported event block codec: {codec}")
+
+        header_length, = _HEADER_LEN.unpack_from(payload)
+        header_end = _HEADER_LEN.size + header_length
+        header = json.loads(bytes(payload[_HEADER_LEN.size:header_end]))
+        body = memoryview(payload)[header_end:]
+
+        self.user_id: str = header['user_id']
+        self.event_type: str = header['event_type']
+        self.num_rows: int = header['rows']
+        self.envelope: Dict[str, _Column] = {}
+        self.metrics: Dict[str, _Column] = {}
+
+        for spec in header['columns']:
+            target = self.envelope if spec['group'] == 'envelope' else self.metrics
+            target[spec['name']] = _Column(spec, body)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __iter__(self) -> Iterator['CampaignEventRow']:
+        for row in range(self.num_rows):
+            yield CampaignEventRow(self, row)
+
+    def column(self, name: str) -> Optional[memoryview]:
+        """Raw numeric metric column, for vectorised consumers"""
+        column = self.metrics.get(name)
+        if column is None or column.type not in ('i', 'f'):
+            return None
+        return column.values
+
+
+class _MetricsView:
+    """Dict-like access to the metric columns of one row"""
+
+    __slots__ = ('_block', '_row')
+
+    def __init__(self, block: CampaignEventBlock, row: int):
+        self._block = block
+        self._row = row
+
+    def get(self, name: str, default: Any = None) -> Any:
+        column = self._block.metrics.get(name)
+        if column is None:
+            return default
+        return column.value(self._row, default)
+
+    def __getitem__(self, name: str) -> Any:
+        value = self.get(name, _MISSING)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        return [name for name in self._block.metrics if name in self]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: self[name] for name in self.keys()}
+
+
+class CampaignEventRow:
+    """
+    Row view over a CampaignEventBlock
+
+    Exposes the same fields as a decoded FacebookCampaignEvent; metric names
+    are also readable at the top level for consumers that expect flat records.
+    """
+
+    __slots__ = ('_block', '_row')
+
+    def __init__(self, block: CampaignEventBlock, row: int):
+        self._block = block
+        self._row = row
+
+    def get(self, name: str, default: Any = None) -> Any:
+        block = self._block
+        if name == 'user_id':
+            return block.user_id
+        if name == 'event_type':
+            return block.event_type
+        if name == 'metrics':
+            return _MetricsView(block, self._row)
+        if name == 'timestamp':
+            column = block.envelope['timestamp']
+            if column.type == 's':
+                return column.value(self._row)
+            return datetime.fromtimestamp(column.value(self._row)).isoformat()
+
+        column = block.envelope.get(name) or block.metrics.get(name)
+        if column is None:
+            return default
+        return column.value(self._row, default)
+
+    def __getitem__(self, name: str) -> Any:
+        value = self.get(name, _MISSING)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name, _MISSING) is not _MISSING
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialize the row as a FacebookCampaignEvent-shaped dict"""
+        return {
+            'user_id': self._block.user_id,
+            'campaign_id': self.get('campaign_id'),
+            'ad_set_id': self.get('ad_set_id'),
+            'ad_id': self.get('ad_id'),
+            'timestamp': self.get('timestamp'),
+            'event_type': self._block.event_type,
+            'metrics': self.get('metrics').to_dict(),
+            'metadata': self.get('metadata'),
+            'event_id': self.get('event_id'),
+        }
+
+    def __repr__(self) -> str:
+        return f"CampaignEventRow({self.to_dict()!r})"
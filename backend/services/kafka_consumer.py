@@ -16,6 +16,9 @@ from kafka.errors import KafkaError
 import signal
 import sys
 
+from .event_blocks import CAMPAIGN_EVENTS_TOPIC, CampaignEventBlock, decode_event_value
+from .embedded_broker import EmbeddedConsumer, is_embedded_bootstrap
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -78,9 +81,18 @@ class MessageProcessor:
 class CampaignMetricsProcessor(MessageProcessor):
     """Processor for Facebook campaign metrics"""
     
-    def __init__(self, clickhouse_client=None):
+    def __init__(self, clickhouse_client=None, feature_engine=None):
+        """
+        Args:
+            clickhouse_client: Optional ClickHouse client for storage
+            feature_engine: Optional incremental feature engine (e.g.
+                ml.feature_engineering.streaming_features.IncrementalLagFeatureEngine);
+                when set, each record is enriched with its lag, moving-average
+                and trend features, fed the message's reported metrics
+        """
         super().__init__("CampaignMetricsProcessor")
         self.clickhouse_client = clickhouse_client
+        self.feature_engine = feature_engine
         
     async def process_message(self, message: Dict[str, Any], topic: str, partition: int, offset: int) -> bool:
         """Process campaign metrics message"""
@@ -109,6 +121,14 @@ class CampaignMetricsProcessor(MessageProcessor):
                 raw_message=message
             )
             
+            # Incremental per-campaign features for real-time scoring, from
+            # the reported counts: rates derived and missing metrics NaN as
+            # in the batch features, not the reported rates and 0 defaults
+            if self.feature_engine and processed_metrics:
+                processed_metrics['lag_features'] = self.feature_engine.update_reported(
+                    (user_id, campaign_id), metrics
+                )
+            
             # Store to ClickHouse if client is available
             if self.clickhouse_client and processed_metrics:
                 await self._store_to_clickhouse(processed_metrics)
@@ -145,28 +165,28 @@ class CampaignMetricsProcessor(MessageProcessor):
                 'ad_id': raw_message.get('ad_id', ''),
                 'timestamp': parsed_timestamp,
                 
-                # Performance metrics
-                'impressions': int(metrics.get('impressions', 0)),
-                'clicks': int(metrics.get('clicks', 0)),
-                'spend': float(metrics.get('spend', 0.0)),
-                'reach': int(metrics.get('reach', 0)),
-                'frequency': float(metrics.get('frequency', 0.0)),
+                # Performance metrics (null when Facebook reports none)
+                'impressions': int(metrics.get('impressions') or 0),
+                'clicks': int(metrics.get('clicks') or 0),
+                'spend': float(metrics.get('spend') or 0.0),
+                'reach': int(metrics.get('reach') or 0),
+                'frequency': float(metrics.get('frequency') or 0.0),
                 
                 # Calculated metrics
-                'ctr': float(metrics.get('ctr', 0.0)),
-                'cpc': float(metrics.get('cpc', 0.0)),
-                'cpm': float(metrics.get('cpm', 0.0)),
-                'cpp': float(metrics.get('cpp', 0.0)),
+                'ctr': float(metrics.get('ctr') or 0.0),
+                'cpc': float(metrics.get('cpc') or 0.0),
+                'cpm': float(metrics.get('cpm') or 0.0),
+                'cpp': float(metrics.get('cpp') or 0.0),
                 
                 # Conversion metrics
-                'conversions': int(metrics.get('conversions', 0)),
-                'conversion_rate': float(metrics.get('conversion_rate', 0.0)),
-                'cost_per_conversion': float(metrics.get('cost_per_conversion', 0.0)),
-                'roas': float(metrics.get('return_on_ad_spend', 0.0)),
+                'conversions': int(metrics.get('conversions') or 0),
+                'conversion_rate': float(metrics.get('conversion_rate') or 0.0),
+                'cost_per_conversion': float(metrics.get('cost_per_conversion') or 0.0),
+                'roas': float(metrics.get('return_on_ad_spend') or 0.0),
                 
                 # Quality metrics
-                'quality_score': float(metrics.get('quality_score', 0.0)),
-                'relevance_score': float(metrics.get('relevance_score', 0.0)),
+                'quality_score': float(metrics.get('quality_score') or 0.0),
+                'relevance_score': float(metrics.get('relevance_score') or 0.0),
                 
                 # Additional metadata
                 'device_platform': metrics.get('device_platform', 'unknown'),
@@ -379,7 +399,12 @@ class KafkaDataConsumer:
     def _create_consumer(self) -> KafkaConsumer:
         """Create and configure Kafka consumer"""
         try:
-            consumer = KafkaConsumer(
+            # embedded:// servers run against the in-process log broker
+            consumer_class = (
+                EmbeddedConsumer if is_embedded_bootstrap(self.config.bootstrap_servers) else KafkaConsumer
+            )
+            
+            consumer = consumer_class(
                 *self.config.topics,
                 bootstrap_servers=self.config.bootstrap_servers,
                 group_id=self.config.group_id,
@@ -393,7 +418,7 @@ class KafkaDataConsumer:
                 fetch_max_wait_ms=self.config.fetch_max_wait_ms,
                 
                 # Serializers
-                value_deserializer=lambda m: json.loads(m.decode('utf-8')) if m else None,
+                value_deserializer=decode_event_value,
                 key_deserializer=lambda m: m.decode('utf-8') if m else None,
                 
                 # Consumer settings
@@ -547,6 +572,12 @@ class KafkaDataConsumer:
                 logger.warning(f"No processor found for topic {topic}")
                 return
             
+            # Columnar event blocks carry many records; hand each row view to
+            # the processor without materializing it as a dict
+            if isinstance(value, CampaignEventBlock):
+                await self._process_event_block(value, processor, topic, partition, offset)
+                return
+            
             # Process message asynchronously
             success = await processor.process_message(value, topic, partition, offset)
             
@@ -561,6 +592,26 @@ class KafkaDataConsumer:
             logger.error(f"Error processing message: {e}")
             self.messages_failed += 1
     
+    async def _process_event_block(self,
+                                   block: CampaignEventBlock,
+                                   processor: MessageProcessor,
+                                   topic: str,
+                                   partition: int,
+                                   offset: int):
+        """Process every row of a columnar event block"""
+        failed = 0
+        for row in block:
+            if await processor.process_message(row, topic, partition, offset):
+                self.messages_processed += 1
+            else:
+                self.messages_failed += 1
+                failed += 1
+        
+        if failed:
+            logger.warning(f"Failed to process {failed}/{len(block)} rows of block from {topic}:{partition}:{offset}")
+        else:
+            logger.debug(f"Successfully processed {len(block)} rows of block from {topic}:{partition}:{offset}")
+    
     def _find_processor(self, topic: str) -> Optional[MessageProcessor]:
         """Find appropriate processor for topic"""
         # Exact match first
@@ -614,8 +665,8 @@ class KafkaDataConsumer:
                 'messages_processed': self.messages_processed,
                 'messages_failed': self.messages_failed,
                 'success_rate': (
-                    self.messages_processed / self.messages_consumed
-                    if self.messages_consumed > 0 else 0
+                    self.messages_processed / (self.messages_processed + self.messages_failed)
+                    if (self.messages_processed + self.messages_failed) > 0 else 0
                 ),
                 'messages_per_second': messages_per_second,
                 'uptime_seconds': uptime,
@@ -652,13 +703,15 @@ class KafkaDataConsumer:
 
 # Factory function for creating configured consumer
 def create_ai_buyer_consumer(bootstrap_servers: List[str] = None,
-                           group_id: str = "ai-buyer-consumer-group") -> KafkaDataConsumer:
+                           group_id: str = "ai-buyer-consumer-group",
+                           feature_engine=None) -> KafkaDataConsumer:
     """
     Create configured Kafka consumer for AI-Buyer application
     
     Args:
         bootstrap_servers: List of Kafka bootstrap servers
         group_id: Consumer group ID
+        feature_engine: Optional incremental feature engine for campaign metrics
         
     Returns:
         Configured KafkaDataConsumer instance
@@ -668,7 +721,7 @@ def create_ai_buyer_consumer(bootstrap_servers: List[str] = None,
     
     # Configure topics
     topics = [
-        'facebook-campaign-events',
+        CAMPAIGN_EVENTS_TOPIC,
         'ml-predictions', 
         'user-actions',
         'anomaly-detection',
@@ -688,7 +741,7 @@ def create_ai_buyer_consumer(bootstrap_servers: List[str] = None,
     consumer = KafkaDataConsumer(config)
     
     # Add processors
-    consumer.add_processor('facebook-campaign-events', CampaignMetricsProcessor())
+    consumer.add_processor(CAMPAIGN_EVENTS_TOPIC, CampaignMetricsProcessor(feature_engine=feature_engine))
     consumer.add_processor('ml-predictions', MLPredictionProcessor())
     consumer.add_processor('anomaly-detection', AnomalyDetectionProcessor())
     
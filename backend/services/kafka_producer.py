@@ -5,17 +5,36 @@ Handles real-time streaming of Facebook advertising data to Kafka topics
 
 import json
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime
 import logging
 from dataclasses import dataclass, asdict
 import uuid
 from kafka import KafkaProducer
 from kafka.errors import KafkaError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
+from .event_blocks import CAMPAIGN_EVENTS_TOPIC, encode_campaign_block, event_timestamp
+from .compression_profile import CompressionProfile, DEFAULT_PRODUCER_SETTINGS
+from .embedded_broker import EmbeddedProducer, is_embedded_bootstrap
+from .spill_log import SpillLog
+
 logger = logging.getLogger(__name__)
 
+# Sentinel placed on the async send queue to ask the sender to drain and exit
+_SENDER_STOP = object()
+
+# Delivery result for records written to the spill log instead of Kafka
+DELIVERY_SPILLED = 'spilled'
+
+# How often the sender loop offers the spill log a replay slot, and the
+# window used to report the replay rate
+_REPLAY_INTERVAL = 0.1
+_REPLAY_RATE_WINDOW = 10.0
+
 @dataclass
 class FacebookCampaignEvent:
     """Data class for Facebook campaign events"""
@@ -74,48 +93,113 @@ class FacebookDataStreamer:
                  bootstrap_servers: List[str] = None,
                  max_batch_size: int = 100,
                  max_batch_timeout: float = 1.0,
-                 compression_type: str = 'gzip'):
+                 compression_type: str = 'gzip',
+                 use_event_blocks: bool = False,
+                 block_max_rows: int = 1000,
+                 compression_profile: Optional[str] = None,
+                 spill_dir: Optional[str] = None,
+                 spill_high_water_ratio: float = 0.8,
+                 spill_replay_rate: float = 500.0,
+                 spill_retry_backoff: float = 5.0):
         
         self.bootstrap_servers = bootstrap_servers or ['localhost:9092']
         self.max_batch_size = max_batch_size
         self.max_batch_timeout = max_batch_timeout
         
+        # Columnar event blocks: one Kafka record per user and batch instead
+        # of one JSON record per campaign metric (see services.event_blocks)
+        self.use_event_blocks = use_event_blocks
+        self.block_max_rows = block_max_rows
+        
         # Topic configuration
         self.topics = {
-            'campaign_events': 'facebook-campaign-events',
+            'campaign_events': CAMPAIGN_EVENTS_TOPIC,
             'ml_predictions': 'ml-predictions',
             'user_actions': 'user-actions',
             'anomalies': 'anomaly-detection',
             'optimization_results': 'optimization-results'
         }
         
+        # Codec and batching settings, optionally picked from a measured
+        # profile written by benchmarks.compression_codecs
+        self.producer_settings = dict(DEFAULT_PRODUCER_SETTINGS, compression_type=compression_type)
+        if compression_profile:
+            self.producer_settings = self._load_compression_profile(compression_profile)
+        
         # Initialize Kafka producer
-        self.producer = self._create_producer(compression_type)
+        self.buffer_memory = 33554432  # 32MB buffer
+        self.producer = self._create_producer(**self.producer_settings)
+        
+        # Spillover: once unacknowledged bytes in the producer cross the
+        # high-water mark (or the producer rejects records), campaign records
+        # go to an append-only local log and are replayed in order at
+        # spill_replay_rate records/s when the broker keeps up again
+        self.spill_log = SpillLog(spill_dir, serializer=self._json_serializer) if spill_dir else None
+        self.spill_high_water_bytes = int(self.buffer_memory * spill_high_water_ratio)
+        self.spill_replay_rate = spill_replay_rate
+        self.spill_retry_backoff = spill_retry_backoff
+        self._inflight_bytes = 0
+        self._inflight_lock = threading.Lock()
+        self._last_send_error = 0.0
+        self._replay_lock = threading.Lock()
+        self._replay_allowance = 0.0
+        self._replay_refilled_at = time.time()
+        self._replay_history = deque()
         
         # Batching configuration
         self.batch_buffer = []
         self.last_batch_time = time.time()
+        self._buffer_lock = threading.Lock()
+        
+        # Async sending pipeline (started with start_async_sender)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._send_queue: Optional[asyncio.Queue] = None
+        self._sender_task: Optional[asyncio.Task] = None
+        self._sender_executor: Optional[ThreadPoolExecutor] = None
+        self._pending_deliveries: Set[asyncio.Future] = set()
+        self._accepting = False
         
         # Performance metrics
         self.messages_sent = 0
         self.messages_failed = 0
         self.total_bytes_sent = 0
+        self.metrics_in_blocks = 0
+        self.records_spilled = 0
+        self.records_replayed = 0
         
         logger.info(f"FacebookDataStreamer initialized with servers: {self.bootstrap_servers}")
     
-    def _create_producer(self, compression_type: str) -> KafkaProducer:
+    def _load_compression_profile(self, path: str) -> Dict[str, Any]:
+        """Pick producer codec and batching settings from a measured profile"""
+        try:
+            settings = CompressionProfile.load(path).producer_settings()
+            logger.info(f"Producer settings from compression profile {path}: {settings}")
+            return settings
+        except Exception as e:
+            logger.error(f"Failed to load compression profile {path}, using defaults: {e}")
+            return dict(self.producer_settings)
+    
+    def _create_producer(self,
+                         compression_type: str,
+                         batch_size: int = 16384,
+                         linger_ms: int = 10) -> KafkaProducer:
         """Create and configure Kafka producer"""
         try:
-            producer = KafkaProducer(
+            # embedded:// servers run against the in-process log broker
+            producer_class = (
+                EmbeddedProducer if is_embedded_bootstrap(self.bootstrap_servers) else KafkaProducer
+            )
+            
+            producer = producer_class(
                 bootstrap_servers=self.bootstrap_servers,
-                value_serializer=lambda v: json.dumps(v, default=self._json_serializer).encode('utf-8'),
+                value_serializer=self._serialize_value,
                 key_serializer=lambda k: k.encode('utf-8') if k else None,
                 compression_type=compression_type,
                 
                 # Performance optimizations
-                batch_size=16384,  # 16KB batch size
-                linger_ms=10,      # Wait up to 10ms to batch messages
-                buffer_memory=33554432,  # 32MB buffer
+                batch_size=batch_size,  # 16KB batch size by default
+                linger_ms=linger_ms,    # Wait up to 10ms to batch messages by default
+                buffer_memory=self.buffer_memory,
                 
                 # Reliability settings
                 acks='all',        # Wait for all replicas to acknowledge
@@ -137,6 +221,12 @@ class FacebookDataStreamer:
             logger.error(f"Failed to create Kafka producer: {e}")
             raise
     
+    def _serialize_value(self, value: Any) -> bytes:
+        """Serialize message values; pre-encoded event blocks pass through"""
+        if isinstance(value, bytes):
+            return value
+        return json.dumps(value, default=self._json_serializer).encode('utf-8')
+    
     def _json_serializer(self, obj):
         """Custom JSON serializer for datetime and other objects"""
         if isinstance(obj, datetime):
@@ -159,33 +249,51 @@ class FacebookDataStreamer:
             Success status
         """
         try:
-            # Create campaign event
-            event = FacebookCampaignEvent(
-                user_id=user_id,
-                campaign_id=campaign_data.get('campaign_id', ''),
-                ad_set_id=campaign_data.get('ad_set_id', ''),
-                ad_id=campaign_data.get('ad_id', ''),
-                timestamp=datetime.now().isoformat(),
-                event_type='metrics_update',
-                metrics=campaign_data.get('metrics', {}),
-                metadata=campaign_data.get('metadata', {})
+            partition_key, value = self._build_campaign_event(
+                user_id, campaign_data, partition_key
             )
             
-            # Use campaign_id as partition key if not provided
-            if partition_key is None:
-                partition_key = f"{user_id}:{event.campaign_id}"
-            
             # Send to Kafka
             return self._send_message(
                 topic=self.topics['campaign_events'],
                 key=partition_key,
-                value=asdict(event)
+                value=value
             )
             
         except Exception as e:
             logger.error(f"Failed to stream campaign metrics: {e}")
             return False
     
+    def _build_campaign_event(self,
+                              user_id: str,
+                              campaign_data: Dict[str, Any],
+                              partition_key: Optional[str] = None,
+                              timestamp: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the partition key and payload for a campaign metrics event
+        
+        The event time is timestamp if given, else the campaign data's own
+        timestamp or the current time.
+        """
+        if timestamp is None:
+            timestamp = event_timestamp({'campaign_data': campaign_data, 'timestamp': time.time()})
+        event = FacebookCampaignEvent(
+            user_id=user_id,
+            campaign_id=campaign_data.get('campaign_id', ''),
+            ad_set_id=campaign_data.get('ad_set_id', ''),
+            ad_id=campaign_data.get('ad_id', ''),
+            timestamp=timestamp,
+            event_type='metrics_update',
+            metrics=campaign_data.get('metrics', {}),
+            metadata=campaign_data.get('metadata', {})
+        )
+        
+        # Use campaign_id as partition key if not provided
+        if partition_key is None:
+            partition_key = f"{user_id}:{event.campaign_id}"
+        
+        return partition_key, asdict(event)
+    
     def stream_ml_prediction(self,
                            user_id: str,
                            model_name: str,
@@ -367,7 +475,7 @@ class FacebookDataStreamer:
             # record_metadata = future.get(timeout=10)
             
             self.messages_sent += 1
-            self.total_bytes_sent += len(json.dumps(value).encode('utf-8'))
+            self.total_bytes_sent += self._payload_size(value)
             
             return True
             
@@ -403,46 +511,540 @@ class FacebookDataStreamer:
             force_send: Force immediate send regardless of batch size
             
         Returns:
-            Dictionary with success/failure counts
+            Dictionary with success/failure/spilled counts
         """
-        results = {'success': 0, 'failed': 0}
+        results = {'success': 0, 'failed': 0, 'spilled': 0}
         
-        # Add to batch buffer
-        for campaign_data in campaigns_data:
-            self.batch_buffer.append({
-                'user_id': user_id,
-                'campaign_data': campaign_data,
-                'timestamp': time.time()
-            })
-        
-        # Check if we should send the batch
-        should_send = (
-            force_send or
-            len(self.batch_buffer) >= self.max_batch_size or
-            (time.time() - self.last_batch_time) >= self.max_batch_timeout
-        )
+        with self._buffer_lock:
+            # Add to batch buffer
+            for campaign_data in campaigns_data:
+                self.batch_buffer.append({
+                    'user_id': user_id,
+                    'campaign_data': campaign_data,
+                    'timestamp': time.time()
+                })
+            
+            # Check if we should send the batch
+            should_send = (
+                force_send or
+                len(self.batch_buffer) >= self.max_batch_size or
+                (time.time() - self.last_batch_time) >= self.max_batch_timeout
+            )
+            
+            if should_send:
+                # Process batch, keeping records the producer did not accept
+                # so that the next flush retries them instead of dropping them
+                counts, rejected = self._dispatch_batch(self.batch_buffer)
+                for key in results:
+                    results[key] += counts[key]
+                self.messages_failed += len(rejected)
+                
+                self.batch_buffer[:] = rejected
+                self.last_batch_time = time.time()
         
         if should_send:
-            # Process batch
-            for item in self.batch_buffer:
-                success = self.stream_campaign_metrics(
-                    item['user_id'],
-                    item['campaign_data']
-                )
-                if success:
-                    results['success'] += 1
-                else:
-                    results['failed'] += 1
-            
-            # Clear buffer and update timestamp
-            self.batch_buffer.clear()
-            self.last_batch_time = time.time()
-            
             # Flush producer to ensure messages are sent
             self.producer.flush()
+            self._replay_spilled()
         
         return results
     
+    async def start_async_sender(self, queue_size: int = 10000):
+        """
+        Start the async sending pipeline
+        
+        Records are put on an asyncio queue and moved into ``batch_buffer`` by a
+        background sender task. The buffer is handed to the Kafka producer on a
+        dedicated thread once it reaches ``max_batch_size`` or when the flush
+        timer sees it older than ``max_batch_timeout``, so the event loop never
+        blocks on the broker.
+        
+        Args:
+            queue_size: Maximum number of records waiting in the queue before
+                enqueueing applies backpressure
+        """
+        if self._sender_task and not self._sender_task.done():
+            return
+        
+        self._loop = asyncio.get_running_loop()
+        self._send_queue = asyncio.Queue(maxsize=queue_size)
+        self._sender_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='kafka-sender'
+        )
+        self._accepting = True
+        self._sender_task = asyncio.create_task(self._async_sender_loop())
+        self._sender_task.add_done_callback(self._on_sender_done)
+        
+        logger.info("Async Kafka sender started")
+    
+    def _on_sender_done(self, task: asyncio.Task):
+        """Stop accepting records once the sender task has ended, however it ended"""
+        self._accepting = False
+        if task.cancelled():
+            logger.warning("Async Kafka sender cancelled")
+        elif task.exception() is not None:
+            logger.error(f"Async Kafka sender stopped: {task.exception()}")
+    
+    async def enqueue_campaign_metrics(self,
+                                       user_id: str,
+                                       campaign_data: Dict[str, Any]) -> asyncio.Future:
+        """
+        Queue campaign metrics on the async sending pipeline
+        
+        Args:
+            user_id: User identifier
+            campaign_data: Campaign metrics and metadata
+            
+        Returns:
+            Future resolving to the delivery status reported by the broker
+        """
+        if not self._accepting:
+            raise RuntimeError("Async sender is not running")
+        
+        delivery = self._loop.create_future()
+        self._pending_deliveries.add(delivery)
+        delivery.add_done_callback(self._pending_deliveries.discard)
+        
+        await self._send_queue.put({
+            'user_id': user_id,
+            'campaign_data': campaign_data,
+            'timestamp': time.time(),
+            'delivery': delivery
+        })
+        return delivery
+    
+    async def async_batch_send_metrics(self,
+                                       user_id: str,
+                                       campaigns_data: List[Dict[str, Any]],
+                                       delivery_timeout: Optional[float] = None) -> Dict[str, int]:
+        """
+        Send multiple campaign metrics without blocking the event loop
+        
+        Args:
+            user_id: User identifier
+            campaigns_data: List of campaign data dictionaries
+            delivery_timeout: Seconds to wait for delivery reports (None waits
+                until every record is acknowledged or failed)
+            
+        Returns:
+            Dictionary with success/failure counts, records written to the
+            spill log and records still pending
+        """
+        deliveries = [
+            await self.enqueue_campaign_metrics(user_id, campaign_data)
+            for campaign_data in campaigns_data
+        ]
+        
+        results = {'success': 0, 'failed': 0, 'spilled': 0, 'pending': 0}
+        if not deliveries:
+            return results
+        
+        done, pending = await asyncio.wait(deliveries, timeout=delivery_timeout)
+        for delivery in done:
+            result = delivery.result()
+            if result == DELIVERY_SPILLED:
+                results['spilled'] += 1
+            elif result:
+                results['success'] += 1
+            else:
+                results['failed'] += 1
+        results['pending'] = len(pending)
+        
+        return results
+    
+    async def _async_sender_loop(self):
+        """Move queued records into the batch buffer and flush on size or age"""
+        while True:
+            # The flush timer: wake up no later than when the oldest buffered
+            # batch reaches max_batch_timeout
+            timeout = self.max_batch_timeout
+            if self.batch_buffer:
+                timeout = max(0.0, self.max_batch_timeout - (time.time() - self.last_batch_time))
+            if self.spill_log and self.spill_log.pending_records:
+                timeout = min(timeout, _REPLAY_INTERVAL)
+            
+            try:
+                item = await asyncio.wait_for(self._send_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            
+            if item is _SENDER_STOP:
+                try:
+                    await self._flush_async_buffer()
+                except Exception as e:
+                    logger.error(f"Final async flush failed, {len(self.batch_buffer)} records left for close(): {e}")
+                break
+            
+            if item is not None:
+                with self._buffer_lock:
+                    if not self.batch_buffer:
+                        self.last_batch_time = time.time()
+                    self.batch_buffer.append(item)
+            
+            # One failed flush or replay must not end the sender while
+            # enqueue_campaign_metrics keeps accepting records
+            try:
+                if self.batch_buffer and (
+                    len(self.batch_buffer) >= self.max_batch_size or
+                    (time.time() - self.last_batch_time) >= self.max_batch_timeout
+                ):
+                    await self._flush_async_buffer()
+                
+                if (self.spill_log and self.spill_log.pending_records and
+                        time.time() - self._replay_refilled_at >= _REPLAY_INTERVAL):
+                    await self._loop.run_in_executor(self._sender_executor, self._replay_spilled)
+            except Exception as e:
+                logger.error(f"Async Kafka sender error, retrying in {self.max_batch_timeout}s: {e}")
+                await asyncio.sleep(self.max_batch_timeout)
+    
+    async def _flush_async_buffer(self):
+        """Hand the batch buffer to the producer on the sender thread"""
+        with self._buffer_lock:
+            batch = list(self.batch_buffer)
+            self.batch_buffer.clear()
+            self.last_batch_time = time.time()
+        
+        if not batch:
+            return
+        
+        try:
+            _, rejected = await self._loop.run_in_executor(
+                self._sender_executor, self._dispatch_batch, batch
+            )
+        except Exception:
+            # Keep the batch for the next flush rather than losing its records
+            with self._buffer_lock:
+                self.batch_buffer[:0] = batch
+            raise
+        
+        if rejected:
+            # Put rejected records back in front so they keep their order
+            with self._buffer_lock:
+                self.batch_buffer[:0] = rejected
+            logger.warning(f"{len(rejected)} records kept in batch buffer for retry")
+    
+    def _build_outgoing(self, batch: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, Any, List[Dict[str, Any]]]],
+                                                                  List[Dict[str, Any]]]:
+        """
+        Turn buffered records into Kafka sends
+        
+        Returns:
+            (key, value, records) per Kafka record to send, and the records
+            whose campaign data could not be encoded at all
+        """
+        outgoing = []
+        invalid = []
+        
+        if self.use_event_blocks:
+            groups = self._group_event_blocks(batch)
+        else:
+            groups = [(None, [item]) for item in batch]
+        
+        for user_id, items in groups:
+            if user_id is not None:
+                try:
+                    outgoing.append((user_id, encode_campaign_block(user_id, items), items))
+                    continue
+                except Exception as e:
+                    logger.error(f"Failed to encode event block, sending records individually: {e}")
+            
+            for item in items:
+                try:
+                    key, value = self._build_campaign_event(item['user_id'], item['campaign_data'],
+                                                            timestamp=event_timestamp(item))
+                except Exception as e:
+                    logger.error(f"Failed to build campaign event: {e}")
+                    invalid.append(item)
+                    continue
+                outgoing.append((key, value, [item]))
+        
+        return outgoing, invalid
+    
+    def _group_event_blocks(self, batch: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Group buffered records by user, in arrival order, capped at block_max_rows"""
+        groups: Dict[str, List[List[Dict[str, Any]]]] = {}
+        for item in batch:
+            chunks = groups.setdefault(item['user_id'], [[]])
+            if len(chunks[-1]) >= self.block_max_rows:
+                chunks.append([])
+            chunks[-1].append(item)
+        
+        return [
+            (user_id, chunk)
+            for user_id, chunks in groups.items()
+            for chunk in chunks
+        ]
+    
+    def _dispatch_batch(self, batch: List[Dict[str, Any]]) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        """
+        Send a batch of buffered records, spilling them when the producer is
+        backed up; runs on the dedicated sender thread for the async path
+        
+        Returns:
+            Record counts by outcome, and the records the producer did not
+            accept and that could not be spilled
+        """
+        counts = {'success': 0, 'failed': 0, 'spilled': 0}
+        rejected = []
+        outgoing, invalid = self._build_outgoing(batch)
+        
+        # Malformed input can never be sent, report it instead of retrying
+        counts['failed'] += len(invalid)
+        self.messages_failed += len(invalid)
+        for item in invalid:
+            self._resolve_delivery(item.get('delivery'), False)
+        
+        # Once a batch starts spilling, the rest of it follows so the spill
+        # log keeps arrival order
+        spilling = False
+        for key, value, items in outgoing:
+            if not spilling and self.spill_log and self._inflight_bytes >= self.spill_high_water_bytes:
+                logger.warning(f"Producer buffer above high-water mark "
+                               f"({self._inflight_bytes} bytes unacknowledged), spilling records")
+                spilling = True
+            
+            if not spilling:
+                try:
+                    self._send_records(key, value, items)
+                    counts['success'] += len(items)
+                    continue
+                except Exception as e:
+                    logger.error(f"Producer rejected campaign event: {e}")
+                    self._last_send_error = time.time()
+                    spilling = self.spill_log is not None
+            
+            if spilling and self._spill(items):
+                counts['spilled'] += len(items)
+            else:
+                counts['failed'] += len(items)
+                rejected.extend(items)
+        
+        return counts, rejected
+    
+    def _send_records(self, key: str, value: Any, items: List[Dict[str, Any]]):
+        """
+        Hand one Kafka record built from buffered items to the producer
+        
+        Raises whatever the producer raises when it cannot accept the record.
+        """
+        size = self._payload_size(value)
+        with self._inflight_lock:
+            self._inflight_bytes += size
+        
+        try:
+            future = self.producer.send(
+                topic=self.topics['campaign_events'],
+                key=key,
+                value=value
+            )
+        except Exception:
+            self._release_inflight(size)
+            raise
+        
+        self.messages_sent += 1
+        self.total_bytes_sent += size
+        if isinstance(value, bytes):
+            self.metrics_in_blocks += len(items)
+        
+        future.add_callback(self._on_records_sent, items, size)
+        future.add_errback(self._on_records_failed, items, size)
+    
+    def _payload_size(self, value: Any) -> int:
+        """Size in bytes of a message value before Kafka compression"""
+        if isinstance(value, bytes):
+            return len(value)
+        return len(json.dumps(value, default=self._json_serializer).encode('utf-8'))
+    
+    def _release_inflight(self, size: int):
+        with self._inflight_lock:
+            self._inflight_bytes -= size
+    
+    def _on_records_sent(self, items: List[Dict[str, Any]], size: int, record_metadata):
+        """Delivery report callback for buffered campaign records"""
+        self._release_inflight(size)
+        self._on_send_success(record_metadata)
+        for item in items:
+            self._resolve_delivery(item.get('delivery'), True)
+    
+    def _on_records_failed(self, items: List[Dict[str, Any]], size: int, exception):
+        """Delivery error callback; records that expired in the producer are spilled"""
+        self._release_inflight(size)
+        self._last_send_error = time.time()
+        
+        if self.spill_log and self._spill(items):
+            logger.warning(f"Spilled {len(items)} records after delivery failure: {exception}")
+            return
+        
+        self._on_send_error(exception)
+        for item in items:
+            self._resolve_delivery(item.get('delivery'), False)
+    
+    def _spill(self, items: List[Dict[str, Any]]) -> bool:
+        """Append buffered records to the spill log"""
+        try:
+            self.spill_log.append([
+                {key: value for key, value in item.items() if key != 'delivery'}
+                for item in items
+            ])
+        except Exception as e:
+            logger.error(f"Failed to write {len(items)} records to spill log: {e}")
+            return False
+        
+        self.records_spilled += len(items)
+        for item in items:
+            self._resolve_delivery(item.get('delivery'), DELIVERY_SPILLED)
+        return True
+    
+    def _replay_spilled(self) -> int:
+        """
+        Send a throttled slice of the spill log back to Kafka, oldest first
+        
+        Replay runs only while unacknowledged bytes are below half the
+        high-water mark and no send has failed for spill_retry_backoff
+        seconds, and never faster than spill_replay_rate records/s, so live
+        traffic keeps the producer's headroom. Records are committed in the
+        spill log once the producer accepts them; records that later fail
+        delivery are spilled again at the tail.
+        
+        Returns:
+            Number of records handed to the producer
+        """
+        if not self.spill_log or not self.spill_log.pending_records:
+            return 0
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        
+        try:
+            now = time.time()
+            self._replay_allowance = min(
+                self.spill_replay_rate,
+                self._replay_allowance + (now - self._replay_refilled_at) * self.spill_replay_rate
+            )
+            self._replay_refilled_at = now
+            
+            if (now - self._last_send_error < self.spill_retry_backoff or
+                    self._inflight_bytes >= self.spill_high_water_bytes // 2):
+                return 0
+            
+            limit = int(self._replay_allowance)
+            entries = self.spill_log.read(limit) if limit > 0 else []
+            
+            replayed = 0
+            position = None
+            for run in self._replay_runs(entries):
+                outgoing, invalid = self._build_outgoing([record for record, _ in run])
+                self.messages_failed += len(invalid)
+                try:
+                    for key, value, items in outgoing:
+                        self._send_records(key, value, items)
+                except Exception as e:
+                    logger.warning(f"Spill replay paused, producer rejected records: {e}")
+                    self._last_send_error = time.time()
+                    break
+                replayed += len(run)
+                position = run[-1][1]
+            
+            if position is not None:
+                self.spill_log.commit(position)
+            
+            self._replay_allowance -= replayed
+            self.records_replayed += replayed
+            if replayed:
+                self._replay_history.append((now, replayed))
+            return replayed
+        
+        finally:
+            self._replay_lock.release()
+    
+    def _replay_runs(self, entries: List[Tuple[Dict[str, Any], Any]]) -> List[List[Tuple[Dict[str, Any], Any]]]:
+        """
+        Split spilled entries into send units that keep log order: consecutive
+        records of one user form one event block, otherwise one record each
+        """
+        runs: List[List[Tuple[Dict[str, Any], Any]]] = []
+        for entry in entries:
+            if (self.use_event_blocks and runs and
+                    runs[-1][0][0]['user_id'] == entry[0]['user_id'] and
+                    len(runs[-1]) < self.block_max_rows):
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+        return runs
+    
+    def get_spill_metrics(self) -> Dict[str, Any]:
+        """Spill log size, replay rate and age of the oldest pending record"""
+        if not self.spill_log:
+            return {'enabled': False}
+        
+        now = time.time()
+        while self._replay_history and now - self._replay_history[0][0] > _REPLAY_RATE_WINDOW:
+            self._replay_history.popleft()
+        
+        oldest = self.spill_log.oldest_timestamp
+        return {
+            'enabled': True,
+            'pending_records': self.spill_log.pending_records,
+            'pending_bytes': self.spill_log.pending_bytes,
+            'oldest_pending_age_seconds': now - oldest if oldest is not None else 0.0,
+            'replay_rate': sum(count for _, count in self._replay_history) / _REPLAY_RATE_WINDOW,
+            'replay_rate_limit': self.spill_replay_rate,
+            'records_spilled': self.records_spilled,
+            'records_replayed': self.records_replayed,
+            'inflight_bytes': self._inflight_bytes,
+            'high_water_bytes': self.spill_high_water_bytes,
+        }
+    
+    def _resolve_delivery(self, delivery: Optional[asyncio.Future], result: Any):
+        """Resolve a delivery future from any thread"""
+        if delivery is None or self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._set_delivery_result, delivery, result)
+    
+    @staticmethod
+    def _set_delivery_result(delivery: asyncio.Future, result: Any):
+        if not delivery.done():
+            delivery.set_result(result)
+    
+    async def close_async(self, timeout: float = 30.0):
+        """
+        Drain the async sending pipeline and close the producer
+        
+        Args:
+            timeout: Seconds to wait for outstanding delivery reports
+        """
+        self._accepting = False
+        if self._sender_task and not self._sender_task.done():
+            await self._send_queue.put(_SENDER_STOP)
+            await self._sender_task
+        
+        # Records a stopped sender never took off the queue go to close() too
+        while self._send_queue and not self._send_queue.empty():
+            item = self._send_queue.get_nowait()
+            if item is not _SENDER_STOP:
+                with self._buffer_lock:
+                    self.batch_buffer.append(item)
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._sender_executor, self.producer.flush, timeout)
+        
+        # Buffered records are only sent by close(), so their deliveries are
+        # not waited for here
+        buffered = {item.get('delivery') for item in self.batch_buffer}
+        outstanding = [delivery for delivery in self._pending_deliveries if delivery not in buffered]
+        if outstanding:
+            await asyncio.wait(outstanding, timeout=timeout)
+        
+        if self._sender_executor:
+            self._sender_executor.shutdown(wait=False)
+            self._sender_executor = None
+        
+        # close() retries whatever is still buffered before closing the producer
+        await loop.run_in_executor(None, self.close)
+        
+        # Records close() could not send either will not be delivered
+        for item in self.batch_buffer:
+            self._resolve_delivery(item.get('delivery'), False)
+    
     async def async_stream_campaign_metrics(self,
                                           user_id: str,
                                           campaign_data: Dict[str, Any]) -> bool:
@@ -476,6 +1078,12 @@ class FacebookDataStreamer:
                 if (self.messages_sent + self.messages_failed) > 0 else 0
             ),
             'current_batch_size': len(self.batch_buffer),
+            'async_queue_size': self._send_queue.qsize() if self._send_queue else 0,
+            'pending_deliveries': len(self._pending_deliveries),
+            'event_blocks_enabled': self.use_event_blocks,
+            'metrics_in_blocks': self.metrics_in_blocks,
+            'producer_settings': self.producer_settings,
+            'spill': self.get_spill_metrics(),
             'topics_configured': list(self.topics.keys())
         }
     
@@ -515,8 +1123,13 @@ class FacebookDataStreamer:
             if self.batch_buffer:
                 self.batch_send_metrics('', [], force_send=True)
             
+            if self.batch_buffer:
+                logger.warning(f"Closing producer with {len(self.batch_buffer)} unsent records in batch buffer")
+            
             # Close producer
             self.producer.close(timeout=30)
+            if self.spill_log:
+                self.spill_log.close()
             logger.info("Kafka producer closed successfully")
             
         except Exception as e:
@@ -532,8 +1145,18 @@ def get_kafka_streamer() -> FacebookDataStreamer:
         _kafka_streamer = FacebookDataStreamer()
     return _kafka_streamer
 
-def initialize_kafka_streamer(bootstrap_servers: List[str] = None) -> FacebookDataStreamer:
+def initialize_kafka_streamer(bootstrap_servers: List[str] = None,
+                              compression_profile: Optional[str] = None,
+                              use_event_blocks: bool = False,
+                              spill_dir: Optional[str] = None,
+                              spill_replay_rate: float = 500.0) -> FacebookDataStreamer:
     """Initialize and configure Kafka streamer"""
     global _kafka_streamer
-    _kafka_streamer = FacebookDataStreamer(bootstrap_servers=bootstrap_servers)
+    _kafka_streamer = FacebookDataStreamer(
+        bootstrap_servers=bootstrap_servers,
+        compression_profile=compression_profile,
+        use_event_blocks=use_event_blocks,
+        spill_dir=spill_dir,
+        spill_replay_rate=spill_replay_rate
+    )
     return _kafka_streamer
\ No newline at end of file
@@ -13,6 +13,9 @@ import aioredis
 import clickhouse_connect
 from dataclasses import dataclass
 
+from .event_blocks import CAMPAIGN_EVENTS_TOPIC, CampaignEventBlock, decode_event_value
+from .embedded_broker import EmbeddedAIOConsumer, EmbeddedAIOProducer, is_embedded_bootstrap
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -214,17 +217,22 @@ class KafkaRulesProcessor:
     async def initialize(self):
         """Ініціалізувати всі компоненти"""
         try:
-            # Kafka consumer
-            self.consumer = aiokafka.AIOKafkaConsumer(
-                'facebook_metrics_stream',
+            # embedded:// servers run against the in-process log broker
+            embedded = is_embedded_bootstrap(self.config['kafka_servers'])
+            consumer_class = EmbeddedAIOConsumer if embedded else aiokafka.AIOKafkaConsumer
+            producer_class = EmbeddedAIOProducer if embedded else aiokafka.AIOKafkaProducer
+            
+            # Kafka consumer: події та блоки подій від FacebookDataStreamer
+            self.consumer = consumer_class(
+                CAMPAIGN_EVENTS_TOPIC,
                 bootstrap_servers=self.config['kafka_servers'],
                 group_id='rules_processor_group',
-                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                value_deserializer=decode_event_value,
                 auto_offset_reset='latest'
             )
             
             # Kafka producer для логів
-            self.producer = aiokafka.AIOKafkaProducer(
+            self.producer = producer_class(
                 bootstrap_servers=self.config['kafka_servers'],
                 value_serializer=lambda v: json.dumps(v, default=str).encode('utf-8')
             )
@@ -262,7 +270,12 @@ class KafkaRulesProcessor:
         
         try:
             async for message in self.consumer:
-                await self._process_message(message.value)
+                if isinstance(message.value, CampaignEventBlock):
+                    # Колонковий блок: обробити кожен рядок без створення dict
+                    for row in message.value:
+                        await self._process_message(row)
+                else:
+                    await self._process_message(message.value)
                 
         except Exception as e:
             logger.error(f"Processing error: {e}")
@@ -307,21 +320,33 @@ class KafkaRulesProcessor:
     def _parse_campaign_metrics(self, data: Dict[str, Any]) -> Optional[CampaignMetrics]:
         """Парсити метрики кампанії з повідомлення"""
         try:
+            # Інші події кампанії (створення, пауза) не несуть метрик
+            if data.get('event_type', 'metrics_update') != 'metrics_update':
+                return None
+            
+            # FacebookCampaignEvent вкладає метрики в 'metrics'; рядки блоків
+            # і пласкі записи мають їх на верхньому рівні
+            nested = data.get('metrics') or {}
+            
+            def value(name: str, default: Any) -> Any:
+                found = data.get(name)
+                return nested.get(name, default) if found is None else found
+            
             return CampaignMetrics(
                 campaign_id=data['campaign_id'],
-                client_id=data['client_id'],
+                client_id=data['client_id'] if 'client_id' in data else data['user_id'],
                 timestamp=datetime.fromisoformat(data['timestamp']),
-                impressions=data.get('impressions', 0),
-                clicks=data.get('clicks', 0),
-                spend=data.get('spend', 0.0),
-                conversions=data.get('conversions', 0),
-                ctr=data.get('ctr', 0.0),
-                cpc=data.get('cpc', 0.0),
-                cpm=data.get('cpm', 0.0),
-                frequency=data.get('frequency', 0.0),
-                reach=data.get('reach', 0),
-                budget=data.get('budget', 0.0),
-                data_points=data.get('data_points', 0)
+                impressions=value('impressions', 0),
+                clicks=value('clicks', 0),
+                spend=value('spend', 0.0),
+                conversions=value('conversions', 0),
+                ctr=value('ctr', 0.0),
+                cpc=value('cpc', 0.0),
+                cpm=value('cpm', 0.0),
+                frequency=value('frequency', 0.0),
+                reach=value('reach', 0),
+                budget=value('budget', 0.0),
+                data_points=value('data_points', 0)
             )
         except Exception as e:
             logger.error(f"Failed to parse metrics: {e}")
@@ -0,0 +1,290 @@
+"""
+Spill Log for AI-Buyer Kafka Producers
+Append-only local log that keeps buffered records while the broker is unavailable
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, List, Any, Optional, Tuple, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Frame layout: payload length (u32) | crc32 of payload (u32) | record timestamp (f64) | payload
+_FRAME = struct.Struct('<IId')
+
+SEGMENT_SUFFIX = '.spill'
+CURSOR_FILE = 'cursor.json'
+
+# Position just after a record: (segment number, byte offset, record index)
+SpillPosition = Tuple[int, int, int]
+
+
+class SpillLog:
+    """
+    Append-only, segmented spill log with a committed read cursor
+
+    Records are appended as JSON frames to numbered segment files. Readers
+    take records from the committed cursor without moving it and call
+    ``commit`` once the records are safely handed off, so a crash during
+    replay re-sends rather than loses records. Fully consumed segments are
+    deleted on commit. Safe to use from several threads.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 segment_bytes: int = 16 * 1024 * 1024,
+                 serializer: Optional[Callable[[Any], Any]] = None,
+                 fsync: bool = False):
+        """
+        Args:
+            directory: Directory holding segment files and the cursor
+            segment_bytes: Size after which a new segment is started
+            serializer: json.dumps ``default`` hook for non-JSON values
+            fsync: Whether to fsync after every append
+        """
+        self.directory = os.path.abspath(directory)
+        self.segment_bytes = segment_bytes
+        self.serializer = serializer
+        self.fsync = fsync
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segment_sizes: Dict[int, int] = {}
+        self._writer = None
+        self._write_segment = 0
+        self._next_index = 0
+        self._cursor: SpillPosition = (0, 0, 0)
+        self._oldest_timestamp: Optional[float] = None
+
+        self._recover()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:020d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        """Rebuild sizes, record count and cursor from the files on disk"""
+        segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                data = json.load(f)
+            self._cursor = (data['segment'], data['offset'], data['index'])
+        elif segments:
+            self._cursor = (segments[0], 0, 0)
+
+        cursor_segment, cursor_offset, index = self._cursor
+        for segment in segments:
+            if segment < cursor_segment:
+                # Consumed before the last shutdown but not yet removed
+                os.remove(self._segment_path(segment))
+                continue
+
+            path = self._segment_path(segment)
+            offset = cursor_offset if segment == cursor_segment else 0
+            valid_end, records = self._scan(path, offset)
+            index += records
+
+            if valid_end < os.path.getsize(path):
+                logger.warning(f"Truncating torn spill frame at {path}:{valid_end}")
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_end)
+            self._segment_sizes[segment] = valid_end
+
+        self._next_index = index
+        if self._segment_sizes:
+            self._write_segment = max(self._segment_sizes)
+        else:
+            self._write_segment = cursor_segment
+            self._segment_sizes[cursor_segment] = 0
+            self._cursor = (cursor_segment, 0, index)
+
+        self._writer = open(self._segment_path(self._write_segment), 'ab')
+        self._oldest_timestamp = self._peek_timestamp()
+
+        if self.pending_records:
+            logger.info(f"Spill log {self.directory} has {self.pending_records} pending records")
+
+    @staticmethod
+    def _scan(path: str, offset: int) -> Tuple[int, int]:
+        """Return the end of the last intact frame and the number of frames from offset"""
+        records = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_FRAME.size)
+                if len(header) < _FRAME.size:
+                    break
+                length, checksum, _ = _FRAME.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                offset += _FRAME.size + length
+                records += 1
+        return offset, records
+
+    @property
+    def pending_records(self) -> int:
+        """Records appended but not yet committed"""
+        return self._next_index - self._cursor[2]
+
+    @property
+    def pending_bytes(self) -> int:
+        """Bytes on disk from the cursor to the end of the log"""
+        with self._lock:
+            segment, offset, _ = self._cursor
+            return sum(
+                size for number, size in self._segment_sizes.items() if number >= segment
+            ) - offset
+
+    @property
+    def oldest_timestamp(self) -> Optional[float]:
+        """Timestamp of the oldest pending record"""
+        return self._oldest_timestamp
+
+    def append(self, records: List[Dict[str, Any]], timestamps: Optional[List[float]] = None) -> int:
+        """
+        Append records to the end of the log
+
+        Args:
+            records: JSON-serializable records
+            timestamps: Per-record timestamps used for age reporting
+                (defaults to each record's 'timestamp' key)
+
+        Returns:
+            Number of bytes written
+        """
+        frames = bytearray()
+        for i, record in enumerate(records):
+            payload = json.dumps(record, default=self.serializer).encode('utf-8')
+            timestamp = timestamps[i] if timestamps else float(record.get('timestamp', 0.0))
+            frames += _FRAME.pack(len(payload), zlib.crc32(payload), timestamp)
+            frames += payload
+
+        with self._lock:
+            if self._segment_sizes[self._write_segment] >= self.segment_bytes:
+                self._roll()
+
+            self._writer.write(frames)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+
+            self._segment_sizes[self._write_segment] += len(frames)
+            was_empty = self.pending_records == 0
+            self._next_index += len(records)
+            if was_empty and records:
+                self._oldest_timestamp = self._peek_timestamp()
+
+        return len(frames)
+
+    def _roll(self):
+        """Start a new segment; caller holds the lock"""
+        self._writer.close()
+        previous = self._write_segment
+        self._write_segment += 1
+        self._segment_sizes[self._write_segment] = 0
+        self._writer = open(self._segment_path(self._write_segment), 'ab')
+
+        segment, offset, index = self._cursor
+        if segment == previous and offset >= self._segment_sizes[previous]:
+            # Fully drained: the cursor moves to the new segment with the writer
+            self._cursor = (self._write_segment, 0, index)
+            self._write_cursor()
+            del self._segment_sizes[previous]
+            try:
+                os.remove(self._segment_path(previous))
+            except FileNotFoundError:
+                pass
+
+    def read(self, max_records: int) -> List[Tuple[Dict[str, Any], SpillPosition]]:
+        """
+        Read pending records from the committed cursor, oldest first
+
+        Returns:
+            (record, position after the record) pairs; pass the position of
+            the last handled record to ``commit``
+        """
+        entries: List[Tuple[Dict[str, Any], SpillPosition]] = []
+
+        with self._lock:
+            segment, offset, index = self._cursor
+            end_index = self._next_index
+            segments = sorted(number for number in self._segment_sizes if number >= segment)
+            sizes = dict(self._segment_sizes)
+
+        for number in segments:
+            if len(entries) >= max_records or index >= end_index:
+                break
+            if number != segment:
+                offset = 0
+
+            with open(self._segment_path(number), 'rb') as f:
+                f.seek(offset)
+                while len(entries) < max_records and offset < sizes[number]:
+                    length, _, _ = _FRAME.unpack(f.read(_FRAME.size))
+                    record = json.loads(f.read(length))
+                    offset += _FRAME.size + length
+                    index += 1
+                    entries.append((record, (number, offset, index)))
+
+        return entries
+
+    def commit(self, position: SpillPosition):
+        """Move the cursor past handed-off records and delete consumed segments"""
+        with self._lock:
+            if position[2] <= self._cursor[2]:
+                return
+
+            segment, offset, index = position
+            if offset >= self._segment_sizes.get(segment, 0) and segment < self._write_segment:
+                # The cursor sits at the end of a closed segment: move to the next one
+                segment, offset = segment + 1, 0
+            self._cursor = (segment, offset, index)
+            self._write_cursor()
+
+            for number in [n for n in self._segment_sizes if n < segment]:
+                del self._segment_sizes[number]
+                try:
+                    os.remove(self._segment_path(number))
+                except FileNotFoundError:
+                    pass
+
+            self._oldest_timestamp = self._peek_timestamp()
+
+    def _write_cursor(self):
+        """Atomically persist the cursor; caller holds the lock"""
+        segment, offset, index = self._cursor
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': segment, 'offset': offset, 'index': index}, f)
+        os.replace(tmp_path, path)
+
+    def _peek_timestamp(self) -> Optional[float]:
+        """Timestamp of the record at the cursor"""
+        if self._next_index <= self._cursor[2]:
+            return None
+        segment, offset, _ = self._cursor
+        while offset >= self._segment_sizes.get(segment, 0) and segment < self._write_segment:
+            # The cursor sits at the end of a closed segment
+            segment, offset = segment + 1, 0
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            _, _, timestamp = _FRAME.unpack(f.read(_FRAME.size))
+        return timestamp
+
+    def close(self):
+        with self._lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
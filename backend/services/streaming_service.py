@@ -10,7 +10,7 @@ from datetime import datetime
 import time
 from dataclasses import dataclass, asdict
 
-from .kafka_producer import FacebookDataStreamer, get_kafka_streamer
+from .kafka_producer import FacebookDataStreamer, initialize_kafka_streamer
 from .kafka_consumer import create_ai_buyer_consumer, KafkaDataConsumer
 
 logger = logging.getLogger(__name__)
@@ -25,6 +25,11 @@ class StreamingConfig:
     health_check_interval: int = 30
     auto_restart_on_failure: bool = True
     max_restart_attempts: int = 3
+    delivery_timeout: float = 30.0
+    use_event_blocks: bool = False
+    compression_profile: Optional[str] = None
+    spill_dir: Optional[str] = None
+    spill_replay_rate: float = 500.0
 
 class StreamingMetrics:
     """Metrics collection for streaming service"""
@@ -106,10 +111,17 @@ class FacebookDataStreamingService:
             
             # Initialize producer
             if self.config.enable_producer:
-                self.producer = get_kafka_streamer()
+                self.producer = initialize_kafka_streamer(
+                    bootstrap_servers=self.config.kafka_bootstrap_servers,
+                    compression_profile=self.config.compression_profile,
+                    use_event_blocks=self.config.use_event_blocks,
+                    spill_dir=self.config.spill_dir,
+                    spill_replay_rate=self.config.spill_replay_rate
+                )
                 if not self.producer:
                     logger.error("Failed to initialize Kafka producer")
                     return False
+                await self.producer.start_async_sender()
                 logger.info("Kafka producer initialized")
             
             # Initialize consumer
@@ -159,9 +171,9 @@ class FacebookDataStreamingService:
                 self.consumer.stop()
                 logger.info("Kafka consumer stopped")
             
-            # Close producer
+            # Drain async sender and close producer
             if self.producer:
-                self.producer.close()
+                await self.producer.close_async()
                 logger.info("Kafka producer closed")
             
             logger.info("Facebook data streaming service stopped")
@@ -189,11 +201,11 @@ class FacebookDataStreamingService:
         try:
             logger.debug(f"Streaming {len(campaigns_data)} campaigns for user {user_id}")
             
-            # Use batch sending for efficiency
-            results = self.producer.batch_send_metrics(
+            # Queue on the async sender and await delivery reports
+            results = await self.producer.async_batch_send_metrics(
                 user_id=user_id,
                 campaigns_data=campaigns_data,
-                force_send=True
+                delivery_timeout=self.config.delivery_timeout
             )
             
             # Update metrics
@@ -401,7 +413,7 @@ class FacebookDataStreamingService:
             if self.consumer:
                 self.consumer.stop()
             if self.producer:
-                self.producer.close()
+                await self.producer.close_async()
             
             # Wait a bit before restart
             await asyncio.sleep(5)
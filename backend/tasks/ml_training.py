@@ -3,19 +3,17 @@ ML Training Tasks for AI-Buyer Celery
 Handles model training, validation, and deployment
 """
 
+import asyncio
 import logging
+import os
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from celery import Task
-import mlflow
-import numpy as np
-import pandas as pd
 
 from backend.tasks import celery_app, TaskConfig
-from backend.ml.models.ctr_predictor import CTRPredictor
-from backend.ml.models.budget_optimizer import BudgetOptimizer
-from backend.ml.training.trainer import ModelTrainer
+from backend.ml.models.model_registry import SHARED_CTR_MODEL, dedicated_ctr_tenants
+from backend.ml.training.trainer import MLTrainingPipeline
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +25,7 @@ class MLTrainingTask(Task, TaskConfig):
         logger.error(f"ML Training task {task_id} failed: {exc}")
         # Could send alerts, update model status, etc.
 
-@celery_app.task(base=MLTrainingTask, bind=True)
+@celery_app.task(base=MLTrainingTask, bind=True, name='ml_training.train_ctr_model')
 def train_ctr_model(self, user_id: str, training_config: Dict[str, Any]) -> Dict[str, Any]:
     """
     Train CTR prediction model for a specific user
@@ -45,17 +43,17 @@ def train_ctr_model(self, user_id: str, training_config: Dict[str, Any]) -> Dict
         logger.info(f"Starting CTR model training for user {user_id}")
         start_time = time.time()
         
-        # Initialize trainer
-        trainer = ModelTrainer()
-        predictor = CTRPredictor()
+        if training_config.get('incremental'):
+            return _retrain_ctr_incremental(self, user_id, training_config, start_time)
+        
+        pipeline = _training_pipeline(user_id, training_config)
         
         # Update state
         self.update_state(state='PROGRESS', meta={'status': 'Loading training data'})
         
-        # Load training data (this would query ClickHouse)
-        training_data = trainer.load_training_data(
-            user_id=user_id,
-            model_type='ctr_prediction',
+        # Load training data; the shared model's rows span every tenant
+        training_data = pipeline.load_training_data(
+            _clickhouse_client(),
             lookback_days=training_config.get('lookback_days', 30)
         )
         
@@ -66,70 +64,23 @@ def train_ctr_model(self, user_id: str, training_config: Dict[str, Any]) -> Dict
         
         # Update state
         self.update_state(state='PROGRESS', meta={
-            'status': 'Preparing features',
+            'status': 'Training model',
             'training_samples': len(training_data)
         })
         
-        # Prepare features
-        X, y = predictor.prepare_features(training_data)
-        
-        # Update state
-        self.update_state(state='PROGRESS', meta={
-            'status': 'Training model',
-            'features_count': X.shape[1] if hasattr(X, 'shape') else len(X)
-        })
-        
-        # Train model with MLflow tracking
-        with mlflow.start_run(run_name=f"ctr_training_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"):
-            # Log parameters
-            mlflow.log_params(training_config)
-            mlflow.log_param("user_id", user_id)
-            mlflow.log_param("training_samples", len(training_data))
-            
-            # Train model
-            model, metrics = predictor.train(X, y)
-            
-            # Log metrics
-            for metric_name, metric_value in metrics.items():
-                mlflow.log_metric(metric_name, metric_value)
-            
-            # Update state
-            self.update_state(state='PROGRESS', meta={
-                'status': 'Validating model',
-                'training_metrics': metrics
-            })
-            
-            # Validate model
-            validation_metrics = trainer.validate_model(model, X, y)
-            
-            # Log validation metrics
-            for metric_name, metric_value in validation_metrics.items():
-                mlflow.log_metric(f"val_{metric_name}", metric_value)
-            
-            # Save model
-            model_version = predictor.save_model(model, user_id)
-            mlflow.log_param("model_version", model_version)
-            
-            # Register model in MLflow
-            model_name = f"ctr_predictor_{user_id}"
-            mlflow.register_model(
-                model_uri=f"runs:/{mlflow.active_run().info.run_id}/model",
-                name=model_name
-            )
+        # Train, validate and register the model (tracked in MLflow)
+        result = asyncio.run(pipeline.run_full_training_pipeline(training_data, models_to_train=['ctr_prediction']))
+        ctr_result = result.get('training_results', {}).get('ctr_prediction', result)
         
         training_time = time.time() - start_time
         
         # Prepare results
         results = {
-            'status': 'completed',
+            **ctr_result,
             'user_id': user_id,
-            'model_version': model_version,
             'training_time_seconds': training_time,
-            'training_samples': len(training_data),
-            'features_count': X.shape[1] if hasattr(X, 'shape') else len(X),
-            'training_metrics': metrics,
-            'validation_metrics': validation_metrics,
-            'mlflow_run_id': mlflow.active_run().info.run_id if mlflow.active_run() else None,
+            'raw_samples': len(training_data),
+            'mlflow_run_id': result.get('pipeline_run_id'),
             'created_at': datetime.now().isoformat()
         }
         
@@ -145,7 +96,56 @@ def train_ctr_model(self, user_id: str, training_config: Dict[str, Any]) -> Dict
             'created_at': datetime.now().isoformat()
         }
 
-@celery_app.task(base=MLTrainingTask, bind=True)
+def _clickhouse_client():
+    """ClickHouse client from the CLICKHOUSE_* environment"""
+    import clickhouse_connect
+    return clickhouse_connect.get_client(
+        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
+        port=int(os.getenv('CLICKHOUSE_PORT', '8123')),
+        username=os.getenv('CLICKHOUSE_USER', 'default'),
+        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
+        database=os.getenv('CLICKHOUSE_DATABASE', 'ai_buyer')
+    )
+
+def _training_pipeline(user_id: str, training_config: Dict[str, Any]) -> MLTrainingPipeline:
+    """Training pipeline of a user, with the options training_config sets"""
+    pipeline = MLTrainingPipeline(user_id)
+    for option in ('validation_split', 'max_training_samples', 'new_window_days', 'replay_ratio', 'full_retrain_days'):
+        if option in training_config:
+            setattr(pipeline, option, training_config[option])
+    return pipeline
+
+def _retrain_ctr_incremental(task, user_id: str, training_config: Dict[str, Any],
+                             start_time: float) -> Dict[str, Any]:
+    """
+    Fine-tune the user's CTR model on the newest data, or retrain it from scratch when due
+    
+    See MLTrainingPipeline.retrain_ctr_model; training_config may set
+    new_window_days, replay_ratio, full_retrain_days and force_full. The
+    shared model (user_id SHARED_CTR_MODEL) is trained on every tenant's rows.
+    """
+    pipeline = _training_pipeline(user_id, training_config)
+    
+    task.update_state(state='PROGRESS', meta={'status': 'Loading training data'})
+    raw_data = pipeline.load_training_data(_clickhouse_client(),
+                                           lookback_days=training_config.get('lookback_days', 30))
+    if raw_data.empty:
+        raise ValueError(f"No training data found for user {user_id}")
+    
+    task.update_state(state='PROGRESS', meta={'status': 'Retraining model', 'training_samples': len(raw_data)})
+    result = asyncio.run(pipeline.retrain_ctr_model(raw_data, force_full=training_config.get('force_full', False)))
+    
+    training_time = time.time() - start_time
+    logger.info(f"CTR model {result.get('mode')} retraining for user {user_id} finished "
+                f"with status {result.get('status')} in {training_time:.2f} seconds")
+    return {
+        **result,
+        'user_id': user_id,
+        'training_time_seconds': training_time,
+        'created_at': datetime.now().isoformat()
+    }
+
+@celery_app.task(base=MLTrainingTask, bind=True, name='ml_training.train_budget_optimizer')
 def train_budget_optimizer(self, user_id: str, training_config: Dict[str, Any]) -> Dict[str, Any]:
     """
     Train budget optimization model for a specific user
@@ -163,17 +163,14 @@ def train_budget_optimizer(self, user_id: str, training_config: Dict[str, Any])
         logger.info(f"Starting budget optimizer training for user {user_id}")
         start_time = time.time()
         
-        # Initialize trainer and optimizer
-        trainer = ModelTrainer()
-        optimizer = BudgetOptimizer()
+        pipeline = _training_pipeline(user_id, training_config)
         
         # Update state
         self.update_state(state='PROGRESS', meta={'status': 'Loading historical data'})
         
         # Load historical campaign data
-        historical_data = trainer.load_training_data(
-            user_id=user_id,
-            model_type='budget_optimization',
+        historical_data = pipeline.load_training_data(
+            _clickhouse_client(),
             lookback_days=training_config.get('lookback_days', 90)
         )
         
@@ -184,84 +181,24 @@ def train_budget_optimizer(self, user_id: str, training_config: Dict[str, Any])
         
         # Update state
         self.update_state(state='PROGRESS', meta={
-            'status': 'Preparing time series data',
+            'status': 'Training Prophet models',
             'historical_records': len(historical_data)
         })
         
-        # Prepare time series data
-        time_series_data = optimizer.prepare_time_series_data(historical_data)
-        
-        # Update state
-        self.update_state(state='PROGRESS', meta={
-            'status': 'Training Prophet models',
-            'campaigns_count': len(time_series_data)
-        })
-        
-        # Train models with MLflow tracking
-        with mlflow.start_run(run_name=f"budget_optimizer_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"):
-            # Log parameters
-            mlflow.log_params(training_config)
-            mlflow.log_param("user_id", user_id)
-            mlflow.log_param("historical_records", len(historical_data))
-            mlflow.log_param("campaigns_count", len(time_series_data))
-            
-            # Train models for each campaign
-            trained_models = {}
-            training_metrics = {}
-            
-            for campaign_id, campaign_data in time_series_data.items():
-                logger.info(f"Training model for campaign {campaign_id}")
-                
-                # Train Prophet model
-                model, metrics = optimizer.train_campaign_model(campaign_data)
-                trained_models[campaign_id] = model
-                training_metrics[campaign_id] = metrics
-                
-                # Log campaign-specific metrics
-                for metric_name, metric_value in metrics.items():
-                    mlflow.log_metric(f"{campaign_id}_{metric_name}", metric_value)
-            
-            # Calculate overall metrics
-            overall_metrics = {
-                'avg_mape': np.mean([m.get('mape', 0) for m in training_metrics.values()]),
-                'avg_rmse': np.mean([m.get('rmse', 0) for m in training_metrics.values()]),
-                'models_trained': len(trained_models)
-            }
-            
-            # Log overall metrics
-            for metric_name, metric_value in overall_metrics.items():
-                mlflow.log_metric(metric_name, metric_value)
-            
-            # Update state
-            self.update_state(state='PROGRESS', meta={
-                'status': 'Saving models',
-                'models_trained': len(trained_models)
-            })
-            
-            # Save models
-            model_version = optimizer.save_models(trained_models, user_id)
-            mlflow.log_param("model_version", model_version)
-            
-            # Register model in MLflow
-            model_name = f"budget_optimizer_{user_id}"
-            mlflow.register_model(
-                model_uri=f"runs:/{mlflow.active_run().info.run_id}/model",
-                name=model_name
-            )
+        # One Prophet model per campaign (tracked in MLflow)
+        result = asyncio.run(pipeline.run_full_training_pipeline(historical_data,
+                                                                 models_to_train=['budget_optimization']))
+        budget_result = result.get('training_results', {}).get('budget_optimization', result)
         
         training_time = time.time() - start_time
         
         # Prepare results
         results = {
-            'status': 'completed',
+            **budget_result,
             'user_id': user_id,
-            'model_version': model_version,
             'training_time_seconds': training_time,
             'historical_records': len(historical_data),
-            'models_trained': len(trained_models),
-            'training_metrics': overall_metrics,
-            'campaign_metrics': training_metrics,
-            'mlflow_run_id': mlflow.active_run().info.run_id if mlflow.active_run() else None,
+            'mlflow_run_id': result.get('pipeline_run_id'),
             'created_at': datetime.now().isoformat()
         }
         
@@ -277,11 +214,15 @@ def train_budget_optimizer(self, user_id: str, training_config: Dict[str, Any])
             'created_at': datetime.now().isoformat()
         }
 
-@celery_app.task(base=MLTrainingTask, bind=True)
+@celery_app.task(base=MLTrainingTask, bind=True, name='ml_training.retrain_ctr_model')
 def retrain_ctr_model(self) -> Dict[str, Any]:
     """
     Periodic task to retrain CTR models for all users
     
+    Tenants are served by the shared model, trained once on the rows of
+    all tenants; only tenants opted in to a dedicated model (see
+    dedicated_ctr_tenants) are trained on their own.
+    
     Returns:
         Retraining summary
     """
@@ -289,8 +230,7 @@ def retrain_ctr_model(self) -> Dict[str, Any]:
         logger.info("Starting periodic CTR model retraining")
         start_time = time.time()
         
-        # Get list of active users (this would query the database)
-        active_users = ['user1', 'user2', 'user3']  # Placeholder
+        active_users = [SHARED_CTR_MODEL] + sorted(dedicated_ctr_tenants())
         
         results = {}
         for user_id in active_users:
@@ -298,10 +238,15 @@ def retrain_ctr_model(self) -> Dict[str, Any]:
                 # Check if model needs retraining
                 if _should_retrain_model(user_id, 'ctr_prediction'):
                     # Trigger training task
+                    # Fine-tuned on the newest day, retrained from scratch
+                    # weekly or on drift
                     training_config = {
                         'lookback_days': 30,
                         'validation_split': 0.2,
-                        'early_stopping': True
+                        'early_stopping': True,
+                        'incremental': True,
+                        'new_window_days': 1,
+                        'full_retrain_days': 7
                     }
                     
                     # Run training
@@ -342,7 +287,7 @@ def retrain_ctr_model(self) -> Dict[str, Any]:
             'created_at': datetime.now().isoformat()
         }
 
-@celery_app.task(base=MLTrainingTask, bind=True)
+@celery_app.task(base=MLTrainingTask, bind=True, name='ml_training.retrain_budget_optimizer')
 def retrain_budget_optimizer(self) -> Dict[str, Any]:
     """
     Periodic task to retrain budget optimization models for all users
@@ -407,7 +352,7 @@ def retrain_budget_optimizer(self) -> Dict[str, Any]:
             'created_at': datetime.now().isoformat()
         }
 
-@celery_app.task(base=MLTrainingTask, bind=True)
+@celery_app.task(base=MLTrainingTask, bind=True, name='ml_training.validate_model_performance')
 def validate_model_performance(self, user_id: str, model_type: str) -> Dict[str, Any]:
     """
     Validate model performance against recent data
@@ -423,13 +368,11 @@ def validate_model_performance(self, user_id: str, model_type: str) -> Dict[str,
         logger.info(f"Starting model validation for user {user_id}, model {model_type}")
         start_time = time.time()
         
-        # Initialize trainer
-        trainer = ModelTrainer()
+        pipeline = MLTrainingPipeline(user_id)
         
         # Load recent data for validation
-        validation_data = trainer.load_training_data(
-            user_id=user_id,
-            model_type=model_type,
+        validation_data = pipeline.load_training_data(
+            _clickhouse_client(),
             lookback_days=7  # Last week's data
         )
         
@@ -443,28 +386,23 @@ def validate_model_performance(self, user_id: str, model_type: str) -> Dict[str,
         
         # Load current model
         if model_type == 'ctr_prediction':
-            predictor = CTRPredictor()
-            model = predictor.load_model(user_id)
+            pipeline.ctr_predictor.load_model()
             
-            # Prepare features
-            X, y = predictor.prepare_features(validation_data)
-            
-            # Make predictions
-            predictions = predictor.predict(X, model)
+            # Score the model on the prepared rows
+            evaluation = asyncio.run(pipeline.evaluate_models(validation_data))
+            if 'error' in evaluation:
+                raise RuntimeError(evaluation['error'])
+            validation_metrics = evaluation['evaluation_results'].get('ctr_prediction', {})
             
         elif model_type == 'budget_optimization':
-            optimizer = BudgetOptimizer()
-            models = optimizer.load_models(user_id)
+            pipeline.budget_optimizer.load_models()
             
             # This would implement validation for budget optimizer
-            predictions = None  # Placeholder
+            validation_metrics = {}  # Placeholder
             
         else:
             raise ValueError(f"Unknown model type: {model_type}")
         
-        # Calculate validation metrics
-        validation_metrics = trainer.calculate_validation_metrics(y, predictions)
-        
         validation_time = time.time() - start_time
         
         # Prepare results
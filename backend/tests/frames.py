@@ -0,0 +1,120 @@
+"""
+Synthetic Ad Frames for AI-Buyer tests and benchmarks
+Generates raw Facebook ad insight frames with the columns the feature pipeline uses,
+and CTR model input frames
+"""
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.models.ctr_preprocessor import DENSE_FEATURES, SPARSE_FEATURES
+
+PLACEMENTS = ['feed', 'stories', 'reels', 'right_column', 'marketplace']
+DEVICES = ['mobile', 'desktop', 'android', 'ios', 'windows']
+AD_FORMATS = ['single_image', 'video', 'carousel', 'collection']
+COUNTRIES = ['US', 'GB', 'CA', 'UA', 'PL', 'DE', 'BR']
+CITIES = ['New York', 'London', 'Kyiv', 'Toronto', 'Lviv', 'Berlin', 'Springfield']
+AD_TEXTS = [
+    'Shop the best deals today',
+    'Amazing new arrivals, love them or return them',
+    'Learn more about our perfect plan',
+    'Sign up now and get 20% off',
+    'Worst prices? Not here. Try us',
+    'Download the app for excellent rewards',
+    'Our great summer collection is here',
+    'Limited offer',
+]
+INTERESTS = ['sports', 'sports,fitness', 'travel,food,music', 'tech', 'fashion,beauty', None]
+CARDINALITY = {
+    'campaign_id': 2000, 'ad_set_id': 5000, 'ad_id': 20000, 'placement': 5, 'device_type': 5,
+    'age_group': 6, 'gender': 3, 'interest_category': 40, 'geographic_location': 200,
+    'time_period': 4, 'day_of_week': 7, 'hour_of_day': 24, 'creative_format': 4,
+    'campaign_objective': 8, 'optimization_goal': 10,
+}
+
+
+def generate_ad_frame(rows: int,
+                      campaigns: int = 100,
+                      seed: int = 42,
+                      start: str = '2023-12-01') -> pd.DataFrame:
+    """
+    Generate hourly campaign insight rows, spread evenly over campaigns
+
+    Args:
+        rows: Number of rows
+        campaigns: Number of distinct campaigns
+        seed: Random seed
+        start: Timestamp of the first hour
+
+    Returns:
+        Raw insights frame, ordered by timestamp
+    """
+    rng = np.random.default_rng(seed)
+
+    campaign = np.arange(rows) % campaigns
+    hour_index = np.arange(rows) // campaigns
+    timestamp = pd.Timestamp(start) + pd.to_timedelta(hour_index, unit='h')
+
+    impressions = rng.integers(100, 20000, rows)
+    clicks = rng.binomial(impressions, rng.uniform(0.002, 0.05, rows))
+    spend = np.round(impressions * rng.uniform(0.002, 0.02, rows), 2)
+    conversions = rng.binomial(clicks, 0.05)
+
+    campaign_start = pd.Timestamp(start) - pd.to_timedelta(rng.integers(0, 60, campaigns), unit='D')
+    creative_created = campaign_start + pd.to_timedelta(rng.integers(0, 10, campaigns), unit='D')
+
+    return pd.DataFrame({
+        'campaign_id': np.char.add('2385', np.char.zfill(campaign.astype(str), 8)),
+        'timestamp': timestamp,
+        'impressions': impressions,
+        'clicks': clicks,
+        'spend': spend,
+        'conversions': conversions,
+        'likes': rng.binomial(clicks, 0.3),
+        'shares': rng.binomial(clicks, 0.05),
+        'comments': rng.binomial(clicks, 0.08),
+        'frequency': np.round(rng.uniform(1.0, 6.0, rows), 2),
+        'reach': (impressions / rng.uniform(1.0, 3.0, rows)).astype(np.int64),
+        'audience_size': rng.integers(50000, 5000000, campaigns)[campaign],
+        'budget': rng.choice([50.0, 100.0, 250.0, 500.0, 1000.0], campaigns)[campaign],
+        'bid_amount': np.round(rng.uniform(0.2, 3.0, campaigns), 2)[campaign],
+        'audience_id': (campaign % max(1, campaigns // 10)).astype(str),
+        'placement': np.array(PLACEMENTS)[rng.integers(0, len(PLACEMENTS), rows)],
+        'age_min': rng.choice([18, 25, 35, 45], campaigns)[campaign],
+        'age_max': rng.choice([34, 44, 54, 65], campaigns)[campaign],
+        'interests': np.array(INTERESTS, dtype=object)[rng.integers(0, len(INTERESTS), campaigns)][campaign],
+        'country': np.array(COUNTRIES)[rng.integers(0, len(COUNTRIES), campaigns)][campaign],
+        'city': np.array(CITIES)[rng.integers(0, len(CITIES), campaigns)][campaign],
+        'device_platform': np.array(DEVICES)[rng.integers(0, len(DEVICES), rows)],
+        'ad_format': np.array(AD_FORMATS)[rng.integers(0, len(AD_FORMATS), campaigns)][campaign],
+        'ad_text': np.array(AD_TEXTS, dtype=object)[rng.integers(0, len(AD_TEXTS), campaigns)][campaign],
+        'campaign_start_date': campaign_start[campaign],
+        'creative_created_date': creative_created[campaign],
+    })
+
+
+def performance_frame(rows: int, campaigns: int, missing: float) -> pd.DataFrame:
+    """Performance features over shuffled rows, with some missing group keys and metrics"""
+    rng = np.random.default_rng(3)
+    engineer = FacebookAdFeatureEngineer()
+    df = generate_ad_frame(rows, campaigns=campaigns)
+    df['audience_id'] = rng.choice([f'aud_{i}' for i in range(50)], rows)
+    df = engineer.engineer_temporal_features(engineer.engineer_performance_features(df))
+    df['spend'] = df['spend'].mask(rng.random(rows) < missing)
+    df['ctr'] = df['ctr'].mask(rng.random(rows) < missing)
+    df['audience_id'] = df['audience_id'].mask(rng.random(rows) < missing / 10)
+    df['placement'] = df['placement'].mask(rng.random(rows) < missing / 10)
+    return df.sample(frac=1.0, random_state=0).reset_index(drop=True)
+
+
+def make_ctr_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """CTR model inputs: string ids and labels, integer calendar fields, float metrics"""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for feat in SPARSE_FEATURES:
+        values = rng.integers(0, CARDINALITY[feat], rows)
+        columns[feat] = values if feat in ('day_of_week', 'hour_of_day') else np.char.add(f'{feat}_', values.astype(str)).astype(object)
+    for feat in DENSE_FEATURES:
+        columns[feat] = rng.lognormal(0, 1, rows)
+    return pd.DataFrame(columns)
@@ -0,0 +1,130 @@
+"""
+Previous implementations of feature engineering stages
+The parity tests and benchmarks check the current stages against these
+"""
+
+import re
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.creative_text import NEGATIVE_WORDS, POSITIVE_WORDS
+
+
+def chained_stages(engineer, df: pd.DataFrame) -> pd.DataFrame:
+    """The stages of create_feature_pipeline chained, each returning a new full frame"""
+    df = engineer.engineer_temporal_features(df)
+    df = engineer.engineer_performance_features(df)
+    df = engineer.engineer_competitive_features(df)
+    df = engineer.engineer_audience_features(df)
+    df = engineer.engineer_creative_features(df)
+    df = engineer.engineer_lag_features(df)
+    df = engineer.engineer_interaction_features(df)
+    return df
+
+
+def legacy_holiday_features(engineer, timestamps: pd.Series) -> dict:
+    """The previous row-wise holiday features, from the engineer's scalar helpers"""
+    return {
+        'is_holiday': timestamps.dt.date.apply(lambda x: x in engineer.holidays).astype(int).to_numpy(),
+        'days_to_holiday': timestamps.apply(engineer._days_to_next_holiday).to_numpy(),
+        'days_from_holiday': timestamps.apply(engineer._days_from_last_holiday).to_numpy(),
+    }
+
+
+def legacy_competitive_features(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous implementation of engineer_competitive_features"""
+    df = df.copy()
+
+    if 'audience_id' in df.columns:
+        audience_competition = df.groupby(['audience_id', 'hour'], observed=True).agg({
+            'impressions': 'sum',
+            'spend': 'sum',
+            'campaign_id': 'nunique'
+        }).rename(columns={
+            'impressions': 'impressions_audience_total',
+            'spend': 'spend_audience_total',
+            'campaign_id': 'competing_campaigns'
+        })
+        df = df.merge(audience_competition, on=['audience_id', 'hour'], how='left')
+
+        df['audience_share_impressions'] = np.where(
+            df['impressions_audience_total'] > 0,
+            df['impressions'] / df['impressions_audience_total'],
+            0
+        )
+        df['audience_share_spend'] = np.where(
+            df['spend_audience_total'] > 0,
+            df['spend'] / df['spend_audience_total'],
+            0
+        )
+
+    if 'placement' in df.columns:
+        placement_stats = df.groupby(['placement', 'hour'], observed=True).agg({
+            'impressions': 'mean',
+            'cpc': 'mean',
+            'ctr': 'mean'
+        }).add_suffix('_placement_avg')
+        df = df.merge(placement_stats, on=['placement', 'hour'], how='left')
+
+        df['ctr_vs_placement_avg'] = df['ctr'] / (df['ctr_placement_avg'] + 1e-6)
+        df['cpc_vs_placement_avg'] = df['cpc'] / (df['cpc_placement_avg'] + 1e-6)
+
+    return df
+
+
+def legacy_lag_features(df: pd.DataFrame,
+                        group_by_cols: List[str] = ['campaign_id'],
+                        lag_periods: List[int] = [1, 3, 7]) -> pd.DataFrame:
+    """The previous implementation of engineer_lag_features"""
+    df = df.copy()
+    df = df.sort_values(group_by_cols + ['timestamp'])
+
+    lag_metrics = ['ctr', 'cpc', 'conversions', 'spend', 'impressions', 'clicks']
+
+    for metric in lag_metrics:
+        if metric in df.columns:
+            for lag in lag_periods:
+                df[f'{metric}_lag_{lag}'] = df.groupby(group_by_cols)[metric].shift(lag)
+                df[f'{metric}_ma_{lag}'] = df.groupby(group_by_cols)[metric].rolling(
+                    window=lag, min_periods=1
+                ).mean().reset_index(level=group_by_cols, drop=True)
+                if lag == 1:
+                    df[f'{metric}_pct_change'] = df.groupby(group_by_cols)[metric].pct_change()
+
+    for metric in ['ctr', 'conversions']:
+        if metric in df.columns:
+            df[f'{metric}_trend_7d'] = df.groupby(group_by_cols)[metric].rolling(
+                window=7, min_periods=3
+            ).apply(lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) >= 3 else 0).reset_index(level=group_by_cols, drop=True)
+
+    return df
+
+
+def legacy_correlated_features(df: pd.DataFrame, threshold: float = 0.95) -> List[str]:
+    """The columns the previous _remove_correlated_features dropped, from DataFrame.corr on every run"""
+    numeric_df = df.select_dtypes(include=[np.number])
+    corr_matrix = numeric_df.corr().abs()
+    upper_triangle = corr_matrix.where(
+        np.triu(np.ones(corr_matrix.shape), k=1).astype(bool)
+    )
+    return [column for column in upper_triangle.columns if any(upper_triangle[column] > threshold)]
+
+
+def legacy_text_features(texts: pd.Series) -> pd.DataFrame:
+    """The previous pandas string passes, with str.count given flags instead of case"""
+    features = pd.DataFrame(index=texts.index)
+    features['text_length'] = texts.str.len().fillna(0)
+    features['has_emoji'] = texts.str.contains(r'[^\w\s]', na=False).astype(int)
+    features['has_call_to_action'] = texts.str.contains(
+        r'buy|shop|learn|sign up|download|get|try', case=False, na=False
+    ).astype(int)
+    features['text_word_count'] = texts.str.split().str.len().fillna(0)
+    features['positive_sentiment_score'] = texts.str.count(
+        '|'.join(POSITIVE_WORDS), flags=re.IGNORECASE
+    ).fillna(0)
+    features['negative_sentiment_score'] = texts.str.count(
+        '|'.join(NEGATIVE_WORDS), flags=re.IGNORECASE
+    ).fillna(0)
+    return features
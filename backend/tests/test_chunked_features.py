@@ -0,0 +1,91 @@
+"""
+Tests for the out-of-core feature pipeline against create_feature_pipeline
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.chunked_pipeline import ChunkedFeaturePipeline, ParquetChunkSource, _RankSearch
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+
+
+@pytest.fixture(scope='module')
+def input_path(tmp_path_factory):
+    """Shuffled raw rows with some conversions missing, so chunks must be bucketed"""
+    df = generate_ad_frame(3000, campaigns=60)
+    rng = np.random.default_rng(7)
+    df['conversions'] = df['conversions'].astype(np.float64)
+    df.loc[rng.random(len(df)) < 0.02, 'conversions'] = np.nan
+    path = tmp_path_factory.mktemp('chunked') / 'input.parquet'
+    df.iloc[rng.permutation(len(df))].to_parquet(path, index=False, row_group_size=700)
+    return path
+
+
+def test_matches_in_memory_pipeline(input_path, tmp_path):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = FacebookAdFeatureEngineer().create_feature_pipeline(pd.read_parquet(input_path))
+
+        # Chunks well below the row count, so medians take the pivot passes
+        engineer = FacebookAdFeatureEngineer()
+        output_path = tmp_path / 'output.parquet'
+        summary = engineer.create_feature_pipeline_chunked(
+            ParquetChunkSource(str(input_path)), str(output_path), chunk_rows=500)
+
+    assert summary['chunks'] > 4
+    # Compared as written, without the input index
+    expected_path = tmp_path / 'expected.parquet'
+    expected.to_parquet(expected_path, index=False)
+    pd.testing.assert_frame_equal(pd.read_parquet(output_path), pd.read_parquet(expected_path))
+
+
+@pytest.mark.parametrize('distinct', [7, 400, None], ids=['many-ties', 'some-ties', 'continuous'])
+def test_rank_search_finds_the_exact_value(distinct):
+    rng = np.random.default_rng(3)
+    values = rng.standard_normal(5000) if distinct is None else rng.integers(0, distinct, 5000).astype(float)
+    chunks = np.array_split(values, 9)
+
+    for rank in [0, 1, 2499, 2500, 4999]:
+        # Small limits, so the search samples, buckets and narrows several times
+        search = _RankSearch('x', rank, len(values), collect_limit=100, sample_size=300, pivots=16)
+        passes = 0
+        while not search.done:
+            for chunk in chunks:
+                search.observe(chunk)
+            search.finish_pass()
+            passes += 1
+            assert passes < 50
+        assert search.result == np.partition(values, rank)[rank], rank
+
+
+def test_streaming_correlation_matches_dataframe_corr(tmp_path):
+    rng = np.random.default_rng(5)
+    base = rng.standard_normal(4000)
+    frame = pd.DataFrame({
+        'a': base,
+        'b': base * 2 + 0.01 * rng.standard_normal(4000),
+        'c': rng.standard_normal(4000),
+        'd': np.full(4000, 3.0),
+        'e': rng.integers(0, 5, 4000).astype(float),
+    })
+    frame.loc[rng.random(4000) < 0.05, 'c'] = np.nan
+    frame.loc[rng.random(4000) < 0.05, 'e'] = np.nan
+    fills = {'e': float(frame['e'].median())}
+
+    paths = []
+    for i, part in enumerate(np.array_split(frame, 3)):
+        path = str(tmp_path / f'{i}.parquet')
+        part.to_parquet(path, index=False)
+        paths.append(path)
+
+    # Small blocks, and shifts well away from the means
+    pipeline = ChunkedFeaturePipeline(FacebookAdFeatureEngineer(), block_rows=512)
+    shifts = {column: 100.0 for column in frame.columns}
+    corr = pipeline._correlation(paths, list(frame.columns), fills, shifts)
+
+    expected = frame.fillna(fills).corr()
+    pd.testing.assert_frame_equal(corr, expected, rtol=1e-9, atol=1e-12)
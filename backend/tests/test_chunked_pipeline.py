@@ -0,0 +1,71 @@
+"""
+Tests for reading raw rows from ClickHouse one chunk of campaigns at a time
+"""
+
+import numpy as np
+import pandas as pd
+
+from ml.feature_engineering.chunked_pipeline import (
+    ClickHouseChunkSource, plan_campaign_chunks, sample_campaigns
+)
+
+
+class FakeClickHouse:
+    """Answers the chunk source's queries from a frame, keeping the SQL it was sent"""
+
+    def __init__(self, rows: pd.DataFrame):
+        self.rows = rows
+        self.queries = []
+
+    def query_df(self, sql: str, parameters):
+        self.queries.append(sql)
+        rows = self.rows
+        if '{user_id:String}' in sql:
+            rows = rows[rows['user_id'] == parameters['user_id']]
+        if 'campaign_ids' in parameters:
+            rows = rows[rows['campaign_id'].isin(parameters['campaign_ids'])]
+            columns = sql.split('SELECT ', 1)[1].split(' FROM', 1)[0]
+            rows = rows if columns == '*' else rows[columns.split(', ')]
+            return rows.sort_values(['campaign_id', 'timestamp']).reset_index(drop=True)
+        return rows.groupby('campaign_id').size().rename('row_count').reset_index()
+
+
+def tenant_rows() -> pd.DataFrame:
+    return pd.DataFrame({
+        'user_id': ['u1', 'u1', 'u2', 'u2', 'u3'],
+        'campaign_id': ['c1', 'c1', 'c2', 'c3', 'c4'],
+        'timestamp': pd.date_range('2024-01-01', periods=5, freq='h'),
+        'impressions': [100, 200, 300, 400, 500],
+    })
+
+
+def read_all(source: ClickHouseChunkSource) -> pd.DataFrame:
+    plan = plan_campaign_chunks(source.campaign_rows(), chunk_rows=2)
+    return pd.concat(source.read_chunks(plan), ignore_index=True)
+
+
+def test_reads_one_tenant():
+    client = FakeClickHouse(tenant_rows())
+    rows = read_all(ClickHouseChunkSource(client, 'u2'))
+    assert list(rows['campaign_id']) == ['c2', 'c3']
+    assert all('user_id = {user_id:String}' in sql for sql in client.queries)
+
+
+def test_reads_every_tenant_with_its_user_id():
+    client = FakeClickHouse(tenant_rows())
+    rows = read_all(ClickHouseChunkSource(client, None, columns=['campaign_id', 'timestamp', 'impressions']))
+    assert list(rows['user_id']) == ['u1', 'u1', 'u2', 'u2', 'u3']
+    assert list(rows['campaign_id']) == ['c1', 'c1', 'c2', 'c3', 'c4']
+    assert not any('user_id =' in sql for sql in client.queries)
+
+
+def test_samples_whole_campaigns_within_the_limit():
+    campaign_rows = pd.Series(np.random.default_rng(0).integers(1, 50, 200),
+                              index=[f'c{i:03d}' for i in range(200)])
+    sampled = sample_campaigns(campaign_rows, 1000)
+    assert 950 < sampled.sum() <= 1000
+    assert (sampled == campaign_rows[sampled.index]).all()
+    assert list(sampled.index) == sorted(sampled.index)
+    # The same campaigns whatever order ClickHouse returns them in
+    pd.testing.assert_series_equal(sample_campaigns(campaign_rows[::-1], 1000), sampled)
+    assert sample_campaigns(campaign_rows, 10 ** 6) is campaign_rows
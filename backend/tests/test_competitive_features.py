@@ -0,0 +1,63 @@
+"""
+Tests for the competitive features against the previous merge implementation
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.dtype_plan import DtypePlan
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import performance_frame
+from tests.legacy_features import legacy_competitive_features
+
+
+def assert_same_features(expected: pd.DataFrame, actual: pd.DataFrame, compact: bool = False):
+    """
+    Same columns, index and values
+
+    Placement means differ from sum / count by rounding only; compact
+    frames match by value (categoricals) and within float32 precision.
+    """
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_index_equal(actual.index, expected.index)
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        if isinstance(right.dtype, pd.CategoricalDtype):
+            right = right.astype(right.cat.categories.dtype)
+        if compact and pd.api.types.is_float_dtype(right):
+            np.testing.assert_allclose(right.to_numpy(dtype=float), left.to_numpy(dtype=float),
+                                       rtol=1e-5, atol=1e-6, equal_nan=True, err_msg=column)
+        elif column.endswith('placement_avg'):
+            np.testing.assert_allclose(right.to_numpy(dtype=float), left.to_numpy(dtype=float),
+                                       rtol=1e-12, equal_nan=True, err_msg=column)
+        else:
+            pd.testing.assert_series_equal(right, left, check_dtype=not compact,
+                                           check_exact=True, obj=column)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    # Shuffled rows; missing audience and placement keys drop out of their groups
+    df = performance_frame(5000, campaigns=100, missing=0.2)
+    assert df['audience_id'].isna().any() and df['placement'].isna().any()
+    return df
+
+
+def test_matches_merge_implementation(frame):
+    expected = legacy_competitive_features(frame)
+    assert_same_features(expected, FacebookAdFeatureEngineer().engineer_competitive_features(frame))
+
+
+def test_precomputed_stats_match_merge_implementation(frame):
+    # The chunked, parallel and feature plan paths broadcast stats computed beforehand
+    engineer = FacebookAdFeatureEngineer()
+    builder = engineer.feature_builder(frame)
+    engineer._apply_competitive_stats(builder, engineer.competitive_stats(builder))
+    assert_same_features(legacy_competitive_features(frame), builder.build())
+
+
+def test_compact_dtypes_match_merge_implementation(frame):
+    compact = FacebookAdFeatureEngineer(dtype_plan=DtypePlan())
+    assert_same_features(legacy_competitive_features(frame), compact.engineer_competitive_features(frame),
+                         compact=True)
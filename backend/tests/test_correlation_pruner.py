@@ -0,0 +1,70 @@
+"""
+Tests for streaming correlation pruning against the per-run DataFrame.corr drop list
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.correlation_pruner import CorrelationPruner, StreamingCorrelation
+from tests.legacy_features import legacy_correlated_features
+
+
+@pytest.fixture(scope='module')
+def frame():
+    """Noisy copies of shared factors, some above the threshold, with NaNs and odd columns"""
+    rng = np.random.default_rng(9)
+    rows = 6000
+    factors = rng.standard_normal((rows, 6))
+    data = {}
+    for i in range(24):
+        noise = 0.05 if i % 3 == 0 else 1.0
+        data[f'f{i:02d}'] = factors[:, i % 6] * (1 + i % 5) + noise * rng.standard_normal(rows)
+    df = pd.DataFrame(data)
+    df['count'] = rng.integers(0, 100, rows)
+    df['count_copy'] = df['count'] * 2 + 1
+    df['constant'] = 1.5
+    df['placement'] = rng.choice(['feed', 'stories'], rows)
+    # NaNs from the start in one column and only in late blocks in others
+    df.loc[rng.random(rows) < 0.02, 'f00'] = np.nan
+    df.loc[rows - 500 + rng.integers(0, 500, 50), 'f06'] = np.nan
+    df.loc[rows - 100:, 'f12'] = np.nan
+    return df
+
+
+def test_streaming_correlation_matches_dataframe_corr(frame):
+    numeric = frame.select_dtypes(include=[np.number])
+    stats = StreamingCorrelation(list(numeric.columns))
+    stats.update_frame(numeric, block_rows=700)
+    assert stats.rows == len(frame)
+    pd.testing.assert_frame_equal(stats.correlation(), numeric.corr(), rtol=1e-9, atol=1e-12)
+
+
+def test_drop_list_matches_dataframe_corr(frame):
+    expected = legacy_correlated_features(frame)
+    assert expected
+
+    pruner = CorrelationPruner(block_rows=1000).fit(frame)
+    assert pruner.to_drop == expected
+    pd.testing.assert_frame_equal(pruner.transform(frame), frame.drop(columns=expected))
+
+    chunked = CorrelationPruner().fit_chunks(np.array_split(frame, 5))
+    assert chunked.to_drop == expected and chunked.fitted_rows == len(frame)
+
+
+def test_fitted_drop_list_is_reapplied(frame, tmp_path):
+    pruner = CorrelationPruner().fit(frame)
+    path = str(tmp_path / 'correlation_pruner.json')
+    pruner.save(path)
+    loaded = CorrelationPruner.load(path)
+
+    # A single row has no correlation of its own; it keeps the fitted columns
+    row = frame.iloc[:1]
+    assert list(loaded.transform(row).columns) == list(pruner.transform(frame).columns)
+    assert loaded.to_dict() == pruner.to_dict()
+
+
+def test_sampled_fit_is_close_to_the_full_drop_list(frame):
+    sampled = CorrelationPruner(sample_rows=3000).fit(frame)
+    assert sampled.fitted_rows == 3000
+    assert len(set(sampled.to_drop) ^ set(legacy_correlated_features(frame))) <= 1
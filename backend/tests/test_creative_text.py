@@ -0,0 +1,84 @@
+"""
+Tests for the single-pass creative text scanner against the pandas string passes
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.creative_text import CreativeTextScanner, TEXT_FEATURES
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.legacy_features import legacy_text_features
+
+# Keywords of every group, in mixed case, run together so matches overlap
+# within and across groups
+WORDS = [
+    'Shop', 'the', 'BEST', 'deals', 'Amazing', 'love', 'Sign up', 'signup', 'get', 'worst',
+    'awful', 'HATE', 'Try', 'download', 'learn', 'excellent', 'great', 'bad', 'greaterrible',
+    'bestry', 'awfulove', 'lovexcellent', 'AMAZINGreat', 'badbad', 'buy', '20%', 'off!', '🔥',
+    'new', 'naïve', '\tnow\n',
+]
+
+
+@pytest.fixture(scope='module')
+def texts():
+    rng = np.random.default_rng(4)
+    pool = [''.join(rng.choice([' ', ''], p=[0.8, 0.2]) + word
+                    for word in rng.choice(WORDS, rng.integers(1, 12)))
+            for _ in range(300)]
+    pool += ['', '   ', 'plain words only']
+    return pd.Series(np.array(pool, dtype=object)[rng.integers(0, len(pool), 3000)])
+
+
+def assert_same_features(result, texts: pd.Series):
+    expected = legacy_text_features(texts)[TEXT_FEATURES]
+    pd.testing.assert_frame_equal(pd.DataFrame(result, index=texts.index), expected)
+
+
+def test_matches_string_passes(texts):
+    assert_same_features(CreativeTextScanner().features(texts), texts)
+
+
+def test_missing_and_non_text_values_get_zeros(texts):
+    mixed = texts.copy()
+    mixed.iloc[::7] = None
+    mixed.iloc[3::11] = np.nan
+    mixed.iloc[5::13] = 42
+    assert_same_features(CreativeTextScanner().features(mixed), mixed)
+
+
+def test_memo_gives_the_same_features(texts, tmp_path):
+    scanner = CreativeTextScanner()
+    cold = scanner.features(texts)
+    unique = texts.nunique()
+    assert scanner.stats == {'hits': 0, 'misses': unique}
+    assert_same_features(scanner.features(texts), texts)
+    assert scanner.stats['misses'] == unique
+
+    path = str(tmp_path / 'creative_text_memo.npz')
+    scanner.save(path)
+    reloaded = CreativeTextScanner(memo_path=path)
+    warm = reloaded.features(texts)
+    assert reloaded.stats == {'hits': unique, 'misses': 0}
+    for name in TEXT_FEATURES:
+        np.testing.assert_array_equal(warm[name], cold[name])
+
+    # Evicting the oldest entries costs rescans, not different features
+    small = CreativeTextScanner(memo_path=path, max_entries=50)
+    assert len(small.memo) == 50
+    assert_same_features(small.features(texts), texts)
+
+
+def test_memo_made_with_other_keywords_is_ignored(texts, tmp_path):
+    scanner = CreativeTextScanner()
+    scanner.features(texts)
+    scanner.version = 'other keywords'
+    path = str(tmp_path / 'creative_text_memo.npz')
+    scanner.save(path)
+    assert CreativeTextScanner(memo_path=path).memo == {}
+
+
+def test_creative_stage_uses_the_scanner(texts):
+    features = FacebookAdFeatureEngineer().engineer_creative_features(pd.DataFrame({'ad_text': texts}))
+    expected = legacy_text_features(texts)
+    pd.testing.assert_frame_equal(features[TEXT_FEATURES], expected[TEXT_FEATURES])
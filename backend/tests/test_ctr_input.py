@@ -0,0 +1,92 @@
+"""
+Tests for streaming CTR training input against fitting on the whole frame
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from ml.models.ctr_input import CTRTrainingInput, DEFAULT_KEY_COLUMNS, validation_mask
+from ml.models.ctr_preprocessor import CTRPreprocessor
+from tests.frames import make_ctr_frame
+
+
+def training_rows(rows: int, seed: int) -> pd.DataFrame:
+    """Model inputs plus the row key, impressions and target"""
+    rng = np.random.default_rng(seed)
+    frame = make_ctr_frame(rows, seed=seed)
+    frame['timestamp'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(
+        rng.integers(0, 90 * 24 * 3600, rows), unit='s') + pd.to_timedelta(seed, unit='ms')
+    frame['impressions'] = rng.integers(50, 5000, rows)
+    frame['ctr'] = rng.beta(1, 60, rows)
+    return frame
+
+
+def reliable_rows(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame[frame['impressions'] >= 100]
+
+
+@pytest.fixture(scope='module')
+def shard_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('ctr-shards')
+    for shard in range(3):
+        table = pa.Table.from_pandas(training_rows(4000, seed=shard), preserve_index=False)
+        pq.write_table(table, directory / f'part-{shard:05d}.parquet', row_group_size=1500)
+    return directory
+
+
+def test_streaming_fit_matches_fit_on_the_training_rows(shard_dir):
+    frame = reliable_rows(pd.read_parquet(shard_dir))
+    training_input = CTRTrainingInput.from_parquet(str(shard_dir), row_filter=reliable_rows, batch_rows=700)
+    assert len(training_input.shards) == 9
+    streamed = training_input.fit_preprocessor(CTRPreprocessor())
+
+    mask = validation_mask(frame, DEFAULT_KEY_COLUMNS, 0.2)
+    fitted = CTRPreprocessor().fit(frame[~mask])
+    states = [streamed.to_dict(), fitted.to_dict()]
+    for state in states:
+        state.pop('fitted_at')
+    assert states[0] == states[1]
+    assert training_input.row_counts == {'train': int((~mask).sum()), 'validation': int(mask.sum())}
+    assert abs(mask.mean() - 0.2) < 0.02
+
+    # Dictionary-decoded batches encode as the object frame does
+    for split, rows in [('train', ~mask), ('validation', mask)]:
+        expected = fitted.transform(frame[rows])
+        batches = list(training_input.batches(streamed, split))
+        for name, values in expected.items():
+            np.testing.assert_allclose(np.concatenate([batch[name] for batch, _ in batches]), values,
+                                       rtol=1e-6, err_msg=name)
+        np.testing.assert_allclose(np.concatenate([target for _, target in batches]),
+                                   frame['ctr'][rows], rtol=1e-6)
+
+
+def test_validation_split_does_not_depend_on_how_rows_arrive():
+    frame = training_rows(5000, seed=7)
+    mask = validation_mask(frame, DEFAULT_KEY_COLUMNS, 0.2)
+
+    # However the rows are chunked or ordered
+    pieces = np.concatenate([validation_mask(frame.iloc[i:i + 777], DEFAULT_KEY_COLUMNS, 0.2)
+                             for i in range(0, len(frame), 777)])
+    np.testing.assert_array_equal(pieces, mask)
+    shuffled = frame.sample(frac=1.0, random_state=1)
+    np.testing.assert_array_equal(validation_mask(shuffled, DEFAULT_KEY_COLUMNS, 0.2),
+                                  mask[shuffled.index.to_numpy()])
+
+    # And whatever types Parquet or ClickHouse hand the keys back in
+    variants = {
+        'microseconds': frame.assign(timestamp=frame['timestamp'].astype('datetime64[us]')),
+        'utc': frame.assign(timestamp=frame['timestamp'].dt.tz_localize('UTC')),
+        'other zone': frame.assign(timestamp=frame['timestamp'].dt.tz_localize('UTC').dt.tz_convert('Europe/Kyiv')),
+        'categorical': frame.astype({'campaign_id': 'category'}),
+        'arrow strings': frame.astype({'campaign_id': 'string[pyarrow]'}),
+    }
+    for name, variant in variants.items():
+        np.testing.assert_array_equal(validation_mask(variant, DEFAULT_KEY_COLUMNS, 0.2), mask, err_msg=name)
+
+
+def test_validation_split_needs_the_key_columns():
+    with pytest.raises(ValueError, match='timestamp'):
+        validation_mask(pd.DataFrame({'campaign_id': ['c1']}), DEFAULT_KEY_COLUMNS, 0.2)
@@ -0,0 +1,119 @@
+"""
+Tests for CTR input encodings across batch sizes and for hashed vocabularies
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.models.ctr_preprocessor import CTRPreprocessor, SMALL_BATCH_ROWS
+
+VALUES = {
+    'float32': np.array([0.1, 0.2, 0.3], dtype=np.float32),
+    'float64': np.array([0.1, 0.2, 0.3]),
+    'int64': np.array([7, 8, 9]),
+    'object': np.array(['feed', 'stories', None], dtype=object),
+}
+
+
+def fitted(values: np.ndarray, **kwargs) -> CTRPreprocessor:
+    df = pd.DataFrame({'placement': values, 'bid_amount': 1.0})
+    return CTRPreprocessor(sparse_features=['placement'], dense_features=['bid_amount'], **kwargs).fit(df)
+
+
+@pytest.mark.parametrize('kind', list(VALUES))
+def test_codes_do_not_depend_on_batch_size(kind):
+    values = VALUES[kind]
+    preprocessor = fitted(np.resize(values, 3 * len(values)))
+    large = np.resize(values, SMALL_BATCH_ROWS + len(values))
+
+    expected = preprocessor.transform(pd.DataFrame({'placement': large}))['placement'][:len(values)]
+    assert (expected > 0).all()
+    np.testing.assert_array_equal(preprocessor.transform(pd.DataFrame({'placement': values}))['placement'],
+                                  expected)
+    for row, code in enumerate(expected):
+        assert preprocessor.transform({'placement': values[row:row + 1]})['placement'][0] == code
+
+
+@pytest.mark.parametrize('kind', list(VALUES))
+def test_hashed_codes_do_not_depend_on_batch_size(kind):
+    values = VALUES[kind]
+    # The first value keeps its own code, the rest and unseen ones are hashed
+    preprocessor = fitted(np.concatenate([values[:1].repeat(3), values[1:]]),
+                          hash_buckets={'placement': 16}, min_frequency=2)
+    unseen = np.array(['reels' if kind == 'object' else 5], dtype=values.dtype)
+    values = np.concatenate([values, unseen])
+    large = np.resize(values, SMALL_BATCH_ROWS + len(values))
+
+    expected = preprocessor.transform({'placement': large})['placement'][:len(values)]
+    assert expected[0] == 1 and (expected[1:] > 1).all()
+    for row, code in enumerate(expected):
+        assert preprocessor.transform({'placement': values[row:row + 1]})['placement'][0] == code
+
+
+def plain_hashed_codes(preprocessor: CTRPreprocessor, feature: str, train: pd.Series,
+                       values: pd.Series) -> np.ndarray:
+    """Codes of a hashed feature worked out value by value from the training counts"""
+    counts = train.astype(str).value_counts()
+    kept = sorted(counts[counts >= preprocessor.min_frequency].items(), key=lambda item: (-item[1], item[0]))
+    vocabulary = sorted(value for value, _ in kept[:preprocessor.max_vocabulary])
+    explicit = {value: code for code, value in enumerate(vocabulary, start=1)}
+    buckets = preprocessor.hash_buckets[feature]
+    codes = []
+    for value in values.astype(str):
+        if value in explicit:
+            codes.append(explicit[value])
+        else:
+            digest = int(pd.util.hash_array(np.array([value], dtype=object), categorize=False)[0])
+            bucket = digest % buckets
+            codes.append(1 + len(vocabulary) + bucket)
+    return np.array(codes)
+
+
+@pytest.fixture(scope='module')
+def long_tailed_ids():
+    """Zipf-like ad ids, most seen a few times, and test rows with unseen ones"""
+    rng = np.random.default_rng(8)
+    ads = pd.Series(rng.zipf(1.3, 6000) % 3000).map(lambda ad: f'ad{ad}')
+    train = pd.DataFrame({'ad_id': ads, 'campaign_id': ads.str[:3], 'bid_amount': rng.random(6000)})
+    test_ads = pd.Series(rng.integers(0, 6000, 3000)).map(lambda ad: f'ad{ad}')
+    test = pd.DataFrame({'ad_id': test_ads, 'campaign_id': test_ads.str[:3]})
+    return train, test
+
+
+@pytest.mark.parametrize('options', [
+    {'min_frequency': 5},
+    {'min_frequency': 2, 'max_vocabulary': 50},
+    {'min_frequency': 10 ** 6},
+], ids=['min-frequency', 'max-vocabulary', 'all-hashed'])
+def test_hashed_codes_match_plain_lookup(long_tailed_ids, options):
+    train, test = long_tailed_ids
+    preprocessor = CTRPreprocessor(sparse_features=['ad_id', 'campaign_id'], dense_features=['bid_amount'],
+                                   hash_buckets={'ad_id': 256}, **options).fit(train)
+    codes = preprocessor.transform(test)
+    np.testing.assert_array_equal(codes['ad_id'],
+                                  plain_hashed_codes(preprocessor, 'ad_id', train['ad_id'], test['ad_id']))
+    assert codes['ad_id'].min() >= 1 and codes['ad_id'].max() < preprocessor.vocabulary_size('ad_id')
+
+    # Features without buckets keep their exact vocabulary
+    vocabulary = sorted(train['campaign_id'].unique())
+    expected = [vocabulary.index(value) + 1 if value in vocabulary else 0 for value in test['campaign_id']]
+    np.testing.assert_array_equal(codes['campaign_id'], expected)
+
+
+def test_hashed_codes_survive_saving_and_chunked_fitting(long_tailed_ids, tmp_path):
+    train, test = long_tailed_ids
+    options = dict(sparse_features=['ad_id', 'campaign_id'], dense_features=['bid_amount'],
+                   hash_buckets={'ad_id': 256, 'campaign_id': 16}, min_frequency=5, max_vocabulary=100)
+    preprocessor = CTRPreprocessor(**options).fit(train)
+    expected = preprocessor.transform(test)
+
+    path = str(tmp_path / 'ctr_preprocessor.json')
+    preprocessor.save(path)
+    chunked = CTRPreprocessor(**options).fit_chunks(np.array_split(train, 7))
+    assert chunked.vocabularies == preprocessor.vocabularies
+    for other in [CTRPreprocessor.load(path), chunked]:
+        for start in range(0, len(test), 500):
+            rows = other.transform(test.iloc[start:start + 500])
+            for feat in ['ad_id', 'campaign_id']:
+                np.testing.assert_array_equal(rows[feat], expected[feat][start:start + 500], err_msg=feat)
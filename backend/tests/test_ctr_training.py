@@ -0,0 +1,166 @@
+"""
+Tests for the CTR training pipeline: every tenant's rows for the shared model,
+and the daily retrain's choice between fine-tuning, retraining and skipping
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('mlflow')
+pytest.importorskip('tensorflow')
+pytest.importorskip('deepctr')
+pytest.importorskip('prophet')
+
+from ml.feature_engineering.correlation_pruner import CorrelationPruner
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.models.model_registry import SHARED_CTR_MODEL
+from ml.training.trainer import MLTrainingPipeline
+from tests.frames import generate_ad_frame
+from tests.test_chunked_pipeline import FakeClickHouse, tenant_rows
+
+
+@pytest.fixture(autouse=True)
+def mlflow_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', f'file://{tmp_path}/mlruns')
+
+
+def ad_rows(user_id=None):
+    df = generate_ad_frame(2000, campaigns=20)
+    # Conversions tracking clicks would be pruned as correlated, budget data needs them
+    df['conversions'] = np.random.default_rng(0).integers(0, 20, len(df))
+    if user_id is not None:
+        df['user_id'] = user_id
+    return df
+
+
+def test_shared_model_loads_every_tenant():
+    rows = MLTrainingPipeline(SHARED_CTR_MODEL).load_training_data(FakeClickHouse(tenant_rows()))
+    assert list(rows['user_id']) == ['u1', 'u1', 'u2', 'u2', 'u3']
+
+    own_rows = MLTrainingPipeline('u2').load_training_data(FakeClickHouse(tenant_rows()))
+    assert list(own_rows['campaign_id']) == ['c2', 'c3']
+
+
+def test_training_data_stays_within_max_training_samples():
+    pipeline = MLTrainingPipeline(SHARED_CTR_MODEL)
+    pipeline.max_training_samples = 3
+    rows = pipeline.load_training_data(FakeClickHouse(tenant_rows()))
+    assert len(rows) <= 3
+    # Sampled campaigns keep all their rows
+    counts = rows['campaign_id'].value_counts()
+    assert counts.to_dict() == tenant_rows()['campaign_id'].value_counts()[counts.index].to_dict()
+
+
+@pytest.mark.asyncio
+async def test_shared_model_needs_the_tenant_of_each_row():
+    pipeline = MLTrainingPipeline(SHARED_CTR_MODEL)
+    with pytest.raises(ValueError, match='user_id'):
+        await pipeline.prepare_training_data(ad_rows())
+
+    datasets = await pipeline.prepare_training_data(ad_rows(user_id='u1'))
+    assert (datasets['ctr_prediction']['user_id'] == 'u1').all()
+
+    # A tenant's own model has no tenant feature to lose
+    datasets = await MLTrainingPipeline('u1').prepare_training_data(ad_rows())
+    assert 'user_id' not in datasets['ctr_prediction']
+
+
+class StubPredictor:
+    """CTR model of a given age and drift, recording its fine-tuning"""
+
+    tenant_feature = None
+    correlation_pruner = None
+    feature_plan = None
+
+    def __init__(self, age_days=1.0, nmse_ratio=1.0, unseen_share=0.0, trained=True):
+        self.trained = trained
+        self.preprocessor = SimpleNamespace(
+            code_offset=1, fitted_at=(datetime.now() - timedelta(days=age_days)).isoformat())
+        self.drift = {'nmse_ratio': nmse_ratio, 'unseen_share': unseen_share}
+        self.fine_tuned = []
+
+    def load_model(self):
+        if not self.trained:
+            raise FileNotFoundError('no registered version')
+
+    def drift_report(self, new_data):
+        return self.drift
+
+    def fine_tune(self, new_data, replay_data, **kwargs):
+        self.fine_tuned.append((new_data, replay_data))
+        return {'success': True, 'training_samples': len(new_data), 'model_version': '4'}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('predictor, window_days, force_full, mode, reason', [
+    (StubPredictor(), 1, False, 'incremental', 'no drift'),
+    (StubPredictor(), 0.1, False, 'skip', 'new rows'),
+    (StubPredictor(age_days=8), 1, False, 'full', 'scheduled'),
+    (StubPredictor(nmse_ratio=1.5), 1, False, 'full', 'normalized MSE'),
+    (StubPredictor(unseen_share=0.5), 1, False, 'full', 'unseen'),
+    (StubPredictor(trained=False), 1, False, 'full', 'no model'),
+    (StubPredictor(), 1, True, 'full', 'forced'),
+], ids=['incremental', 'skip', 'scheduled', 'drift', 'unseen', 'untrained', 'forced'])
+async def test_retrain_decision(predictor, window_days, force_full, mode, reason):
+    pipeline = MLTrainingPipeline('u1')
+    pipeline.ctr_predictor = predictor
+    pipeline.new_window_days = window_days
+    full_runs = []
+
+    async def run_full_training_pipeline(raw_data, models_to_train=None):
+        full_runs.append((raw_data, models_to_train))
+        return {'training_results': {'ctr_prediction': {'model_type': 'ctr_prediction', 'status': 'success'}}}
+
+    pipeline.run_full_training_pipeline = run_full_training_pipeline
+    raw_data = ad_rows()
+    result = await pipeline.retrain_ctr_model(raw_data, force_full=force_full)
+
+    assert result['mode'] == mode and reason in result['reason']
+    assert len(full_runs) == (mode == 'full')
+    assert len(predictor.fine_tuned) == (mode == 'incremental')
+    if mode == 'full':
+        assert full_runs[0][0] is raw_data and full_runs[0][1] == ['ctr_prediction']
+    elif mode == 'incremental':
+        # The new window, replayed with as many older rows
+        new_data, replay_data = predictor.fine_tuned[0]
+        window_start = raw_data['timestamp'].max() - timedelta(days=window_days)
+        assert (new_data['timestamp'] > window_start).all()
+        assert (replay_data['timestamp'] <= window_start).all()
+        assert len(replay_data) == len(new_data)
+        assert result['status'] == 'success' and result['replay_samples'] == len(new_data)
+    else:
+        assert result['status'] == 'skipped'
+
+
+@pytest.mark.asyncio
+async def test_fine_tune_keeps_the_model_features():
+    raw_data = ad_rows()
+    # Duplicated inputs: pruning refit on this data would drop one of them
+    raw_data['frequency'] = raw_data['bid_amount'] * 2
+    refit = FacebookAdFeatureEngineer().create_feature_pipeline(raw_data, fit=True)
+    assert not {'frequency', 'bid_amount'} <= set(refit.columns)
+
+    predictor = StubPredictor()
+    predictor.correlation_pruner = CorrelationPruner.from_dict({
+        'threshold': 0.95, 'columns': [], 'to_drop': [], 'fitted_rows': 1000,
+        'fitted_at': datetime.now().isoformat()})
+    window_start = raw_data['timestamp'].max() - timedelta(days=1)
+    older = raw_data[raw_data['timestamp'] <= window_start]
+    predictor.feature_plan = FacebookAdFeatureEngineer().fit_feature_plan(older, fit=True)
+    pipeline = MLTrainingPipeline('u1')
+    pipeline.ctr_predictor = predictor
+
+    result = await pipeline.retrain_ctr_model(raw_data)
+    assert result['mode'] == 'incremental'
+    new_data, replay_data = predictor.fine_tuned[0]
+    assert {'frequency', 'bid_amount'} <= set(new_data.columns) & set(replay_data.columns)
+    # The model's own drop list is reused, not refit in place
+    assert pipeline.feature_engineer.correlation_pruner is not predictor.correlation_pruner
+    assert pipeline.feature_engineer.correlation_pruner.to_drop == []
+
+    # Served lags look back at the window just trained on
+    latest = FacebookAdFeatureEngineer().fit_feature_plan(raw_data)
+    assert predictor.feature_plan.lag_history == latest.lag_history
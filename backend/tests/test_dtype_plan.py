@@ -0,0 +1,89 @@
+"""
+Tests for compact dtypes against the full-width feature pipeline
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.dtype_plan import DtypePlan, frame_memory
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+
+
+def assert_compact_equal(compact: pd.DataFrame, full: pd.DataFrame):
+    """Same columns, rows and values, allowing for the planned dtypes"""
+    assert list(compact.columns) == list(full.columns)
+    pd.testing.assert_index_equal(compact.index, full.index)
+    for name in full.columns:
+        left, right = compact[name], full[name]
+        if isinstance(left.dtype, pd.CategoricalDtype):
+            left = left.astype(left.cat.categories.dtype)
+        if left.dtype == np.float32:
+            np.testing.assert_allclose(left.to_numpy(np.float64), right.to_numpy(np.float64),
+                                       rtol=1e-5, atol=1e-6, equal_nan=True, err_msg=name)
+        else:
+            pd.testing.assert_series_equal(left, right, check_dtype=False, check_exact=False,
+                                           rtol=1e-5, atol=1e-6, obj=name)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    df = generate_ad_frame(3000, campaigns=60)
+    df['ctr'] = df['clicks'] / df['impressions']
+    return df
+
+
+def test_compact_pipeline_matches_full_width(frame):
+    # Correlation pruning fitted on other float widths could pick other
+    # columns, so the compact run reuses the full-width drop list
+    full_engineer = FacebookAdFeatureEngineer()
+    full = full_engineer.create_feature_pipeline(frame, fit=True)
+    compact_engineer = FacebookAdFeatureEngineer(
+        correlation_pruner=full_engineer.correlation_pruner, dtype_plan=DtypePlan()
+    )
+    compact = compact_engineer.create_feature_pipeline(frame)
+
+    assert_compact_equal(compact, full)
+    report = DtypePlan().report(full, compact)
+    assert report['columns'] and report['bytes_after'] < report['bytes_before']
+    assert compact_engineer.memory_report['output_bytes'] == frame_memory(compact)
+
+
+def test_rules_only_apply_to_values_they_hold_exactly():
+    df = pd.DataFrame({
+        'placement': ['feed', 'stories', 'feed', 'reels'],
+        'campaign_id': [1, 2, 3, 4],
+        'ctr': [0.1, 0.2, np.nan, 0.4],
+        'cpc': np.array([1, 2, 3, 4], dtype=np.float32),
+        'is_weekend': [0, 1, 1, 0],
+        'is_odd': [0, 1, 2, 0],
+        'has_text': [True, False, True, True],
+        'is_gap': [0.0, 1.0, np.nan, 1.0],
+        'hour': [0, 23, 5, 12],
+        'days_to_holiday': [0, 300, 5, 12],
+        'num_interests': [0, 1, 2, 3],
+        'impressions': [1, 2, 3, 4],
+    })
+    df['num_interests'] = df['num_interests'].astype(np.int8)
+    plan = DtypePlan(keep=['days_*'])
+    compact = plan.apply(df)
+
+    assert {name: str(dtype) for name, dtype in compact.dtypes.items()} == {
+        'placement': 'category', 'campaign_id': 'int64', 'ctr': 'float32', 'cpc': 'float32',
+        'is_weekend': 'int8', 'is_odd': 'int64', 'has_text': 'int8', 'is_gap': 'float64',
+        'hour': 'int8', 'days_to_holiday': 'int64', 'num_interests': 'int8', 'impressions': 'int64',
+    }
+    assert_compact_equal(compact, df.astype({'has_text': int}))
+    # Unchanged columns are shared, not copied, and a compact frame is left as is
+    assert np.shares_memory(compact['impressions'].to_numpy(), df['impressions'].to_numpy())
+    assert plan.apply(compact) is compact
+
+
+def test_small_ints_take_the_smallest_type_that_fits():
+    plan = DtypePlan()
+    assert plan.target('hour', pd.Series([0, 127])) == np.int8
+    assert plan.target('hour', pd.Series([-1, 128])) == np.int16
+    assert plan.target('week_of_year', pd.Series([0, 40000])) == np.int32
+    assert plan.target('week_of_year', pd.Series([0, 2 ** 40])) is None
+    assert plan.target('hour', pd.Series([1, None], dtype='Int64')) is None
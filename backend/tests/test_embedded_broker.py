@@ -0,0 +1,133 @@
+"""
+Tests for the embedded log broker: durability across restarts, consumer
+group rebalancing and committed offsets
+"""
+
+from services.embedded_broker import (
+    EmbeddedConsumer, EmbeddedLogBroker, EmbeddedProducer, TopicPartition, get_embedded_broker
+)
+
+TOPIC = 'campaign-events'
+
+
+def bootstrap(tmp_path):
+    return [f'embedded://{tmp_path}/log']
+
+
+def produce(tmp_path, start: int, count: int):
+    producer = EmbeddedProducer(bootstrap(tmp_path), value_serializer=str.encode,
+                                key_serializer=str.encode)
+    for i in range(start, start + count):
+        producer.send(TOPIC, key=f'c{i % 7}', value=str(i))
+    producer.flush()
+
+
+def consumer(tmp_path, group='g1', **kwargs):
+    return EmbeddedConsumer(TOPIC, bootstrap_servers=bootstrap(tmp_path), group_id=group,
+                            auto_offset_reset='earliest', enable_auto_commit=False,
+                            value_deserializer=bytes.decode, **kwargs)
+
+
+def drain(client):
+    values = []
+    while True:
+        batch = client.poll(max_records=50)
+        if not batch:
+            return values
+        values += [int(record.value) for records in batch.values() for record in records]
+
+
+def restart(tmp_path):
+    """Close the broker as a process exit would, and open its data directory again"""
+    get_embedded_broker(bootstrap(tmp_path)).close()
+    return get_embedded_broker(bootstrap(tmp_path))
+
+
+def test_records_survive_a_restart(tmp_path):
+    # Small segments, so the log rolls several times
+    broker = get_embedded_broker(bootstrap(tmp_path), segment_bytes=512)
+    produce(tmp_path, 0, 100)
+    before = {p: broker.end_offset(TopicPartition(TOPIC, p)) for p in broker.partitions_for(TOPIC)}
+    assert sum(before.values()) == 100
+
+    broker = restart(tmp_path)
+    assert broker.topics() == [TOPIC]
+    assert {p: broker.end_offset(TopicPartition(TOPIC, p)) for p in broker.partitions_for(TOPIC)} == before
+
+    # New records continue each partition's offsets
+    produce(tmp_path, 100, 20)
+    assert sorted(drain(consumer(tmp_path))) == list(range(120))
+    for partition in broker.partitions_for(TOPIC):
+        offsets = [record.offset for record in broker.fetch(TopicPartition(TOPIC, partition), 0, 1000)]
+        assert offsets == list(range(len(offsets)))
+
+
+def test_keys_keep_their_partition_across_a_restart(tmp_path):
+    produce(tmp_path, 0, 14)
+    broker = get_embedded_broker(bootstrap(tmp_path))
+    partition_of = {}
+    for partition in broker.partitions_for(TOPIC):
+        for record in broker.fetch(TopicPartition(TOPIC, partition), 0, 100):
+            partition_of.setdefault(bytes(record.key), set()).add(partition)
+    assert all(len(partitions) == 1 for partitions in partition_of.values())
+
+    broker = restart(tmp_path)
+    produce(tmp_path, 14, 7)
+    for partition in broker.partitions_for(TOPIC):
+        for record in broker.fetch(TopicPartition(TOPIC, partition), 0, 100):
+            assert partition_of[bytes(record.key)] == {partition}
+
+
+def test_consumers_resume_from_committed_offsets(tmp_path):
+    produce(tmp_path, 0, 30)
+    first = consumer(tmp_path)
+    seen = drain(first)
+    first.commit()
+    first.close()
+
+    produce(tmp_path, 30, 10)
+    broker = restart(tmp_path)
+    reader = consumer(tmp_path)
+    assert sorted(seen + drain(reader)) == list(range(40))
+    reader.close()
+    assert EmbeddedLogBroker(broker.data_dir).committed('g1', TopicPartition(TOPIC, 0)) is not None
+
+    # Uncommitted progress is read again; other groups start on their own
+    resumed = consumer(tmp_path)
+    assert sorted(drain(resumed)) == list(range(30, 40))
+    assert sorted(drain(consumer(tmp_path, group='g2'))) == list(range(40))
+
+
+def test_group_members_split_partitions_and_rebalance(tmp_path):
+    produce(tmp_path, 0, 60)
+    first, second = consumer(tmp_path), consumer(tmp_path)
+    assert first.assignment().isdisjoint(second.assignment())
+    assert len(first.assignment() | second.assignment()) == 3
+
+    seen = drain(first) + drain(second)
+    assert sorted(seen) == list(range(60))
+    first.commit()
+    second.commit()
+    second.close()
+
+    # The remaining member takes over the partitions of the one that left,
+    # from the offsets it committed
+    assert len(first.assignment()) == 3
+    produce(tmp_path, 60, 30)
+    assert sorted(drain(first)) == list(range(60, 90))
+
+
+def test_rejoining_member_starts_from_the_group_offsets(tmp_path):
+    produce(tmp_path, 0, 60)
+    first = consumer(tmp_path)
+    drain(first)
+    first.commit()
+
+    # While another member owns some partitions, it moves their offsets on
+    second = consumer(tmp_path)
+    produce(tmp_path, 60, 30)
+    taken_over = drain(second)
+    second.commit()
+    second.close()
+
+    assert sorted(taken_over + drain(first)) == list(range(60, 90))
@@ -0,0 +1,78 @@
+"""
+Tests for columnar event blocks against the JSON campaign events they replace
+"""
+
+import uuid
+
+import pytest
+
+from services.event_blocks import decode_event_value
+from services.kafka_producer import FacebookDataStreamer
+
+
+def buffered(campaign_data, offset: float):
+    return {'user_id': 'u1', 'campaign_data': campaign_data, 'timestamp': 1700000000.25 + offset}
+
+
+RECORDS = [
+    {'campaign_id': 'c1', 'ad_set_id': 's1', 'ad_id': 'a1',
+     'metrics': {'impressions': 1200, 'clicks': 30, 'ctr': 0.025, 'spend': 12.5, 'placement': 'feed'},
+     'metadata': {'source': 'facebook_insights'}},
+    # A whole-number ctr next to fractional ones, a null and an absent metric
+    {'campaign_id': 'c2', 'ad_set_id': 's2', 'ad_id': 'a2',
+     'metrics': {'impressions': 0, 'clicks': 0, 'ctr': 0, 'spend': None, 'placement': None}},
+    {'campaign_id': 'c3', 'metrics': {'impressions': 2 ** 40, 'ctr': 1, 'conversions': 4,
+                                      'reach': None, 'flags': {'learning': True}},
+     'metadata': None},
+]
+
+
+@pytest.fixture
+def streamer(tmp_path):
+    producer = FacebookDataStreamer(bootstrap_servers=[f'embedded://{tmp_path}/log'])
+    yield producer
+    producer.close()
+
+
+def json_events(streamer, batch):
+    outgoing, invalid = streamer._build_outgoing(batch)
+    assert not invalid
+    return [decode_event_value(streamer._serialize_value(value)) for _, value, _ in outgoing]
+
+
+def block_events(streamer, batch):
+    streamer.use_event_blocks = True
+    outgoing, invalid = streamer._build_outgoing(batch)
+    streamer.use_event_blocks = False
+    assert not invalid and len(outgoing) == 1
+    return [row.to_dict() for row in decode_event_value(outgoing[0][1])]
+
+
+def assert_same_events(decoded, expected):
+    assert len(decoded) == len(expected)
+    for row, event in zip(decoded, expected):
+        uuid.UUID(row.pop('event_id'))
+        event.pop('event_id')
+        assert row == event
+        # Equal is not enough: 1 == 1.0
+        for name, value in event['metrics'].items():
+            assert type(row['metrics'][name]) is type(value), name
+
+
+@pytest.mark.parametrize('own_timestamps', [False, True], ids=['buffer-time', 'own-time'])
+def test_block_rows_match_json_events(streamer, own_timestamps):
+    batch = [buffered(dict(data), i * 0.5) for i, data in enumerate(RECORDS)]
+    if own_timestamps:
+        batch[1]['campaign_data']['timestamp'] = '2024-03-01T12:00:00+00:00'
+
+    expected = json_events(streamer, batch)
+    decoded = block_events(streamer, batch)
+    assert_same_events(decoded, expected)
+
+    # Nulls stay present, absent metrics stay absent
+    assert decoded[1]['metrics']['spend'] is None and 'reach' not in decoded[1]['metrics']
+    assert decoded[2]['metrics']['reach'] is None and 'spend' not in decoded[2]['metrics']
+    if own_timestamps:
+        assert decoded[1]['timestamp'] == '2024-03-01T12:00:00+00:00'
+        assert decoded[0]['timestamp'] != decoded[2]['timestamp']
+
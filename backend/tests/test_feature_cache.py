@@ -0,0 +1,53 @@
+"""
+Tests for the per-day Parquet feature cache and the modules reading Parquet through pyarrow
+"""
+
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.feature_cache import FeatureCache
+from tests.frames import generate_ad_frame
+
+
+@pytest.mark.parametrize('module', [
+    'ml.feature_engineering.feature_cache',
+    'ml.feature_engineering.chunked_pipeline',
+    'ml.feature_engineering.parallel_pipeline',
+    'ml.models.ctr_input',
+])
+def test_pyarrow_modules_import(module):
+    importlib.import_module(module)
+
+
+def engineer_without_fills(**options) -> FacebookAdFeatureEngineer:
+    # Missing-value handling and correlation pruning run on the result either way
+    engineer = FacebookAdFeatureEngineer(**options)
+    engineer._handle_missing_values = lambda frame: frame
+    engineer._remove_correlated_features = lambda frame, fit=False: frame
+    return engineer
+
+
+def test_cached_days_match_the_uncached_pipeline(tmp_path):
+    df = generate_ad_frame(4 * 24 * 10, campaigns=10)
+    df['ctr'] = df['clicks'] / df['impressions']
+    df['conversions'] = df['conversions'].astype(np.float64).mask(np.random.default_rng(0).random(len(df)) < 0.05)
+    day = (df['timestamp'] - df['timestamp'].min()).dt.days
+    today, tomorrow = df[day < 3], df[day >= 1]
+
+    cache = FeatureCache(str(tmp_path))
+    plain, cached = engineer_without_fills(), engineer_without_fills(feature_cache=cache)
+
+    expected = plain.create_feature_pipeline(today)
+    pd.testing.assert_frame_equal(cached.create_feature_pipeline(today, user_id='u1'), expected)
+    misses = cache.stats['misses']
+    pd.testing.assert_frame_equal(cached.create_feature_pipeline(today, user_id='u1'), expected)
+    assert cache.stats['misses'] == misses
+
+    # Slid forward one day: the new day, and the first day whose lag context was dropped
+    pd.testing.assert_frame_equal(cached.create_feature_pipeline(tomorrow, user_id='u1'),
+                                  plain.create_feature_pipeline(tomorrow))
+    assert cache.stats['misses'] == misses + 2
@@ -0,0 +1,125 @@
+"""
+Tests for the feature plan executor against create_feature_pipeline
+"""
+
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.feature_plan import FeaturePlan, FeaturePlanExecutor, refresh_lag_history
+from tests.frames import generate_ad_frame
+
+LAG_SUFFIXES = ('_lag_1', '_lag_3', '_lag_7', '_ma_1', '_ma_3', '_ma_7', '_pct_change', '_trend_7d')
+
+
+def ad_frame(missing: float = 0.2, seed: int = 7) -> pd.DataFrame:
+    """Ad frame with metrics, texts, timestamps and campaign ids blanked at random"""
+    df = generate_ad_frame(4000, campaigns=40)
+    df['ctr'] = df['clicks'] / df['impressions']
+    rng = np.random.default_rng(seed)
+    for column in ['conversions', 'spend', 'frequency']:
+        df[column] = df[column].astype(np.float64).mask(rng.random(len(df)) < missing)
+    df['ad_text'] = df['ad_text'].mask(rng.random(len(df)) < missing)
+    df['timestamp'] = df['timestamp'].mask(rng.random(len(df)) < missing / 20)
+    df['campaign_id'] = df['campaign_id'].mask(rng.random(len(df)) < missing / 20)
+    return df
+
+
+def test_executor_matches_pipeline_on_fitted_frame(tmp_path):
+    df = ad_frame()
+    engineer = FacebookAdFeatureEngineer()
+    path = str(tmp_path / 'feature_plan.json')
+    engineer.fit_feature_plan(df, fit=True).save(path)
+    plan = FeaturePlan.load(path)
+
+    expected = engineer.create_feature_pipeline(df).sort_index()
+    result = pd.DataFrame(FeaturePlanExecutor(plan).transform(df, use_history=False))
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=True)
+
+
+@pytest.mark.parametrize('single_rows', [False, True], ids=['batch', 'row'])
+def test_lag_features_from_history_match_pipeline(single_rows):
+    df = ad_frame()
+    df = df[df['campaign_id'].notna() & df['timestamp'].notna()]
+    last = df.sort_values('timestamp', kind='stable').groupby('campaign_id').tail(1).index
+    context, new = df.drop(last), df.loc[last].reset_index(drop=True)
+
+    # Without fills, so a NaN is never hidden behind a fitted median
+    plan = replace(FacebookAdFeatureEngineer().fit_feature_plan(context, fit=True), fill_values={})
+    executor = FeaturePlanExecutor(plan)
+    if single_rows:
+        rows = [executor.transform_row(row) for row in new.to_dict('records')]
+        result = {name: np.array([row[name] for row in rows]) for name in plan.columns}
+    else:
+        result = executor.transform(new)
+
+    # The pipeline over context and new rows, before fills
+    reference = FacebookAdFeatureEngineer()
+    reference._handle_missing_values = lambda frame: frame
+    reference._remove_correlated_features = lambda frame, fit=False: frame
+    expected = reference.create_feature_pipeline(pd.concat([context, new], ignore_index=True))
+    expected = expected.sort_index().iloc[len(context):]
+
+    lag_columns = [name for name in plan.columns if name.endswith(LAG_SUFFIXES)]
+    assert lag_columns
+    for name in lag_columns:
+        np.testing.assert_array_equal(result[name], expected[name].to_numpy(dtype=np.float64), err_msg=name)
+
+
+def test_single_row_path_matches_batch_path():
+    df = ad_frame()
+    plan = FacebookAdFeatureEngineer().fit_feature_plan(df, fit=True)
+    executor = FeaturePlanExecutor(replace(plan, fill_values={}))
+    later = generate_ad_frame(32, campaigns=80, seed=1, start='2024-03-01')
+    later['ctr'] = later['clicks'] / later['impressions']
+    later.loc[3, 'campaign_id'] = None
+    later.loc[5:8, 'spend'] = np.nan
+
+    for use_history in (True, False):
+        for i, row in enumerate(later.to_dict('records')):
+            # An ungrouped second row keeps the batch path without touching the row's lags
+            batch = executor.transform([row, {**row, 'campaign_id': None}], use_history=use_history)
+            result = executor.transform_row(row, use_history=use_history)
+            assert list(result) == list(batch)
+            for name, values in batch.items():
+                np.testing.assert_array_equal(np.array([result[name]]), values[:1], err_msg=f'{i} {name}')
+
+
+def test_complete_fills_only_missing_model_inputs():
+    df = ad_frame(missing=0.0)
+    executor = FeaturePlanExecutor(FacebookAdFeatureEngineer().fit_feature_plan(df, fit=True))
+    raw = generate_ad_frame(4, campaigns=40, seed=1, start='2024-03-01')
+    records = raw.to_dict('records')
+    records[1]['day_of_week'] = 6
+    expected = executor.transform(records)
+
+    completed = executor.complete(records, ['day_of_week', 'is_weekend', 'not_a_feature'])
+    assert [row['day_of_week'] for row in completed] == [expected['day_of_week'][0], 6] + list(expected['day_of_week'][2:])
+    assert [row['is_weekend'] for row in completed] == list(expected['is_weekend'])
+    assert all('not_a_feature' not in row for row in completed)
+    assert 'day_of_week' not in records[0]
+
+    frame = executor.complete(raw, ['day_of_week'])
+    np.testing.assert_array_equal(frame['day_of_week'].to_numpy(), expected['day_of_week'])
+    assert executor.complete(frame, ['day_of_week']) is frame
+    assert executor.complete(completed, ['day_of_week']) is completed
+
+
+def test_refreshed_lag_history_matches_refit():
+    df = generate_ad_frame(4000, campaigns=40)
+    older = df[df['timestamp'] < df['timestamp'].max() - pd.Timedelta(hours=24)]
+    engineer = FacebookAdFeatureEngineer()
+    plan = engineer.fit_feature_plan(older, fit=True)
+
+    refreshed = refresh_lag_history(engineer, plan, df)
+    assert refreshed.lag_history == engineer.fit_feature_plan(df).lag_history
+    assert refreshed.columns == plan.columns and refreshed.fill_values == plan.fill_values
+
+    # Campaigns without new rows keep the history they had
+    some = df[df['campaign_id'].isin(df['campaign_id'].unique()[:5])]
+    partial = dict(refresh_lag_history(engineer, plan, some).lag_history)
+    expected = {**dict(plan.lag_history), **dict(engineer.fit_feature_plan(some).lag_history)}
+    assert partial == expected
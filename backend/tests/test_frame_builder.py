@@ -0,0 +1,58 @@
+"""
+Tests for the column builder pipeline against the chained engineer_* stages
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FEATURE_STAGES, FacebookAdFeatureEngineer
+from ml.feature_engineering.frame_builder import FeatureFrameBuilder
+from tests.frames import generate_ad_frame
+from tests.legacy_features import chained_stages
+
+
+@pytest.fixture(scope='module')
+def frame():
+    df = generate_ad_frame(2000, campaigns=40)
+    df['ctr'] = df['clicks'] / df['impressions']
+    # A shuffled, non-default index: the stages keep, sort or reset it
+    df = df.sample(frac=1.0, random_state=1)
+    df.index = df.index * 3 + 5
+    return df
+
+
+def test_stages_match_chained_stages(frame):
+    engineer = FacebookAdFeatureEngineer()
+    builder = engineer.feature_builder(frame)
+    engineer.run_stages(builder, FEATURE_STAGES)
+    pd.testing.assert_frame_equal(builder.build(), chained_stages(engineer, frame))
+
+
+def test_pipeline_matches_chained_stages(frame):
+    original = frame.copy()
+    engineer = FacebookAdFeatureEngineer()
+    result = engineer.create_feature_pipeline(frame, fit=True)
+
+    reference = FacebookAdFeatureEngineer()
+    expected = reference._remove_correlated_features(
+        reference._handle_missing_values(chained_stages(reference, frame)), fit=True)
+    pd.testing.assert_frame_equal(result, expected)
+    # The input is read, never modified
+    pd.testing.assert_frame_equal(frame, original)
+
+
+def test_builder_replaces_and_reorders_without_touching_the_input():
+    df = pd.DataFrame({'a': [3, 1, 2], 'b': ['x', 'y', 'z']}, index=[10, 20, 30])
+    builder = FeatureFrameBuilder(df)
+    builder['a'] = builder['a'] * 10
+    builder['c'] = np.array([0.5, 1.5, 2.5])
+    # Series are aligned by index, not position
+    builder['d'] = pd.Series([7, 8, 9], index=[30, 10, 20])
+    builder.reorder_rows(builder.sorted_positions(['a']))
+
+    expected = pd.DataFrame({'a': [10, 20, 30], 'b': ['y', 'z', 'x'], 'c': [1.5, 2.5, 0.5],
+                             'd': [9, 7, 8]}, index=[20, 30, 10])
+    pd.testing.assert_frame_equal(builder.build(), expected)
+    assert builder.columns == ['a', 'b', 'c', 'd']
+    assert df['a'].tolist() == [3, 1, 2] and list(df.columns) == ['a', 'b']
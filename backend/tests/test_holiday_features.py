@@ -0,0 +1,54 @@
+"""
+Tests for the vectorized holiday features against the row-wise helpers
+"""
+
+import holidays
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.legacy_features import legacy_holiday_features
+
+
+def engineer_for(country_code: str, timestamps: pd.Series) -> FacebookAdFeatureEngineer:
+    engineer = FacebookAdFeatureEngineer(country_code=country_code)
+    # The scalar helpers only see years already loaded into engineer.holidays;
+    # load the neighbouring years too so they see the same calendar
+    years = range(timestamps.dt.year.min() - 1, timestamps.dt.year.max() + 2)
+    engineer.holidays = holidays.country_holidays(country_code, years=years)
+    return engineer
+
+
+def assert_same_holidays(engineer: FacebookAdFeatureEngineer, timestamps: pd.Series):
+    vectorized = engineer._holiday_features(timestamps)
+    for name, expected in legacy_holiday_features(engineer, timestamps).items():
+        np.testing.assert_array_equal(vectorized[name], expected, err_msg=name)
+
+
+@pytest.mark.parametrize('country_code', ['US', 'GB', 'UA'])
+def test_matches_row_wise_helpers(country_code):
+    rng = np.random.default_rng(42)
+    first, last = pd.Timestamp('2022-01-01').value, pd.Timestamp('2025-01-01').value
+    timestamps = pd.Series(pd.to_datetime(rng.integers(first, last, 3000)))
+    assert_same_holidays(engineer_for(country_code, timestamps), timestamps)
+
+
+@pytest.mark.parametrize('country_code', ['US', 'GB', 'UA'])
+def test_matches_row_wise_helpers_around_new_year(country_code):
+    # Lookups past the year end use the neighbouring year's fallbacks
+    days = pd.Series(pd.concat([
+        pd.Series(pd.date_range(f'{year - 1}-12-15', f'{year}-01-20', freq='D'))
+        for year in range(2022, 2026)
+    ], ignore_index=True))
+    assert_same_holidays(engineer_for(country_code, days), days)
+
+
+def test_temporal_stage_uses_the_holiday_lookup():
+    rng = np.random.default_rng(3)
+    timestamps = pd.Series(pd.to_datetime(rng.integers(pd.Timestamp('2023-11-01').value,
+                                                       pd.Timestamp('2024-02-01').value, 500)))
+    engineer = engineer_for('US', timestamps)
+    features = engineer.engineer_temporal_features(pd.DataFrame({'timestamp': timestamps}))
+    for name, expected in legacy_holiday_features(engineer, timestamps).items():
+        np.testing.assert_array_equal(features[name].to_numpy(), expected, err_msg=name)
@@ -0,0 +1,71 @@
+"""
+Tests for the campaign metrics consumer's streaming features against the batch pipeline
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.streaming_features import IncrementalLagFeatureEngine
+from services.kafka_consumer import CampaignMetricsProcessor
+from tests.frames import generate_ad_frame
+
+COUNTS = ['impressions', 'clicks', 'spend', 'conversions']
+
+
+class RecordingProcessor(CampaignMetricsProcessor):
+    """Keeps the processed records instead of storing them"""
+
+    def __init__(self, **kwargs):
+        super().__init__(clickhouse_client=object(), **kwargs)
+        self.stored = []
+
+    async def _store_to_clickhouse(self, metrics):
+        self.stored.append(metrics)
+
+
+def event(row: dict, rng: np.random.Generator) -> dict:
+    """A campaign event as the producer sends it: missing counts left out or null"""
+    metrics = {name: row[name] for name in COUNTS if not pd.isna(row[name])}
+    for name in list(metrics):
+        if rng.random() < 0.02:
+            metrics[name] = None
+    # Facebook's ctr is a percentage; the features must not use it
+    metrics['ctr'] = 100 * row['clicks'] / row['impressions'] if row['impressions'] else 0
+    return {
+        'user_id': 'u1',
+        'campaign_id': row['campaign_id'],
+        'timestamp': row['timestamp'].isoformat() + 'Z',
+        'metrics': metrics,
+    }
+
+
+@pytest.mark.asyncio
+async def test_consumer_lag_features_match_batch_pipeline():
+    rng = np.random.default_rng(5)
+    df = generate_ad_frame(3000, campaigns=40)
+    for name in COUNTS:
+        df[name] = df[name].astype(float).mask(rng.random(len(df)) < 0.05)
+    df.loc[rng.random(len(df)) < 0.02, 'impressions'] = 0
+
+    processor = RecordingProcessor(feature_engine=IncrementalLagFeatureEngine())
+    stream = df.sort_values('timestamp', kind='stable')
+    messages = [event(row, rng) for row in stream.to_dict('records')]
+    for offset, message in enumerate(messages):
+        assert await processor.process_message(message, 'campaign_events', 0, offset)
+
+    # Values sent as null are missing in the batch frame too
+    for (index, row), message in zip(stream.iterrows(), messages):
+        for name in COUNTS:
+            if message['metrics'].get(name) is None:
+                df.loc[index, name] = np.nan
+
+    engineer = FacebookAdFeatureEngineer()
+    expected = engineer.engineer_lag_features(engineer.engineer_performance_features(df)).loc[stream.index]
+    for name in processor.feature_engine.feature_names:
+        np.testing.assert_allclose(
+            np.array([record['lag_features'][name] for record in processor.stored]),
+            expected[name].to_numpy(dtype=float),
+            rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=name
+        )
@@ -0,0 +1,126 @@
+"""
+Tests for the producer's async sending pipeline, against the embedded broker
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from services.embedded_broker import EmbeddedConsumer
+from services.event_blocks import CAMPAIGN_EVENTS_TOPIC
+from services.kafka_producer import FacebookDataStreamer
+
+
+class FlakyProducer:
+    """Wraps a producer, rejecting the given number of sends (all of them when None)"""
+
+    def __init__(self, producer, rejections=None):
+        self.producer = producer
+        self.rejections = rejections
+        self.rejected = 0
+
+    def send(self, *args, **kwargs):
+        if self.rejections is None or self.rejected < self.rejections:
+            self.rejected += 1
+            raise BufferError('producer queue full')
+        return self.producer.send(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.producer, name)
+
+
+def streamer(tmp_path, **kwargs) -> FacebookDataStreamer:
+    return FacebookDataStreamer(bootstrap_servers=[f'embedded://{tmp_path}/log'], **kwargs)
+
+
+def delivered(tmp_path):
+    consumer = EmbeddedConsumer(CAMPAIGN_EVENTS_TOPIC, bootstrap_servers=[f'embedded://{tmp_path}/log'],
+                                auto_offset_reset='earliest', value_deserializer=json.loads)
+    records = [record for records in consumer.poll().values() for record in records]
+    consumer.close()
+    return sorted(record.value['campaign_id'] for record in records)
+
+
+def campaign(i: int):
+    return {'campaign_id': f'c{i:02d}', 'metrics': {'impressions': 100 * i, 'clicks': i}}
+
+
+@pytest.mark.asyncio
+async def test_enqueued_records_are_delivered(tmp_path):
+    producer = streamer(tmp_path, max_batch_size=4, max_batch_timeout=0.05)
+    await producer.start_async_sender()
+
+    results = await producer.async_batch_send_metrics('u1', [campaign(i) for i in range(10)],
+                                                      delivery_timeout=5)
+    assert results == {'success': 10, 'failed': 0, 'spilled': 0, 'pending': 0}
+    assert delivered(tmp_path) == [f'c{i:02d}' for i in range(10)]
+
+    await producer.close_async(timeout=5)
+    assert producer.get_metrics()['pending_deliveries'] == 0
+
+
+@pytest.mark.asyncio
+async def test_rejected_records_are_retried_in_order(tmp_path):
+    producer = streamer(tmp_path, max_batch_size=3, max_batch_timeout=0.05)
+    producer.producer = FlakyProducer(producer.producer, rejections=2)
+    await producer.start_async_sender()
+
+    deliveries = [await producer.enqueue_campaign_metrics('u1', campaign(i)) for i in range(3)]
+    assert await asyncio.wait_for(asyncio.gather(*deliveries), 5) == [True, True, True]
+    assert producer.producer.rejected == 2
+    assert delivered(tmp_path) == ['c00', 'c01', 'c02']
+    await producer.close_async(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_sender_survives_a_failed_flush(tmp_path):
+    producer = streamer(tmp_path, max_batch_size=1, max_batch_timeout=0.05)
+    dispatch_batch = producer._dispatch_batch
+    failures = []
+
+    def fail_once(batch):
+        if not failures:
+            failures.append(batch)
+            raise RuntimeError('encoder crashed')
+        return dispatch_batch(batch)
+
+    producer._dispatch_batch = fail_once
+    await producer.start_async_sender()
+
+    deliveries = [await producer.enqueue_campaign_metrics('u1', campaign(i)) for i in range(2)]
+    assert await asyncio.wait_for(asyncio.gather(*deliveries), 5) == [True, True]
+    assert failures and not producer._sender_task.done()
+    await producer.close_async(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_fails_once_the_sender_has_stopped(tmp_path):
+    producer = streamer(tmp_path)
+    await producer.start_async_sender()
+    producer._sender_task.cancel()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError, match='not running'):
+        await producer.enqueue_campaign_metrics('u1', campaign(0))
+    await producer.close_async(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_without_waiting_on_rejected_records(tmp_path):
+    producer = streamer(tmp_path, max_batch_size=2, max_batch_timeout=10)
+    await producer.start_async_sender()
+    sent = [await producer.enqueue_campaign_metrics('u1', campaign(i)) for i in range(3)]
+    await asyncio.sleep(0.1)
+
+    # The last record is still buffered at shutdown and the producer rejects it
+    producer.producer = FlakyProducer(producer.producer)
+    started = time.monotonic()
+    await producer.close_async(timeout=30)
+    await asyncio.sleep(0)
+    assert time.monotonic() - started < 5
+
+    assert [delivery.result() for delivery in sent] == [True, True, False]
+    assert delivered(tmp_path) == ['c00', 'c01']
@@ -0,0 +1,66 @@
+"""
+Tests for the lag features against the per-metric groupby implementation
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.dtype_plan import DtypePlan
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from tests.frames import generate_ad_frame
+from tests.legacy_features import legacy_lag_features
+
+
+def assert_same_features(expected: pd.DataFrame, actual: pd.DataFrame, rtol: float = 1e-7):
+    """Same rows, and every column of the legacy output within rounding of the closed-form trend"""
+    pd.testing.assert_index_equal(actual.index, expected.index)
+    for column in expected.columns:
+        left, right = expected[column], actual[column]
+        if pd.api.types.is_float_dtype(left) or pd.api.types.is_float_dtype(right):
+            np.testing.assert_allclose(right.to_numpy(dtype=float), left.to_numpy(dtype=float),
+                                       rtol=rtol, atol=1e-9, equal_nan=True, err_msg=column)
+        else:
+            pd.testing.assert_series_equal(right, left, check_names=False, check_dtype=False)
+
+
+def legacy(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        return legacy_lag_features(df, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    engineer = FacebookAdFeatureEngineer()
+    df = engineer.engineer_performance_features(generate_ad_frame(3000, campaigns=60))
+    # Missing and zero values exercise the rolling windows and pct_change
+    rng = np.random.default_rng(11)
+    for metric in ['ctr', 'conversions', 'spend', 'clicks']:
+        df[metric] = df[metric].astype(float).mask(rng.random(len(df)) < 0.05)
+    df.loc[rng.random(len(df)) < 0.05, 'clicks'] = 0
+    # Shuffled, so the stage's sort does real work
+    return df.sample(frac=1.0, random_state=0)
+
+
+def test_matches_groupby_implementation(frame):
+    expected = legacy(frame)
+    actual = FacebookAdFeatureEngineer().engineer_lag_features(frame)
+    assert list(actual.columns) == list(expected.columns)
+    assert_same_features(expected, actual.loc[expected.index])
+
+
+def test_matches_groupby_implementation_per_group_columns(frame):
+    group_by_cols, lag_periods = ['campaign_id', 'placement'], [1, 2, 5]
+    expected = legacy(frame, group_by_cols=group_by_cols, lag_periods=lag_periods)
+    actual = FacebookAdFeatureEngineer().engineer_lag_features(
+        frame, group_by_cols=group_by_cols, lag_periods=lag_periods)
+    assert_same_features(expected, actual.loc[expected.index])
+
+
+def test_compact_dtypes_match_groupby_implementation(frame):
+    expected = legacy(frame)
+    actual = FacebookAdFeatureEngineer(dtype_plan=DtypePlan()).engineer_lag_features(frame)
+    assert_same_features(expected, actual.loc[expected.index], rtol=1e-5)
@@ -0,0 +1,67 @@
+"""
+Tests for loading CTR models into the model registry from their NumPy export
+"""
+
+import os
+
+import numpy as np
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.models import model_registry
+from ml.models.ctr_preprocessor import CTRPreprocessor
+from ml.models.deepfm_numpy import NumpyDeepFM
+from ml.models.model_registry import ModelLoader, ModelRegistry, ctr_predictor_size
+from tests.frames import generate_ad_frame
+
+
+def exported_model(df, model_version: str) -> NumpyDeepFM:
+    """A small DeepFM with random weights over a preprocessor fitted on df"""
+    rng = np.random.default_rng(0)
+    preprocessor = CTRPreprocessor().fit(df)
+    dim, hidden = 4, 8
+    rows = sum(preprocessor.vocabulary_size(feat) for feat in preprocessor.sparse_features)
+    inputs = len(preprocessor.sparse_features) * dim + len(preprocessor.dense_features)
+    return NumpyDeepFM(
+        preprocessor,
+        embedding_table=rng.normal(size=(rows, dim)).astype(np.float32),
+        linear_table=rng.normal(size=rows).astype(np.float32),
+        linear_kernel=rng.normal(size=len(preprocessor.dense_features)),
+        dnn_kernels=[rng.normal(size=(inputs, hidden))],
+        dnn_biases=[np.zeros(hidden)],
+        output_kernel=rng.normal(size=hidden),
+        model_version=model_version,
+    )
+
+
+def test_registry_serves_the_numpy_export_under_its_registry_version(tmp_path, monkeypatch):
+    df = generate_ad_frame(2000, campaigns=20)
+    df['ctr'] = df['clicks'] / df['impressions']
+    artifacts = tmp_path / 'artifacts_u1'
+    # Exported before the registry version was recorded: the run id
+    exported_model(df, model_version='0123abcd').save(str(artifacts / 'numpy_model'))
+    FacebookAdFeatureEngineer().fit_feature_plan(df, fit=True).save(str(artifacts / 'feature_plan.json'))
+    monkeypatch.setattr(model_registry, '_ctr_model_artifacts', lambda user_id, version: str(artifacts))
+
+    registry = ModelRegistry()
+    registry.register('ctr', ModelLoader(lambda user_id: '3', model_registry._load_ctr_predictor,
+                                         ctr_predictor_size))
+    model = registry.get('ctr', 'u1')
+    assert isinstance(model, NumpyDeepFM)
+    assert model.feature_executor is not None
+    assert registry.status()['models'][0]['version'] == '3'
+    assert registry.memory_bytes >= model.nbytes
+
+    # Raw request fields only: day_of_week and the rest come from the feature plan
+    request = {name: value for name, value in df.iloc[-1].items()
+               if name in ('campaign_id', 'placement', 'bid_amount', 'timestamp', 'impressions', 'clicks')}
+    result = model.predict(request)
+    assert 'error' not in result and result['model_version'] == '3'
+    completed = model.feature_executor.complete([request], model.sparse_features + model.dense_features)
+    assert completed[0]['day_of_week'] == df['timestamp'].iloc[-1].dayofweek
+    assert result['predicted_ctr'] == float(model.forward(model.preprocessor.transform_records(completed))[0])
+
+
+def test_runs_without_an_export_fall_back_to_keras(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'artifacts_u1')
+    monkeypatch.setattr(model_registry, '_ctr_model_artifacts', lambda user_id, version: str(tmp_path / 'artifacts_u1'))
+    assert model_registry._load_numpy_ctr_model('u1', '3') is None
@@ -0,0 +1,44 @@
+"""
+Tests for the campaign-sharded feature pipeline against the serial stages
+"""
+
+import pandas as pd
+import pytest
+
+from ml.feature_engineering.facebook_features import FEATURE_STAGES, FacebookAdFeatureEngineer
+from ml.feature_engineering.parallel_pipeline import ParallelFeaturePipeline
+from tests.frames import generate_ad_frame
+
+
+def serial_features(engineer: FacebookAdFeatureEngineer, df: pd.DataFrame) -> pd.DataFrame:
+    builder = engineer.feature_builder(df)
+    engineer.run_stages(builder, FEATURE_STAGES)
+    return builder.build()
+
+
+@pytest.mark.parametrize('shuffled', [False, True], ids=['input-order', 'shuffled'])
+def test_matches_serial_stages(shuffled):
+    df = generate_ad_frame(2000, campaigns=50)
+    df['ctr'] = df['clicks'] / df['impressions']
+    if shuffled:
+        # Shards are scattered and gathered by campaign, then put back in serial order
+        df = df.sample(frac=1.0, random_state=2)
+        df.index = df.index * 3 + 5
+
+    engineer = FacebookAdFeatureEngineer()
+    pipeline = ParallelFeaturePipeline(engineer, workers=2, shards_per_worker=3)
+    result = pipeline.engineer_features(df)
+
+    assert pipeline.last_run['shards'] > 2
+    pd.testing.assert_frame_equal(result, serial_features(engineer, df), check_exact=True)
+
+
+def test_pipeline_matches_serial_pipeline():
+    df = generate_ad_frame(1500, campaigns=30)
+    df['ctr'] = df['clicks'] / df['impressions']
+    engineer = FacebookAdFeatureEngineer()
+    expected = engineer.create_feature_pipeline(df, fit=True)
+
+    features = ParallelFeaturePipeline(engineer, workers=2).engineer_features(df)
+    result = engineer._remove_correlated_features(engineer._handle_missing_values(features))
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
@@ -0,0 +1,66 @@
+"""
+Tests for the producer spill log
+"""
+
+import json
+import os
+
+from services.spill_log import CURSOR_FILE, SpillLog
+
+
+def records(start: int, count: int):
+    return [{'i': i, 'timestamp': float(i)} for i in range(start, start + count)]
+
+
+def drain(log: SpillLog):
+    entries = log.read(1000)
+    if entries:
+        log.commit(entries[-1][1])
+    return [record['i'] for record, _ in entries]
+
+
+def test_append_after_draining_a_full_segment(tmp_path):
+    log = SpillLog(str(tmp_path), segment_bytes=200)
+    for record in records(0, 20):
+        log.append([record])
+    assert drain(log) == list(range(20))
+    assert log.pending_records == 0 and log.oldest_timestamp is None
+
+    # The drained segment is full, so this append rolls to a new one
+    log.append(records(20, 1))
+    assert log.pending_records == 1
+    assert log.oldest_timestamp == 20.0
+    assert drain(log) == [20]
+
+    log.append(records(21, 2))
+    log.close()
+    reopened = SpillLog(str(tmp_path), segment_bytes=200)
+    assert reopened.pending_records == 2 and reopened.oldest_timestamp == 21.0
+    assert drain(reopened) == [21, 22]
+
+
+def test_drained_segments_are_removed_on_roll(tmp_path):
+    log = SpillLog(str(tmp_path), segment_bytes=200)
+    log.append(records(0, 20))
+    drain(log)
+    log.append(records(20, 1))
+    segments = sorted(name for name in os.listdir(tmp_path) if name.endswith('.spill'))
+    assert len(segments) == 1
+    assert log.pending_bytes > 0
+
+
+def test_cursor_left_at_the_end_of_a_closed_segment(tmp_path):
+    # Cursor files written before a roll moved the cursor along
+    log = SpillLog(str(tmp_path), segment_bytes=200)
+    log.append(records(0, 20))
+    position = log.read(1000)[-1][1]
+    log.close()
+    with open(os.path.join(tmp_path, CURSOR_FILE), 'w') as f:
+        json.dump({'segment': position[0], 'offset': position[1], 'index': position[2]}, f)
+    with open(os.path.join(tmp_path, f"{position[0] + 1:020d}.spill"), 'wb'):
+        pass
+
+    reopened = SpillLog(str(tmp_path), segment_bytes=200)
+    reopened.append(records(20, 1))
+    assert reopened.pending_records == 1 and reopened.oldest_timestamp == 20.0
+    assert drain(reopened) == [20]
@@ -0,0 +1,32 @@
+"""
+Tests for the incremental per-campaign lag feature engine
+"""
+
+import numpy as np
+
+from ml.feature_engineering.facebook_features import FacebookAdFeatureEngineer
+from ml.feature_engineering.streaming_features import IncrementalLagFeatureEngine, LAG_METRICS
+from tests.frames import generate_ad_frame
+
+
+def test_stream_matches_batch_lag_features():
+    engineer = FacebookAdFeatureEngineer()
+    df = engineer.engineer_performance_features(generate_ad_frame(3000, campaigns=40))
+    rng = np.random.default_rng(7)
+    for metric in LAG_METRICS:
+        df[metric] = df[metric].astype(float).mask(rng.random(len(df)) < 0.05)
+
+    batch = engineer.engineer_lag_features(df)
+
+    # Records arrive in timestamp order, interleaved across campaigns
+    stream = df.sort_values('timestamp', kind='stable')
+    engine = IncrementalLagFeatureEngine()
+    emitted = [engine.update(campaign_id, record) for campaign_id, record in
+               zip(stream['campaign_id'].tolist(), stream[LAG_METRICS].to_dict('records'))]
+
+    expected = batch.loc[stream.index]
+    for name in engine.feature_names:
+        np.testing.assert_allclose(
+            np.array([features[name] for features in emitted]), expected[name].to_numpy(dtype=float),
+            rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=name
+        )